@@ -0,0 +1,354 @@
+"""
+Admission control and load shedding for the API.
+
+Every /api request (except the exemptions below) takes a slot before it
+reaches the endpoint. The number of slots is an adaptive limit (AIMD): a
+request slower than the latency target of its cost class shrinks the limit
+multiplicatively (at most once per ADMISSION_DECREASE_INTERVAL_MS), a request
+within target while the limit is saturated grows it by 1/limit.
+
+Requests that find no free slot wait in a priority queue: interactive reads
+first, then standard work, heavy analytics last. Each class may hold only a
+share of the limit, and a route can have its own concurrency cap, so a burst
+of heavy requests cannot occupy the slots interactive reads need. A request
+whose estimated wait exceeds the queue budget of its class is answered 503
+with Retry-After right away; one that waits longer than the budget is
+answered 503 as well.
+
+Cached responses are served before admission (the middleware sits inside the
+response cache), so cache hits never take a slot. State is per process.
+"""
+import asyncio
+import bisect
+import itertools
+import logging
+import math
+import os
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from starlette.background import BackgroundTask
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_LIMIT_INITIAL = int(os.getenv("ADMISSION_LIMIT_INITIAL", "16"))
+ADMISSION_LIMIT_MIN = int(os.getenv("ADMISSION_LIMIT_MIN", "2"))
+ADMISSION_LIMIT_MAX = int(os.getenv("ADMISSION_LIMIT_MAX", "64"))
+ADMISSION_BACKOFF_FACTOR = float(os.getenv("ADMISSION_BACKOFF_FACTOR", "0.9"))
+ADMISSION_DECREASE_INTERVAL_MS = float(os.getenv("ADMISSION_DECREASE_INTERVAL_MS", "1000"))
+# Доля адаптивного лимита, которую может занять класс (interactive - весь лимит)
+ADMISSION_STANDARD_SHARE = float(os.getenv("ADMISSION_STANDARD_SHARE", "0.75"))
+ADMISSION_HEAVY_SHARE = float(os.getenv("ADMISSION_HEAVY_SHARE", "0.25"))
+ADMISSION_INTERACTIVE_BUDGET_MS = float(os.getenv("ADMISSION_INTERACTIVE_BUDGET_MS", "500"))
+ADMISSION_STANDARD_BUDGET_MS = float(os.getenv("ADMISSION_STANDARD_BUDGET_MS", "1000"))
+ADMISSION_HEAVY_BUDGET_MS = float(os.getenv("ADMISSION_HEAVY_BUDGET_MS", "2000"))
+ADMISSION_INTERACTIVE_TARGET_MS = float(os.getenv("ADMISSION_INTERACTIVE_TARGET_MS", "300"))
+ADMISSION_STANDARD_TARGET_MS = float(os.getenv("ADMISSION_STANDARD_TARGET_MS", "1000"))
+ADMISSION_HEAVY_TARGET_MS = float(os.getenv("ADMISSION_HEAVY_TARGET_MS", "5000"))
+
+_EWMA_ALPHA = 0.2
+
+
+class CostClass(NamedTuple):
+    priority: int  # lower is served first
+    share: float  # fraction of the adaptive limit the class may hold
+    queue_budget_ms: float  # longest acceptable wait for a slot
+    latency_target_ms: float  # slower requests shrink the limit
+
+
+COST_CLASSES: Dict[str, CostClass] = {
+    "interactive": CostClass(0, 1.0, ADMISSION_INTERACTIVE_BUDGET_MS, ADMISSION_INTERACTIVE_TARGET_MS),
+    "standard": CostClass(1, ADMISSION_STANDARD_SHARE, ADMISSION_STANDARD_BUDGET_MS, ADMISSION_STANDARD_TARGET_MS),
+    "heavy": CostClass(2, ADMISSION_HEAVY_SHARE, ADMISSION_HEAVY_BUDGET_MS, ADMISSION_HEAVY_TARGET_MS),
+}
+_CLASS_ORDER = ("interactive", "standard", "heavy")
+
+
+class AdmissionRule(NamedTuple):
+    cost: str
+    limit: Optional[int] = None  # concurrent requests of this route
+    costly_params: Tuple[str, ...] = ()  # any of these in the query string moves the request one class up
+
+
+# Exact paths; the rest of /api is interactive for GET and standard otherwise
+ADMISSION_RULES: Dict[str, AdmissionRule] = {
+    # source - подстрочный поиск (ILIKE '%...%'), индексы не помогают
+    "/api/events/": AdmissionRule("interactive", costly_params=("source",)),
+    "/api/events/paged": AdmissionRule("interactive", costly_params=("source",)),
+    "/api/events/summary": AdmissionRule("standard", costly_params=("source",)),
+    "/api/events/export": AdmissionRule("heavy", limit=2),
+    "/api/events/evaluate-all": AdmissionRule("standard"),
+    "/api/alerts/bulk": AdmissionRule("standard"),
+    "/api/alerts/rules/preview": AdmissionRule("heavy", limit=4),
+    "/api/mitre/heatmap": AdmissionRule("standard"),
+    "/api/mitre/retag": AdmissionRule("standard"),
+    "/api/analytics/events": AdmissionRule("heavy"),
+    "/api/analytics/export": AdmissionRule("heavy", limit=1),
+}
+
+# Не проходят через контроль: проверка живости и диагностика перегрузки
+ADMISSION_EXEMPT = ("/api/health", "/api/admission/", "/api/debug/")
+
+
+def classify(method: str, path: str, query_params) -> Tuple[str, Optional[AdmissionRule]]:
+    """Cost class of a request and its route rule (None for unlisted routes)."""
+    rule = ADMISSION_RULES.get(path)
+    if rule is None:
+        return ("interactive" if method in ("GET", "HEAD") else "standard"), None
+    cost = rule.cost
+    if any(query_params.get(name) for name in rule.costly_params):
+        cost = _CLASS_ORDER[min(_CLASS_ORDER.index(cost) + 1, len(_CLASS_ORDER) - 1)]
+    return cost, rule
+
+
+class Rejected(Exception):
+    """No slot within the queue budget; ``retry_after`` is in seconds."""
+
+    def __init__(self, retry_after: int, reason: str) -> None:
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("cost", "route", "rule", "future")
+
+    def __init__(self, cost: str, route: str, rule: Optional[AdmissionRule], future: asyncio.Future) -> None:
+        self.cost = cost
+        self.route = route
+        self.rule = rule
+        self.future = future
+
+
+class AdmissionController:
+    """Adaptive concurrency limit with a priority queue; used from one event loop."""
+
+    def __init__(
+        self,
+        initial: int = ADMISSION_LIMIT_INITIAL,
+        min_limit: int = ADMISSION_LIMIT_MIN,
+        max_limit: int = ADMISSION_LIMIT_MAX,
+        classes: Optional[Dict[str, CostClass]] = None,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.classes = classes or COST_CLASSES
+        self.in_flight = 0
+        self._class_in_flight: Counter = Counter()
+        self._route_in_flight: Counter = Counter()
+        # (priority, seq, waiter) по возрастанию: первым обслуживается самый дешёвый и ранний
+        self._queue: List[Tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._service_ms = 0.0
+        self._class_latency_ms: Dict[str, float] = {name: 0.0 for name in self.classes}
+        self._last_decrease = 0.0
+        self.counters: Dict[str, Counter] = {name: Counter() for name in self.classes}
+        self.limit_changes: Counter = Counter()
+
+    # --- slots ------------------------------------------------------------------
+
+    def _class_cap(self, cost: str) -> int:
+        return max(1, int(self.limit * self.classes[cost].share))
+
+    def _can_run(self, cost: str, route: str, rule: Optional[AdmissionRule]) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        if self._class_in_flight[cost] >= self._class_cap(cost):
+            return False
+        return rule is None or rule.limit is None or self._route_in_flight[route] < rule.limit
+
+    def _take(self, cost: str, route: str) -> None:
+        self.in_flight += 1
+        self._class_in_flight[cost] += 1
+        self._route_in_flight[route] += 1
+
+    def _free(self, cost: str, route: str) -> None:
+        self.in_flight -= 1
+        self._class_in_flight[cost] -= 1
+        self._route_in_flight[route] -= 1
+        if not self._route_in_flight[route]:
+            del self._route_in_flight[route]
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued requests in priority order, skipping those blocked by their caps."""
+        index = 0
+        while index < len(self._queue) and self.in_flight < int(self.limit):
+            waiter = self._queue[index][2]
+            if waiter.future.done() or not self._can_run(waiter.cost, waiter.route, waiter.rule):
+                index += 1
+                continue
+            del self._queue[index]
+            self._take(waiter.cost, waiter.route)
+            waiter.future.set_result(None)
+
+    def estimated_wait_ms(self, cost: str) -> float:
+        """Queue time of a new request: requests ahead of it times the mean service time per slot."""
+        priority = self.classes[cost].priority
+        ahead = sum(1 for item in self._queue if item[0] <= priority)
+        return (ahead + 1) * self._service_ms / max(self.limit, 1.0)
+
+    async def acquire(self, cost: str, route: str, rule: Optional[AdmissionRule] = None) -> float:
+        """Wait for a slot; returns the time spent queued (ms) or raises Rejected."""
+        counters = self.counters[cost]
+        priority = self.classes[cost].priority
+        queued_ahead = any(item[0] <= priority for item in self._queue)
+        if not queued_ahead and self._can_run(cost, route, rule):
+            self._take(cost, route)
+            counters["admitted"] += 1
+            return 0.0
+
+        budget_ms = self.classes[cost].queue_budget_ms
+        estimate = self.estimated_wait_ms(cost)
+        if estimate > budget_ms:
+            counters["rejected"] += 1
+            raise Rejected(_retry_after(estimate), "queue over latency budget")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(cost, route, rule, future)
+        bisect.insort(self._queue, (priority, next(self._seq), waiter), key=lambda item: item[:2])
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=budget_ms / 1000)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Клиент ушёл, пока слот уже передавался: вернуть его, не трогая лимит
+            if future.done() and not future.cancelled():
+                self._free(cost, route)
+                self._dispatch()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+                self._queue = [item for item in self._queue if item[2] is not waiter]
+        waited_ms = (time.perf_counter() - started) * 1000
+        if future.cancelled():
+            counters["timed_out"] += 1
+            raise Rejected(_retry_after(max(self.estimated_wait_ms(cost), budget_ms)), "queue wait timed out")
+        counters["admitted"] += 1
+        counters["queued"] += 1
+        counters["queue_ms"] += round(waited_ms)
+        return waited_ms
+
+    def release(self, cost: str, route: str, latency_ms: float) -> None:
+        """Free the slot and adjust the limit by the request's service time."""
+        saturated = self.in_flight >= int(self.limit)
+        self._free(cost, route)
+        self._service_ms += _EWMA_ALPHA * (latency_ms - self._service_ms)
+        self._class_latency_ms[cost] += _EWMA_ALPHA * (latency_ms - self._class_latency_ms[cost])
+        now = time.monotonic()
+        if latency_ms > self.classes[cost].latency_target_ms:
+            if (now - self._last_decrease) * 1000 >= ADMISSION_DECREASE_INTERVAL_MS:
+                self.limit = max(float(self.min_limit), self.limit * ADMISSION_BACKOFF_FACTOR)
+                self._last_decrease = now
+                self.limit_changes["decrease"] += 1
+        elif saturated and self.limit < self.max_limit:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.limit_changes["increase"] += 1
+        self._dispatch()
+
+    def snapshot(self) -> dict:
+        """Current limit, occupancy and per-class counters."""
+        queued = Counter(item[2].cost for item in self._queue)
+        return {
+            "limit": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": len(self._queue),
+            "service_ms_ewma": round(self._service_ms, 1),
+            "limit_changes": dict(self.limit_changes),
+            "classes": {
+                name: {
+                    "priority": cost_class.priority,
+                    "cap": self._class_cap(name),
+                    "queue_budget_ms": cost_class.queue_budget_ms,
+                    "latency_target_ms": cost_class.latency_target_ms,
+                    "in_flight": self._class_in_flight[name],
+                    "queued": queued[name],
+                    "latency_ms_ewma": round(self._class_latency_ms[name], 1),
+                    "admitted": self.counters[name]["admitted"],
+                    "rejected": self.counters[name]["rejected"],
+                    "timed_out": self.counters[name]["timed_out"],
+                    "avg_queue_ms": round(self.counters[name]["queue_ms"] / self.counters[name]["queued"], 1)
+                    if self.counters[name]["queued"]
+                    else 0.0,
+                }
+                for name, cost_class in self.classes.items()
+            },
+            "routes": {
+                path: {"cost": rule.cost, "limit": rule.limit, "in_flight": self._route_in_flight[path]}
+                for path, rule in ADMISSION_RULES.items()
+            },
+        }
+
+
+def _retry_after(wait_ms: float) -> int:
+    return max(1, math.ceil(wait_ms / 1000))
+
+
+controller = AdmissionController()
+
+
+class _Slot:
+    """Held from admission until the response body has been sent."""
+
+    __slots__ = ("cost", "route", "started", "released")
+
+    def __init__(self, cost: str, route: str) -> None:
+        self.cost = cost
+        self.route = route
+        self.started = time.perf_counter()
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            controller.release(self.cost, self.route, (time.perf_counter() - self.started) * 1000)
+
+
+class AdmissionMiddleware(BaseHTTPMiddleware):
+    """Admit /api requests through ``controller``; shed load with 503 + Retry-After."""
+
+    async def dispatch(self, request: Request, call_next):
+        path = request.url.path
+        if request.method == "OPTIONS" or not path.startswith("/api/") or path.startswith(ADMISSION_EXEMPT):
+            return await call_next(request)
+
+        cost, rule = classify(request.method, path, request.query_params)
+        route = path if rule is not None else cost
+        try:
+            await controller.acquire(cost, route, rule)
+        except Rejected as exc:
+            logger.warning("Shed %s %s (%s): %s", request.method, path, cost, exc.reason)
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Server is overloaded, retry later"},
+                headers={"Retry-After": str(exc.retry_after), "X-Admission-Class": cost},
+            )
+
+        slot = _Slot(cost, route)
+        try:
+            response = await call_next(request)
+        except BaseException:
+            slot.release()
+            raise
+        # Экспорт стримит тело после заголовков - слот держится до конца отправки
+        response.body_iterator = _release_after(response.body_iterator, slot)
+        response.background = BackgroundTask(slot.release)
+        response.headers["X-Admission-Class"] = cost
+        return response
+
+
+async def _release_after(body_iterator, slot: _Slot):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        slot.release()
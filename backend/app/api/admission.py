@@ -0,0 +1,18 @@
+"""Admission control state: adaptive limit, queue and per-class shed counters."""
+from fastapi import APIRouter, Depends
+
+from app import admission
+from app.auth import require_role
+from app.models.user import UserOut
+
+router = APIRouter(prefix="/api/admission", tags=["admission"])
+
+
+@router.get("/stats")
+def admission_stats(current_user: UserOut = Depends(require_role("admin"))):
+    """
+    Current concurrency limit and its AIMD adjustments, requests in flight and queued,
+    and per cost class: admitted, rejected (over budget on arrival), timed out in the queue,
+    average queue wait and latency.
+    """
+    return {"enabled": admission.ADMISSION_ENABLED, **admission.controller.snapshot()}
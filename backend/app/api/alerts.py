@@ -1,23 +1,41 @@
+from datetime import datetime, timedelta
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from app.auth import get_current_user, require_role
-from app.db import get_db
-from app.models.alert import AlertOut, AlertRuleCreate, AlertRuleOut, AlertUpdate
+from app.db import get_db, get_read_db
+from app.ip_utils import split_cidrs
+from app.models.alert import (
+    AlertBulkResult,
+    AlertBulkUpdate,
+    AlertOut,
+    AlertRuleCreate,
+    AlertRuleOut,
+    AlertRulePreview,
+    AlertRulePreviewRequest,
+    AlertStats,
+    AlertUpdate,
+)
 from app.models.db_models import AlertORM, AlertRuleORM, SecurityEventORM
 from app.models.user import UserOut
+from app.serialization import FastJSONResponse, rows_to_dicts
 from app.services.alert_service import (
+    ALERT_COLUMNS,
+    RULE_COLUMNS,
+    bulk_update_alerts,
     create_alert_rule,
     delete_alert_rule,
     get_alert_by_id,
-    get_alert_rules,
-    get_alerts,
+    get_alert_rows,
+    get_alert_rule_rows,
     get_alert_rule_by_id,
     update_alert,
     update_alert_rule,
 )
+from app.services.alert_stats import get_alert_stats
+from app.services.rule_preview import draft_rule, preview_rule
 
 router = APIRouter(prefix="/api/alerts", tags=["alerts"])
 
@@ -48,6 +66,9 @@ def _enrich_alert_with_event_data(db: Session, alert: AlertORM) -> dict:
         "notes": alert.notes,
         "created_at": alert.created_at,
         "resolved_at": alert.resolved_at,
+        "count": alert.count,
+        "first_seen": alert.first_seen,
+        "last_seen": alert.last_seen,
     }
 
 
@@ -58,11 +79,11 @@ def list_alerts(
     assigned_to: Optional[str] = Query(default=None),
     offset: int = Query(default=0, ge=0),
     limit: int = Query(default=50, ge=1, le=500),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: UserOut = Depends(get_current_user),
 ):
     """List alerts with pagination and filters. Requires authentication."""
-    alerts, total = get_alerts(
+    rows, total = get_alert_rows(
         db=db,
         status=status,
         rule_id=rule_id,
@@ -71,14 +92,62 @@ def list_alerts(
         limit=limit,
     )
 
-    items = [_enrich_alert_with_event_data(db, alert) for alert in alerts]
-
-    return {
-        "items": items,
+    return FastJSONResponse({
+        "items": rows_to_dicts(ALERT_COLUMNS, rows),
         "total": total,
         "offset": offset,
         "limit": limit,
-    }
+    })
+
+
+# /stats и /bulk объявлены до /{alert_id}, иначе попадут в маршрут с alert_id
+@router.get("/stats", response_model=AlertStats)
+def alert_stats(
+    since_days: int = Query(default=30, ge=1, le=365, description="Period for MTTR/MTTA, by alert created_at"),
+    db: Session = Depends(get_read_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Alert counts per status, rule and assignee (from maintained counters, not a
+    scan of alerts) and per-rule MTTR/MTTA. Requires authentication.
+    """
+    return get_alert_stats(db, since=datetime.utcnow() - timedelta(days=since_days))
+
+
+@router.patch("/bulk", response_model=AlertBulkResult)
+def bulk_update_alerts_endpoint(
+    update: AlertBulkUpdate,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(require_role("analyst", "admin")),
+):
+    """
+    Update many alerts at once, selected by IDs and/or filter (status, rule_id,
+    created_at range). Requires analyst or admin role.
+    """
+    flt = update.filter
+    has_filter = flt is not None and any(
+        value is not None for value in (flt.status, flt.rule_id, flt.created_from, flt.created_to)
+    )
+    if update.ids is None and not has_filter:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Either ids or a non-empty filter is required",
+        )
+    if update.status is None and update.assigned_to is None and update.notes is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Nothing to update")
+
+    updated = bulk_update_alerts(
+        db=db,
+        ids=update.ids,
+        filter_status=flt.status if flt else None,
+        filter_rule_id=flt.rule_id if flt else None,
+        created_from=flt.created_from if flt else None,
+        created_to=flt.created_to if flt else None,
+        status=update.status,
+        assigned_to=update.assigned_to,
+        notes=update.notes,
+    )
+    return AlertBulkResult(updated=updated)
 
 
 @router.get("/{alert_id}", response_model=AlertOut)
@@ -87,8 +156,8 @@ def get_alert(
     db: Session = Depends(get_db),
     current_user: UserOut = Depends(get_current_user),
 ):
-    """Get a single alert by ID."""
-    alert = get_alert_by_id(db, alert_id)
+    """Get a single alert by ID (archived alerts included)."""
+    alert = get_alert_by_id(db, alert_id, include_archived=True)
     if not alert:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alert not found")
     return _enrich_alert_with_event_data(db, alert)
@@ -118,12 +187,16 @@ def update_alert_endpoint(
 @router.get("/rules/", response_model=List[AlertRuleOut])
 def list_alert_rules(
     is_active: Optional[bool] = Query(default=None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: UserOut = Depends(get_current_user),
 ):
     """List alert rules. Requires authentication."""
-    rules = get_alert_rules(db=db, is_active=is_active)
-    return rules
+    items = rows_to_dicts(RULE_COLUMNS, get_alert_rule_rows(db=db, is_active=is_active))
+    for item in items:
+        # В БД CIDR-списки хранятся строкой через запятую
+        item["src_cidrs"] = split_cidrs(item["src_cidrs"])
+        item["dst_cidrs"] = split_cidrs(item["dst_cidrs"])
+    return FastJSONResponse(items)
 
 
 @router.post("/rules/", response_model=AlertRuleOut, status_code=status.HTTP_201_CREATED)
@@ -142,10 +215,36 @@ def create_alert_rule_endpoint(
         source_filter=rule_in.source_filter,
         is_active=rule_in.is_active,
         created_by=current_user.username,
+        aggregation_window_seconds=rule_in.aggregation_window_seconds,
+        suppress_from=rule_in.suppress_from,
+        suppress_until=rule_in.suppress_until,
+        src_cidrs=rule_in.src_cidrs,
+        dst_cidrs=rule_in.dst_cidrs,
     )
     return rule
 
 
+@router.post("/rules/preview", response_model=AlertRulePreview)
+def preview_alert_rule(
+    draft: AlertRulePreviewRequest,
+    db: Session = Depends(get_read_db),
+    current_user: UserOut = Depends(require_role("analyst", "admin")),
+):
+    """
+    Dry run of a draft rule over the last ``window_hours``: estimated number of
+    matching events and sample matches, within RULE_PREVIEW_TIMEOUT_MS. Nothing
+    is saved. Requires analyst or admin role.
+    """
+    end = datetime.utcnow()
+    return preview_rule(
+        db,
+        draft_rule(draft),
+        start=end - timedelta(hours=draft.window_hours),
+        end=end,
+        sample_size=draft.sample_size,
+    )
+
+
 @router.get("/rules/{rule_id}", response_model=AlertRuleOut)
 def get_alert_rule(
     rule_id: int,
@@ -166,7 +265,11 @@ def update_alert_rule_endpoint(
     db: Session = Depends(get_db),
     current_user: UserOut = Depends(require_role("analyst", "admin")),
 ):
-    """Update an alert rule. Requires analyst or admin role."""
+    """
+    Update an alert rule. Requires analyst or admin role.
+    An explicit null for suppress_from/suppress_until removes that bound of
+    the suppression window; an omitted field is left as is.
+    """
     rule = update_alert_rule(
         db=db,
         rule_id=rule_id,
@@ -176,6 +279,16 @@ def update_alert_rule_endpoint(
         category_filter=rule_in.category_filter,
         source_filter=rule_in.source_filter,
         is_active=rule_in.is_active,
+        aggregation_window_seconds=rule_in.aggregation_window_seconds,
+        suppress_from=rule_in.suppress_from,
+        suppress_until=rule_in.suppress_until,
+        src_cidrs=rule_in.src_cidrs,
+        dst_cidrs=rule_in.dst_cidrs,
+        clear_fields=[
+            field
+            for field in ("suppress_from", "suppress_until")
+            if field in rule_in.model_fields_set and getattr(rule_in, field) is None
+        ],
     )
     if not rule:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alert rule not found")
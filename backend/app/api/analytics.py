@@ -0,0 +1,79 @@
+"""Analytical (threat-hunting) aggregate queries over long time ranges."""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from app.auth import get_current_user, require_role
+from app.db import get_db, get_read_db
+from app.models.user import UserOut
+from app.services.analytics_service import (
+    GROUP_BY_FIELDS,
+    aggregate_events,
+    columnar_boundary,
+    export_closed_partitions,
+    is_available,
+)
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+
+@router.get("/events")
+def events_aggregate(
+    group_by: str = Query(default="source", description=f"One of: {', '.join(GROUP_BY_FIELDS)}"),
+    start: Optional[datetime] = Query(default=None, description="Range start (default: 90 days ago)"),
+    end: Optional[datetime] = Query(default=None, description="Range end, exclusive (default: now)"),
+    severity: Optional[str] = Query(default=None),
+    category: Optional[str] = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=1000),
+    db: Session = Depends(get_read_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Top keys by event count over a time range, e.g. top sources by high-severity
+    count over 90 days. Closed partitions are read from the columnar store.
+    """
+    if group_by not in GROUP_BY_FIELDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"group_by must be one of: {', '.join(GROUP_BY_FIELDS)}",
+        )
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=90)
+
+    items, plan = aggregate_events(
+        db=db,
+        group_by=group_by,
+        start=start,
+        end=end,
+        severity=severity,
+        category=category,
+        limit=limit,
+    )
+    return {"group_by": group_by, "items": items, "plan": plan}
+
+
+@router.get("/status")
+def analytics_status(current_user: UserOut = Depends(get_current_user)):
+    """Whether the columnar store is enabled and up to which timestamp it holds data."""
+    boundary = columnar_boundary()
+    return {
+        "enabled": is_available(),
+        "columnar_until": boundary.isoformat() if boundary else None,
+    }
+
+
+@router.post("/export")
+def analytics_export(
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(require_role("admin")),
+):
+    """Export closed partitions now instead of waiting for the periodic job. Requires admin role."""
+    if not is_available():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analytics store is disabled (set ANALYTICS_ENABLED=true and install duckdb, pyarrow)",
+        )
+    written = export_closed_partitions(db)
+    return {"exported": written}
@@ -0,0 +1,80 @@
+"""Admin diagnostics: request profiles, slow-query log and memory snapshots (PROFILING_ENABLED only)."""
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from app import profiling, response_cache
+from app.api import mitre
+from app.auth import require_role
+from app.models.user import UserOut
+from app.services import dedup_service, event_buffer, ioc_service
+
+router = APIRouter(prefix="/api/debug", tags=["debug"])
+
+profiling.memory_probes.update(
+    {
+        "mitre._cache": lambda: mitre._cache,
+        "response_cache": lambda: response_cache.backend,
+        "ioc_index": lambda: ioc_service.engine.index,
+        "dedup": lambda: dedup_service.deduplicator,
+        "event_buffer": lambda: event_buffer.buffer,
+    }
+)
+
+
+@router.get("/profiles")
+def list_profiles(current_user: UserOut = Depends(require_role("admin"))):
+    """Recent request profiles (request with ``X-Profile: 1`` or ``?profile=1`` to record one)."""
+    return [
+        {
+            "id": profile_id,
+            "method": report["method"],
+            "path": report["path"],
+            "status_code": report["status_code"],
+            "wall_ms": report["wall_ms"],
+            "sql_ms": report["sql"]["total_ms"],
+            "at": report["at"],
+        }
+        for profile_id, report in reversed(list(profiling.profiles.items()))
+    ]
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, current_user: UserOut = Depends(require_role("admin"))):
+    report = profiling.profiles.get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return report
+
+
+@router.get("/slow-queries")
+def slow_queries(
+    limit: int = Query(default=50, ge=1, le=1000),
+    current_user: UserOut = Depends(require_role("admin")),
+):
+    """SQL slower than SLOW_QUERY_MS, newest first; ``explain`` is filled on Postgres."""
+    return {"threshold_ms": profiling.SLOW_QUERY_MS, "items": list(reversed(profiling.slow_queries))[:limit]}
+
+
+@router.get("/memory")
+def memory_snapshot(
+    limit: int = Query(default=20, ge=1, le=200),
+    group_by: str = Query(default="lineno", pattern="^(lineno|filename|traceback)$"),
+    current_user: UserOut = Depends(require_role("admin")),
+):
+    """tracemalloc top allocations and growth since the previous call, plus deep sizes of caches."""
+    return profiling.memory_report(limit=limit, group_by=group_by)
+
+
+@router.post("/memory/start")
+def start_memory_tracing(
+    frames: int = Query(default=1, ge=1, le=50),
+    current_user: UserOut = Depends(require_role("admin")),
+):
+    """Start tracemalloc (slows allocations down until stopped)."""
+    profiling.start_tracing(frames)
+    return {"tracing": True}
+
+
+@router.post("/memory/stop")
+def stop_memory_tracing(current_user: UserOut = Depends(require_role("admin"))):
+    profiling.stop_tracing()
+    return {"tracing": False}
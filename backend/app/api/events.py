@@ -1,11 +1,15 @@
+from datetime import datetime
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.db import get_db
+from app.db import get_db, get_read_db
+from app.ip_utils import parse_network
 from app.models.security_event import EventsSummary, SecurityEvent
-from app.services.event_service import get_events, get_events_summary
+from app.serialization import FastJSONResponse, dumps, rows_to_dicts
+from app.services.event_service import EVENT_COLUMNS, get_event_rows, get_events_summary, iter_event_rows
 
 router = APIRouter(prefix="/api/events")
 
@@ -31,8 +35,35 @@ def get_api_key(x_api_key: str | None = Header(default=None)) -> None:
         )
 
 
+def network_filters(
+    src_ip: Optional[str] = Query(
+        default=None,
+        description="Source address or CIDR block, e.g. 10.0.0.0/8",
+    ),
+    dst_ip: Optional[str] = Query(
+        default=None,
+        description="Destination address or CIDR block",
+    ),
+    hostname: Optional[str] = Query(
+        default=None,
+        description="Exact hostname (case-insensitive)",
+    ),
+) -> dict:
+    """Shared src_ip/dst_ip/hostname filters; malformed CIDRs are rejected with 400."""
+    for name, value in (("src_ip", src_ip), ("dst_ip", dst_ip)):
+        if value:
+            try:
+                parse_network(value)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"{name} must be an IP address or CIDR block",
+                )
+    return {"src_ip": src_ip, "dst_ip": dst_ip, "hostname": hostname}
+
+
 @router.get("/", response_model=List[SecurityEvent], dependencies=[Depends(get_api_key)])
-async def list_events(
+def list_events(
     severity: Optional[str] = Query(
         default=None,
         description="Filter by severity (e.g. low, medium, high)",
@@ -56,17 +87,29 @@ async def list_events(
         le=500,
         description="Page size for pagination",
     ),
-    db: Session = Depends(get_db),
+    start: Optional[datetime] = Query(
+        default=None,
+        description="Only events at or after this time; older ranges include the cold tier",
+    ),
+    end: Optional[datetime] = Query(default=None, description="Only events before this time"),
+    network: dict = Depends(network_filters),
+    db: Session = Depends(get_read_db),
 ):
-    page, _total = get_events(
+    # Строки сериализуются напрямую, без SecurityEvent (response_model - только для OpenAPI);
+    # total здесь не нужен, поэтому и не считается
+    rows, _total = get_event_rows(
         db=db,
         severity=severity,
         category=category,
         source=source,
         offset=offset,
         limit=limit,
+        start=start,
+        end=end,
+        count=False,
+        **network,
     )
-    return page
+    return FastJSONResponse(rows_to_dicts(EVENT_COLUMNS, rows))
 
 
 @router.get(
@@ -74,31 +117,54 @@ async def list_events(
     response_model=dict,
     dependencies=[Depends(get_api_key)],
 )
-async def list_events_paged(
+def list_events_paged(
     severity: Optional[str] = Query(default=None),
     category: Optional[str] = Query(default=None),
     source: Optional[str] = Query(default=None),
     offset: int = Query(default=0, ge=0),
     limit: int = Query(default=50, ge=1, le=500),
-    db: Session = Depends(get_db),
+    start: Optional[datetime] = Query(default=None),
+    end: Optional[datetime] = Query(default=None),
+    network: dict = Depends(network_filters),
+    db: Session = Depends(get_read_db),
 ):
     """
     Same as /api/events/, but returns both items and total count for UI pagination.
     """
-    items, total = get_events(
+    rows, total = get_event_rows(
         db=db,
         severity=severity,
         category=category,
         source=source,
         offset=offset,
         limit=limit,
+        start=start,
+        end=end,
+        **network,
     )
-    return {
-        "items": items,
+    return FastJSONResponse({
+        "items": rows_to_dicts(EVENT_COLUMNS, rows),
         "total": total,
         "offset": offset,
         "limit": limit,
-    }
+    })
+
+
+@router.get("/export", dependencies=[Depends(get_api_key)])
+def export_events(
+    severity: Optional[str] = Query(default=None),
+    category: Optional[str] = Query(default=None),
+    source: Optional[str] = Query(default=None),
+    network: dict = Depends(network_filters),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Export all matching events as NDJSON (one event per line), newest first.
+    Streamed in chunks, so memory use does not grow with the result size.
+    """
+    rows = iter_event_rows(db=db, severity=severity, category=category, source=source, **network)
+    lines = (dumps(dict(zip(EVENT_COLUMNS, row))) + b"\n" for row in rows)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
 
 @router.get(
@@ -106,40 +172,38 @@ async def list_events_paged(
     response_model=EventsSummary,
     dependencies=[Depends(get_api_key)],
 )
-async def events_summary(
+def events_summary(
     severity: Optional[str] = Query(default=None),
     category: Optional[str] = Query(default=None),
     source: Optional[str] = Query(default=None),
-    db: Session = Depends(get_db),
+    network: dict = Depends(network_filters),
+    db: Session = Depends(get_read_db),
 ):
     """
     Aggregated statistics for dashboard widgets (counts, last event timestamp).
     """
-    return get_events_summary(db=db, severity=severity, category=category, source=source)
+    return get_events_summary(db=db, severity=severity, category=category, source=source, **network)
 
 
-@router.post("/evaluate-all", status_code=status.HTTP_200_OK)
-async def evaluate_all_events(
+@router.post("/evaluate-all", status_code=status.HTTP_202_ACCEPTED)
+def evaluate_all_events(
+    resume_run_id: Optional[int] = Query(default=None, description="continue an interrupted backfill run"),
     db: Session = Depends(get_db),
     dependencies=[Depends(get_api_key)],
 ):
     """
     Manually trigger evaluation of all existing events against alert rules.
     Useful for creating alerts retroactively after rules are added.
+    Queues a backfill job (see app.services.backfill and job_queue) and
+    returns at once; poll GET /api/jobs/{job_id} for progress. While a
+    backfill with the same parameters is queued or running, that job is returned.
     """
-    from app.models.db_models import SecurityEventORM
-    from app.services.alert_service import create_alerts_for_event, evaluate_event_against_rules
-
-    events = db.query(SecurityEventORM).all()
-    total_alerts_created = 0
-
-    for event in events:
-        matched_rule_ids = evaluate_event_against_rules(db, event)
-        if matched_rule_ids:
-            created = create_alerts_for_event(db, event, matched_rule_ids)
-            total_alerts_created += created
+    from app.services import job_queue
 
+    params = {"resume_run_id": resume_run_id} if resume_run_id is not None else {}
+    job = job_queue.submit(db, "backfill", params, dedupe=True)
     return {
-        "message": f"Evaluated {len(events)} events",
-        "alerts_created": total_alerts_created,
+        "message": "Rule backfill queued",
+        "job_id": job.id,
+        "status": job.status,
     }
@@ -0,0 +1,30 @@
+"""Status of the network ingestion listeners, duplicate suppression and the recent-events buffer."""
+from fastapi import APIRouter, Depends
+
+from app.auth import require_role
+from app.models.user import UserOut
+from app.services import dedup_service, event_buffer, syslog_listener
+
+router = APIRouter(prefix="/api/ingest", tags=["ingest"])
+
+
+@router.get("/stats")
+def ingest_stats(current_user: UserOut = Depends(require_role("admin"))):
+    """
+    Syslog/CEF listener counters: received, dropped, written and parse errors per source host;
+    dedup: duplicate ratio and memory of the dedup window and bloom filter;
+    event_buffer: size and hit/miss/reload counters of the recent-events buffer.
+    """
+    dedup = dedup_service.deduplicator.stats()
+    buffer = event_buffer.buffer.stats() if event_buffer.buffer is not None else None
+    listener = syslog_listener.listener
+    if listener is None:
+        return {"enabled": False, "dedup": dedup, "event_buffer": buffer}
+    return {
+        "enabled": True,
+        "udp": listener.udp_address,
+        "tcp": listener.tcp_address,
+        **listener.snapshot(),
+        "dedup": dedup,
+        "event_buffer": buffer,
+    }
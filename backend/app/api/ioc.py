@@ -0,0 +1,22 @@
+"""Threat-intel IOC feeds: index status and manual reload."""
+from fastapi import APIRouter, Depends
+from starlette.concurrency import run_in_threadpool
+
+from app.auth import get_current_user, require_role
+from app.models.user import UserOut
+from app.services import ioc_service
+
+router = APIRouter(prefix="/api/ioc", tags=["ioc"])
+
+
+@router.get("/status")
+def ioc_status(current_user: UserOut = Depends(get_current_user)):
+    """Loaded feeds, indicator counts, index memory footprint and match throughput."""
+    return ioc_service.engine.status()
+
+
+@router.post("/reload")
+async def ioc_reload(current_user: UserOut = Depends(require_role("admin"))):
+    """Rebuild the index from the feed files; matching continues on the old index meanwhile."""
+    reloaded = await run_in_threadpool(ioc_service.engine.reload, True)
+    return {"reloaded": reloaded, **ioc_service.engine.status()}
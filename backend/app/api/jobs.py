@@ -0,0 +1,73 @@
+"""Background jobs: submission, status polling and cancellation (see app.services.job_queue)."""
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from app.auth import get_current_user, require_role
+from app.db import get_db
+from app.models.job import JobCreate, JobOut
+from app.models.user import UserOut
+from app.services import job_queue
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+
+@router.post("/", response_model=JobOut, status_code=status.HTTP_202_ACCEPTED)
+def submit_job(
+    job_in: JobCreate,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(require_role("admin")),
+):
+    """Queue a maintenance job and return it at once; poll GET /api/jobs/{id} for progress. Admin only."""
+    try:
+        return job_queue.submit(db, job_in.type, job_in.params, created_by=current_user.username)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+
+@router.get("/", response_model=List[JobOut])
+def list_jobs(
+    status: Optional[str] = Query(default=None, description="queued, running, succeeded, failed, cancelled"),
+    type: Optional[str] = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """Recent jobs, newest first. Requires authentication."""
+    return job_queue.list_jobs(db, status=status, type=type, limit=limit)
+
+
+@router.get("/types")
+def job_types(current_user: UserOut = Depends(get_current_user)):
+    """Registered job types with their concurrency limit and attempts."""
+    return [
+        {"type": spec.name, "concurrency": spec.concurrency, "max_attempts": spec.max_attempts}
+        for spec in job_queue.JOB_TYPES.values()
+    ]
+
+
+@router.get("/{job_id}", response_model=JobOut)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """Status, progress and result of a job. Requires authentication."""
+    job = job_queue.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.post("/{job_id}/cancel", response_model=JobOut)
+def cancel_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(require_role("admin")),
+):
+    """Cancel a queued job, or ask a running one to stop at its next progress report. Admin only."""
+    job = job_queue.cancel(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
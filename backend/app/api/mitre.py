@@ -1,9 +1,17 @@
 """MITRE ATT&CK API integration."""
 import logging
-from typing import Dict, List, Any
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
 import httpx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.auth import get_current_user, require_role
+from app.db import get_db, get_read_db
+from app.models.user import UserOut
+from app.services import mitre_mapping
+from app.time_utils import as_naive_utc
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/mitre", tags=["mitre"])
@@ -33,6 +41,18 @@ class Tactic(BaseModel):
     techniques: List[Technique]
 
 
+class TechniqueCounts(BaseModel):
+    """Events tagged with a technique and alerts raised on them."""
+    events: int
+    alerts: int
+
+
+class TechniqueHeatmap(BaseModel):
+    start: datetime
+    end: datetime
+    techniques: Dict[str, TechniqueCounts]  # external_id -> counts
+
+
 async def fetch_mitre_data() -> Dict[str, Any]:
     """
     Получает данные MITRE ATT&CK из официального GitHub репозитория.
@@ -185,3 +205,45 @@ async def clear_cache() -> Dict[str, str]:
     _cache.clear()
     logger.info("MITRE ATT&CK cache cleared")
     return {"status": "success", "message": "Cache cleared"}
+
+
+@router.get("/heatmap", response_model=TechniqueHeatmap)
+def get_heatmap(
+    start: Optional[datetime] = Query(default=None, description="Window start (default: end - 24h)"),
+    end: Optional[datetime] = Query(default=None, description="Window end (default: now)"),
+    db: Session = Depends(get_read_db),
+    current_user: UserOut = Depends(get_current_user),
+) -> TechniqueHeatmap:
+    """
+    Количество событий и алертов по техникам ATT&CK за окно (по времени события)
+    для раскраски матрицы. Техники без событий в ответ не попадают.
+    """
+    end = as_naive_utc(end) if end else datetime.utcnow()
+    start = as_naive_utc(start) if start else end - timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return TechniqueHeatmap(start=start, end=end, techniques=mitre_mapping.technique_heatmap(db, start, end))
+
+
+@router.post("/retag", status_code=status.HTTP_202_ACCEPTED)
+def retag_events(
+    start: Optional[datetime] = Query(default=None),
+    end: Optional[datetime] = Query(default=None),
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(require_role("admin")),
+) -> Dict[str, Any]:
+    """
+    Пересчитывает теги техник сохранённых событий за период по текущему файлу
+    сопоставлений (после его изменения). Только для администраторов.
+    Ставит задачу retag_techniques в очередь (см. job_queue) и сразу отвечает;
+    прогресс - GET /api/jobs/{job_id}.
+    """
+    from app.services import job_queue
+
+    params = {}
+    if start:
+        params["start"] = as_naive_utc(start).isoformat()
+    if end:
+        params["end"] = as_naive_utc(end).isoformat()
+    job = job_queue.submit(db, "retag_techniques", params, created_by=current_user.username, dedupe=True)
+    return {"message": "Technique re-tagging queued", "job_id": job.id, "status": job.status}
@@ -0,0 +1,43 @@
+"""
+Bloom filter over 64-bit fingerprints, shared by the IOC index and ingest dedup.
+
+Callers hash their keys once (e.g. blake2b with digest_size=8); the k bit
+positions are derived from that fingerprint by double hashing, so no extra
+hash functions run per lookup.
+"""
+import math
+
+
+class BloomFilter:
+    """Bit array sized for ``capacity`` items at the given false positive rate."""
+
+    __slots__ = ("bits", "size", "hashes", "count")
+
+    def __init__(self, capacity: int, false_positive_rate: float) -> None:
+        capacity = max(capacity, 1)
+        size = int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)) or 8
+        self.size = size
+        self.hashes = max(1, round(size / capacity * math.log(2)))
+        self.bits = bytearray((size + 7) // 8)
+        self.count = 0
+
+    def add(self, fp: int) -> None:
+        bits, size = self.bits, self.size
+        h1, h2 = fp & 0xFFFFFFFF, (fp >> 32) | 1
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % size
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, fp: int) -> bool:
+        bits, size = self.bits, self.size
+        h1, h2 = fp & 0xFFFFFFFF, (fp >> 32) | 1
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def false_positive_rate(self) -> float:
+        """Expected false positive rate at the current number of added items."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
@@ -0,0 +1,152 @@
+"""
+IP address helpers shared by the event model, event filters and alert rules.
+
+Postgres stores addresses in ``inet`` columns (GiST-indexed, CIDR containment
+with ``<<=``). Other databases store the text address plus a sortable key:
+the address as a 128-bit integer (IPv4 mapped into ::ffff:0:0/96) packed into
+32 hex digits. A CIDR block is then a contiguous key range, i.e. a B-tree
+range scan (SQLite integers are 64-bit, so a fixed-width hex string is used
+instead of a number).
+"""
+import ipaddress
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import String
+from sqlalchemy.dialects.postgresql import INET
+from sqlalchemy.types import TypeDecorator
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+_V4_MAPPED = 0xFFFF << 32
+
+
+def normalize_ip(value) -> Optional[str]:
+    """Canonical text form of an address, or None if it is empty or invalid."""
+    if not value:
+        return None
+    try:
+        return str(ipaddress.ip_address(str(value).strip()))
+    except ValueError:
+        return None
+
+
+def parse_network(value: str) -> IPNetwork:
+    """'10.0.0.0/8', '10.1.2.3' (single host) or IPv6 equivalents. Raises ValueError."""
+    return ipaddress.ip_network(value.strip(), strict=False)
+
+
+def _packed(number: int, version: int) -> str:
+    return f"{(_V4_MAPPED | number) if version == 4 else number:032x}"
+
+
+def ip_key(value) -> Optional[str]:
+    """Sortable key of an address (see module docstring)."""
+    if not value:
+        return None
+    try:
+        address = ipaddress.ip_address(str(value).strip())
+    except ValueError:
+        return None
+    return _packed(int(address), address.version)
+
+
+def network_key_range(network: IPNetwork) -> Tuple[str, str]:
+    """Inclusive [low, high] key range covered by a network."""
+    return (
+        _packed(int(network.network_address), network.version),
+        _packed(int(network.broadcast_address), network.version),
+    )
+
+
+def ip_key_default(column: str):
+    """Column default computing the key from the address column of the same row."""
+
+    def default(context) -> Optional[str]:
+        return ip_key(context.get_current_parameters().get(column))
+
+    return default
+
+
+class IPAddressType(TypeDecorator):
+    """``inet`` on Postgres, text elsewhere. Values are plain strings."""
+
+    impl = String(45)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(INET())
+        return dialect.type_descriptor(String(45))
+
+
+class IPRadixTrie:
+    """
+    Binary (radix-2) trie of CIDR prefixes mapping to sets of values.
+    lookup() walks at most 32/128 bits and returns values of every prefix
+    that contains the address, independent of the number of prefixes.
+    """
+
+    __slots__ = ("_roots", "_size")
+
+    def __init__(self) -> None:
+        # Узел: [потомок по биту 0, потомок по биту 1, значения или None]
+        self._roots: Dict[int, list] = {4: [None, None, None], 6: [None, None, None]}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def insert(self, network: Union[str, IPNetwork], value) -> None:
+        if isinstance(network, str):
+            network = parse_network(network)
+        bits = network.max_prefixlen
+        number = int(network.network_address)
+        node = self._roots[network.version]
+        for i in range(network.prefixlen):
+            bit = (number >> (bits - 1 - i)) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, None]
+            node = child
+        if node[2] is None:
+            node[2] = set()
+        node[2].add(value)
+        self._size += 1
+
+    def lookup(self, address) -> Set:
+        """Values of all prefixes containing ``address``; empty for None/invalid input."""
+        if not address:
+            return set()
+        try:
+            parsed = ipaddress.ip_address(str(address))
+        except ValueError:
+            return set()
+        if parsed.version == 6 and parsed.ipv4_mapped is not None:
+            parsed = parsed.ipv4_mapped
+        bits = parsed.max_prefixlen
+        number = int(parsed)
+        node = self._roots[parsed.version]
+        found: Set = set()
+        i = 0
+        while node is not None:
+            if node[2]:
+                found |= node[2]
+            if i == bits:
+                break
+            node = node[(number >> (bits - 1 - i)) & 1]
+            i += 1
+        return found
+
+
+def split_cidrs(value: Optional[str]) -> List[str]:
+    """Comma-separated CIDR list as stored on alert rules."""
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def join_cidrs(values: Optional[Iterable[str]]) -> Optional[str]:
+    """Validate and normalize CIDRs for storage; raises ValueError on a bad entry."""
+    if not values:
+        return None
+    return ",".join(str(parse_network(value)) for value in values) or None
@@ -1,17 +1,26 @@
+import asyncio
 import logging
 import os
+from datetime import datetime, timedelta, timezone
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
-from app.api import alerts, auth, events, mitre
-from app.db import Base, engine, SessionLocal
-from app.models.db_models import AlertORM, AlertRuleORM, SecurityEventORM, UserORM  # noqa: F401 - импорты для создания таблиц
-from app.repositories.event_repo import seed_events_from_file
+from app import admission, profiling
+from app.api import admission as admission_api
+from app.api import alerts, analytics, auth, events, ingest, ioc, jobs, mitre
+from app.db import Base, QueryCancellationMiddleware, QueryCancelled, StatementTimeout, engine, read_engine, SessionLocal, mark_read_primary
+from app.migrations import upgrade_schema
+from app.models.db_models import AlertArchiveORM, AlertCounterORM, AlertORM, AlertRuleORM, BackfillRangeORM, BackfillRunORM, EventTechniqueORM, JobORM, SecurityEventORM, UserORM  # noqa: F401 - импорты для создания таблиц
 from app.repositories.user_repo import seed_default_users
+from app.response_cache import RESPONSE_CACHE_ENABLED, ResponseCacheMiddleware
+from app.serialization import CompressionMiddleware
+from app.services import alert_archive, alert_stats, analytics_service, cold_storage, event_buffer, ioc_service, job_queue, syslog_listener
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,6 +33,19 @@ limiter = Limiter(key_func=get_remote_address)
 
 app = FastAPI(title="Cybersecurity Monitoring API")
 
+# Admission control is the innermost middleware: cache hits are answered without taking a slot,
+# and shed responses still get CORS headers
+if admission.ADMISSION_ENABLED:
+    app.add_middleware(admission.AdmissionMiddleware)
+
+# Response cache is added before CORS so that CORS headers are computed per request,
+# not stored in cached entries
+if RESPONSE_CACHE_ENABLED:
+    app.add_middleware(ResponseCacheMiddleware)
+
+# zstd/br/gzip by Accept-Encoding; wraps the cache so cached bodies are compressed per client
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
 # CORS configuration
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
 app.add_middleware(
@@ -34,6 +56,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+async def read_your_writes(request: Request, call_next):
+    """After a successful write the client reads from the primary for a while."""
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        mark_read_primary(response)
+    return response
+
+
+if read_engine is not engine:
+    app.middleware("http")(read_your_writes)
+
+# Statement timeouts per path and cancellation of running SQL when the client disconnects;
+# it reads the ASGI receive channel itself, so a disconnect is seen while the endpoint waits on SQL
+app.add_middleware(QueryCancellationMiddleware)
+
+
+@app.exception_handler(StatementTimeout)
+async def statement_timeout_handler(request: Request, exc: StatementTimeout) -> JSONResponse:
+    return JSONResponse(status_code=504, content={"detail": f"Database query timed out: {exc}"})
+
+
+@app.exception_handler(QueryCancelled)
+async def query_cancelled_handler(request: Request, exc: QueryCancelled) -> JSONResponse:
+    # Клиент уже ушёл - ответ никто не прочитает, код 499 только для логов
+    return JSONResponse(status_code=499, content={"detail": "Client closed request"})
+
 # Rate limiting
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
@@ -42,14 +91,31 @@ app.include_router(auth.router)
 app.include_router(events.router)
 app.include_router(alerts.router)
 app.include_router(mitre.router)
+app.include_router(analytics.router)
+app.include_router(ingest.router)
+app.include_router(ioc.router)
+app.include_router(jobs.router)
+app.include_router(admission_api.router)
+
+# Диагностика для админов; выключенная не добавляет ни middleware, ни слушателей SQL
+if profiling.PROFILING_ENABLED:
+    from app.api import debug
+
+    app.add_middleware(profiling.ProfilingMiddleware)
+    profiling.install_query_logging(engine, read_engine)
+    if profiling.TRACEMALLOC_FRAMES > 0:
+        profiling.start_tracing(profiling.TRACEMALLOC_FRAMES)
+    app.include_router(debug.router)
 
 
 @app.on_event("startup")
 async def on_startup() -> None:
     logger.info("Cybersecurity Monitoring API starting up")
 
-    # Create tables if they do not exist yet
+    # Create tables if they do not exist yet, then add columns/indexes that
+    # older databases lack (create_all never alters existing tables)
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
 
     # Seed default users (one-off on empty table)
     db = SessionLocal()
@@ -60,18 +126,143 @@ async def on_startup() -> None:
     finally:
         db.close()
 
-    # Seed initial events from JSON into DB (one-off on empty table)
+    # Начальные события из JSON (один раз, в пустую таблицу) импортирует фоновая задача,
+    # старт API её не ждёт
     db = SessionLocal()
     try:
-        inserted = seed_events_from_file(db)
-        if inserted:
-            logger.info("Seeded %d events into database", inserted)
+        if db.query(SecurityEventORM.id).first() is None:
+            job_queue.submit(db, "seed_events", dedupe=True)
     finally:
         db.close()
 
+    # Первый проход заполняет alert_counters для уже существующих алертов
+    asyncio.create_task(_alert_counters_reconcile_loop())
+
+    if analytics_service.is_available():
+        asyncio.create_task(_analytics_export_loop())
+
+    if cold_storage.is_available():
+        asyncio.create_task(_cold_tiering_loop())
+
+    if alert_archive.is_enabled():
+        asyncio.create_task(_alert_archive_loop())
+
+    # IOC index грузится до приёма событий, дальше перечитывается при изменении фидов
+    if ioc_service.IOC_ENABLED:
+        await run_in_threadpool(ioc_service.engine.reload)
+        asyncio.create_task(_ioc_reload_loop())
+
+    # Буфер свежих событий прогревается до приёма, дальше пополняется при ingest
+    if event_buffer.EVENT_BUFFER_ENABLED:
+        event_buffer.buffer = event_buffer.EventBuffer(SessionLocal)
+        await run_in_threadpool(event_buffer.buffer.reload)
+
+    if syslog_listener.SYSLOG_ENABLED:
+        syslog_listener.listener = syslog_listener.SyslogListener(SessionLocal)
+        await syslog_listener.listener.start()
+
+    # Воркеры очереди задач в процессе API; отдельные процессы: python -m app.services.job_queue
+    for _ in range(job_queue.JOB_WORKERS):
+        worker = job_queue.JobWorker(SessionLocal)
+        worker.start()
+        job_queue.workers.append(worker)
+
     logger.info("Cybersecurity Monitoring API started")
 
 
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    if syslog_listener.listener is not None:
+        await syslog_listener.listener.stop()
+        syslog_listener.listener = None
+    for worker in job_queue.workers:
+        worker.stop(timeout=0)
+    job_queue.workers.clear()
+
+
+async def _alert_counters_reconcile_loop() -> None:
+    """Periodically correct alert counters that drifted from the alerts table."""
+
+    def _reconcile() -> None:
+        db = SessionLocal()
+        try:
+            alert_stats.reconcile_alert_counters(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            await run_in_threadpool(_reconcile)
+        except Exception:
+            logger.exception("Alert counters reconciliation failed")
+        await asyncio.sleep(alert_stats.ALERT_STATS_RECONCILE_INTERVAL_SECONDS)
+
+
+async def _analytics_export_loop() -> None:
+    """Periodically export closed event partitions to the columnar store."""
+
+    def _export() -> None:
+        db = SessionLocal()
+        try:
+            analytics_service.export_closed_partitions(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            await run_in_threadpool(_export)
+        except Exception:
+            logger.exception("Analytics export failed")
+        await asyncio.sleep(analytics_service.ANALYTICS_EXPORT_INTERVAL_SECONDS)
+
+
+async def _cold_tiering_loop() -> None:
+    """Periodically move events older than COLD_AFTER_DAYS to cold segments."""
+
+    def _tier() -> None:
+        db = SessionLocal()
+        try:
+            cold_storage.run_tiering(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            await run_in_threadpool(_tier)
+        except Exception:
+            logger.exception("Cold storage tiering failed")
+        await asyncio.sleep(cold_storage.COLD_TIERING_INTERVAL_SECONDS)
+
+
+async def _alert_archive_loop() -> None:
+    """Periodically move alerts closed more than ALERT_ARCHIVE_AFTER_DAYS ago to alerts_archive."""
+
+    def _archive() -> None:
+        db = SessionLocal()
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=alert_archive.ALERT_ARCHIVE_AFTER_DAYS)
+            alert_archive.archive_resolved_alerts(db, cutoff)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            await run_in_threadpool(_archive)
+        except Exception:
+            logger.exception("Alert archival failed")
+        await asyncio.sleep(alert_archive.ALERT_ARCHIVE_INTERVAL_SECONDS)
+
+
+async def _ioc_reload_loop() -> None:
+    """Rebuild the IOC index when feed files change; ingestion keeps using the old one meanwhile."""
+    while True:
+        await asyncio.sleep(ioc_service.IOC_RELOAD_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(ioc_service.engine.reload)
+        except Exception:
+            logger.exception("IOC reload failed")
+
+
 @app.get("/api/health")
 async def health() -> dict:
     return {"status": "ok"}
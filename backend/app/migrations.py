@@ -0,0 +1,173 @@
+"""
+Idempotent in-place upgrades of existing databases.
+
+Base.metadata.create_all creates missing tables but never alters a table
+that already exists, and deployments keep the database across upgrades
+(the db_data volume). upgrade_schema(), run at startup right after
+create_all, brings older tables up to the models:
+
+- columns listed in ADDED_COLUMNS are added when missing; the DDL is
+  compiled from the model column, so types and server defaults match what
+  create_all produces (a column added here must be nullable or have a
+  server_default). A unique=True column gets a unique index;
+- indexes listed in DROPPED_INDEXES are dropped when present;
+- on SQLite, a table declared with sqlite_autoincrement but created
+  without AUTOINCREMENT is rebuilt (rename, create, copy rows), since the
+  keyword cannot be added in place; the sequence starts after the highest
+  id already used, including ids kept in alerts_archive;
+- every index declared on the models is created when missing, with the
+  same dialect conditions (ddl_if, postgresql_where) as in create_all;
+  an index on a column the table lacks is skipped with a warning.
+
+On a current database every step is a no-op. On Postgres the upgrade is one
+transaction under an advisory lock, so workers starting together do not
+race. Indexes are built without CONCURRENTLY: the first start after an
+upgrade of a large database holds table locks while they are built.
+"""
+import logging
+import zlib
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+
+from app.db import Base
+
+logger = logging.getLogger(__name__)
+
+# Колонки, добавленные в уже выпущенные таблицы (в порядке изменений)
+ADDED_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    # Агрегация и окна подавления алертов; CIDR-условия правил; IOC-правила
+    "alert_rules": ("aggregation_window_seconds", "suppress_from", "suppress_until", "src_cidrs", "dst_cidrs", "rule_type"),
+    "alerts": ("group_key", "count", "first_seen", "last_seen", "acknowledged_at"),
+    # Сетевые поля событий; дедупликация при приёме
+    "security_events": ("src_ip", "dst_ip", "hostname", "src_ip_key", "dst_ip_key", "content_hash", "duplicate_count"),
+}
+
+# (table, index) - индексы, убранные из моделей
+DROPPED_INDEXES: Tuple[Tuple[str, str], ...] = (
+    # Заменены частичными индексами по активной очереди
+    ("alerts", "ix_alerts_status_created"),
+    ("alerts", "ix_alerts_rule_group_status"),
+)
+
+# Таблицы, хранящие ids, выданные таблице с sqlite_autoincrement: {table: (tables, ...)}
+_SHARED_IDS: Dict[str, Tuple[str, ...]] = {"alerts": ("alerts_archive",)}
+
+_LOCK_KEY = zlib.crc32(b"schema_upgrade")
+
+
+def upgrade_schema(engine: Engine) -> List[str]:
+    """Add missing columns and indexes, drop removed indexes; returns the DDL statements run."""
+    import app.models.db_models  # noqa: F401 - модели регистрируются в Base.metadata
+
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(select(func.pg_advisory_xact_lock(_LOCK_KEY)))
+        applied = _add_columns(conn) + _drop_indexes(conn) + _rebuild_autoincrement(conn) + _create_indexes(conn)
+    for statement in applied:
+        logger.info("Schema upgrade: %s", statement)
+    return applied
+
+
+def _add_columns(conn: Connection) -> List[str]:
+    inspector = inspect(conn)
+    applied = []
+    for table_name, names in ADDED_COLUMNS.items():
+        if not inspector.has_table(table_name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table_name)}
+        table = Base.metadata.tables[table_name]
+        for name in names:
+            if name in existing:
+                continue
+            column = table.c[name]
+            statements = [f"ALTER TABLE {table_name} ADD COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}"]
+            if column.unique:
+                # ADD COLUMN ... UNIQUE не поддерживается SQLite; уникальный индекс равнозначен
+                statements.append(f"CREATE UNIQUE INDEX uq_{table_name}_{name} ON {table_name} ({name})")
+            for statement in statements:
+                conn.execute(text(statement))
+            applied.extend(statements)
+    return applied
+
+
+def _drop_indexes(conn: Connection) -> List[str]:
+    inspector = inspect(conn)
+    applied = []
+    for table_name, index_name in DROPPED_INDEXES:
+        if not inspector.has_table(table_name):
+            continue
+        if index_name in {index["name"] for index in inspector.get_indexes(table_name)}:
+            statement = f"DROP INDEX {index_name}"
+            conn.execute(text(statement))
+            applied.append(statement)
+    return applied
+
+
+def _rebuild_autoincrement(conn: Connection) -> List[str]:
+    if conn.dialect.name != "sqlite":
+        return []
+    inspector = inspect(conn)
+    applied = []
+    for table in Base.metadata.sorted_tables:
+        if not table.dialect_options["sqlite"]["autoincrement"] or not inspector.has_table(table.name):
+            continue
+        ddl = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+        ).scalar()
+        if "AUTOINCREMENT" in ddl.upper():
+            continue
+        # Имена индексов в SQLite глобальны: старые индексы мешают create() новой таблицы
+        old_name = f"{table.name}_before_upgrade"
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        names = ", ".join(column.name for column in table.columns if column.name in existing)
+        statements = [
+            f"DROP INDEX {index['name']}" for index in inspector.get_indexes(table.name) if index["name"]
+        ]
+        statements.append(f"ALTER TABLE {table.name} RENAME TO {old_name}")
+        for statement in statements:
+            conn.execute(text(statement))
+        table.create(conn)
+        statements.append(f"CREATE TABLE {table.name} (AUTOINCREMENT)")
+        copy = [
+            f"INSERT INTO {table.name} ({names}) SELECT {names} FROM {old_name}",
+            f"DROP TABLE {old_name}",
+        ]
+        for statement in copy:
+            conn.execute(text(statement))
+        statements.extend(copy)
+        used = [f"SELECT MAX(id) AS id FROM {table.name}"]
+        used += [f"SELECT MAX(id) FROM {name}" for name in _SHARED_IDS.get(table.name, ()) if inspector.has_table(name)]
+        last_id = conn.execute(text(f"SELECT MAX(id) FROM ({' UNION ALL '.join(used)})")).scalar()
+        if last_id is not None:
+            # Строки в sqlite_sequence может не быть (пустая таблица); DELETE + INSERT покрывает оба случая
+            params = {"name": table.name, "seq": last_id}
+            conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), params)
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), params)
+            statements.append(f"UPDATE sqlite_sequence SET seq = {last_id} WHERE name = '{table.name}'")
+        applied.extend(statements)
+    return applied
+
+
+def _create_indexes(conn: Connection) -> List[str]:
+    inspector = inspect(conn)
+    applied = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                continue
+            missing = {column.name for column in index.columns} - columns
+            if missing:
+                logger.warning("Schema upgrade: index %s skipped, %s lacks %s", index.name, table.name, sorted(missing))
+                continue
+            # Индексы с ddl_if другого диалекта create() пропускает; в отчёт попадают только созданные
+            index.create(conn, checkfirst=True)
+            if inspect(conn).has_index(table.name, index.name):
+                applied.append(f"CREATE INDEX {index.name} ON {table.name}")
+    return applied
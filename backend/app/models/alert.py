@@ -1,7 +1,10 @@
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
+
+from app.ip_utils import parse_network, split_cidrs
+from app.models.security_event import SecurityEvent
 
 
 class AlertRuleCreate(BaseModel):
@@ -11,6 +14,19 @@ class AlertRuleCreate(BaseModel):
     category_filter: Optional[str] = None
     source_filter: Optional[str] = None
     is_active: bool = True
+    aggregation_window_seconds: Optional[int] = Field(default=None, ge=0)
+    suppress_from: Optional[datetime] = None
+    suppress_until: Optional[datetime] = None
+    # Событие совпадает, если его src_ip/dst_ip входит в один из блоков
+    src_cidrs: Optional[List[str]] = Field(default=None, max_length=10000)
+    dst_cidrs: Optional[List[str]] = Field(default=None, max_length=10000)
+
+    @field_validator("src_cidrs", "dst_cidrs")
+    @classmethod
+    def _valid_cidrs(cls, value: Optional[List[str]]) -> Optional[List[str]]:
+        if value is None:
+            return None
+        return [str(parse_network(item)) for item in value]
 
 
 class AlertRuleOut(BaseModel):
@@ -23,6 +39,18 @@ class AlertRuleOut(BaseModel):
     is_active: bool
     created_by: Optional[str]
     created_at: datetime
+    aggregation_window_seconds: Optional[int] = None
+    suppress_from: Optional[datetime] = None
+    suppress_until: Optional[datetime] = None
+    src_cidrs: List[str] = []
+    dst_cidrs: List[str] = []
+    rule_type: str = "filter"
+
+    @field_validator("src_cidrs", "dst_cidrs", mode="before")
+    @classmethod
+    def _split_cidrs(cls, value):
+        # В БД хранится строка через запятую
+        return split_cidrs(value) if isinstance(value, str) or value is None else value
 
     class Config:
         from_attributes = True
@@ -43,6 +71,9 @@ class AlertOut(BaseModel):
     notes: Optional[str]
     created_at: datetime
     resolved_at: Optional[datetime]
+    count: int = 1
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -53,3 +84,66 @@ class AlertUpdate(BaseModel):
     assigned_to: Optional[str] = None
     notes: Optional[str] = None
 
+
+
+class AlertBulkFilter(BaseModel):
+    status: Optional[str] = None
+    rule_id: Optional[int] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+
+class AlertBulkUpdate(AlertUpdate):
+    """Target alerts either by explicit IDs or by filter (e.g. all open alerts of one rule)."""
+
+    ids: Optional[List[int]] = Field(default=None, max_length=10000)
+    filter: Optional[AlertBulkFilter] = None
+
+
+class AlertBulkResult(BaseModel):
+    updated: int
+
+
+class AlertRuleStats(BaseModel):
+    rule_id: int
+    rule_name: Optional[str]
+    total: int
+    by_status: Dict[str, int]
+    # MTTR/MTTA - по алертам, созданным в пределах периода AlertStats.since
+    resolved: int = 0
+    mttr_seconds: Optional[float] = None
+    acknowledged: int = 0
+    mtta_seconds: Optional[float] = None
+
+
+class AlertStats(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+    by_assignee: Dict[str, int]
+    unassigned: int
+    by_rule: List[AlertRuleStats]
+    since: datetime
+
+
+class AlertRulePreviewRequest(AlertRuleCreate):
+    """Draft rule to estimate before saving; name is not needed for a preview."""
+
+    name: str = ""
+    window_hours: int = Field(default=24, ge=1, le=24 * 90)
+    sample_size: int = Field(default=10, ge=0, le=100)
+
+
+class AlertRulePreview(BaseModel):
+    start: datetime
+    end: datetime
+    # index - точный подсчёт в SQL, scan - все кандидаты проверены правилом,
+    # sample - оценка по выборке кандидатов
+    method: str
+    matches: Optional[int]
+    exact: bool
+    # Кандидаты по индексируемым условиям: верхняя граница числа совпадений
+    upper_bound: Optional[int] = None
+    sampled: int = 0
+    samples: List[SecurityEvent] = []
+    timed_out: bool = False
+    elapsed_ms: float
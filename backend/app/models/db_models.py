@@ -1,9 +1,17 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text, Index
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String, Text, Index, text
 from sqlalchemy.orm import relationship
 
 from app.db import Base
+from app.ip_utils import IPAddressType, ip_key_default
+
+
+def _not_postgres(ddl, target, bind, **kw) -> bool:
+    return kw["dialect"].name != "postgresql"
+
+
+_ACTIVE_ALERTS = text("status IN ('open', 'investigating')")
 
 
 class SecurityEventORM(Base):
@@ -16,6 +24,16 @@ class SecurityEventORM(Base):
     severity = Column(String, index=True, nullable=False)
     description = Column(Text, nullable=False)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    src_ip = Column(IPAddressType, nullable=True)
+    dst_ip = Column(IPAddressType, nullable=True)
+    hostname = Column(String, nullable=True, index=True)
+    # Сортируемые ключи адресов для CIDR-фильтров по диапазону вне Postgres (см. app.ip_utils)
+    src_ip_key = Column(String(32), nullable=True, default=ip_key_default("src_ip"))
+    dst_ip_key = Column(String(32), nullable=True, default=ip_key_default("dst_ip"))
+    # Дедупликация при приёме (см. app.services.dedup_service): хэш содержимого и временного
+    # интервала (NULL при выключенной дедупликации) и число отброшенных повторов события
+    content_hash = Column(String(32), nullable=True, unique=True)
+    duplicate_count = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Relationships
     alerts = relationship("AlertORM", back_populates="event")
@@ -24,9 +42,30 @@ class SecurityEventORM(Base):
     __table_args__ = (
         Index('ix_events_severity_category', 'severity', 'category'),
         Index('ix_events_timestamp_severity', 'timestamp', 'severity'),
+        Index(
+            'ix_events_src_ip_gist', 'src_ip', postgresql_using='gist', postgresql_ops={'src_ip': 'inet_ops'}
+        ).ddl_if(dialect='postgresql'),
+        Index(
+            'ix_events_dst_ip_gist', 'dst_ip', postgresql_using='gist', postgresql_ops={'dst_ip': 'inet_ops'}
+        ).ddl_if(dialect='postgresql'),
+        Index('ix_events_src_ip_key', 'src_ip_key').ddl_if(callable_=_not_postgres),
+        Index('ix_events_dst_ip_key', 'dst_ip_key').ddl_if(callable_=_not_postgres),
     )
 
 
+class EventTechniqueORM(Base):
+    """ATT&CK technique tags of events (see app.services.mitre_mapping)."""
+
+    __tablename__ = "event_techniques"
+
+    event_id = Column(String, ForeignKey("security_events.id", ondelete="CASCADE"), primary_key=True)
+    technique = Column(String(16), primary_key=True)  # external_id, e.g. "T1110.003"
+    # Копия времени события: агрегация по окну идёт по одному индексу, без join с событиями
+    timestamp = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_event_techniques_timestamp_technique", "timestamp", "technique"),)
+
+
 class UserORM(Base):
     __tablename__ = "users"
 
@@ -47,9 +86,22 @@ class AlertRuleORM(Base):
     severity_filter = Column(String, nullable=True)  # e.g. "high", "critical"
     category_filter = Column(String, nullable=True)  # e.g. "network"
     source_filter = Column(String, nullable=True)  # substring match
+    # Comma-separated CIDR lists, e.g. "10.0.0.0/8,192.168.0.0/16"
+    src_cidrs = Column(Text, nullable=True)
+    dst_cidrs = Column(Text, nullable=True)
     is_active = Column(Boolean, default=True, nullable=False, index=True)
     created_by = Column(String, nullable=True)  # username
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    # filter - обычное правило по полям события; ioc - системное правило для совпадений
+    # с threat-intel индикаторами (по одному на тип), само по себе событий не сопоставляет
+    rule_type = Column(String, default="filter", server_default="filter", nullable=False)
+
+    # Aggregation: совпадения по одному правилу и источнику в пределах окна
+    # сворачиваются в один алерт (count/first_seen/last_seen). NULL - без группировки.
+    aggregation_window_seconds = Column(Integer, nullable=True)
+    # Suppression window: события с timestamp в [suppress_from, suppress_until] алертов не создают
+    suppress_from = Column(DateTime, nullable=True)
+    suppress_until = Column(DateTime, nullable=True)
 
     # Relationships
     alerts = relationship("AlertORM", back_populates="rule")
@@ -66,15 +118,142 @@ class AlertORM(Base):
     notes = Column(Text, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
     resolved_at = Column(DateTime, nullable=True)
+    # Первый уход из "open" или назначение на аналитика (для MTTA)
+    acknowledged_at = Column(DateTime, nullable=True)
+
+    # Aggregation (see AlertRuleORM.aggregation_window_seconds)
+    group_key = Column(String, nullable=True)  # event source for aggregated alerts
+    count = Column(Integer, default=1, server_default="1", nullable=False)
+    first_seen = Column(DateTime, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
 
     # Relationships
     rule = relationship("AlertRuleORM", back_populates="alerts")
     event = relationship("SecurityEventORM", back_populates="alerts")
 
-    # Composite indexes for common queries
+    # Composite indexes for common queries. Очередь разбора (open/investigating) покрыта
+    # частичными индексами: их размер не растёт с историей закрытых алертов
     __table_args__ = (
-        Index('ix_alerts_status_created', 'status', 'created_at'),
+        Index(
+            'ix_alerts_active_status_created', 'status', 'created_at',
+            postgresql_where=_ACTIVE_ALERTS, sqlite_where=_ACTIVE_ALERTS,
+        ),
+        Index(
+            'ix_alerts_active_assignee_created', 'assigned_to', 'created_at',
+            postgresql_where=_ACTIVE_ALERTS, sqlite_where=_ACTIVE_ALERTS,
+        ),
+        Index(
+            'ix_alerts_active_rule_group', 'rule_id', 'group_key', 'last_seen',
+            postgresql_where=_ACTIVE_ALERTS, sqlite_where=_ACTIVE_ALERTS,
+        ),
         Index('ix_alerts_rule_event', 'rule_id', 'event_id'),
+        # Без AUTOINCREMENT SQLite снова выдаёт id удалённых (архивированных) последних строк
+        {'sqlite_autoincrement': True},
     )
 
 
+class AlertArchiveORM(Base):
+    """
+    Resolved and false-positive alerts moved out of ``alerts`` after
+    ALERT_ARCHIVE_AFTER_DAYS (see app.services.alert_archive); ids are kept.
+    """
+
+    __tablename__ = "alerts_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    rule_id = Column(Integer, ForeignKey("alert_rules.id", ondelete="CASCADE"), nullable=False, index=True)
+    event_id = Column(String, ForeignKey("security_events.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String, nullable=False)
+    assigned_to = Column(String, nullable=True)
+    notes = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    resolved_at = Column(DateTime, nullable=True)
+    acknowledged_at = Column(DateTime, nullable=True)
+    group_key = Column(String, nullable=True)
+    count = Column(Integer, default=1, nullable=False)
+    first_seen = Column(DateTime, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    __table_args__ = (Index('ix_alerts_archive_status_created', 'status', 'created_at'),)
+
+
+class AlertCounterORM(Base):
+    """
+    Число алертов по (rule_id, status, assigned_to); поддерживается вместе с изменениями
+    алертов и периодически сверяется с таблицей alerts (см. app.services.alert_stats).
+    """
+
+    __tablename__ = "alert_counters"
+
+    rule_id = Column(Integer, ForeignKey("alert_rules.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(String, primary_key=True)
+    assigned_to = Column(String, primary_key=True, default="")  # "" - не назначен
+    count = Column(Integer, default=0, nullable=False)
+
+
+class BackfillRunORM(Base):
+    """Ретроспективная оценка правил по истории событий (см. app.services.backfill)."""
+
+    __tablename__ = "backfill_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    rule_ids = Column(Text, nullable=True)  # через запятую; NULL - все активные filter-правила
+    status = Column(String, default="running", nullable=False)  # running | done | failed
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+    ranges = relationship("BackfillRangeORM", back_populates="run", cascade="all, delete-orphan")
+
+
+class BackfillRangeORM(Base):
+    """
+    Временной диапазон [range_start, range_end) прогона. Чекпоинт (last_timestamp, last_id)
+    и счётчики коммитятся в одной транзакции с алертами порции.
+    """
+
+    __tablename__ = "backfill_ranges"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("backfill_runs.id", ondelete="CASCADE"), nullable=False, index=True)
+    range_start = Column(DateTime, nullable=False)
+    range_end = Column(DateTime, nullable=False)
+    status = Column(String, default="pending", nullable=False)  # pending | done | failed
+    last_timestamp = Column(DateTime, nullable=True)
+    last_id = Column(String, nullable=True)
+    events_scanned = Column(Integer, default=0, nullable=False)
+    alerts_created = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+
+    run = relationship("BackfillRunORM", back_populates="ranges")
+
+
+class JobORM(Base):
+    """Фоновая задача из очереди (см. app.services.job_queue)."""
+
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    type = Column(String, nullable=False)  # имя из job_queue.JOB_TYPES
+    status = Column(String, default="queued", nullable=False)  # queued | running | succeeded | failed | cancelled
+    params = Column(Text, nullable=True)  # JSON
+    result = Column(Text, nullable=True)  # JSON
+    error = Column(Text, nullable=True)
+    progress = Column(Float, default=0.0, nullable=False)  # 0..1
+    progress_message = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=1, nullable=False)
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    # Не раньше этого времени (отложенный повтор после ошибки), naive UTC
+    run_after = Column(DateTime, nullable=False)
+    locked_by = Column(String, nullable=True)  # воркер, выполняющий задачу
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_by = Column(String, nullable=True)  # username
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_type_status", "type", "status"),
+    )
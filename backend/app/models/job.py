@@ -0,0 +1,37 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+
+class JobCreate(BaseModel):
+    type: str = Field(..., description="Job type, e.g. backfill or seed_events")
+    params: Dict[str, Any] = Field(default_factory=dict)
+
+
+class JobOut(BaseModel):
+    id: int
+    type: str
+    status: str
+    params: Dict[str, Any] = {}
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    progress: float
+    progress_message: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    cancel_requested: bool
+    created_by: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @field_validator("params", "result", mode="before")
+    @classmethod
+    def _decode_json(cls, value):
+        # В БД params и result хранятся JSON-строкой
+        return json.loads(value) if isinstance(value, str) else value
+
+    class Config:
+        from_attributes = True
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Optional
 
 from pydantic import BaseModel
 
@@ -9,7 +9,7 @@ class SecurityEvent(BaseModel):
     Basic normalized representation of a security event.
 
     For прототипа достаточно этих полей; при необходимости можно расширять
-    (src_ip, dst_ip, hostname, detection_rule и т.п.).
+    (detection_rule и т.п.).
     """
 
     id: str
@@ -18,6 +18,11 @@ class SecurityEvent(BaseModel):
     category: str
     severity: str
     description: str
+    src_ip: Optional[str] = None
+    dst_ip: Optional[str] = None
+    hostname: Optional[str] = None
+    # Сколько повторов события отброшено дедупликацией при приёме
+    duplicate_count: int = 0
 
 
 class EventsSummary(BaseModel):
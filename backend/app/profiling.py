@@ -0,0 +1,369 @@
+"""
+Opt-in diagnostics for admins: per-request sampling profiles, slow-query log
+and tracemalloc snapshots.
+
+Nothing here is installed unless PROFILING_ENABLED is set: no middleware, no
+SQLAlchemy event listeners and no /api/debug routes, so a disabled deployment
+pays nothing.
+
+When enabled:
+
+    profile     a request from an admin (JWT role claim) with ``X-Profile: 1`` or
+                ``?profile=1`` runs under a sampling profiler. Every
+                PROFILE_SAMPLE_INTERVAL_MS the stacks of threads executing project
+                code are recorded; the result (wall ms per function, self and
+                inclusive, plus the SQL the request issued) is stored under the
+                id returned in ``X-Profile-Id`` and summarized in Server-Timing.
+                Stacks are sampled process-wide, so requests running
+                concurrently with the profiled one can show up in its profile.
+    slow SQL    statements slower than SLOW_QUERY_MS are kept (with parameters)
+                in a ring buffer; on Postgres SELECTs are re-run with
+                EXPLAIN (ANALYZE, BUFFERS) in a background thread.
+    memory      tracemalloc top allocations, growth since the previous snapshot
+                and deep sizes of the in-process caches.
+"""
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from jose import JWTError, jwt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.auth import ALGORITHM, SECRET_KEY
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "2"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+# >0 - tracemalloc запускается при старте с таким числом кадров в трассировке
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "0"))
+
+PROFILE_HEADER = "x-profile"
+_APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+_PROJECT_ROOT = os.path.dirname(_APP_ROOT) + os.sep
+_SITE_PACKAGES = "site-packages" + os.sep
+_MAX_PARAMS_REPR = 2000
+
+
+# --- Sampling profiler ------------------------------------------------------------
+
+
+class SamplingProfiler:
+    """Samples stacks of all threads that are inside project code; wall time per function."""
+
+    def __init__(self, interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS) -> None:
+        self.interval = interval_ms / 1000
+        self.samples = 0
+        self._self: Counter = Counter()
+        self._total: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self.wall = 0.0
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.wall = time.perf_counter() - self._started
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self._sample(frame)
+
+    def _sample(self, frame) -> None:
+        stack = []
+        in_app = False
+        while frame is not None:
+            code = frame.f_code
+            filename = code.co_filename
+            if filename == _THIS_FILE:
+                return
+            if filename.startswith(_PROJECT_ROOT) and _SITE_PACKAGES not in filename:
+                in_app = True
+            stack.append(f"{_short_path(filename)}:{code.co_firstlineno}:{code.co_name}")
+            frame = frame.f_back
+        if not in_app:
+            return
+        self.samples += 1
+        self._self[stack[0]] += 1
+        # Рекурсивная функция считается один раз на сэмпл
+        self._total.update(set(stack))
+
+    def report(self, top: int = 40) -> dict:
+        ms = self.interval * 1000
+        functions = [
+            {
+                "function": name,
+                "total_ms": round(count * ms, 1),
+                "self_ms": round(self._self.get(name, 0) * ms, 1),
+            }
+            for name, count in self._total.most_common(top)
+        ]
+        return {
+            "wall_ms": round(self.wall * 1000, 1),
+            "interval_ms": ms,
+            "samples": self.samples,
+            "functions": functions,
+            "hot_spots": [
+                {"function": name, "self_ms": round(count * ms, 1)} for name, count in self._self.most_common(10)
+            ],
+        }
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_PROJECT_ROOT):
+        return filename[len(_PROJECT_ROOT):]
+    index = filename.find(_SITE_PACKAGES)
+    return filename[index + len(_SITE_PACKAGES):] if index >= 0 else filename
+
+
+# Профили последних запросов: id -> отчёт
+profiles: "OrderedDict[str, dict]" = OrderedDict()
+_profiles_lock = threading.Lock()
+
+# SQL текущего профилируемого запроса; None для всех остальных
+_request_queries: contextvars.ContextVar[Optional[List[dict]]] = contextvars.ContextVar(
+    "profiled_request_queries", default=None
+)
+
+
+def _store_profile(report: dict) -> str:
+    profile_id = uuid.uuid4().hex[:12]
+    with _profiles_lock:
+        profiles[profile_id] = report
+        while len(profiles) > PROFILE_KEEP:
+            profiles.popitem(last=False)
+    return profile_id
+
+
+def _is_admin(request: Request) -> bool:
+    auth_header = request.headers.get("authorization", "")
+    if not auth_header.lower().startswith("bearer "):
+        return False
+    try:
+        payload = jwt.decode(auth_header[7:], SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("role") == "admin"
+
+
+def profile_requested(request: Request) -> bool:
+    flag = request.headers.get(PROFILE_HEADER) or request.query_params.get("profile")
+    return flag is not None and flag.lower() in ("1", "true", "yes") and _is_admin(request)
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """Profiles requests that ask for it (admins only); everything else passes straight through."""
+
+    async def dispatch(self, request: Request, call_next):
+        if not profile_requested(request):
+            return await call_next(request)
+
+        queries: List[dict] = []
+        token = _request_queries.set(queries)
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            response = await call_next(request)
+            # Тело StreamingResponse формируется при отправке - дочитываем его под профайлером
+            body = b"".join([chunk async for chunk in response.body_iterator])
+        finally:
+            profiler.stop()
+            _request_queries.reset(token)
+
+        report = profiler.report()
+        sql_ms = sum(query["duration_ms"] for query in queries)
+        report.update(
+            {
+                "method": request.method,
+                "path": request.url.path,
+                "query": str(request.url.query),
+                "status_code": response.status_code,
+                "at": time.time(),
+                "sql": {
+                    "queries": len(queries),
+                    "total_ms": round(sql_ms, 1),
+                    "slowest": sorted(queries, key=lambda query: query["duration_ms"], reverse=True)[:10],
+                },
+            }
+        )
+        profile_id = _store_profile(report)
+        headers = dict(response.headers)
+        headers.pop("content-length", None)
+        headers["X-Profile-Id"] = profile_id
+        headers["Server-Timing"] = f'app;dur={report["wall_ms"]}, db;dur={round(sql_ms, 1)};desc="{len(queries)} queries"'
+        return Response(body, status_code=response.status_code, headers=headers, media_type=response.media_type)
+
+
+# --- Slow query log ----------------------------------------------------------------
+
+slow_queries: Deque[dict] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_explain_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _params_repr(parameters: Any) -> str:
+    text = repr(parameters)
+    return text if len(text) <= _MAX_PARAMS_REPR else text[:_MAX_PARAMS_REPR] + "..."
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info["profiling_started"].pop()
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.append({"duration_ms": round(duration_ms, 2), "statement": statement[:300]})
+
+    if duration_ms < SLOW_QUERY_MS:
+        return
+    entry = {
+        "at": time.time(),
+        "duration_ms": round(duration_ms, 1),
+        "statement": statement,
+        "parameters": _params_repr(parameters),
+        "executemany": executemany,
+        "dialect": conn.dialect.name,
+        "explain": None,
+    }
+    slow_queries.append(entry)
+    logger.warning("Slow query (%.0f ms): %s", duration_ms, statement[:500])
+    if (
+        SLOW_QUERY_EXPLAIN
+        and conn.dialect.name == "postgresql"
+        and not executemany
+        and statement.lstrip()[:6].upper() == "SELECT"
+        and _explain_executor is not None
+    ):
+        _explain_executor.submit(_explain, conn.engine, statement, parameters, entry)
+
+
+def _explain(engine: Engine, statement: str, parameters: Any, entry: dict) -> None:
+    """EXPLAIN (ANALYZE, BUFFERS) on a separate connection; re-runs the SELECT, hence off the request path."""
+    try:
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters).fetchall()
+        entry["explain"] = "\n".join(row[0] for row in rows)
+    except Exception as exc:
+        entry["explain"] = f"EXPLAIN failed: {exc}"
+
+
+def install_query_logging(*engines: Engine) -> None:
+    """Attach timing listeners to the engines (once per engine)."""
+    global _explain_executor
+    if _explain_executor is None:
+        _explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+    for engine in dict.fromkeys(engines):
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- Memory ------------------------------------------------------------------------
+
+_previous_snapshot: Optional[tracemalloc.Snapshot] = None
+
+# Кэши процесса, размер которых показывается в отчёте о памяти: имя -> функция, возвращающая объект
+memory_probes: Dict[str, Callable[[], Any]] = {}
+
+
+def deep_size(obj: Any, limit: int = 5_000_000) -> int:
+    """Approximate retained size of a container graph (shared objects counted once)."""
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack and len(seen) < limit:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        elif hasattr(current, "__dict__") and not isinstance(current, type):
+            stack.append(vars(current))
+    return size
+
+
+def start_tracing(frames: int = 1) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracing() -> None:
+    global _previous_snapshot
+    tracemalloc.stop()
+    _previous_snapshot = None
+
+
+def memory_report(limit: int = 20, group_by: str = "lineno") -> dict:
+    """Top allocations, growth since the previous report and sizes of registered caches."""
+    global _previous_snapshot
+    caches = {}
+    for name, probe in memory_probes.items():
+        try:
+            caches[name] = deep_size(probe())
+        except Exception as exc:
+            caches[name] = f"error: {exc}"
+    report: Dict[str, Any] = {"tracing": tracemalloc.is_tracing(), "caches": caches}
+    if not tracemalloc.is_tracing():
+        return report
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"))
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    report.update(
+        {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {"location": _stat_location(stat.traceback), "size": stat.size, "count": stat.count}
+                for stat in snapshot.statistics(group_by)[:limit]
+            ],
+        }
+    )
+    if _previous_snapshot is not None:
+        report["growth"] = [
+            {"location": _stat_location(stat.traceback), "size_diff": stat.size_diff, "size": stat.size}
+            for stat in snapshot.compare_to(_previous_snapshot, group_by)[:limit]
+            if stat.size_diff
+        ]
+    _previous_snapshot = snapshot
+    return report
+
+
+def _stat_location(traceback: tracemalloc.Traceback) -> str:
+    return " <- ".join(f"{_short_path(frame.filename)}:{frame.lineno}" for frame in traceback)
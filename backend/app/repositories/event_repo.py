@@ -1,13 +1,17 @@
 import json
 import logging
 import os
+from collections import Counter, namedtuple
 from pathlib import Path
-from typing import Iterable, List
+from typing import Any, Dict, Iterable, List, Sequence, Union
 
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
+from app.ip_utils import normalize_ip
 from app.models.db_models import SecurityEventORM
 from app.models.security_event import SecurityEvent
+from app.services.event_parsers import validate_rows
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +26,10 @@ def load_events(db: Session) -> List[SecurityEvent]:
             category=row.category,
             severity=row.severity,
             description=row.description,
+            src_ip=row.src_ip,
+            dst_ip=row.dst_ip,
+            hostname=row.hostname,
+            duplicate_count=row.duplicate_count,
         )
         for row in rows
     ]
@@ -48,39 +56,130 @@ def seed_events_from_file(db: Session) -> int:
         logger.error("Failed to parse events JSON from %s: %s", data_file, exc)
         return 0
 
-    inserted = 0
-    from app.services.alert_service import create_alerts_for_event, evaluate_event_against_rules
-
-    for item in raw:
-        try:
-            ev = SecurityEvent(**item)
-        except Exception as exc:
-            logger.warning("Invalid event in seed file skipped: %s (%s)", item, exc)
-            continue
-
-        event_orm = SecurityEventORM(
-            id=ev.id,
-            timestamp=ev.timestamp,
-            source=ev.source,
-            category=ev.category,
-            severity=ev.severity,
-            description=ev.description,
-        )
-        db.add(event_orm)
-        db.flush()  # Flush to get the event in DB before evaluating
-
-        # Evaluate against alert rules and create alerts
-        matched_rule_ids = evaluate_event_against_rules(db, event_orm)
-        if matched_rule_ids:
-            create_alerts_for_event(db, event_orm, matched_rule_ids)
+    if not isinstance(raw, list):
+        logger.error("Seed file %s must contain a JSON array of events", data_file)
+        return 0
 
-        inserted += 1
+    # Одна bulk-валидация вместо модели SecurityEvent на каждую запись
+    rows, errors = validate_rows(raw)
+    for index, error in errors:
+        logger.warning("Invalid event in seed file skipped: %s (%s)", raw[index], error)
 
-    db.commit()
+    inserted = ingest_events(db, rows)
     logger.info("Seeded %d security events from %s", inserted, data_file)
     return inserted
 
 
+# Лёгкое представление строки для сопоставления с правилами (атрибуты как у SecurityEventORM)
+_IngestedEvent = namedtuple(
+    "_IngestedEvent",
+    ["id", "timestamp", "source", "category", "severity", "description", "src_ip", "dst_ip", "hostname"],
+)
+
+
+def ingest_events(db: Session, events: Sequence[Union[Dict[str, Any], SecurityEvent]]) -> int:
+    """
+    Insert a batch of events, evaluate them against alert rules and create
+    alerts, all in one transaction. Rules are loaded once per batch; when the
+    IOC engine is loaded, events are also matched against threat-intel feeds;
+    ATT&CK technique tags are stored alongside (see mitre_mapping).
+    With DEDUP_ENABLED duplicates are not stored; duplicate_count of the
+    original event is incremented instead (see dedup_service). Committed rows
+    go to the in-memory event buffer when it is enabled. Events whose id is
+    already stored (a retransmitted externalId/event_id) are skipped.
+    Accepts validated row dicts (see event_parsers.validate_rows) or SecurityEvent.
+    Used by seeding and by the network listeners.
+    Returns number of events inserted (duplicates excluded).
+    """
+    if not events:
+        return 0
+
+    from app.services import dedup_service, event_buffer, ioc_service, mitre_mapping
+    from app.services.alert_service import RuleMatcher, create_alerts_for_event, get_active_rules
+
+    rows = [ev.model_dump() if isinstance(ev, SecurityEvent) else ev for ev in events]
+    for row in rows:
+        # Некорректный адрес не должен ронять весь пакет (inet в Postgres)
+        row["src_ip"] = normalize_ip(row.get("src_ip"))
+        row["dst_ip"] = normalize_ip(row.get("dst_ip"))
+        row["hostname"] = row["hostname"].lower() if row.get("hostname") else None
+    dedup = dedup_service.deduplicator if dedup_service.DEDUP_ENABLED else None
+    duplicates: Counter = Counter()
+    if dedup is not None:
+        rows, duplicates = dedup.split(db, rows)
+        if rows:
+            # Последний рубеж - уникальный индекс по content_hash: строки, уже вставленные
+            # другим потоком/процессом, пропускаются, RETURNING отдаёт только вставленные
+            inserted_ids = _insert_skipping_duplicates(db, rows)
+            duplicates.update(dedup.resolve_conflicts(db, rows, inserted_ids))
+            rows = _only_inserted(rows, inserted_ids)
+        dedup_service.add_duplicate_counts(db, duplicates)
+    else:
+        # Повторно присланное событие (тот же externalId/event_id) пропускается,
+        # остальные события пакета записываются
+        rows = _only_inserted(rows, _insert_skipping_duplicates(db, rows))
+
+    mitre_mapping.tag_events(db, rows)
+
+    matcher = RuleMatcher(get_active_rules(db))
+    ioc = ioc_service.engine if ioc_service.is_enabled() else None
+    for row in rows:
+        event = _IngestedEvent(
+            row["id"],
+            row["timestamp"],
+            row["source"],
+            row["category"],
+            row["severity"],
+            row["description"],
+            row["src_ip"],
+            row["dst_ip"],
+            row["hostname"],
+        )
+        matched_rule_ids = matcher.match(event)
+        if matched_rule_ids:
+            create_alerts_for_event(db, event, matched_rule_ids, commit=False)
+        if ioc is not None:
+            ioc.alert_on_event(db, event, commit=False)
+
+    buffer = event_buffer.buffer
+    generation = buffer.generation() if buffer is not None else None
+    db.commit()
+    if dedup is not None:
+        dedup.remember(rows)
+    if buffer is not None:
+        buffer.add(rows, duplicates, before=generation)
+    return len(rows)
+
+
+def _insert_skipping_duplicates(db: Session, rows: List[Dict[str, Any]]) -> set:
+    """
+    executemany одним INSERT ... ON CONFLICT DO NOTHING без указания индекса:
+    пропускаются строки, конфликтующие и по id, и по content_hash.
+    Returns ids of inserted rows.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        db.execute(insert(SecurityEventORM), rows)
+        return {row["id"] for row in rows}
+    stmt = dialect_insert(SecurityEventORM).on_conflict_do_nothing().returning(SecurityEventORM.id)
+    return set(db.execute(stmt, rows).scalars())
+
+
+def _only_inserted(rows: List[Dict[str, Any]], inserted_ids: set) -> List[Dict[str, Any]]:
+    # Один id дважды в пакете вставлен один раз: дальше идёт только первая строка
+    seen = set()
+    kept = []
+    for row in rows:
+        if row["id"] in inserted_ids and row["id"] not in seen:
+            seen.add(row["id"])
+            kept.append(row)
+    return kept
+
+
 def _resolve_data_file() -> Path:
     env_path = os.getenv("EVENTS_FILE")
     if env_path:
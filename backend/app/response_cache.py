@@ -0,0 +1,381 @@
+"""
+Short-TTL response cache with ETags for read-heavy GET endpoints.
+
+Responses are keyed on route, normalized query string, caller role and the
+"generation" of every table the route reads. Commits that touch a table bump
+its generation (see ``_track_writes``), so the committing process stops
+serving stale entries at once and they age out of the LRU. Generations of
+the in-memory backend are per process: a write made by another worker (or by
+the ingest/job processes) is seen only after the route TTL expires. Set
+RESPONSE_CACHE_URL to share entries and generations between processes.
+
+A bearer token is not enough to get a cached response: its user must be in
+the snapshot of active users (refreshed every RESPONSE_CACHE_USERS_TTL
+seconds and on writes to ``users``), and the role from that snapshot, not
+the token claim, selects the cache partition. Other requests bypass the
+cache and get their 401/400 from the endpoint.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from jose import JWTError, jwt
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.auth import ALGORITHM, SECRET_KEY
+
+try:
+    import redis
+except ImportError:  # optional shared backend
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+# redis://host:6379/0 - общий кэш для нескольких воркеров; без него кэш у каждого процесса свой
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL")
+# Как долго отключённый/удалённый пользователь ещё может получать ответы из кэша (другого процесса)
+RESPONSE_CACHE_USERS_TTL = float(os.getenv("RESPONSE_CACHE_USERS_TTL", "5"))
+
+
+class CacheRule(NamedTuple):
+    ttl: int  # seconds
+    tables: Tuple[str, ...]  # writes to these tables invalidate the route
+
+
+# Per-route TTLs; only exact paths listed here are cached
+CACHE_RULES: Dict[str, CacheRule] = {
+    "/api/events/": CacheRule(ttl=5, tables=("security_events",)),
+    "/api/events/paged": CacheRule(ttl=5, tables=("security_events",)),
+    "/api/events/summary": CacheRule(ttl=10, tables=("security_events",)),
+    "/api/alerts/": CacheRule(ttl=5, tables=("alerts", "alerts_archive", "alert_rules", "security_events")),
+    "/api/alerts/rules/": CacheRule(ttl=30, tables=("alert_rules",)),
+    "/api/alerts/stats": CacheRule(ttl=10, tables=("alert_counters", "alerts", "alert_rules")),
+    "/api/mitre/tactics": CacheRule(ttl=300, tables=()),
+    "/api/mitre/heatmap": CacheRule(ttl=10, tables=("event_techniques", "alerts")),
+}
+
+
+class CachedResponse(NamedTuple):
+    status_code: int
+    media_type: Optional[str]
+    body: bytes
+    etag: str
+
+
+class CacheBackend:
+    """Storage interface for cached responses and per-table generations."""
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: CachedResponse, ttl: int) -> None:
+        raise NotImplementedError
+
+    def generations(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        raise NotImplementedError
+
+    def bump(self, tables: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class InMemoryLRUCache(CacheBackend):
+    """Process-local LRU bounded by number of entries."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CachedResponse, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._generations.get(t, 0) for t in tables)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        with self._lock:
+            for t in tables:
+                self._generations[t] = self._generations.get(t, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache(CacheBackend):
+    """Shared backend: entries and generations live in Redis, visible to all workers."""
+
+    PREFIX = "respcache:"
+
+    def __init__(self, url: str):
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        data = self._client.hgetall(self.PREFIX + key)
+        if not data:
+            return None
+        media_type = data.get(b"media_type", b"").decode() or None
+        return CachedResponse(
+            status_code=int(data[b"status_code"]),
+            media_type=media_type,
+            body=data[b"body"],
+            etag=data[b"etag"].decode(),
+        )
+
+    def set(self, key: str, value: CachedResponse, ttl: int) -> None:
+        name = self.PREFIX + key
+        pipe = self._client.pipeline()
+        pipe.hset(
+            name,
+            mapping={
+                "status_code": value.status_code,
+                "media_type": value.media_type or "",
+                "body": value.body,
+                "etag": value.etag,
+            },
+        )
+        pipe.expire(name, ttl)
+        pipe.execute()
+
+    def generations(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        tables = list(tables)
+        if not tables:
+            return ()
+        values = self._client.mget([f"{self.PREFIX}gen:{t}" for t in tables])
+        return tuple(int(v or 0) for v in values)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        pipe = self._client.pipeline()
+        for t in tables:
+            pipe.incr(f"{self.PREFIX}gen:{t}")
+        pipe.execute()
+
+    def clear(self) -> None:
+        for name in self._client.scan_iter(f"{self.PREFIX}*"):
+            if b":gen:" not in name:
+                self._client.delete(name)
+
+
+def _create_backend() -> CacheBackend:
+    if RESPONSE_CACHE_URL:
+        if redis is None:
+            logger.warning("RESPONSE_CACHE_URL is set but redis package is not installed; using in-memory cache")
+        else:
+            logger.info("Using shared response cache at %s", RESPONSE_CACHE_URL)
+            return RedisCache(RESPONSE_CACHE_URL)
+    return InMemoryLRUCache()
+
+
+backend: CacheBackend = _create_backend()
+
+
+class ActiveUsers:
+    """Short-TTL snapshot of active users (username -> role) checked before serving from the cache."""
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_USERS_TTL, session_factory=None):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self._roles: Optional[Dict[str, str]] = None
+        self._loaded_at = 0.0
+
+    def expired(self) -> bool:
+        return self._roles is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def refresh(self) -> None:
+        from app.db import SessionLocal
+        from app.models.db_models import UserORM
+
+        db = (self.session_factory or SessionLocal)()
+        try:
+            self._roles = dict(db.query(UserORM.username, UserORM.role).filter(UserORM.is_active.is_(True)))
+            self._loaded_at = time.monotonic()
+        except Exception:
+            # Без снимка запросы с токеном идут мимо кэша
+            logger.exception("Failed to load active users for the response cache")
+            self._roles = None
+        finally:
+            db.close()
+
+    def role(self, username: Optional[str]) -> Optional[str]:
+        roles = self._roles
+        return roles.get(username) if roles is not None and username else None
+
+    def invalidate(self) -> None:
+        self._roles = None
+
+
+active_users = ActiveUsers()
+
+
+def invalidate_tables(tables: Iterable[str]) -> None:
+    """Make cached responses of routes reading these tables unreachable."""
+    tables = set(tables)
+    if tables:
+        backend.bump(tables)
+        if "users" in tables:
+            active_users.invalidate()
+
+
+# --- Write tracking -------------------------------------------------------
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_tables(session: Session, flush_context) -> None:
+    touched = session.info.setdefault("cache_touched_tables", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            touched.add(table)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_statement_tables(orm_execute_state) -> None:
+    # query.update()/delete() и session.execute(insert(...)) не проходят через flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            touched = orm_execute_state.session.info.setdefault("cache_touched_tables", set())
+            touched.add(table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _track_writes(session: Session) -> None:
+    touched = session.info.pop("cache_touched_tables", None)
+    if touched:
+        invalidate_tables(touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_writes(session: Session) -> None:
+    session.info.pop("cache_touched_tables", None)
+
+
+# --- Middleware -----------------------------------------------------------
+
+def _caller_key(request: Request) -> Optional[str]:
+    """
+    Cache partition of the caller: role of the token's user, or a digest of
+    the API key. Returns None when the token is invalid or its user is not
+    active - such requests bypass the cache and get their 401/400 from the
+    endpoint itself.
+    """
+    parts = []
+    auth_header = request.headers.get("authorization", "")
+    if auth_header.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(auth_header[7:], SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        role = active_users.role(payload.get("sub"))
+        if role is None:
+            return None
+        parts.append(f"role={role}")
+    else:
+        parts.append("role=anonymous")
+
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        parts.append("key=" + hashlib.sha256(api_key.encode()).hexdigest()[:16])
+    return "|".join(parts)
+
+
+def _normalized_query(request: Request) -> str:
+    items = sorted((k, v) for k, v in request.query_params.multi_items() if v != "")
+    return "&".join(f"{k}={v}" for k, v in items)
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """Serve repeated GETs of CACHE_RULES routes from the cache; answer If-None-Match with 304."""
+
+    async def dispatch(self, request: Request, call_next):
+        rule = CACHE_RULES.get(request.url.path)
+        if request.method != "GET" or rule is None:
+            return await call_next(request)
+
+        if request.headers.get("authorization", "").lower().startswith("bearer ") and active_users.expired():
+            await run_in_threadpool(active_users.refresh)
+        caller = _caller_key(request)
+        if caller is None:
+            return await call_next(request)
+
+        generations = backend.generations(rule.tables)
+        raw_key = f"{request.url.path}?{_normalized_query(request)}|{caller}|{generations}"
+        key = hashlib.sha1(raw_key.encode()).hexdigest()
+
+        cached = backend.get(key)
+        if cached is not None:
+            return self._respond(request, cached, rule, "HIT")
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        entry = CachedResponse(
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type"),
+            body=body,
+            etag=_etag(body),
+        )
+        backend.set(key, entry, rule.ttl)
+        return self._respond(request, entry, rule, "MISS")
+
+    @staticmethod
+    def _respond(request: Request, entry: CachedResponse, rule: CacheRule, state: str) -> Response:
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": f"private, max-age={rule.ttl}",
+            "X-Cache": state,
+            "Vary": "Authorization, X-API-Key",
+        }
+        if _etag_matches(request, entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(
+            content=entry.body,
+            status_code=entry.status_code,
+            media_type=entry.media_type,
+            headers=headers,
+        )
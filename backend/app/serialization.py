@@ -0,0 +1,185 @@
+"""
+Fast JSON rendering and response compression for list/export endpoints.
+
+orjson is used when installed (falls back to stdlib json with the same output
+format as Starlette's JSONResponse). brotli and zstandard are optional: the
+compression middleware only offers encodings whose library is importable.
+"""
+import datetime
+import json
+import zlib
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def rows_to_dicts(columns: Sequence[str], rows: Iterable[Tuple]) -> List[dict]:
+    """Map plain row tuples to dicts without building intermediate models."""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# --- Compression ----------------------------------------------------------
+
+# Порядок предпочтения при равных q-values: лучшее сжатие/скорость первыми
+SUPPORTED_ENCODINGS = tuple(
+    name
+    for name, available in (("zstd", zstandard is not None), ("br", brotli is not None), ("gzip", True))
+    if available
+)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token.strip().lower()] = q
+
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in SUPPORTED_ENCODINGS:
+        q = weights.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def _compressor(encoding: str):
+    """Streaming compressor with compress(bytes) / flush() -> bytes."""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=4)
+        # brotli.Compressor uses process()/finish() instead of compress()/flush()
+        return _BrotliAdapter(compressor)
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+
+class _BrotliAdapter:
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses responses with zstd/br/gzip according to
+    Accept-Encoding. Works chunk by chunk, so streaming exports are compressed
+    without buffering. Small single-chunk bodies are sent as is.
+
+    When an encoding is negotiated, strong ETags are made weak (W/"..."): the
+    encoded body is not byte-identical to the one the tag was computed for,
+    and a 304 to the same client must carry the same tag as its 200.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = MutableHeaders(raw=message["headers"])
+                passthrough = "content-encoding" in headers
+                etag = headers.get("etag")
+                if not passthrough and etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                if start_message is not None:
+                    await send(start_message)
+                    start_message = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    passthrough = True
+                    return
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                await send(start_message)
+                start_message = None
+                compressor = _compressor(encoding)
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
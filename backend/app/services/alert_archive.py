@@ -0,0 +1,110 @@
+"""
+Hot/cold split of alerts.
+
+Analysts work on the open queue (status open/investigating); resolved and
+false-positive alerts are only looked up now and then. Closed alerts whose
+resolution is older than ALERT_ARCHIVE_AFTER_DAYS are moved from ``alerts``
+to ``alerts_archive`` (same columns and ids, plus archived_at), so the hot
+table and its partial indexes stay proportional to the active queue rather
+than to the whole history.
+
+Listings read the archive only when the status filter asks for a closed
+status (see alert_service.get_alerts/get_alert_rows); alert_counters keep
+counting archived alerts, so /api/alerts/stats totals do not change.
+
+main.py runs archive_resolved_alerts() every ALERT_ARCHIVE_INTERVAL_SECONDS
+(ALERT_ARCHIVE_AFTER_DAYS=0 turns it off). By hand, from backend/:
+    python -m app.services.alert_archive [--older-than-days 90]
+"""
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, insert, literal, or_, select
+from sqlalchemy.orm import Session
+
+from app.models.db_models import AlertArchiveORM, AlertORM
+from app.services.alert_service import RESOLVED_ALERT_STATUSES
+from app.services.alert_stats import lock_counters
+from app.time_utils import as_naive_utc
+
+logger = logging.getLogger(__name__)
+
+ALERT_ARCHIVE_AFTER_DAYS = int(os.getenv("ALERT_ARCHIVE_AFTER_DAYS", "90"))
+ALERT_ARCHIVE_BATCH_SIZE = int(os.getenv("ALERT_ARCHIVE_BATCH_SIZE", "1000"))
+ALERT_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ALERT_ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+_ALERTS = AlertORM.__table__
+_ARCHIVE = AlertArchiveORM.__table__
+# Колонки alerts в порядке, в котором они переносятся в архив
+_MOVED_COLUMNS = [column.name for column in _ALERTS.columns]
+
+
+def is_enabled() -> bool:
+    return ALERT_ARCHIVE_AFTER_DAYS > 0
+
+
+def archive_resolved_alerts(
+    db: Session,
+    older_than: datetime,
+    batch_size: int = ALERT_ARCHIVE_BATCH_SIZE,
+) -> int:
+    """
+    Move resolved/false-positive alerts closed before ``older_than`` to the
+    archive, ``batch_size`` per transaction (INSERT ... SELECT, then DELETE).
+    Alerts closed without resolved_at count from created_at.
+    Returns number of alerts moved.
+    """
+    cutoff = as_naive_utc(older_than)
+    closed_before = and_(
+        _ALERTS.c.status.in_(RESOLVED_ALERT_STATUSES),
+        or_(
+            _ALERTS.c.resolved_at < cutoff,
+            and_(_ALERTS.c.resolved_at.is_(None), _ALERTS.c.created_at < cutoff),
+        ),
+    )
+    moved = 0
+    while True:
+        ids = db.execute(
+            select(_ALERTS.c.id).where(closed_before).order_by(_ALERTS.c.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        # Сверка счётчиков считает обе таблицы; перенос не должен попасть между её запросами
+        lock_counters(db)
+        archived_at = literal(datetime.utcnow(), _ARCHIVE.c.archived_at.type)
+        source = select(*[_ALERTS.c[name] for name in _MOVED_COLUMNS], archived_at)
+        db.execute(
+            insert(_ARCHIVE).from_select(_MOVED_COLUMNS + ["archived_at"], source.where(_ALERTS.c.id.in_(ids)))
+        )
+        db.execute(delete(_ALERTS).where(_ALERTS.c.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+    if moved:
+        logger.info("Archived %d alerts closed before %s", moved, f"{cutoff:%Y-%m-%d %H:%M}")
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than-days", type=int, default=ALERT_ARCHIVE_AFTER_DAYS or 90)
+    parser.add_argument("--batch-size", type=int, default=ALERT_ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+
+    from app.db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+        print(f"Archived {archive_resolved_alerts(db, cutoff, args.batch_size)} alerts closed before {cutoff:%Y-%m-%d %H:%M}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,78 @@
+import heapq
 import logging
-from typing import List, Optional, Tuple
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
 
+from sqlalchemy import case, func, lambda_stmt, select, union_all
 from sqlalchemy.orm import Session
+from sqlalchemy.sql.lambdas import StatementLambdaElement
 
-from app.models.db_models import AlertORM, AlertRuleORM, SecurityEventORM
+from app.ip_utils import IPRadixTrie, join_cidrs, split_cidrs
+from app.models.db_models import AlertArchiveORM, AlertORM, AlertRuleORM, SecurityEventORM
+from app.services.alert_stats import bump_counters, counter_key, counts_by_key, delete_rule_counters, lock_counters
+from app.time_utils import as_naive_utc
 
 logger = logging.getLogger(__name__)
 
+# Статусы, при которых алерт ещё в работе и может принимать сгруппированные события
+ACTIVE_ALERT_STATUSES = ("open", "investigating")
+RESOLVED_ALERT_STATUSES = ("resolved", "false_positive")
+
+_GROUPS_LOCK_KEY = zlib.crc32(b"alert_groups")
+
 
 def evaluate_event_against_rules(db: Session, event: SecurityEventORM) -> List[int]:
     """
     Evaluate a single event against all active alert rules.
     Returns list of rule IDs that matched.
     """
-    rules: List[AlertRuleORM] = db.query(AlertRuleORM).filter(AlertRuleORM.is_active == True).all()
-    matched_rule_ids: List[int] = []
+    return match_rules(get_active_rules(db), event)
 
-    for rule in rules:
-        if _rule_matches_event(rule, event):
-            matched_rule_ids.append(rule.id)
 
-    return matched_rule_ids
+def get_active_rules(db: Session) -> List[AlertRuleORM]:
+    """Active filter rules; load once and reuse with match_rules() for a batch of events."""
+    return (
+        db.query(AlertRuleORM)
+        .filter(AlertRuleORM.is_active == True, AlertRuleORM.rule_type == "filter")
+        .all()
+    )
+
+
+def match_rules(rules: List[AlertRuleORM], event) -> List[int]:
+    """IDs of the given rules that match the event (ORM row or SecurityEvent)."""
+    return RuleMatcher(rules).match(event)
+
+
+class RuleMatcher:
+    """
+    Rules prepared for matching many events: the CIDR lists of all rules go
+    into one radix trie per direction, so an IP lookup costs the same for
+    one rule or thousands of ranges.
+    """
+
+    def __init__(self, rules: List[AlertRuleORM]) -> None:
+        self.rules = rules
+        self._src = IPRadixTrie()
+        self._dst = IPRadixTrie()
+        for rule in rules:
+            for cidr in split_cidrs(rule.src_cidrs):
+                self._src.insert(cidr, rule.id)
+            for cidr in split_cidrs(rule.dst_cidrs):
+                self._dst.insert(cidr, rule.id)
+
+    def match(self, event) -> List[int]:
+        src_hits = self._src.lookup(getattr(event, "src_ip", None)) if len(self._src) else ()
+        dst_hits = self._dst.lookup(getattr(event, "dst_ip", None)) if len(self._dst) else ()
+        matched: List[int] = []
+        for rule in self.rules:
+            if rule.src_cidrs and rule.id not in src_hits:
+                continue
+            if rule.dst_cidrs and rule.id not in dst_hits:
+                continue
+            if _rule_matches_event(rule, event):
+                matched.append(rule.id)
+        return matched
 
 
 def _rule_matches_event(rule: AlertRuleORM, event: SecurityEventORM) -> bool:
@@ -34,33 +86,135 @@ def _rule_matches_event(rule: AlertRuleORM, event: SecurityEventORM) -> bool:
     return True
 
 
-def create_alerts_for_event(db: Session, event: SecurityEventORM, rule_ids: List[int]) -> int:
+def create_alerts_for_event(
+    db: Session,
+    event: SecurityEventORM,
+    rule_ids: List[int],
+    commit: bool = True,
+    notes: Optional[str] = None,
+) -> int:
     """
     Create alert records for an event that matched rules.
+
+    Rules with ``aggregation_window_seconds`` fold the event into an active alert
+    of the same rule and source (updating count/first_seen/last_seen in place)
+    instead of inserting a new row. Rules whose suppression window covers the
+    event timestamp produce nothing.
+    With ``commit=False`` the caller commits (batch ingestion). ``notes`` is
+    stored on new alerts (e.g. which IOC matched).
     Returns count of alerts created.
     """
+    if not rule_ids:
+        return 0
+
+    rules = db.query(AlertRuleORM).filter(AlertRuleORM.id.in_(rule_ids)).all()
     created = 0
-    for rule_id in rule_ids:
+    new_counts: Dict[tuple, int] = {}
+    grouped = 0
+    for rule in rules:
+        if _is_suppressed(rule, event.timestamp):
+            continue
+
         # Check if alert already exists for this event+rule combo
         existing = (
             db.query(AlertORM)
-            .filter(AlertORM.rule_id == rule_id, AlertORM.event_id == event.id)
+            .filter(AlertORM.rule_id == rule.id, AlertORM.event_id == event.id)
             .first()
         )
         if existing:
             continue  # Skip duplicates
 
-        alert = AlertORM(rule_id=rule_id, event_id=event.id, status="open")
+        if rule.aggregation_window_seconds:
+            _lock_alert_groups(db)
+            if _fold_into_group(db, rule, event):
+                grouped += 1
+                continue
+
+        alert = AlertORM(
+            rule_id=rule.id,
+            event_id=event.id,
+            status="open",
+            group_key=event.source if rule.aggregation_window_seconds else None,
+            count=1,
+            first_seen=event.timestamp,
+            last_seen=event.timestamp,
+            notes=notes,
+        )
         db.add(alert)
         created += 1
-
-    if created > 0:
-        db.commit()
-        logger.info("Created %d alerts for event %s", created, event.id)
+        new_counts[counter_key(rule.id, "open", None)] = 1
+
+    if created > 0 or grouped > 0:
+        # Счётчики меняются в той же транзакции, что и алерты
+        bump_counters(db, new_counts)
+        if commit:
+            db.commit()
+        else:
+            # Следующее событие пакета должно видеть созданные группы (autoflush выключен)
+            db.flush()
+        logger.debug("Created %d alerts (grouped %d) for event %s", created, grouped, event.id)
 
     return created
 
 
+def _is_suppressed(rule: AlertRuleORM, ts: datetime) -> bool:
+    """Check if the rule's suppression window covers the event timestamp."""
+    if rule.suppress_from is None and rule.suppress_until is None:
+        return False
+    ts = as_naive_utc(ts)
+    if rule.suppress_from is not None and ts < as_naive_utc(rule.suppress_from):
+        return False
+    if rule.suppress_until is not None and ts > as_naive_utc(rule.suppress_until):
+        return False
+    return True
+
+
+def _lock_alert_groups(db: Session) -> None:
+    """
+    Transaction-level advisory lock around group lookup and creation (Postgres
+    only; SQLite serializes writers by itself), so concurrent writers cannot
+    both miss a group and open two alerts for it. Taken after the shared
+    counters lock that every alert writer takes anyway: both locks are always
+    acquired in the same order and a batch never waits once it holds them.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    lock_counters(db)
+    db.execute(select(func.pg_advisory_xact_lock(_GROUPS_LOCK_KEY)))
+
+
+def _fold_into_group(db: Session, rule: AlertRuleORM, event: SecurityEventORM) -> bool:
+    """
+    Fold the event into an active alert of the same rule and source if the
+    group's [first_seen, last_seen] range, extended by the event, still fits
+    in the aggregation window. Returns True if an alert was updated.
+    """
+    window = timedelta(seconds=rule.aggregation_window_seconds)
+    ts = event.timestamp
+    fits = (
+        AlertORM.rule_id == rule.id,
+        AlertORM.group_key == event.source,
+        AlertORM.status.in_(ACTIVE_ALERT_STATUSES),
+        AlertORM.first_seen >= ts - window,
+        AlertORM.last_seen <= ts + window,
+    )
+    group = db.query(AlertORM.id).filter(*fits).order_by(AlertORM.last_seen.desc()).first()
+    if group is None:
+        return False
+
+    # Один UPDATE без загрузки объекта: счётчик и границы считаются в SQL;
+    # условия повторяются на случай, если группу только что закрыли
+    updated = db.query(AlertORM).filter(AlertORM.id == group.id, *fits).update(
+        {
+            AlertORM.count: AlertORM.count + 1,
+            AlertORM.first_seen: case((AlertORM.first_seen > ts, ts), else_=AlertORM.first_seen),
+            AlertORM.last_seen: case((AlertORM.last_seen < ts, ts), else_=AlertORM.last_seen),
+        },
+        synchronize_session=False,
+    )
+    return updated > 0
+
+
 def get_alerts(
     db: Session,
     status: Optional[str] = None,
@@ -71,26 +225,169 @@ def get_alerts(
 ) -> Tuple[List[AlertORM], int]:
     """
     Get paginated list of alerts with optional filters.
-    Returns (alerts, total_count).
+    Returns (alerts, total_count). A resolved/false_positive status filter
+    also reads alerts_archive (AlertArchiveORM rows have the same fields);
+    everything else reads only the hot table.
     """
-    query = db.query(AlertORM)
-
+    models = (AlertORM, AlertArchiveORM) if uses_archive(status) else (AlertORM,)
+    queries = []
+    for model in models:
+        query = db.query(model)
+        if status:
+            query = query.filter(model.status == status)
+        if rule_id:
+            query = query.filter(model.rule_id == rule_id)
+        if assigned_to:
+            query = query.filter(model.assigned_to == assigned_to)
+        queries.append(query.order_by(model.created_at.desc(), model.id.desc()))
+
+    total = sum(query.count() for query in queries)
+    if len(queries) == 1:
+        return queries[0].offset(offset).limit(limit).all(), total
+
+    # Каждая таблица отдаёт первые offset + limit строк, слияние по тому же порядку
+    merged = heapq.merge(
+        *(query.limit(offset + limit).all() for query in queries),
+        key=lambda alert: (alert.created_at, alert.id),
+        reverse=True,
+    )
+    return list(merged)[offset:offset + limit], total
+
+
+def uses_archive(status: Optional[str]) -> bool:
+    """Archived alerts are closed ones: only a closed-status filter can match them."""
+    return status in RESOLVED_ALERT_STATUSES
+
+
+# Колонки строк get_alert_rows; совпадают с полями AlertOut
+ALERT_COLUMNS = (
+    "id",
+    "rule_id",
+    "rule_name",
+    "event_id",
+    "event_timestamp",
+    "event_source",
+    "event_category",
+    "event_severity",
+    "event_description",
+    "status",
+    "assigned_to",
+    "notes",
+    "created_at",
+    "resolved_at",
+    "count",
+    "first_seen",
+    "last_seen",
+)
+
+_ALERTS = AlertORM.__table__
+_RULES = AlertRuleORM.__table__
+_EVENTS = SecurityEventORM.__table__
+_ALERT_SELECT = (
+    _ALERTS.c.id,
+    _ALERTS.c.rule_id,
+    _RULES.c.name,
+    _ALERTS.c.event_id,
+    _EVENTS.c.timestamp,
+    _EVENTS.c.source,
+    _EVENTS.c.category,
+    _EVENTS.c.severity,
+    _EVENTS.c.description,
+    _ALERTS.c.status,
+    _ALERTS.c.assigned_to,
+    _ALERTS.c.notes,
+    _ALERTS.c.created_at,
+    _ALERTS.c.resolved_at,
+    _ALERTS.c.count,
+    _ALERTS.c.first_seen,
+    _ALERTS.c.last_seen,
+)
+_ALERT_JOIN = _ALERTS.join(_EVENTS, _EVENTS.c.id == _ALERTS.c.event_id).join(
+    _RULES, _RULES.c.id == _ALERTS.c.rule_id
+)
+
+_ARCHIVE = AlertArchiveORM.__table__
+_ARCHIVE_SELECT = tuple(_ARCHIVE.c[column.name] if column.table is _ALERTS else column for column in _ALERT_SELECT)
+_ARCHIVE_JOIN = _ARCHIVE.join(_EVENTS, _EVENTS.c.id == _ARCHIVE.c.event_id).join(
+    _RULES, _RULES.c.id == _ARCHIVE.c.rule_id
+)
+
+
+def get_alert_rows(
+    db: Session,
+    status: Optional[str] = None,
+    rule_id: Optional[int] = None,
+    assigned_to: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 50,
+) -> Tuple[List[tuple], int]:
+    """
+    get_alerts with the event and rule fields joined in: plain row tuples in
+    ALERT_COLUMNS order from one cached Core lambda statement, instead of
+    ORM alerts plus two lookups per alert.
+    """
+    filters = (status, rule_id, assigned_to)
+    if uses_archive(status):
+        return _alert_rows_with_archive(db, *filters, offset, limit)
+    count_stmt = _alerts_where(lambda_stmt(lambda: select(func.count()).select_from(_ALERTS)), *filters)
+    total = db.execute(count_stmt).scalar_one()
+    rows_stmt = _alerts_where(lambda_stmt(lambda: select(*_ALERT_SELECT).select_from(_ALERT_JOIN)), *filters)
+    rows_stmt += lambda s: s.order_by(_ALERTS.c.created_at.desc(), _ALERTS.c.id.desc()).offset(offset).limit(limit)
+    return [tuple(row) for row in db.execute(rows_stmt)], total
+
+
+def _alerts_where(
+    stmt: StatementLambdaElement,
+    status: Optional[str],
+    rule_id: Optional[int],
+    assigned_to: Optional[str],
+) -> StatementLambdaElement:
     if status:
-        query = query.filter(AlertORM.status == status)
+        stmt += lambda s: s.where(_ALERTS.c.status == status)
     if rule_id:
-        query = query.filter(AlertORM.rule_id == rule_id)
+        stmt += lambda s: s.where(_ALERTS.c.rule_id == rule_id)
     if assigned_to:
-        query = query.filter(AlertORM.assigned_to == assigned_to)
+        stmt += lambda s: s.where(_ALERTS.c.assigned_to == assigned_to)
+    return stmt
 
-    total = query.count()
-    alerts = query.order_by(AlertORM.created_at.desc()).offset(offset).limit(limit).all()
 
-    return alerts, total
+def _alert_rows_with_archive(
+    db: Session,
+    status: str,
+    rule_id: Optional[int],
+    assigned_to: Optional[str],
+    offset: int,
+    limit: int,
+) -> Tuple[List[tuple], int]:
+    """get_alert_rows over alerts UNION ALL alerts_archive (closed-status filters only)."""
+
+    def where(table, stmt):
+        stmt = stmt.where(table.c.status == status)
+        if rule_id:
+            stmt = stmt.where(table.c.rule_id == rule_id)
+        if assigned_to:
+            stmt = stmt.where(table.c.assigned_to == assigned_to)
+        return stmt
+
+    total = sum(
+        db.execute(where(table, select(func.count()).select_from(table))).scalar_one() for table in (_ALERTS, _ARCHIVE)
+    )
+    both = union_all(
+        where(_ALERTS, select(*_ALERT_SELECT).select_from(_ALERT_JOIN)),
+        where(_ARCHIVE, select(*_ARCHIVE_SELECT).select_from(_ARCHIVE_JOIN)),
+    ).subquery()
+    rows = db.execute(
+        select(both).order_by(both.c.created_at.desc(), both.c.id.desc()).offset(offset).limit(limit)
+    )
+    return [tuple(row) for row in rows], total
 
 
-def get_alert_by_id(db: Session, alert_id: int) -> Optional[AlertORM]:
-    """Get a single alert by ID."""
-    return db.query(AlertORM).filter(AlertORM.id == alert_id).first()
+def get_alert_by_id(db: Session, alert_id: int, include_archived: bool = False):
+    """Get a single alert by ID; with ``include_archived`` fall back to alerts_archive (read-only)."""
+    alert = db.query(AlertORM).filter(AlertORM.id == alert_id).first()
+    if alert is None and include_archived:
+        alert = db.get(AlertArchiveORM, alert_id)
+    return alert
 
 
 def update_alert(
@@ -104,12 +401,11 @@ def update_alert(
     alert = get_alert_by_id(db, alert_id)
     if not alert:
         return None
+    old_key = counter_key(alert.rule_id, alert.status, alert.assigned_to)
 
     if status is not None:
         alert.status = status
-        if status in ("resolved", "false_positive"):
-            from datetime import datetime
-
+        if status in RESOLVED_ALERT_STATUSES:
             alert.resolved_at = datetime.utcnow()
         elif status == "open":
             alert.resolved_at = None
@@ -117,14 +413,88 @@ def update_alert(
     if assigned_to is not None:
         alert.assigned_to = assigned_to
 
+    if alert.acknowledged_at is None and (alert.status != "open" or alert.assigned_to):
+        alert.acknowledged_at = datetime.utcnow()
+
     if notes is not None:
         alert.notes = notes
 
+    new_key = counter_key(alert.rule_id, alert.status, alert.assigned_to)
+    if new_key != old_key:
+        bump_counters(db, {old_key: -1, new_key: 1})
+
     db.commit()
     db.refresh(alert)
     return alert
 
 
+def bulk_update_alerts(
+    db: Session,
+    ids: Optional[List[int]] = None,
+    filter_status: Optional[str] = None,
+    filter_rule_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    status: Optional[str] = None,
+    assigned_to: Optional[str] = None,
+    notes: Optional[str] = None,
+) -> int:
+    """
+    Apply status/assignment/notes changes to many alerts with one UPDATE ... WHERE.
+    resolved_at/acknowledged_at follow the same rules as update_alert (naive
+    UTC bound from Python, not the DB clock); alert counters are moved by the pre-update distribution of
+    the selected alerts. Returns number of affected rows.
+    """
+    # now() в Postgres - время в TimeZone сессии, а колонки хранят naive UTC
+    now = datetime.utcnow()
+    values = {}
+    if status is not None:
+        values[AlertORM.status] = status
+        if status in RESOLVED_ALERT_STATUSES:
+            values[AlertORM.resolved_at] = now
+        elif status == "open":
+            values[AlertORM.resolved_at] = None
+    if assigned_to is not None:
+        values[AlertORM.assigned_to] = assigned_to
+    if (status is not None and status != "open") or assigned_to:
+        values[AlertORM.acknowledged_at] = func.coalesce(AlertORM.acknowledged_at, now)
+    if notes is not None:
+        values[AlertORM.notes] = notes
+    if not values:
+        return 0
+
+    query = db.query(AlertORM)
+    if ids is not None:
+        query = query.filter(AlertORM.id.in_(ids))
+    if filter_status:
+        query = query.filter(AlertORM.status == filter_status)
+    if filter_rule_id:
+        query = query.filter(AlertORM.rule_id == filter_rule_id)
+    if created_from:
+        query = query.filter(AlertORM.created_at >= created_from)
+    if created_to:
+        query = query.filter(AlertORM.created_at < created_to)
+
+    deltas: Dict[tuple, int] = {}
+    if status is not None or assigned_to is not None:
+        for old_key, count in counts_by_key(query).items():
+            rule_id, old_status, old_assignee = old_key
+            new_key = counter_key(
+                rule_id,
+                status if status is not None else old_status,
+                assigned_to if assigned_to is not None else old_assignee,
+            )
+            if new_key != old_key:
+                deltas[old_key] = deltas.get(old_key, 0) - count
+                deltas[new_key] = deltas.get(new_key, 0) + count
+
+    updated = query.update(values, synchronize_session=False)
+    bump_counters(db, deltas)
+    db.commit()
+    logger.info("Bulk-updated %d alerts", updated)
+    return updated
+
+
 def get_alert_rules(
     db: Session,
     is_active: Optional[bool] = None,
@@ -136,6 +506,36 @@ def get_alert_rules(
     return query.order_by(AlertRuleORM.created_at.desc()).all()
 
 
+# Колонки строк get_alert_rule_rows; совпадают с полями AlertRuleOut
+RULE_COLUMNS = (
+    "id",
+    "name",
+    "description",
+    "severity_filter",
+    "category_filter",
+    "source_filter",
+    "is_active",
+    "created_by",
+    "created_at",
+    "aggregation_window_seconds",
+    "suppress_from",
+    "suppress_until",
+    "src_cidrs",
+    "dst_cidrs",
+    "rule_type",
+)
+_RULE_SELECT = tuple(_RULES.c[name] for name in RULE_COLUMNS)
+
+
+def get_alert_rule_rows(db: Session, is_active: Optional[bool] = None) -> List[tuple]:
+    """get_alert_rules as plain row tuples in RULE_COLUMNS order (CIDR lists as stored strings)."""
+    stmt = lambda_stmt(lambda: select(*_RULE_SELECT))
+    if is_active is not None:
+        stmt += lambda s: s.where(_RULES.c.is_active == is_active)
+    stmt += lambda s: s.order_by(_RULES.c.created_at.desc())
+    return [tuple(row) for row in db.execute(stmt)]
+
+
 def get_alert_rule_by_id(db: Session, rule_id: int) -> Optional[AlertRuleORM]:
     """Get a single alert rule by ID."""
     return db.query(AlertRuleORM).filter(AlertRuleORM.id == rule_id).first()
@@ -150,8 +550,13 @@ def create_alert_rule(
     source_filter: Optional[str],
     is_active: bool,
     created_by: Optional[str],
+    aggregation_window_seconds: Optional[int] = None,
+    suppress_from: Optional[datetime] = None,
+    suppress_until: Optional[datetime] = None,
+    src_cidrs: Optional[List[str]] = None,
+    dst_cidrs: Optional[List[str]] = None,
 ) -> AlertRuleORM:
-    """Create a new alert rule."""
+    """Create a new alert rule. Invalid CIDRs raise ValueError."""
     rule = AlertRuleORM(
         name=name,
         description=description,
@@ -160,6 +565,11 @@ def create_alert_rule(
         source_filter=source_filter,
         is_active=is_active,
         created_by=created_by,
+        aggregation_window_seconds=aggregation_window_seconds,
+        suppress_from=suppress_from,
+        suppress_until=suppress_until,
+        src_cidrs=join_cidrs(src_cidrs),
+        dst_cidrs=join_cidrs(dst_cidrs),
     )
     db.add(rule)
     db.commit()
@@ -177,8 +587,18 @@ def update_alert_rule(
     category_filter: Optional[str] = None,
     source_filter: Optional[str] = None,
     is_active: Optional[bool] = None,
+    aggregation_window_seconds: Optional[int] = None,
+    suppress_from: Optional[datetime] = None,
+    suppress_until: Optional[datetime] = None,
+    src_cidrs: Optional[List[str]] = None,
+    dst_cidrs: Optional[List[str]] = None,
+    clear_fields: Sequence[str] = (),
 ) -> Optional[AlertRuleORM]:
-    """Update an alert rule."""
+    """
+    Update an alert rule; None leaves a field as is. An empty CIDR list removes
+    the IP condition; ``clear_fields`` names fields to set to NULL (the
+    suppression window: "suppress_from", "suppress_until").
+    """
     rule = get_alert_rule_by_id(db, rule_id)
     if not rule:
         return None
@@ -195,6 +615,21 @@ def update_alert_rule(
         rule.source_filter = source_filter
     if is_active is not None:
         rule.is_active = is_active
+    if aggregation_window_seconds is not None:
+        # 0 отключает группировку
+        rule.aggregation_window_seconds = aggregation_window_seconds or None
+    if suppress_from is not None:
+        rule.suppress_from = suppress_from
+    if suppress_until is not None:
+        rule.suppress_until = suppress_until
+    for field in clear_fields:
+        if field not in ("suppress_from", "suppress_until"):
+            raise ValueError(f"field {field!r} cannot be cleared")
+        setattr(rule, field, None)
+    if src_cidrs is not None:
+        rule.src_cidrs = join_cidrs(src_cidrs)
+    if dst_cidrs is not None:
+        rule.dst_cidrs = join_cidrs(dst_cidrs)
 
     db.commit()
     db.refresh(rule)
@@ -207,6 +642,7 @@ def delete_alert_rule(db: Session, rule_id: int) -> bool:
     if not rule:
         return False
 
+    delete_rule_counters(db, rule_id)
     db.delete(rule)
     db.commit()
     logger.info("Deleted alert rule: %s (id=%d)", rule.name, rule_id)
@@ -0,0 +1,291 @@
+"""
+Alert counts per rule, status and assignee without scanning the alerts table.
+
+alert_counters holds one row per (rule_id, status, assigned_to) combination.
+alert_service adjusts it in the same transaction that creates or changes
+alerts, so /api/alerts/stats reads a table whose size depends on the number
+of rules and analysts, not alerts. Archived alerts (alerts_archive) stay
+counted. Writes that bypass alert_service (event deletes cascading to
+alerts, manual SQL) are corrected by reconcile_alert_counters(), which
+main.py runs at startup and then every ALERT_STATS_RECONCILE_INTERVAL_SECONDS.
+On Postgres writers take a shared advisory lock (lock_counters) and the
+reconciler an exclusive one, so its recount and overwrite see no counter
+change committed in between.
+
+MTTR/MTTA are averaged in SQL over alerts created within the requested
+period (created_at index range), since they depend on per-alert timestamps.
+When the period reaches back past the archive age (ALERT_ARCHIVE_AFTER_DAYS),
+alerts_archive is read too (UNION ALL), so old resolved alerts are not lost.
+"""
+
+import logging
+import os
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, union_all, update
+from sqlalchemy.orm import Session
+
+from app.models.alert import AlertRuleStats, AlertStats
+from app.models.db_models import AlertArchiveORM, AlertCounterORM, AlertORM, AlertRuleORM
+
+logger = logging.getLogger(__name__)
+
+ALERT_STATS_RECONCILE_INTERVAL_SECONDS = int(os.getenv("ALERT_STATS_RECONCILE_INTERVAL_SECONDS", "600"))
+
+# (rule_id, status, assigned_to или "")
+CounterKey = Tuple[int, str, str]
+
+_COUNTERS_LOCK_KEY = zlib.crc32(b"alert_counters")
+
+
+def counter_key(rule_id: int, status: str, assigned_to: Optional[str]) -> CounterKey:
+    return (rule_id, status, assigned_to or "")
+
+
+def lock_counters(db: Session, exclusive: bool = False) -> None:
+    """
+    Transaction-level advisory lock on the counters (Postgres only; SQLite
+    serializes writers by itself). Writers of alerts/counters take it shared,
+    the reconciler exclusive; released on commit/rollback.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    lock = func.pg_advisory_xact_lock if exclusive else func.pg_advisory_xact_lock_shared
+    db.execute(select(lock(_COUNTERS_LOCK_KEY)))
+
+
+def bump_counters(db: Session, deltas: Dict[CounterKey, int]) -> None:
+    """
+    Add deltas to the counters inside the caller's transaction (no commit).
+    One upsert for all keys on Postgres/SQLite.
+    """
+    rows = [
+        {"rule_id": rule_id, "status": status, "assigned_to": assignee, "count": delta}
+        for (rule_id, status, assignee), delta in deltas.items()
+        if delta
+    ]
+    if not rows:
+        return
+    # Пока идёт сверка, прибавка ждёт: иначе сверка перезапишет её старым значением
+    lock_counters(db)
+
+    table = AlertCounterORM.__table__
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        # Без ON CONFLICT: UPDATE, а для отсутствующих ключей INSERT
+        for row in rows:
+            result = db.execute(
+                update(table)
+                .where(
+                    table.c.rule_id == row["rule_id"],
+                    table.c.status == row["status"],
+                    table.c.assigned_to == row["assigned_to"],
+                )
+                .values(count=table.c.count + row["count"])
+            )
+            if result.rowcount == 0:
+                db.execute(insert(table), [row])
+        return
+
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.rule_id, table.c.status, table.c.assigned_to],
+        set_={"count": table.c.count + stmt.excluded.count},
+    )
+    db.execute(stmt, rows)
+
+
+def _set_counters(db: Session, values: Dict[CounterKey, int]) -> None:
+    """Overwrite counters with exact values (used by the reconciler)."""
+    rows = [
+        {"rule_id": rule_id, "status": status, "assigned_to": assignee, "count": count}
+        for (rule_id, status, assignee), count in values.items()
+    ]
+    if not rows:
+        return
+
+    table = AlertCounterORM.__table__
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        for row in rows:
+            _delete_counter(db, (row["rule_id"], row["status"], row["assigned_to"]))
+        db.execute(insert(table), rows)
+        return
+
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.rule_id, table.c.status, table.c.assigned_to],
+        set_={"count": stmt.excluded.count},
+    )
+    db.execute(stmt, rows)
+
+
+def _delete_counter(db: Session, key: CounterKey) -> None:
+    table = AlertCounterORM.__table__
+    rule_id, status, assignee = key
+    db.execute(
+        delete(table).where(
+            table.c.rule_id == rule_id, table.c.status == status, table.c.assigned_to == assignee
+        )
+    )
+
+
+def _dialect_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def counts_by_key(query, model=AlertORM) -> Counter:
+    """GROUP BY rule_id, status, assigned_to over an alerts query -> Counter of CounterKey."""
+    rows = (
+        query.with_entities(model.rule_id, model.status, model.assigned_to, func.count(model.id))
+        .group_by(model.rule_id, model.status, model.assigned_to)
+        .all()
+    )
+    counts: Counter = Counter()
+    for rule_id, status, assignee, count in rows:
+        counts[counter_key(rule_id, status, assignee)] += count
+    return counts
+
+
+def delete_rule_counters(db: Session, rule_id: int) -> None:
+    db.query(AlertCounterORM).filter(AlertCounterORM.rule_id == rule_id).delete(synchronize_session=False)
+
+
+def reconcile_alert_counters(db: Session) -> int:
+    """
+    Recount alerts with one GROUP BY and fix counters that drifted.
+    Returns number of corrected counters (all of them on first run); rows
+    that dropped to zero are removed along the way. Runs under the exclusive
+    counters lock: bump_counters and archiving wait for it to commit.
+    """
+    lock_counters(db, exclusive=True)
+    # Архив входит в счётчики: перенос алертов не меняет итоги /api/alerts/stats
+    actual = counts_by_key(db.query(AlertORM)) + counts_by_key(db.query(AlertArchiveORM), AlertArchiveORM)
+    stored = {
+        (row.rule_id, row.status, row.assigned_to): row.count
+        for row in db.query(AlertCounterORM).all()
+    }
+
+    fixes = {key: count for key, count in actual.items() if stored.get(key) != count}
+    stale = [key for key in stored if key not in actual]
+    if not fixes and not stale:
+        db.rollback()  # снимает блокировку
+        return 0
+
+    for key in stale:
+        _delete_counter(db, key)
+    _set_counters(db, fixes)
+    db.commit()
+
+    # Нулевые строки остаются после переходов статусов; их удаление - уборка, а не дрейф
+    corrected = len(fixes) + sum(1 for key in stale if stored[key])
+    if not corrected:
+        return 0
+    if stored:
+        logger.warning("Alert counters drifted: corrected %d of %d", corrected, len(stored))
+    else:
+        logger.info("Initialized %d alert counters", corrected)
+    return corrected
+
+
+def _seconds_between(db: Session, start, end):
+    """SQL expression for end - start in seconds (NULL if either is NULL)."""
+    if db.get_bind().dialect.name == "sqlite":
+        return (func.julianday(end) - func.julianday(start)) * 86400.0
+    return func.extract("epoch", end - start)
+
+
+def get_alert_stats(db: Session, since: datetime) -> AlertStats:
+    """
+    Counts per status, rule and assignee from alert_counters, plus per-rule
+    MTTR (created_at -> resolved_at) and MTTA (created_at -> acknowledged_at)
+    for alerts created since ``since``.
+    """
+    by_status: Counter = Counter()
+    by_assignee: Counter = Counter()
+    rule_status: Dict[int, Counter] = defaultdict(Counter)
+    unassigned = 0
+    for rule_id, status, assignee, count in (
+        db.query(AlertCounterORM.rule_id, AlertCounterORM.status, AlertCounterORM.assigned_to, AlertCounterORM.count)
+        .filter(AlertCounterORM.count != 0)
+        .all()
+    ):
+        by_status[status] += count
+        rule_status[rule_id][status] += count
+        if assignee:
+            by_assignee[assignee] += count
+        else:
+            unassigned += count
+
+    timings = {row.rule_id: row for row in _timings(db, since)}
+
+    rule_ids = set(rule_status) | set(timings)
+    names = dict(db.query(AlertRuleORM.id, AlertRuleORM.name).filter(AlertRuleORM.id.in_(rule_ids)).all()) if rule_ids else {}
+
+    by_rule = []
+    for rule_id in sorted(rule_ids):
+        statuses = rule_status.get(rule_id, Counter())
+        timing = timings.get(rule_id)
+        by_rule.append(
+            AlertRuleStats(
+                rule_id=rule_id,
+                rule_name=names.get(rule_id),
+                total=sum(statuses.values()),
+                by_status=dict(statuses),
+                resolved=timing.resolved if timing else 0,
+                mttr_seconds=_round(timing.mttr) if timing else None,
+                acknowledged=timing.acknowledged if timing else 0,
+                mtta_seconds=_round(timing.mtta) if timing else None,
+            )
+        )
+
+    return AlertStats(
+        total=sum(by_status.values()),
+        by_status=dict(by_status),
+        by_assignee=dict(by_assignee),
+        unassigned=unassigned,
+        by_rule=by_rule,
+        since=since,
+    )
+
+
+def _timings(db: Session, since: datetime) -> list:
+    """Per-rule resolved/acknowledged counts and MTTR/MTTA of alerts created since ``since``."""
+    from app.services import alert_archive
+
+    tables = [AlertORM.__table__]
+    archive_age = alert_archive.ALERT_ARCHIVE_AFTER_DAYS
+    # Алерт, закрытый раньше границы архива, создан ещё раньше: архив нужен только длинным окнам
+    if not archive_age or since < datetime.utcnow() - timedelta(days=archive_age):
+        tables.append(AlertArchiveORM.__table__)
+    parts = [
+        select(table.c.rule_id, table.c.created_at, table.c.resolved_at, table.c.acknowledged_at).where(
+            table.c.created_at >= since
+        )
+        for table in tables
+    ]
+    alerts = (union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+    return db.execute(
+        select(
+            alerts.c.rule_id,
+            func.count(alerts.c.resolved_at).label("resolved"),
+            func.avg(_seconds_between(db, alerts.c.created_at, alerts.c.resolved_at)).label("mttr"),
+            func.count(alerts.c.acknowledged_at).label("acknowledged"),
+            func.avg(_seconds_between(db, alerts.c.created_at, alerts.c.acknowledged_at)).label("mtta"),
+        ).group_by(alerts.c.rule_id)
+    ).all()
+
+
+def _round(value) -> Optional[float]:
+    return round(float(value), 1) if value is not None else None
+
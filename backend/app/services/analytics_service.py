@@ -0,0 +1,268 @@
+"""
+Columnar analytical sidecar for the events store.
+
+Closed daily partitions of ``security_events`` are exported to Parquet files
+under ANALYTICS_DIR. Aggregate queries over a time range are split at the end
+of the exported range: the cold part is answered by DuckDB over the Parquet
+files (only files overlapping the range are scanned), the hot part by a SQL
+GROUP BY on the OLTP table. Results are merged by key.
+
+Optional dependencies: ``pip install duckdb pyarrow``. Without them the
+sidecar is disabled and every query goes to the OLTP table.
+"""
+import logging
+import os
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.db_models import SecurityEventORM
+from app.services.event_service import EVENT_COLUMNS, iter_event_rows
+from app.time_utils import as_naive_utc
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    duckdb = None
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "false").lower() == "true"
+ANALYTICS_DIR = Path(os.getenv("ANALYTICS_DIR", "data/analytics"))
+# Партиция считается закрытой через столько дней после её окончания (опоздавшие события)
+ANALYTICS_CLOSE_AFTER_DAYS = int(os.getenv("ANALYTICS_CLOSE_AFTER_DAYS", "1"))
+ANALYTICS_EXPORT_INTERVAL_SECONDS = int(os.getenv("ANALYTICS_EXPORT_INTERVAL_SECONDS", "3600"))
+
+GROUP_BY_FIELDS = ("source", "category", "severity", "day")
+PARTITION_PREFIX = "events_"
+
+
+def is_available() -> bool:
+    return ANALYTICS_ENABLED and duckdb is not None
+
+
+def _partition_path(day: date) -> Path:
+    return ANALYTICS_DIR / f"{PARTITION_PREFIX}{day.isoformat()}.parquet"
+
+
+def _exported_days() -> List[date]:
+    if not ANALYTICS_DIR.exists():
+        return []
+    days = []
+    for path in ANALYTICS_DIR.glob(f"{PARTITION_PREFIX}*.parquet"):
+        try:
+            days.append(date.fromisoformat(path.stem[len(PARTITION_PREFIX):]))
+        except ValueError:
+            continue
+    return sorted(days)
+
+
+def columnar_boundary() -> Optional[datetime]:
+    """End (exclusive) of the newest exported partition; older events are served from Parquet."""
+    days = _exported_days()
+    if not days:
+        return None
+    newest = days[-1]
+    return datetime.combine(newest + timedelta(days=1), time.min)
+
+
+def _contiguous_start() -> Optional[datetime]:
+    """Start of the contiguous exported range ending at columnar_boundary()."""
+    days = _exported_days()
+    if not days:
+        return None
+    start = days[-1]
+    present = set(days)
+    while start - timedelta(days=1) in present:
+        start -= timedelta(days=1)
+    return datetime.combine(start, time.min)
+
+
+def export_closed_partitions(db: Session, now: Optional[datetime] = None) -> List[str]:
+    """
+    Export every closed day that has no Parquet file yet.
+    Returns names of the files written.
+    """
+    if pa is None:
+        raise RuntimeError("Analytics export requires duckdb and pyarrow")
+
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    cutoff_day = now.date() - timedelta(days=ANALYTICS_CLOSE_AFTER_DAYS)
+
+    first_ts = db.query(func.min(SecurityEventORM.timestamp)).scalar()
+    if first_ts is None:
+        return []
+
+    ANALYTICS_DIR.mkdir(parents=True, exist_ok=True)
+    exported = set(_exported_days())
+    written = []
+    day = first_ts.date()
+    while day < cutoff_day:
+        if day not in exported:
+            count = _export_day(db, day)
+            written.append(_partition_path(day).name)
+            logger.info("Exported %d events for %s to columnar store", count, day)
+        day += timedelta(days=1)
+    return written
+
+
+EXPORT_BATCH_ROWS = 50000
+
+
+def _export_day(db: Session, day: date) -> int:
+    """Write one day to Parquet in row groups of EXPORT_BATCH_ROWS, so memory stays bounded."""
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+    schema = pa.schema(
+        [
+            ("id", pa.string()),
+            ("timestamp", pa.timestamp("us")),
+            ("source", pa.string()),
+            ("category", pa.string()),
+            ("severity", pa.string()),
+            ("description", pa.string()),
+            ("src_ip", pa.string()),
+            ("dst_ip", pa.string()),
+            ("hostname", pa.string()),
+            ("duplicate_count", pa.int32()),
+        ]
+    )
+
+    # Запись через временный файл: читатели никогда не видят половину партиции
+    path = _partition_path(day)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    total = 0
+    batch: List[Tuple] = []
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        for row in iter_event_rows(db, start=start, end=end, chunk_size=10000):
+            batch.append(row)
+            if len(batch) >= EXPORT_BATCH_ROWS:
+                total += _write_batch(writer, schema, batch)
+                batch = []
+        if batch or total == 0:
+            total += _write_batch(writer, schema, batch)
+    os.replace(tmp_path, path)
+    return total
+
+
+def _write_batch(writer, schema, rows: List[Tuple]) -> int:
+    columns = [list(values) for values in zip(*rows)] if rows else [[] for _ in EVENT_COLUMNS]
+    columns[1] = [as_naive_utc(ts) for ts in columns[1]]
+    arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    return len(rows)
+
+
+def aggregate_events(
+    db: Session,
+    group_by: str,
+    start: datetime,
+    end: datetime,
+    severity: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: int = 20,
+) -> Tuple[List[Dict], Dict]:
+    """
+    Count events in [start, end) grouped by one field, top ``limit`` keys first.
+    Returns (items, plan) where plan tells which ranges each engine served.
+    """
+    if group_by not in GROUP_BY_FIELDS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY_FIELDS)}")
+
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    counts: Counter = Counter()
+    plan: Dict = {"columnar": None, "oltp": []}
+
+    hot_ranges = [(start, end)]
+    if is_available():
+        cold_start, boundary = _contiguous_start(), columnar_boundary()
+        if boundary is not None:
+            cold_lo, cold_hi = max(start, cold_start), min(end, boundary)
+            if cold_lo < cold_hi:
+                counts.update(_aggregate_columnar(group_by, cold_lo, cold_hi, severity, category))
+                plan["columnar"] = [cold_lo.isoformat(), cold_hi.isoformat()]
+                hot_ranges = [(start, cold_lo), (cold_hi, end)]
+
+    for lo, hi in hot_ranges:
+        if lo < hi:
+            counts.update(_aggregate_oltp(db, group_by, lo, hi, severity, category))
+            plan["oltp"].append([lo.isoformat(), hi.isoformat()])
+
+    items = [{"key": key, "count": count} for key, count in counts.most_common(limit)]
+    return items, plan
+
+
+def _aggregate_oltp(
+    db: Session,
+    group_by: str,
+    start: datetime,
+    end: datetime,
+    severity: Optional[str],
+    category: Optional[str],
+) -> Dict[str, int]:
+    if group_by == "day":
+        key_expr = func.date(SecurityEventORM.timestamp)
+    else:
+        key_expr = getattr(SecurityEventORM, group_by)
+
+    query = db.query(key_expr, func.count()).filter(
+        SecurityEventORM.timestamp >= start,
+        SecurityEventORM.timestamp < end,
+    )
+    if severity:
+        query = query.filter(SecurityEventORM.severity.ilike(severity))
+    if category:
+        query = query.filter(SecurityEventORM.category.ilike(category))
+    return {_key_str(key): count for key, count in query.group_by(key_expr).all()}
+
+
+def _aggregate_columnar(
+    group_by: str,
+    start: datetime,
+    end: datetime,
+    severity: Optional[str],
+    category: Optional[str],
+) -> Dict[str, int]:
+    # Partition pruning по имени файла: читаем только дни внутри диапазона
+    files = []
+    day = start.date()
+    while datetime.combine(day, time.min) < end:
+        path = _partition_path(day)
+        if path.exists():
+            files.append(str(path))
+        day += timedelta(days=1)
+    if not files:
+        return {}
+
+    key_expr = "CAST(timestamp AS DATE)" if group_by == "day" else group_by
+    # union_by_name: партиции, выгруженные до появления src_ip/dst_ip/hostname, читаются вместе с новыми
+    sql = [f"SELECT {key_expr} AS key, count(*) AS cnt FROM read_parquet(?, union_by_name = true) WHERE timestamp >= ? AND timestamp < ?"]
+    params: list = [files, start, end]
+    if severity:
+        sql.append("AND lower(severity) = lower(?)")
+        params.append(severity)
+    if category:
+        sql.append("AND lower(category) = lower(?)")
+        params.append(category)
+    sql.append("GROUP BY 1")
+
+    con = duckdb.connect()
+    try:
+        rows = con.execute(" ".join(sql), params).fetchall()
+    finally:
+        con.close()
+    return {_key_str(key): count for key, count in rows}
+
+
+def _key_str(key) -> str:
+    if isinstance(key, (date, datetime)):
+        return key.isoformat()[:10]
+    return str(key)
@@ -0,0 +1,423 @@
+"""
+Retroactive evaluation of alert rules over stored events (backfill).
+
+A run splits security_events into time ranges of BACKFILL_RANGE_HOURS and
+evaluates them in a process pool of BACKFILL_PROCESSES workers. Every worker
+opens its own engine and walks its range in (timestamp, id) order with keyset
+pages of BACKFILL_CHUNK_SIZE rows, matching them with RuleMatcher - the same
+code path as ingest, so any rule the matcher understands can be backfilled.
+Ranges are many more than workers and handed out as workers free up, so
+uneven event density does not leave cores idle.
+
+Alerts of a page are merged idempotently: (rule, event) pairs that already
+have an alert, and events inside the time span of an existing group of an
+aggregating rule, are skipped; suppression windows apply. The page's alerts, counter deltas and the
+range checkpoint (last timestamp, id) are committed in one transaction, so an
+interrupted run resumes exactly where each range stopped:
+
+    python -m app.services.backfill run [--rules 3,4] [--start ...] [--end ...]
+    python -m app.services.backfill resume RUN_ID
+    python -m app.services.backfill status RUN_ID
+
+Aggregating rules fold only into groups the run created in the same range:
+matches near a range boundary, or next to a group that existed before the
+run, start a new group instead of extending it.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, create_engine, func, insert, or_
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.models.db_models import (
+    AlertArchiveORM,
+    AlertORM,
+    AlertRuleORM,
+    BackfillRangeORM,
+    BackfillRunORM,
+    SecurityEventORM,
+)
+from app.services.alert_service import ACTIVE_ALERT_STATUSES, RuleMatcher, _is_suppressed, get_active_rules
+from app.services.alert_stats import bump_counters, counter_key
+from app.services.event_service import _event_columns
+from app.time_utils import as_naive_utc
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_PROCESSES = int(os.getenv("BACKFILL_PROCESSES", "0")) or os.cpu_count() or 1
+BACKFILL_RANGE_HOURS = float(os.getenv("BACKFILL_RANGE_HOURS", "6"))
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", "1000"))
+
+
+def create_run(
+    db: Session,
+    rule_ids: Optional[Sequence[int]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    range_hours: float = BACKFILL_RANGE_HOURS,
+) -> BackfillRunORM:
+    """Create a run with its ranges covering the events in [start, end). No rule_ids - all active rules."""
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    bounds = db.query(func.min(SecurityEventORM.timestamp), func.max(SecurityEventORM.timestamp))
+    if start:
+        bounds = bounds.filter(SecurityEventORM.timestamp >= start)
+    if end:
+        bounds = bounds.filter(SecurityEventORM.timestamp < end)
+    lo, hi = bounds.one()
+
+    run = BackfillRunORM(rule_ids=",".join(str(rule_id) for rule_id in rule_ids) if rule_ids else None)
+    db.add(run)
+    if lo is not None:
+        step = timedelta(hours=range_hours)
+        # Границы по сетке часов: одинаковые диапазоны у повторных прогонов
+        cursor = lo.replace(minute=0, second=0, microsecond=0)
+        if start:
+            cursor = max(cursor, start)
+        while cursor <= hi:
+            range_end = min(cursor + step, end) if end else cursor + step
+            run.ranges.append(BackfillRangeORM(range_start=cursor, range_end=range_end))
+            cursor = range_end
+    if not run.ranges:
+        run.status = "done"
+        run.finished_at = datetime.now(timezone.utc)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def run_backfill(
+    db: Session,
+    run_id: int,
+    processes: int = BACKFILL_PROCESSES,
+    chunk_size: int = BACKFILL_CHUNK_SIZE,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, object]:
+    """
+    Evaluate the unfinished ranges of a run (fresh or interrupted) and return
+    a summary. With one process, or an in-memory SQLite database that other
+    processes cannot open, ranges are evaluated in this session.
+    ``progress(done, total)`` is called as ranges finish; an exception raised
+    from it stops the run (the pool is terminated, checkpoints stay).
+    """
+    pending = [
+        range_id
+        for (range_id,) in db.query(BackfillRangeORM.id)
+        .filter(BackfillRangeORM.run_id == run_id, BackfillRangeORM.status != "done")
+        .order_by(BackfillRangeORM.range_start)
+    ]
+    url = db.get_bind().url
+    processes = min(processes, len(pending))
+    failed = done = 0
+    if processes <= 1 or url.database in (None, "", ":memory:"):
+        for range_id in pending:
+            failed += _process_range_safely(db, range_id, chunk_size) is not None
+            done += 1
+            if progress is not None:
+                progress(done, len(pending))
+    else:
+        # spawn: рабочие не наследуют соединения и состояние родителя
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(
+            processes, initializer=_init_worker, initargs=(url.render_as_string(hide_password=False),)
+        ) as pool:
+            for error in pool.imap_unordered(_worker_process_range, [(range_id, chunk_size) for range_id in pending]):
+                failed += error is not None
+                done += 1
+                if progress is not None:
+                    progress(done, len(pending))
+
+    db.expire_all()
+    run = db.get(BackfillRunORM, run_id)
+    run.status = "failed" if failed else "done"
+    run.finished_at = datetime.now(timezone.utc)
+    db.commit()
+    summary = run_summary(db, run_id)
+    logger.info("Backfill run %d: %s", run_id, summary)
+    return summary
+
+
+def run_summary(db: Session, run_id: int) -> Dict[str, object]:
+    run = db.get(BackfillRunORM, run_id)
+    if run is None:
+        raise ValueError(f"backfill run {run_id} not found")
+    statuses = dict(
+        db.query(BackfillRangeORM.status, func.count())
+        .filter(BackfillRangeORM.run_id == run_id)
+        .group_by(BackfillRangeORM.status)
+        .all()
+    )
+    scanned, created = (
+        db.query(
+            func.coalesce(func.sum(BackfillRangeORM.events_scanned), 0),
+            func.coalesce(func.sum(BackfillRangeORM.alerts_created), 0),
+        )
+        .filter(BackfillRangeORM.run_id == run_id)
+        .one()
+    )
+    return {
+        "run_id": run.id,
+        "status": run.status,
+        "ranges": statuses,
+        "events_scanned": scanned,
+        "alerts_created": created,
+    }
+
+
+def process_range(db: Session, range_id: int, chunk_size: int = BACKFILL_CHUNK_SIZE) -> Tuple[int, int]:
+    """Evaluate one range from its checkpoint to the end. Returns (events scanned, alerts created) by this call."""
+    item = db.get(BackfillRangeORM, range_id)
+    if item is None or item.status == "done":
+        return 0, 0
+    range_start, range_end = item.range_start, item.range_end
+    last_ts, last_id = item.last_timestamp, item.last_id
+    scope = _Scope(range_start, range_end, item.run.created_at)
+    matcher = RuleMatcher(_run_rules(db, item.run))
+    rules = {rule.id: rule for rule in matcher.rules}
+    for rule in matcher.rules:
+        db.expunge(rule)  # не перечитываются после каждого коммита порции
+    db.commit()
+
+    ts = SecurityEventORM.timestamp
+    base = db.query(*_event_columns()).filter(ts >= range_start, ts < range_end)
+    scanned = created = 0
+    while rules:
+        query = base
+        if last_ts is not None:
+            query = query.filter(or_(ts > last_ts, and_(ts == last_ts, SecurityEventORM.id > last_id)))
+        rows = query.order_by(ts, SecurityEventORM.id).limit(chunk_size).all()
+        if not rows:
+            break
+        chunk_created = _merge_alerts(db, rows, matcher, rules, scope)
+        last_ts, last_id = rows[-1].timestamp, rows[-1].id
+        # Чекпоинт в одной транзакции с алертами порции: повтор после сбоя ничего не задваивает
+        db.query(BackfillRangeORM).filter(BackfillRangeORM.id == range_id).update(
+            {
+                BackfillRangeORM.last_timestamp: last_ts,
+                BackfillRangeORM.last_id: last_id,
+                BackfillRangeORM.events_scanned: BackfillRangeORM.events_scanned + len(rows),
+                BackfillRangeORM.alerts_created: BackfillRangeORM.alerts_created + chunk_created,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+        scanned += len(rows)
+        created += chunk_created
+        if len(rows) < chunk_size:
+            break
+
+    db.query(BackfillRangeORM).filter(BackfillRangeORM.id == range_id).update(
+        {BackfillRangeORM.status: "done", BackfillRangeORM.error: None}, synchronize_session=False
+    )
+    db.commit()
+    return scanned, created
+
+
+def _run_rules(db: Session, run: BackfillRunORM) -> List[AlertRuleORM]:
+    if not run.rule_ids:
+        return get_active_rules(db)
+    rule_ids = [int(rule_id) for rule_id in run.rule_ids.split(",")]
+    return (
+        db.query(AlertRuleORM)
+        .filter(AlertRuleORM.id.in_(rule_ids), AlertRuleORM.rule_type == "filter")
+        .all()
+    )
+
+
+class _Scope(NamedTuple):
+    """Where a range may fold events: groups created by this run within [start, end)."""
+
+    start: datetime
+    end: datetime
+    run_started: datetime
+
+
+def _merge_alerts(
+    db: Session, rows: Sequence, matcher: RuleMatcher, rules: Dict[int, AlertRuleORM], scope: _Scope
+) -> int:
+    """
+    Alerts for one page of event rows. Skipped: (rule, event) pairs that already
+    have an alert, and events inside an existing group of an aggregating rule.
+    """
+    matches = [(row, rule_ids) for row in rows for rule_ids in (matcher.match(row),) if rule_ids]
+    if not matches:
+        return 0
+    event_ids = [row.id for row, _ in matches]
+    # Архивированные (закрытые) алерты тоже считаются: иначе повторный прогон создал бы их заново
+    existing = {
+        pair
+        for model in (AlertORM, AlertArchiveORM)
+        for pair in db.query(model.rule_id, model.event_id).filter(model.event_id.in_(event_ids)).all()
+    }
+    covered = _covering_groups(
+        db, rows, [rule_id for rule_id, rule in rules.items() if rule.aggregation_window_seconds], scope
+    )
+
+    new_alerts: List[dict] = []
+    deltas: Counter = Counter()
+    for row, rule_ids in matches:
+        for rule_id in rule_ids:
+            rule = rules[rule_id]
+            if (rule_id, row.id) in existing or _is_suppressed(rule, row.timestamp):
+                continue
+            if rule.aggregation_window_seconds:
+                if any(first <= row.timestamp <= last for first, last in covered.get((rule_id, row.source), ())):
+                    continue  # уже свёрнуто в группу при приёме или прошлым прогоном
+                if _fold_in_range(db, rule, row, scope):
+                    continue
+            alert = {
+                "rule_id": rule_id,
+                "event_id": row.id,
+                "status": "open",
+                "group_key": row.source if rule.aggregation_window_seconds else None,
+                "count": 1,
+                "first_seen": row.timestamp,
+                "last_seen": row.timestamp,
+            }
+            if rule.aggregation_window_seconds:
+                db.execute(insert(AlertORM), [alert])  # следующие события страницы сворачиваются в неё
+            else:
+                new_alerts.append(alert)
+            deltas[counter_key(rule_id, "open", None)] += 1
+    created = sum(deltas.values())
+    if new_alerts:
+        db.execute(insert(AlertORM), new_alerts)
+    if deltas:
+        bump_counters(db, deltas)
+    return created
+
+
+def _covering_groups(
+    db: Session, rows: Sequence, rule_ids: List[int], scope: _Scope
+) -> Dict[Tuple[int, str], List[tuple]]:
+    """
+    [first_seen, last_seen] of groups that existed before the run and overlap
+    the page. Folded events leave no alert row of their own, so an event inside
+    such a span counts as already alerted on. Groups of this run are excluded:
+    the range checkpoint already tells which of their events were processed.
+    """
+    if not rule_ids:
+        return {}
+    groups: Dict[Tuple[int, str], List[tuple]] = {}
+    for rule_id, group_key, first_seen, last_seen in db.query(
+        AlertORM.rule_id, AlertORM.group_key, AlertORM.first_seen, AlertORM.last_seen
+    ).filter(
+        AlertORM.rule_id.in_(rule_ids),
+        AlertORM.group_key.isnot(None),
+        AlertORM.created_at < scope.run_started,
+        AlertORM.first_seen <= rows[-1].timestamp,
+        AlertORM.last_seen >= rows[0].timestamp,
+    ):
+        groups.setdefault((rule_id, group_key), []).append((first_seen, last_seen))
+    return groups
+
+
+def _fold_in_range(db: Session, rule: AlertRuleORM, row, scope: _Scope) -> bool:
+    """
+    alert_service._fold_into_group limited to the groups this run created in
+    the range: older groups and other ranges' groups are never extended, so
+    what _covering_groups sees does not change while workers run.
+    """
+    window = timedelta(seconds=rule.aggregation_window_seconds)
+    group = (
+        db.query(AlertORM.id)
+        .filter(
+            AlertORM.rule_id == rule.id,
+            AlertORM.group_key == row.source,
+            AlertORM.status.in_(ACTIVE_ALERT_STATUSES),
+            AlertORM.created_at >= scope.run_started,
+            AlertORM.first_seen >= scope.start,
+            AlertORM.last_seen >= row.timestamp - window,
+            AlertORM.last_seen < scope.end,
+        )
+        .order_by(AlertORM.last_seen.desc())
+        .first()
+    )
+    if group is None:
+        return False
+    # Страница идёт по возрастанию времени: событие всегда не раньше last_seen группы
+    db.query(AlertORM).filter(AlertORM.id == group.id).update(
+        {AlertORM.count: AlertORM.count + 1, AlertORM.last_seen: row.timestamp}, synchronize_session=False
+    )
+    return True
+
+
+def _process_range_safely(db: Session, range_id: int, chunk_size: int) -> Optional[str]:
+    """process_range that records a failure on the range instead of raising; returns the error text."""
+    try:
+        process_range(db, range_id, chunk_size)
+        return None
+    except Exception as exc:
+        db.rollback()
+        logger.exception("Backfill range %d failed", range_id)
+        error = f"{type(exc).__name__}: {exc}"
+        db.query(BackfillRangeORM).filter(BackfillRangeORM.id == range_id).update(
+            {BackfillRangeORM.status: "failed", BackfillRangeORM.error: error[:1000]}, synchronize_session=False
+        )
+        db.commit()
+        return error
+
+
+# --- Worker processes ---------------------------------------------------------
+
+_worker_session = None
+
+
+def _init_worker(database_url: str) -> None:
+    global _worker_session
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    _worker_session = sessionmaker(autocommit=False, autoflush=False, bind=create_engine(database_url))
+
+
+def _worker_process_range(args: Tuple[int, int]) -> Optional[str]:
+    range_id, chunk_size = args
+    db = _worker_session()
+    try:
+        return _process_range_safely(db, range_id, chunk_size)
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=BACKFILL_PROCESSES)
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="evaluate rules over stored events")
+    run.add_argument("--rules", type=lambda value: [int(item) for item in value.split(",")], default=None)
+    run.add_argument("--start", type=datetime.fromisoformat)
+    run.add_argument("--end", type=datetime.fromisoformat)
+    run.add_argument("--range-hours", type=float, default=BACKFILL_RANGE_HOURS)
+    resume = commands.add_parser("resume", help="continue an interrupted run")
+    resume.add_argument("run_id", type=int)
+    status = commands.add_parser("status", help="progress of a run")
+    status.add_argument("run_id", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+
+    from app.db import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if args.command == "status":
+            summary = run_summary(db, args.run_id)
+        else:
+            run_id = args.run_id if args.command == "resume" else create_run(
+                db, args.rules, args.start, args.end, args.range_hours
+            ).id
+            summary = run_backfill(db, run_id, processes=args.processes, chunk_size=args.chunk_size)
+        print(json.dumps(summary, default=str, indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""
+Cold tier for aged security events.
+
+Events older than COLD_AFTER_DAYS are moved out of ``security_events`` into
+append-only segment files in COLD_STORAGE_DIR (requires: pip install zstandard).
+Events referenced by alerts (archived ones included) stay in the hot table.
+Technique tags (event_techniques) of moved events are deleted and are
+recomputed with the current mapping when the events are restored.
+
+Segment layout:
+
+    events-<first ts>-<suffix>.seg       zstd frames of COLD_BLOCK_ROWS rows each
+                                         (JSON arrays, SEGMENT_COLUMNS order),
+                                         rows sorted by timestamp
+    events-<first ts>-<suffix>.seg.idx   JSON: sparse time index (first/last
+                                         timestamp, offset and length of every
+                                         block), row count, min/max timestamp and
+                                         min/max (plus distinct values when few)
+                                         of severity and category
+
+The index is written last, so a segment becomes visible only when complete;
+segments are never modified in place (restore rewrites the remainder as a new
+segment and deletes the old one).
+
+Reads (get_events / get_event_rows with a start older than the newest cold
+event) open only segments whose time range and severity/category stats can
+match, and decompress only the blocks overlapping the time range.
+
+Commands (run from backend/):
+    python -m app.services.cold_storage tier [--older-than-days 90]
+    python -m app.services.cold_storage restore --start 2024-01-01 --end 2024-02-01
+    python -m app.services.cold_storage stats
+"""
+import argparse
+import heapq
+import ipaddress
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import exists, insert, select
+from sqlalchemy.orm import Session
+
+from app.ip_utils import parse_network
+from app.models.db_models import AlertArchiveORM, AlertORM, EventTechniqueORM, SecurityEventORM
+from app.serialization import dumps
+from app.services import mitre_mapping
+from app.time_utils import as_naive_utc
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+COLD_STORAGE_ENABLED = os.getenv("COLD_STORAGE_ENABLED", "false").lower() == "true"
+COLD_STORAGE_DIR = Path(os.getenv("COLD_STORAGE_DIR", "data/cold"))
+COLD_AFTER_DAYS = int(os.getenv("COLD_AFTER_DAYS", "90"))
+COLD_SEGMENT_ROWS = int(os.getenv("COLD_SEGMENT_ROWS", "100000"))
+COLD_BLOCK_ROWS = int(os.getenv("COLD_BLOCK_ROWS", "1000"))
+COLD_COMPRESSION_LEVEL = int(os.getenv("COLD_COMPRESSION_LEVEL", "9"))
+COLD_TIERING_INTERVAL_SECONDS = int(os.getenv("COLD_TIERING_INTERVAL_SECONDS", "3600"))
+
+# Первые 10 колонок совпадают с event_service.EVENT_COLUMNS
+SEGMENT_COLUMNS = (
+    "id",
+    "timestamp",
+    "source",
+    "category",
+    "severity",
+    "description",
+    "src_ip",
+    "dst_ip",
+    "hostname",
+    "duplicate_count",
+    "content_hash",
+)
+EVENT_WIDTH = 10
+STATS_COLUMNS = {"severity": 4, "category": 3}
+# Больше различных значений - в индексе остаются только min/max
+MAX_DISTINCT_VALUES = 64
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".seg.idx"
+
+_LOOKUP_CHUNK = 500
+
+
+def is_available() -> bool:
+    return COLD_STORAGE_ENABLED and zstandard is not None
+
+
+def _loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class Segment:
+    __slots__ = ("path", "rows", "min_ts", "max_ts", "stats", "blocks", "size")
+
+    def __init__(self, path: Path, meta: dict) -> None:
+        self.path = path
+        self.rows = meta["rows"]
+        self.min_ts = datetime.fromisoformat(meta["min_ts"])
+        self.max_ts = datetime.fromisoformat(meta["max_ts"])
+        self.stats = meta["stats"]
+        # [первая метка, последняя метка, смещение, длина, строк]
+        self.blocks = [
+            (datetime.fromisoformat(first), datetime.fromisoformat(last), offset, length, rows)
+            for first, last, offset, length, rows in meta["blocks"]
+        ]
+        self.size = meta.get("bytes", 0)
+
+    @property
+    def index_path(self) -> Path:
+        return self.path.with_name(self.path.name[: -len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+
+    def overlaps(self, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        return (start is None or self.max_ts >= start) and (end is None or self.min_ts < end)
+
+    def may_contain(self, column: str, value: Optional[str]) -> bool:
+        """False if min/max (or the distinct values) of the column rule the value out."""
+        if not value:
+            return True
+        stats = self.stats.get(column)
+        if not stats:
+            return True
+        value = value.lower()
+        if stats.get("values") is not None:
+            return value in stats["values"]
+        return stats["min"] <= value <= stats["max"]
+
+    def iter_rows(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[list]:
+        """Rows of blocks overlapping [start, end); timestamps are parsed, rows are not range-filtered."""
+        decompressor = zstandard.ZstdDecompressor()
+        with open(self.path, "rb") as f:
+            for first, last, offset, length, _rows in self.blocks:
+                if (start is not None and last < start) or (end is not None and first >= end):
+                    continue
+                f.seek(offset)
+                for row in _loads(decompressor.decompress(f.read(length))):
+                    row[1] = datetime.fromisoformat(row[1])
+                    yield row
+
+    def remove(self) -> None:
+        # Сначала индекс: без него сегмент уже не виден читателям
+        self.index_path.unlink(missing_ok=True)
+        self.path.unlink(missing_ok=True)
+
+
+def write_segment(directory: Path, rows: Sequence[Sequence[Any]]) -> Segment:
+    """Write rows (SEGMENT_COLUMNS order) as a new segment; rows are sorted by timestamp first."""
+    directory.mkdir(parents=True, exist_ok=True)
+    rows = sorted(([row[0], as_naive_utc(row[1]), *row[2:]] for row in rows), key=lambda row: row[1])
+    compressor = zstandard.ZstdCompressor(level=COLD_COMPRESSION_LEVEL)
+    name = f"events-{rows[0][1]:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    path = directory / (name + SEGMENT_SUFFIX)
+    index_path = directory / (name + INDEX_SUFFIX)
+
+    blocks = []
+    raw_bytes = 0
+    offset = 0
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        for i in range(0, len(rows), COLD_BLOCK_ROWS):
+            block = rows[i:i + COLD_BLOCK_ROWS]
+            raw = dumps(block)
+            data = compressor.compress(raw)
+            f.write(data)
+            blocks.append([block[0][1].isoformat(), block[-1][1].isoformat(), offset, len(data), len(block)])
+            offset += len(data)
+            raw_bytes += len(raw)
+    os.replace(tmp_path, path)
+
+    stats = {}
+    for column, position in STATS_COLUMNS.items():
+        values = {str(row[position]).lower() for row in rows}
+        stats[column] = {
+            "min": min(values),
+            "max": max(values),
+            "values": sorted(values) if len(values) <= MAX_DISTINCT_VALUES else None,
+        }
+    meta = {
+        "version": 1,
+        "columns": SEGMENT_COLUMNS,
+        "rows": len(rows),
+        "min_ts": rows[0][1].isoformat(),
+        "max_ts": rows[-1][1].isoformat(),
+        "bytes": offset,
+        "raw_bytes": raw_bytes,
+        "stats": stats,
+        "blocks": blocks,
+    }
+    tmp_index = index_path.with_suffix(".tmp")
+    tmp_index.write_bytes(dumps(meta))
+    os.replace(tmp_index, index_path)
+    return Segment(path, meta)
+
+
+class SegmentCatalog:
+    """Segment indexes of a directory, re-read when the directory changes."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._segments: List[Segment] = []
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._mtime = None
+
+    def segments(self) -> List[Segment]:
+        """All complete segments, newest first."""
+        try:
+            mtime = self.directory.stat().st_mtime
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if mtime != self._mtime:
+                segments = []
+                for index_path in self.directory.glob(f"*{INDEX_SUFFIX}"):
+                    path = index_path.with_name(index_path.name[: -len(INDEX_SUFFIX)] + SEGMENT_SUFFIX)
+                    try:
+                        segments.append(Segment(path, _loads(index_path.read_bytes())))
+                    except (OSError, ValueError, KeyError) as exc:
+                        logger.error("Skipping unreadable cold segment index %s: %s", index_path, exc)
+                segments.sort(key=lambda segment: segment.max_ts, reverse=True)
+                self._segments = segments
+                self._mtime = mtime
+            return self._segments
+
+    def newest_timestamp(self) -> Optional[datetime]:
+        segments = self.segments()
+        return segments[0].max_ts if segments else None
+
+    def stats(self) -> dict:
+        segments = self.segments()
+        return {
+            "directory": str(self.directory),
+            "segments": len(segments),
+            "rows": sum(segment.rows for segment in segments),
+            "bytes": sum(segment.size for segment in segments),
+            "oldest": min((segment.min_ts for segment in segments), default=None),
+            "newest": segments[0].max_ts if segments else None,
+        }
+
+
+catalog = SegmentCatalog(COLD_STORAGE_DIR)
+
+
+# --- Reads ----------------------------------------------------------------------
+
+
+def covers(start: Optional[datetime]) -> bool:
+    """True if a query from ``start`` reaches into cold data."""
+    if start is None or not is_available():
+        return False
+    newest = catalog.newest_timestamp()
+    return newest is not None and as_naive_utc(start) <= newest
+
+
+def _in_network(value: Optional[str], network) -> bool:
+    if not value:
+        return False
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return False
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.version == network.version and address in network
+
+
+def _row_predicate(
+    severity: Optional[str] = None,
+    category: Optional[str] = None,
+    source: Optional[str] = None,
+    src_ip: Optional[str] = None,
+    dst_ip: Optional[str] = None,
+    hostname: Optional[str] = None,
+) -> Callable[[list], bool]:
+    """Same semantics as event_service._filter_events_query, evaluated on segment rows."""
+    checks: List[Callable[[list], bool]] = []
+    if severity:
+        severity = severity.lower()
+        checks.append(lambda row: row[4].lower() == severity)
+    if category:
+        category = category.lower()
+        checks.append(lambda row: row[3].lower() == category)
+    if source:
+        source = source.lower()
+        checks.append(lambda row: source in row[2].lower())
+    if hostname:
+        hostname = hostname.lower()
+        checks.append(lambda row: row[8] == hostname)
+    if src_ip:
+        src_network = parse_network(src_ip)
+        checks.append(lambda row: _in_network(row[6], src_network))
+    if dst_ip:
+        dst_network = parse_network(dst_ip)
+        checks.append(lambda row: _in_network(row[7], dst_network))
+    return lambda row: all(check(row) for check in checks)
+
+
+def query_rows(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    limit: int,
+    severity: Optional[str] = None,
+    category: Optional[str] = None,
+    **filters: Optional[str],
+) -> Tuple[List[Tuple], int]:
+    """
+    Newest ``limit`` cold events in [start, end) matching the filters (EVENT_COLUMNS
+    order) and the total number of matches.
+    """
+    start = as_naive_utc(start) if start else None
+    end = as_naive_utc(end) if end else None
+    predicate = _row_predicate(severity=severity, category=category, **filters)
+    total = 0
+
+    def matching() -> Iterator[Tuple]:
+        nonlocal total
+        for segment in catalog.segments():
+            if not segment.overlaps(start, end):
+                continue
+            if not (segment.may_contain("severity", severity) and segment.may_contain("category", category)):
+                continue
+            for row in segment.iter_rows(start, end):
+                ts = row[1]
+                if (start is None or ts >= start) and (end is None or ts < end) and predicate(row):
+                    total += 1
+                    yield tuple(row[:EVENT_WIDTH])
+
+    rows = heapq.nlargest(max(limit, 0), matching(), key=lambda row: row[1])
+    return rows, total
+
+
+# --- Tiering and restore --------------------------------------------------------------
+
+
+def _segment_columns():
+    return [getattr(SecurityEventORM, column) for column in SEGMENT_COLUMNS]
+
+
+def tier_events(db: Session, older_than: datetime, segment_rows: int = COLD_SEGMENT_ROWS) -> int:
+    """
+    Move events older than ``older_than`` (not referenced by alerts) into new
+    segments, ``segment_rows`` per segment. Returns number of events moved.
+    """
+    has_alerts = exists().where(AlertORM.event_id == SecurityEventORM.id)
+    has_archived_alerts = exists().where(AlertArchiveORM.event_id == SecurityEventORM.id)
+    moved = 0
+    while True:
+        rows = (
+            db.query(*_segment_columns())
+            .filter(SecurityEventORM.timestamp < as_naive_utc(older_than), ~has_alerts, ~has_archived_alerts)
+            .order_by(SecurityEventORM.timestamp, SecurityEventORM.id)
+            .limit(segment_rows)
+            .all()
+        )
+        if not rows:
+            break
+        segment = write_segment(catalog.directory, rows)
+        try:
+            ids = [row[0] for row in rows]
+            for i in range(0, len(ids), _LOOKUP_CHUNK):
+                chunk = ids[i:i + _LOOKUP_CHUNK]
+                # Явно: на SQLite без PRAGMA foreign_keys ON DELETE CASCADE не срабатывает
+                db.query(EventTechniqueORM).filter(EventTechniqueORM.event_id.in_(chunk)).delete(
+                    synchronize_session=False
+                )
+                db.query(SecurityEventORM).filter(SecurityEventORM.id.in_(chunk)).delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            # Без удаления из горячей таблицы сегмент дублировал бы события
+            db.rollback()
+            segment.remove()
+            raise
+        moved += len(rows)
+        logger.info("Moved %d events (%s .. %s) to %s", len(rows), segment.min_ts, segment.max_ts, segment.path.name)
+    catalog.invalidate()
+    return moved
+
+
+def _insert_ignoring_existing(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(SecurityEventORM)
+    return dialect_insert(SecurityEventORM).on_conflict_do_nothing()
+
+
+def restore_events(db: Session, start: datetime, end: datetime) -> int:
+    """
+    Move cold events in [start, end) back into the hot table and tag them
+    with ATT&CK techniques again. Segments that only partly overlap are
+    rewritten without the restored rows. Returns number of events restored.
+    """
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    restored = 0
+    for segment in list(catalog.segments()):
+        if not segment.overlaps(start, end):
+            continue
+        back: List[dict] = []
+        keep: List[list] = []
+        for row in segment.iter_rows():
+            if start <= row[1] < end:
+                back.append(dict(zip(SEGMENT_COLUMNS, row)))
+            else:
+                keep.append(row)
+        if not back:
+            continue
+        # Порядок: вставка, новый сегмент с остатком, удаление старого - сбой оставит
+        # дубликат, но не потеряет события
+        ids = [row["id"] for row in back]
+        present = set()
+        for i in range(0, len(ids), _LOOKUP_CHUNK):
+            chunk = ids[i:i + _LOOKUP_CHUNK]
+            present.update(db.execute(select(SecurityEventORM.id).where(SecurityEventORM.id.in_(chunk))).scalars())
+        db.execute(_insert_ignoring_existing(db), back)
+        # Уже присутствующие события (повтор после сбоя) сохранили свои теги
+        mitre_mapping.tag_events(db, [row for row in back if row["id"] not in present])
+        db.commit()
+        if keep:
+            write_segment(catalog.directory, keep)
+        segment.remove()
+        restored += len(back)
+        logger.info("Restored %d events from %s", len(back), segment.path.name)
+    catalog.invalidate()
+    return restored
+
+
+def run_tiering(db: Session) -> int:
+    return tier_events(db, datetime.now(timezone.utc) - timedelta(days=COLD_AFTER_DAYS))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    tier = commands.add_parser("tier", help="move aged events to cold segments")
+    tier.add_argument("--older-than-days", type=int, default=COLD_AFTER_DAYS)
+    restore = commands.add_parser("restore", help="move cold events back to the hot table")
+    restore.add_argument("--start", type=datetime.fromisoformat, required=True)
+    restore.add_argument("--end", type=datetime.fromisoformat, required=True)
+    commands.add_parser("stats", help="segment count, rows and size on disk")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    if zstandard is None:
+        parser.error("zstandard is not installed")
+
+    from app.db import SessionLocal
+
+    if args.command == "stats":
+        print(json.dumps(catalog.stats(), default=str, indent=2))
+        return
+    db = SessionLocal()
+    try:
+        if args.command == "tier":
+            cutoff = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+            print(f"Moved {tier_events(db, cutoff)} events older than {cutoff:%Y-%m-%d %H:%M} to cold storage")
+        else:
+            print(f"Restored {restore_events(db, args.start, args.end)} events")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
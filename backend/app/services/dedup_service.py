@@ -0,0 +1,235 @@
+"""
+Ingest-time suppression of duplicate events.
+
+Sensors retransmit and imports get rerun, producing the same event under a
+new id. With DEDUP_ENABLED every ingested event gets a content hash over
+DEDUP_FIELDS plus the DEDUP_BUCKET_SECONDS time bucket of its timestamp.
+An event whose hash is already stored is not inserted (and not evaluated
+against rules); instead duplicate_count of the original event is incremented.
+
+Lookups go through three levels:
+
+    window   hash -> event id of the last DEDUP_WINDOW_SECONDS of event time,
+             in memory; retransmits almost always land here
+    bloom    fingerprints of every hash seen (filled from the table on first
+             use); a miss proves the event is new without touching the DB,
+             a hit is confirmed by an indexed query on content_hash
+    DB       unique index on content_hash; inserts skip conflicting rows, which
+             catches races between writer threads and listener processes
+"""
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from app.bloom import BloomFilter
+from app.models.db_models import SecurityEventORM
+
+logger = logging.getLogger(__name__)
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "false").lower() == "true"
+DEDUP_FIELDS = tuple(
+    field.strip()
+    for field in os.getenv("DEDUP_FIELDS", "source,category,severity,description,src_ip,dst_ip,hostname").split(",")
+    if field.strip()
+)
+DEDUP_BUCKET_SECONDS = int(os.getenv("DEDUP_BUCKET_SECONDS", "60"))
+DEDUP_WINDOW_SECONDS = int(os.getenv("DEDUP_WINDOW_SECONDS", "3600"))
+DEDUP_BLOOM_CAPACITY = int(os.getenv("DEDUP_BLOOM_CAPACITY", "5000000"))
+DEDUP_BLOOM_FALSE_POSITIVE_RATE = float(os.getenv("DEDUP_BLOOM_FALSE_POSITIVE_RATE", "0.001"))
+
+# Ограничение числа параметров в IN (...) для SQLite
+_LOOKUP_CHUNK = 500
+
+
+def _bucket(timestamp: datetime, bucket_seconds: int) -> int:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp() // bucket_seconds)
+
+
+def content_hash(row: Dict[str, Any], fields: Sequence[str] = DEDUP_FIELDS, bucket_seconds: int = DEDUP_BUCKET_SECONDS) -> str:
+    """128-bit hex hash of the dedup fields and the time bucket of an event row."""
+    parts = ["" if row.get(field) is None else str(row[field]) for field in fields]
+    parts.append(str(_bucket(row["timestamp"], bucket_seconds)))
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def _fingerprint(digest: str) -> int:
+    return int(digest[:16], 16)
+
+
+class Deduplicator:
+    def __init__(
+        self,
+        fields: Sequence[str] = DEDUP_FIELDS,
+        bucket_seconds: int = DEDUP_BUCKET_SECONDS,
+        window_seconds: int = DEDUP_WINDOW_SECONDS,
+        bloom_capacity: int = DEDUP_BLOOM_CAPACITY,
+        bloom_false_positive_rate: float = DEDUP_BLOOM_FALSE_POSITIVE_RATE,
+    ) -> None:
+        self.fields = tuple(fields)
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = max(1, window_seconds // bucket_seconds)
+        self._window: Dict[str, str] = {}
+        self._order: Deque[Tuple[int, str]] = deque()
+        self._newest_bucket: Optional[int] = None
+        self.bloom_capacity = bloom_capacity
+        self.bloom_false_positive_rate = bloom_false_positive_rate
+        # Создаётся при первом использовании: при выключенной дедупликации память не занимает
+        self._bloom: Optional[BloomFilter] = None
+        # Пишущие потоки листенера вызывают split/remember параллельно
+        self._lock = threading.Lock()
+
+        self.received = 0
+        self.duplicates = 0
+        self.window_hits = 0
+        self.db_hits = 0
+        self.insert_conflicts = 0
+        self.bloom_false_positives = 0
+
+    def _warm_up(self, db: Session) -> None:
+        """Fill the bloom filter with hashes already stored (once per process)."""
+        started = time.perf_counter()
+        self._bloom = BloomFilter(self.bloom_capacity, self.bloom_false_positive_rate)
+        loaded = 0
+        result = db.execute(
+            select(SecurityEventORM.content_hash).where(SecurityEventORM.content_hash.isnot(None))
+        ).yield_per(50000)
+        for (digest,) in result:
+            self._bloom.add(_fingerprint(digest))
+            loaded += 1
+        if loaded:
+            logger.info("Loaded %d event hashes into dedup filter in %.2fs", loaded, time.perf_counter() - started)
+
+    def _lookup(self, db: Session, digests: List[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        for i in range(0, len(digests), _LOOKUP_CHUNK):
+            chunk = digests[i:i + _LOOKUP_CHUNK]
+            rows = db.query(SecurityEventORM.content_hash, SecurityEventORM.id).filter(
+                SecurityEventORM.content_hash.in_(chunk)
+            )
+            found.update((digest, event_id) for digest, event_id in rows)
+        return found
+
+    def split(self, db: Session, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Counter]:
+        """
+        Set content_hash on every row and separate new rows from duplicates.
+        Returns (new rows, Counter of original event id -> duplicates).
+        Duplicates within the batch count against the first row.
+        """
+        with self._lock:
+            if self._bloom is None:
+                self._warm_up(db)
+        duplicates: Counter = Counter()
+        new_rows: List[Dict[str, Any]] = []
+        maybe_stored: List[Dict[str, Any]] = []
+        in_batch: Dict[str, str] = {}
+        with self._lock:
+            self.received += len(rows)
+            for row in rows:
+                digest = row["content_hash"] = content_hash(row, self.fields, self.bucket_seconds)
+                original = in_batch.get(digest) or self._window.get(digest)
+                if original is not None:
+                    duplicates[original] += 1
+                    self.window_hits += 1
+                elif _fingerprint(digest) in self._bloom:
+                    maybe_stored.append(row)
+                else:
+                    in_batch[digest] = row["id"]
+                    new_rows.append(row)
+
+        if maybe_stored:
+            stored = self._lookup(db, [row["content_hash"] for row in maybe_stored])
+            for row in maybe_stored:
+                digest = row["content_hash"]
+                original = stored.get(digest) or in_batch.get(digest)
+                if original is not None:
+                    duplicates[original] += 1
+                    self.db_hits += 1
+                else:
+                    self.bloom_false_positives += 1
+                    in_batch[digest] = row["id"]
+                    new_rows.append(row)
+
+        self.duplicates += sum(duplicates.values())
+        return new_rows, duplicates
+
+    def resolve_conflicts(self, db: Session, rows: List[Dict[str, Any]], inserted_ids: set) -> Counter:
+        """Rows skipped by the unique index: count them against the event stored by someone else."""
+        skipped = [row for row in rows if row["id"] not in inserted_ids]
+        if not skipped:
+            return Counter()
+        stored = self._lookup(db, [row["content_hash"] for row in skipped])
+        duplicates = Counter(stored[row["content_hash"]] for row in skipped if row["content_hash"] in stored)
+        self.insert_conflicts += len(skipped)
+        self.duplicates += len(skipped)
+        return duplicates
+
+    def remember(self, rows: List[Dict[str, Any]]) -> None:
+        """Add stored rows to the window and the bloom filter, evicting old buckets."""
+        with self._lock:
+            window, order = self._window, self._order
+            for row in rows:
+                digest = row["content_hash"]
+                bucket = _bucket(row["timestamp"], self.bucket_seconds)
+                window[digest] = row["id"]
+                order.append((bucket, digest))
+                self._bloom.add(_fingerprint(digest))
+                if self._newest_bucket is None or bucket > self._newest_bucket:
+                    self._newest_bucket = bucket
+            oldest = self._newest_bucket - self.window_buckets if self._newest_bucket is not None else None
+            while order and order[0][0] < oldest:
+                _bucket_id, digest = order.popleft()
+                window.pop(digest, None)
+
+    def _window_bytes(self) -> int:
+        size = sys.getsizeof(self._window) + sys.getsizeof(self._order)
+        if self._order:
+            bucket, digest = self._order[0]
+            entry = sys.getsizeof(digest) + sys.getsizeof(self._window.get(digest, "")) + sys.getsizeof((bucket, digest))
+            size += entry * len(self._order)
+        return size
+
+    def stats(self) -> dict:
+        bloom = self._bloom
+        return {
+            "enabled": DEDUP_ENABLED,
+            "fields": list(self.fields),
+            "bucket_seconds": self.bucket_seconds,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "dedup_ratio": round(self.duplicates / self.received, 4) if self.received else 0.0,
+            "window_hits": self.window_hits,
+            "db_hits": self.db_hits,
+            "insert_conflicts": self.insert_conflicts,
+            "bloom_false_positives": self.bloom_false_positives,
+            "window_entries": len(self._window),
+            "bloom_items": bloom.count if bloom else 0,
+            "bloom_false_positive_rate": round(bloom.false_positive_rate(), 6) if bloom else 0.0,
+            "memory_bytes": {"window": self._window_bytes(), "bloom": len(bloom.bits) if bloom else 0},
+        }
+
+
+def add_duplicate_counts(db: Session, duplicates: Counter) -> None:
+    """duplicate_count += n on original events, one executemany."""
+    if not duplicates:
+        return
+    table = SecurityEventORM.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("event_id"))
+        .values(duplicate_count=table.c.duplicate_count + bindparam("duplicates"))
+    )
+    db.execute(stmt, [{"event_id": event_id, "duplicates": n} for event_id, n in duplicates.items()])
+
+
+deduplicator = Deduplicator()
@@ -0,0 +1,260 @@
+"""
+In-process buffer of the newest events for the live first pages of
+/api/events/ and /api/events/paged.
+
+The buffer keeps the EVENT_BUFFER_SIZE newest events (by timestamp, id) as
+plain row tuples in EVENT_COLUMNS order - the form the endpoints serialize -
+sorted ascending, plus per (severity, category) counts of the whole table
+for the "total" of /paged. Invariant: every event with a key >= the oldest buffered
+key is in the buffer (or the whole table is, if it is smaller).
+
+Freshness is tied to the response cache generation of security_events
+(response_cache.backend): every commit touching the table bumps it, in
+Redis when RESPONSE_CACHE_URL is set, so it is shared by all workers.
+Batches ingested by this process are added in place and advance the
+buffer's generation; any other write (another worker, tiering, restore)
+leaves the buffer behind the current generation, and the next read reloads
+it from the primary (at most once per EVENT_BUFFER_MIN_RELOAD_SECONDS) or
+falls back to SQL. Without a shared cache backend several workers only see
+their own ingests, so EVENT_BUFFER_MAX_AGE_SECONDS bounds staleness there.
+
+Served from memory: no CIDR filters, no LIKE wildcards in severity/category,
+``start`` (if any) within the buffered range, and either enough matches for
+offset+limit or a filter whose full match set is known. Everything else -
+deeper pages, IP filters, cold ranges - goes to SQL.
+"""
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import response_cache
+from app.models.db_models import SecurityEventORM
+from app.time_utils import as_naive_utc
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUFFER_ENABLED = os.getenv("EVENT_BUFFER_ENABLED", "false").lower() == "true"
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "5000"))
+EVENT_BUFFER_MIN_RELOAD_SECONDS = float(os.getenv("EVENT_BUFFER_MIN_RELOAD_SECONDS", "1"))
+EVENT_BUFFER_MAX_AGE_SECONDS = float(os.getenv("EVENT_BUFFER_MAX_AGE_SECONDS", "30"))
+
+_TABLES = ("security_events",)
+# Индексы полей в строке (порядок EVENT_COLUMNS)
+_TS, _SOURCE, _CATEGORY, _SEVERITY, _HOSTNAME, _DUPLICATES = 1, 2, 3, 4, 8, 9
+
+
+class EventBuffer:
+    """Newest events kept in memory; see module docstring for what it serves."""
+
+    def __init__(self, session_factory: Callable[[], Session], size: int = EVENT_BUFFER_SIZE) -> None:
+        self.session_factory = session_factory
+        self.size = size
+        self._keys: List[Tuple[datetime, str]] = []
+        self._rows: List[tuple] = []
+        self._has_all = False
+        self._pairs: Counter = Counter()
+        self._generation: Optional[Tuple[int, ...]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    # --- Loading -------------------------------------------------------------
+
+    def reload(self) -> None:
+        """Replace the contents with the newest events from the primary."""
+        from app.services.event_service import EVENT_COLUMNS
+
+        generation = response_cache.backend.generations(_TABLES)
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(*(getattr(SecurityEventORM, name) for name in EVENT_COLUMNS))
+                .order_by(SecurityEventORM.timestamp.desc(), SecurityEventORM.id.desc())
+                .limit(self.size)
+                .all()
+            )
+            pairs = Counter(
+                {
+                    (severity, category): count
+                    for severity, category, count in db.query(
+                        SecurityEventORM.severity, SecurityEventORM.category, func.count()
+                    ).group_by(SecurityEventORM.severity, SecurityEventORM.category)
+                }
+            )
+        finally:
+            db.close()
+
+        rows = [(row[0], as_naive_utc(row[1]), *row[2:]) for row in reversed(rows)]
+        with self._lock:
+            self._rows = rows
+            self._keys = [(row[_TS], row[0]) for row in rows]
+            self._has_all = len(rows) < self.size
+            self._pairs = pairs
+            self._generation = generation
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+
+    def _refresh(self) -> bool:
+        """True if the contents are current; reloads when behind, without waiting on another reload."""
+        current = response_cache.backend.generations(_TABLES)
+        now = time.monotonic()
+        if current == self._generation and now - self._loaded_at < EVENT_BUFFER_MAX_AGE_SECONDS:
+            return True
+        if now - self._loaded_at < EVENT_BUFFER_MIN_RELOAD_SECONDS or not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self.reload()
+        except Exception:
+            logger.exception("Event buffer reload failed")
+            return False
+        finally:
+            self._reload_lock.release()
+        return True
+
+    # --- Ingest --------------------------------------------------------------
+
+    def generation(self) -> Tuple[int, ...]:
+        return response_cache.backend.generations(_TABLES)
+
+    def add(self, rows: Sequence[Dict[str, Any]], duplicates: Counter, before: Tuple[int, ...]) -> None:
+        """
+        Apply a batch committed by this process: new rows (ingest dicts) and
+        duplicate_count increments. ``before`` is the generation read before the
+        commit; the buffer stays current only if that commit was the sole write.
+        """
+        from app.services.event_service import EVENT_COLUMNS
+
+        after = response_cache.backend.generations(_TABLES)
+        with self._lock:
+            in_sync = self._generation == before
+            for data in rows:
+                row = tuple(data.get(name, 0 if name == "duplicate_count" else None) for name in EVENT_COLUMNS)
+                row = (row[0], as_naive_utc(row[_TS]), *row[2:])
+                self._pairs[(row[_SEVERITY], row[_CATEGORY])] += 1
+                key = (row[_TS], row[0])
+                if not self._has_all and self._keys and key < self._keys[0]:
+                    continue  # старее всего буфера: в него не попадает
+                index = bisect_left(self._keys, key)
+                self._keys.insert(index, key)
+                self._rows.insert(index, row)
+                if len(self._rows) > self.size:
+                    del self._keys[0], self._rows[0]
+                    self._has_all = False
+            if duplicates:
+                positions = {key[1]: index for index, key in enumerate(self._keys)}
+                for event_id, count in duplicates.items():
+                    index = positions.get(event_id)
+                    if index is not None:
+                        row = self._rows[index]
+                        self._rows[index] = row[:_DUPLICATES] + (row[_DUPLICATES] + count,) + row[_DUPLICATES + 1:]
+            # Только наш коммит между before и after: буфер остаётся актуальным
+            if in_sync and _advanced_by_one(before, after):
+                self._generation = after
+
+    # --- Reads ---------------------------------------------------------------
+
+    def page(
+        self,
+        severity: Optional[str] = None,
+        category: Optional[str] = None,
+        source: Optional[str] = None,
+        hostname: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        offset: int = 0,
+        limit: int = 50,
+        count: bool = True,
+    ) -> Optional[Tuple[List[tuple], Optional[int]]]:
+        """
+        (rows newest first, total or None) like event_service.get_event_rows,
+        or None when the buffer cannot answer and the caller must use SQL.
+        """
+        if any(value and ("%" in value or "_" in value) for value in (severity, category)):
+            return self._miss()
+        if not self._refresh():
+            return self._miss()
+
+        start, end = as_naive_utc(start), as_naive_utc(end)
+        severity = severity.lower() if severity else None
+        category = category.lower() if category else None
+        source = source.lower() if source else None
+        hostname = hostname.lower() if hostname else None
+        offset, limit = max(offset, 0), max(limit, 1)
+
+        with self._lock:
+            rows, keys = self._rows, self._keys
+            # Для полного ответа буфер должен содержать все события диапазона
+            complete = self._has_all or (start is not None and bool(keys) and start > keys[0][0])
+            total = None
+            if count and not complete:
+                if source or hostname or start or end:
+                    return self._miss()
+                total = sum(
+                    n
+                    for (pair_severity, pair_category), n in self._pairs.items()
+                    if (not severity or pair_severity.lower() == severity)
+                    and (not category or pair_category.lower() == category)
+                )
+
+            wanted = offset + limit
+            matched: List[tuple] = []
+            for index in range(len(rows) - 1, -1, -1):
+                row = rows[index]
+                if start is not None and row[_TS] < start:
+                    break
+                if end is not None and row[_TS] >= end:
+                    continue
+                if severity and row[_SEVERITY].lower() != severity:
+                    continue
+                if category and row[_CATEGORY].lower() != category:
+                    continue
+                if source and source not in row[_SOURCE].lower():
+                    continue
+                if hostname and row[_HOSTNAME] != hostname:
+                    continue
+                matched.append(row)
+                if len(matched) >= wanted and not (count and complete):
+                    break
+
+        if len(matched) < wanted and not complete:
+            return self._miss()
+        self.hits += 1
+        if count and complete:
+            total = len(matched)
+        return matched[offset:wanted], total
+
+    def _miss(self) -> None:
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._rows),
+                "capacity": self.size,
+                "has_all": self._has_all,
+                "oldest": self._keys[0][0] if self._keys else None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+            }
+
+
+def _advanced_by_one(before: Tuple[int, ...], after: Tuple[int, ...]) -> bool:
+    return all(b == a - 1 for a, b in zip(after, before))
+
+
+# Создаётся при старте приложения (EVENT_BUFFER_ENABLED)
+buffer: Optional[EventBuffer] = None
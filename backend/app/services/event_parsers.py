@@ -0,0 +1,599 @@
+"""
+Event normalization: a registry of vendor-format parsers.
+
+Each parser is a format tokenizer (json, cef, leef, kv, syslog) plus a
+declarative field mapping, e.g.
+
+    "severity": {"from": ["severity", "event.severity"], "type": "severity", "default": "low"}
+
+"from" lists alternative source fields (dotted paths into nested JSON), the
+first non-empty one wins; "template" builds a value from several fields
+("{vendor} {product}"); "type" normalizes the value through a lookup table.
+Mappings are compiled once into a list of extractor closures, so parsing a
+message is a tokenize call plus one closure call per target field.
+
+Parsers return plain row dicts (SecurityEvent fields). Rows are validated in
+bulk with validate_rows() right before they are written, instead of building
+a pydantic model per message.
+
+Extra parsers can be declared in a JSON file pointed to by EVENT_PARSERS_FILE:
+    {"my_fw": {"format": "kv", "fields": {...}}}
+"""
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+from typing_extensions import NotRequired, TypedDict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib json fallback
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+EVENT_PARSERS_FILE = os.getenv("EVENT_PARSERS_FILE")
+
+
+class ParseError(ValueError):
+    pass
+
+
+# --- Lookup tables -----------------------------------------------------------
+
+# Названия уровней у разных вендоров и числовые шкалы CEF (0-10) / LEEF (1-10)
+SEVERITY_LOOKUP: Dict[str, str] = {
+    "informational": "low", "information": "low", "info": "low", "notice": "low", "debug": "low",
+    "low": "low", "minor": "low",
+    "medium": "medium", "med": "medium", "moderate": "medium", "warning": "medium", "warn": "medium",
+    "high": "high", "major": "high", "error": "high", "err": "high",
+    "critical": "critical", "crit": "critical", "very-high": "critical", "severe": "critical",
+    "alert": "critical", "emergency": "critical", "emerg": "critical", "fatal": "critical",
+}
+SEVERITY_LOOKUP.update({str(level): "low" for level in range(0, 4)})
+SEVERITY_LOOKUP.update({str(level): "medium" for level in range(4, 7)})
+SEVERITY_LOOKUP.update({str(level): "high" for level in range(7, 9)})
+SEVERITY_LOOKUP.update({str(level): "critical" for level in range(9, 11)})
+
+# Syslog PRI severity (0 emerg .. 7 debug)
+SYSLOG_LEVEL_SEVERITY = ("critical", "critical", "critical", "high", "medium", "low", "low", "low")
+# Syslog facility -> category; остальные facility считаются "system"
+SYSLOG_FACILITY_CATEGORY = {4: "auth", 10: "auth", 13: "audit", 14: "audit"}
+
+CATEGORY_LOOKUP: Dict[str, str] = {
+    "auth": "auth", "authentication": "auth", "login": "auth", "logon": "auth", "iam": "auth",
+    "network": "network", "firewall": "network", "traffic": "network", "ids": "network",
+    "ips": "network", "dns": "network", "proxy": "network", "vpn": "network",
+    "endpoint": "endpoint", "edr": "endpoint", "malware": "endpoint", "process": "endpoint",
+    "file": "endpoint", "registry": "endpoint", "antivirus": "endpoint",
+    "audit": "audit", "system": "system",
+}
+
+
+def normalize_severity(value: Any) -> str:
+    severity = SEVERITY_LOOKUP.get(str(value).strip().lower())
+    if severity is None:
+        raise ParseError(f"unknown severity {value!r}")
+    return severity
+
+
+def normalize_category(value: Any) -> str:
+    key = str(value).strip().lower()
+    # CEF/LEEF часто присылают путь вида "/Firewall/Deny"
+    head = key.strip("/").split("/", 1)[0]
+    return CATEGORY_LOOKUP.get(key) or CATEGORY_LOOKUP.get(head) or key
+
+
+def normalize_timestamp(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        number = float(value)
+        # Эпоха в миллисекундах (CEF rt) или в секундах
+        return datetime.fromtimestamp(number / 1000 if number > 1e11 else number, tz=timezone.utc)
+    text = str(value).strip()
+    try:
+        return datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        pass
+    for fmt in ("%b %d %Y %H:%M:%S", "%b %d %Y %H:%M:%S.%f", "%b %d %H:%M:%S %Y"):
+        try:
+            return datetime.strptime(text, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    raise ParseError(f"invalid timestamp {value!r}")
+
+
+_TRANSFORMS: Dict[str, Callable[[Any], Any]] = {
+    "str": str,
+    "severity": normalize_severity,
+    "category": normalize_category,
+    "timestamp": normalize_timestamp,
+    "syslog_level": lambda level: SYSLOG_LEVEL_SEVERITY[int(level)],
+    "syslog_facility": lambda facility: SYSLOG_FACILITY_CATEGORY.get(int(facility), "system"),
+}
+
+
+# --- Tokenizers: raw payload -> fields -----------------------------------------
+
+_RFC5424_RE = re.compile(
+    r"<(?P<pri>\d{1,3})>1 (?P<ts>\S+) (?P<host>\S+) (?P<app>\S+) (?P<procid>\S+) (?P<msgid>\S+) ?",
+)
+# Ключ расширения CEF: начало строки или пробел, затем \w+= (в значениях "=" экранируется)
+_CEF_KEY_RE = re.compile(r"(?:^|\s)(\w+)=")
+_ESCAPE_RE = re.compile(r"\\(.)")
+_KV_RE = re.compile(r'([\w.-]+)=(?:"((?:\\.|[^"\\])*)"|(\S*))')
+
+
+def split_syslog_header(text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Split an RFC 5424 header off the message. Returns (header or None, payload)."""
+    match = _RFC5424_RE.match(text)
+    if match is None:
+        return None, text
+    pri = int(match["pri"])
+    if pri > 191:
+        raise ParseError(f"invalid PRI {pri}")
+    facility, level = divmod(pri, 8)
+
+    def nil(value: str) -> Optional[str]:
+        return None if value == "-" else value
+
+    header = {
+        "facility": facility,
+        "level": level,
+        "timestamp": nil(match["ts"]),
+        "hostname": nil(match["host"]),
+        "app_name": nil(match["app"]),
+        "procid": nil(match["procid"]),
+        "msgid": nil(match["msgid"]),
+    }
+    return header, _strip_structured_data(text[match.end():]).lstrip("\ufeff")
+
+
+def _strip_structured_data(rest: str) -> str:
+    """Drop STRUCTURED-DATA ('-' or one or more [id k="v"] elements) and return MSG."""
+    if rest.startswith("-"):
+        return rest[2:] if rest.startswith("- ") else rest[1:]
+    i = 0
+    while i < len(rest) and rest[i] == "[":
+        i += 1
+        while i < len(rest) and rest[i] != "]":
+            # Внутри значений PARAM-VALUE "]" экранируется обратным слешем
+            i += 2 if rest[i] == "\\" else 1
+        i += 1
+    if i == 0:
+        # Некоторые отправители опускают STRUCTURED-DATA
+        return rest
+    return rest[i:].lstrip(" ")
+
+
+def _split_header(text: str, count: int) -> List[str]:
+    """First ``count`` '|'-separated fields (with \\| and \\\\ escapes) and the remainder."""
+    fields = text.split("|", count)
+    if len(fields) == count + 1 and not any("\\" in field for field in fields[:count]):
+        return fields
+    # Медленный путь: в заголовке есть экранированные символы
+    fields, current, i = [], [], 0
+    while i < len(text) and len(fields) < count:
+        ch = text[i]
+        if ch == "\\" and i + 1 < len(text):
+            current.append(text[i + 1])
+            i += 2
+            continue
+        if ch == "|":
+            fields.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+    fields.append(text[i:])
+    return fields
+
+
+def tokenize_cef(payload: str) -> Dict[str, Any]:
+    """CEF:Version|Vendor|Product|DeviceVersion|SignatureID|Name|Severity|Extension"""
+    fields = _split_header(payload, 7)
+    if len(fields) != 8 or not fields[0].startswith("CEF:"):
+        raise ParseError("CEF header must have 7 fields")
+    extension = fields[7]
+    tokens: Dict[str, Any] = {}
+    # Значение ключа - всё до начала следующего ключа
+    matches = list(_CEF_KEY_RE.finditer(extension))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(extension)
+        value = extension[match.end():end].rstrip()
+        tokens[match.group(1)] = _ESCAPE_RE.sub(r"\1", value) if "\\" in value else value
+    tokens.update(
+        version=fields[0][4:],
+        vendor=fields[1],
+        product=fields[2],
+        device_version=fields[3],
+        signature_id=fields[4],
+        name=fields[5],
+        severity=fields[6],
+    )
+    return tokens
+
+
+def tokenize_leef(payload: str) -> Dict[str, Any]:
+    """
+    LEEF:1.0|Vendor|Product|Version|EventID|<tab-separated key=value>
+    LEEF:2.0|Vendor|Product|Version|EventID|<delimiter>|<key=value...>
+    """
+    fields = _split_header(payload, 5)
+    if len(fields) != 6 or not fields[0].startswith("LEEF:"):
+        raise ParseError("LEEF header must have 5 fields")
+    version = fields[0][5:]
+    attributes = fields[5]
+    delimiter = "\t"
+    if version.startswith("2"):
+        custom, sep, rest = attributes.partition("|")
+        if sep:
+            attributes = rest
+            # Разделитель задаётся символом или hex-кодом (x09 / 0x09)
+            if len(custom) > 1 and custom.lower().lstrip("0").startswith("x"):
+                delimiter = chr(int(custom.lower().lstrip("0")[1:], 16))
+            elif custom:
+                delimiter = custom
+    tokens: Dict[str, Any] = {}
+    for pair in attributes.split(delimiter):
+        key, sep, value = pair.partition("=")
+        if sep:
+            tokens[key.strip()] = value
+    tokens.update(version=version, vendor=fields[1], product=fields[2], product_version=fields[3], event_id=fields[4])
+    return tokens
+
+
+def tokenize_kv(payload: str) -> Dict[str, Any]:
+    tokens = {}
+    for key, quoted, bare in _KV_RE.findall(payload):
+        tokens[key] = _ESCAPE_RE.sub(r"\1", quoted) if quoted else bare
+    if not tokens:
+        raise ParseError("no key=value pairs")
+    return tokens
+
+
+def tokenize_json(payload: Any) -> Dict[str, Any]:
+    if isinstance(payload, dict):
+        return payload
+    try:
+        value = orjson.loads(payload) if orjson is not None else json.loads(payload)
+    except ValueError as exc:
+        raise ParseError(f"invalid JSON: {exc}") from None
+    if not isinstance(value, dict):
+        raise ParseError("JSON event must be an object")
+    return value
+
+
+def tokenize_syslog(payload: str) -> Dict[str, Any]:
+    # Заголовок разбирается заранее (split_syslog_header), здесь остаётся только MSG
+    return {"msg": payload}
+
+
+TOKENIZERS: Dict[str, Callable[[Any], Dict[str, Any]]] = {
+    "json": tokenize_json,
+    "cef": tokenize_cef,
+    "leef": tokenize_leef,
+    "kv": tokenize_kv,
+    "syslog": tokenize_syslog,
+}
+
+
+# --- Declarative mappings and their compilation ----------------------------------
+
+BUILTIN_PARSERS: Dict[str, dict] = {
+    # Наш собственный формат (seed-файл, API)
+    "native": {
+        "format": "json",
+        "fields": {
+            "id": {"from": ["id"]},
+            "timestamp": {"from": ["timestamp"]},
+            "source": {"from": ["source"]},
+            "category": {"from": ["category"]},
+            "severity": {"from": ["severity"]},
+            "description": {"from": ["description"]},
+            "src_ip": {"from": ["src_ip"]},
+            "dst_ip": {"from": ["dst_ip"]},
+            "hostname": {"from": ["hostname"]},
+        },
+    },
+    "edr_json": {
+        "format": "json",
+        "fields": {
+            "id": {"from": ["event_id", "id", "event.id"]},
+            "timestamp": {"from": ["@timestamp", "timestamp", "event_time", "syslog.timestamp"], "type": "timestamp"},
+            "source": {"from": ["sensor.name", "source", "device.hostname", "host.name"], "default": "EDR"},
+            "category": {"from": ["category", "event.category", "event_type"], "type": "category", "default": "endpoint"},
+            "severity": {"from": ["severity", "event.severity", "threat.severity"], "type": "severity", "default": "medium"},
+            "description": {"from": ["message", "description", "threat.name", "event_type"], "default": ""},
+            "src_ip": {"from": ["source.ip", "src_ip", "network.src_ip"]},
+            "dst_ip": {"from": ["destination.ip", "dst_ip", "network.dst_ip"]},
+            "hostname": {"from": ["host.hostname", "host.name", "device.hostname", "syslog.hostname"]},
+        },
+    },
+    "cef": {
+        "format": "cef",
+        "fields": {
+            "id": {"from": ["externalId"]},
+            "timestamp": {"from": ["rt", "end", "start", "syslog.timestamp"], "type": "timestamp"},
+            "source": {"template": "{vendor} {product}"},
+            "category": {"from": ["cat"], "type": "category", "default": "network"},
+            "severity": {"from": ["severity"], "type": "severity"},
+            "description": {"from": ["msg", "name", "signature_id"]},
+            "src_ip": {"from": ["src", "c6a2"]},
+            "dst_ip": {"from": ["dst", "c6a3"]},
+            "hostname": {"from": ["dvchost", "shost", "syslog.hostname"]},
+        },
+    },
+    "leef": {
+        "format": "leef",
+        "fields": {
+            "id": {"from": ["externalId"]},
+            "timestamp": {"from": ["devTime", "syslog.timestamp"], "type": "timestamp"},
+            "source": {"template": "{vendor} {product}"},
+            "category": {"from": ["cat"], "type": "category", "default": "network"},
+            "severity": {"from": ["sev"], "type": "severity", "default": "low"},
+            "description": {"from": ["msg", "event_id"]},
+            "src_ip": {"from": ["src", "srcPreNAT"]},
+            "dst_ip": {"from": ["dst", "dstPreNAT"]},
+            "hostname": {"from": ["identHostName", "syslog.hostname"]},
+        },
+    },
+    # key=value логи межсетевых экранов (FortiGate-подобные)
+    "kv_firewall": {
+        "format": "kv",
+        "fields": {
+            "id": {"from": ["logid_uuid", "sessionid_uuid"]},
+            "timestamp": {
+                "template": "{date}T{time}",
+                "from": ["timestamp", "eventtime", "ts", "syslog.timestamp"],
+                "type": "timestamp",
+            },
+            "source": {"from": ["devname", "device", "host", "syslog.app_name", "syslog.hostname"], "default": "firewall"},
+            "category": {"from": ["category", "type"], "type": "category", "default": "network"},
+            "severity": {"from": ["severity", "level", "pri"], "type": "severity", "default": "low"},
+            "description": {"from": ["msg", "message", "action"], "default": ""},
+            "src_ip": {"from": ["srcip", "src", "src_ip"]},
+            "dst_ip": {"from": ["dstip", "dst", "dst_ip"]},
+            "hostname": {"from": ["devname", "hostname", "syslog.hostname"]},
+        },
+    },
+    "syslog": {
+        "format": "syslog",
+        "fields": {
+            "timestamp": {"from": ["syslog.timestamp"], "type": "timestamp"},
+            "source": {"from": ["syslog.app_name", "syslog.hostname"], "default": "syslog"},
+            "category": {"from": ["syslog.facility"], "type": "syslog_facility"},
+            "severity": {"from": ["syslog.level"], "type": "syslog_level"},
+            "description": {"from": ["msg", "syslog.msgid"], "default": ""},
+            "hostname": {"from": ["syslog.hostname"]},
+        },
+    },
+}
+
+EVENT_FIELDS = ("id", "timestamp", "source", "category", "severity", "description", "src_ip", "dst_ip", "hostname")
+OPTIONAL_FIELDS = frozenset(("src_ip", "dst_ip", "hostname"))
+
+_MISSING = object()
+
+
+def _compile_getter(path: str, nested: bool) -> Callable[[Dict[str, Any]], Any]:
+    if not nested or "." not in path:
+        return lambda fields: fields.get(path)
+    keys = tuple(path.split("."))
+
+    def get(fields: Dict[str, Any]) -> Any:
+        value: Any = fields
+        for key in keys:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    return get
+
+
+def _compile_field(name: str, spec: dict, nested: bool) -> Callable[[Dict[str, Any]], Any]:
+    getters = [_compile_getter(path, nested) for path in spec.get("from", ())]
+    template: Optional[str] = spec.get("template")
+    template_getters = (
+        [(key, _compile_getter(key, nested)) for key in re.findall(r"{([^}]+)}", template)] if template else []
+    )
+    transform = _TRANSFORMS[spec["type"]] if "type" in spec else None
+    default = spec.get("default", None if name in OPTIONAL_FIELDS else _MISSING)
+
+    def extract(fields: Dict[str, Any]) -> Any:
+        value = None
+        if template_getters:
+            parts = {key: get(fields) for key, get in template_getters}
+            if all(part not in (None, "") for part in parts.values()):
+                value = template.format_map(parts)
+        if value is None:
+            for get in getters:
+                candidate = get(fields)
+                if candidate not in (None, ""):
+                    value = candidate
+                    break
+        if value is None:
+            if default is not _MISSING:
+                return default
+            if name == "id":
+                return uuid.uuid4().hex
+            if name == "timestamp":
+                # Отправитель не указал время: берём время приёма
+                return datetime.now(timezone.utc)
+            raise ParseError(f"no value for {name}")
+        if transform is not None:
+            try:
+                return transform(value)
+            except ParseError:
+                raise
+            except (ValueError, TypeError, IndexError) as exc:
+                raise ParseError(f"invalid {name} {value!r}: {exc}") from None
+        return value
+
+    return extract
+
+
+class CompiledParser:
+    """A tokenizer plus compiled field extractors; build with compile_parser()."""
+
+    def __init__(self, name: str, fmt: str, extractors: List[Tuple[str, Callable]]) -> None:
+        self.name = name
+        self.format = fmt
+        self.tokenize = TOKENIZERS[fmt]
+        self._extractors = extractors
+
+    def map_fields(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        return {name: extract(fields) for name, extract in self._extractors}
+
+    def parse(self, payload: Any, header: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Parse one payload into a row dict. ``header`` is a syslog header, if any."""
+        fields = self.tokenize(payload)
+        if header is not None:
+            if self.format == "json":
+                fields.setdefault("syslog", header)
+            else:
+                for key, value in header.items():
+                    fields["syslog." + key] = value
+        return self.map_fields(fields)
+
+    def parse_batch(self, payloads: Sequence[Any]) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+        """Parse many payloads; returns (rows, [(index, error), ...])."""
+        rows: List[Dict[str, Any]] = []
+        errors: List[Tuple[int, str]] = []
+        parse = self.parse
+        for index, payload in enumerate(payloads):
+            try:
+                rows.append(parse(payload))
+            except ParseError as exc:
+                errors.append((index, str(exc)))
+        return rows, errors
+
+
+def compile_parser(name: str, spec: dict) -> CompiledParser:
+    fmt = spec.get("format")
+    if fmt not in TOKENIZERS:
+        raise ValueError(f"Parser {name}: unknown format {fmt!r}")
+    fields = spec.get("fields", {})
+    unknown = set(fields) - set(EVENT_FIELDS)
+    if unknown:
+        raise ValueError(f"Parser {name}: unknown target fields {sorted(unknown)}")
+    for field_name, field_spec in fields.items():
+        if "type" in field_spec and field_spec["type"] not in _TRANSFORMS:
+            raise ValueError(f"Parser {name}: unknown type {field_spec['type']!r} for {field_name}")
+    nested = fmt == "json"
+    # id и timestamp генерируются, если маппинг их не задаёт
+    extractors = [
+        (field_name, _compile_field(field_name, fields.get(field_name, {}), nested)) for field_name in EVENT_FIELDS
+    ]
+    return CompiledParser(name, fmt, extractors)
+
+
+_registry: Dict[str, CompiledParser] = {}
+
+
+def register_parser(name: str, spec: dict) -> CompiledParser:
+    parser = compile_parser(name, spec)
+    _registry[name] = parser
+    return parser
+
+
+def get_parser(name: str) -> CompiledParser:
+    try:
+        return _registry[name]
+    except KeyError:
+        raise ValueError(f"Unknown parser {name!r}; available: {', '.join(sorted(_registry))}") from None
+
+
+def parser_names() -> List[str]:
+    return sorted(_registry)
+
+
+def load_parser_specs(path: str) -> List[str]:
+    with open(path) as f:
+        specs = json.load(f)
+    for name, spec in specs.items():
+        register_parser(name, spec)
+    return list(specs)
+
+
+for _name, _spec in BUILTIN_PARSERS.items():
+    register_parser(_name, _spec)
+
+if EVENT_PARSERS_FILE:
+    logger.info("Loaded event parsers %s from %s", load_parser_specs(EVENT_PARSERS_FILE), EVENT_PARSERS_FILE)
+
+
+def detect_parser(payload: str, has_header: bool) -> CompiledParser:
+    """Pick a parser by the payload prefix."""
+    if payload.startswith("CEF:"):
+        return _registry["cef"]
+    if payload.startswith("LEEF:"):
+        return _registry["leef"]
+    if payload.startswith("{"):
+        return _registry["edr_json"]
+    if not has_header and "=" in payload:
+        return _registry["kv_firewall"]
+    if has_header:
+        return _registry["syslog"]
+    raise ParseError("unrecognized message format")
+
+
+def parse_message(data: bytes) -> Dict[str, Any]:
+    """Parse one network message (optionally wrapped in a syslog header) into a row dict."""
+    text = data.decode("utf-8", errors="replace").strip().lstrip("\ufeff")
+    if not text:
+        raise ParseError("empty message")
+    header, payload = split_syslog_header(text)
+    if header is None:
+        # CEF/LEEF за BSD-заголовком (RFC 3164) или иным префиксом
+        for marker in ("CEF:", "LEEF:"):
+            at = text.find(marker)
+            if at > 0:
+                payload = text[at:]
+                break
+    return detect_parser(payload, header is not None).parse(payload, header)
+
+
+# --- Bulk validation ---------------------------------------------------------------
+
+
+class EventRow(TypedDict):
+    id: str
+    timestamp: datetime
+    source: str
+    category: str
+    severity: str
+    description: str
+    src_ip: NotRequired[Optional[str]]
+    dst_ip: NotRequired[Optional[str]]
+    hostname: NotRequired[Optional[str]]
+
+
+_ROWS_ADAPTER = TypeAdapter(List[EventRow])
+
+
+def validate_rows(rows: Sequence[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+    """
+    Validate a batch of row dicts in one pydantic-core call (no model instances).
+    Returns (valid rows, [(index, error), ...]); indices refer to the input.
+    """
+    try:
+        return _ROWS_ADAPTER.validate_python(rows), []
+    except ValidationError as exc:
+        errors: Dict[int, str] = {}
+        for error in exc.errors():
+            loc = error["loc"]
+            index = loc[0] if loc and isinstance(loc[0], int) else -1
+            field = ".".join(str(part) for part in loc[1:])
+            errors.setdefault(index, f"{field}: {error['msg']}")
+    if -1 in errors:
+        raise ValueError(f"Rows must be a list of objects: {errors[-1]}")
+    good = [row for index, row in enumerate(rows) if index not in errors]
+    return _ROWS_ADAPTER.validate_python(good), sorted(errors.items())
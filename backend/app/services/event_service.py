@@ -1,10 +1,18 @@
+import heapq
 from collections import Counter
-from typing import List, Optional, Tuple
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
 
+from sqlalchemy import and_, cast, func, lambda_stmt, not_, or_, select
+from sqlalchemy.dialects.postgresql import INET
 from sqlalchemy.orm import Session
+from sqlalchemy.sql.lambdas import StatementLambdaElement
 
+from app.ip_utils import network_key_range, parse_network, split_cidrs
 from app.models.db_models import SecurityEventORM
 from app.models.security_event import EventsSummary, SecurityEvent
+from app.services import cold_storage, event_buffer
 
 
 def _filter_events_query(
@@ -12,22 +20,56 @@ def _filter_events_query(
     severity: Optional[str] = None,
     category: Optional[str] = None,
     source: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    src_ip: Optional[str] = None,
+    dst_ip: Optional[str] = None,
+    hostname: Optional[str] = None,
 ):
     query = db.query(SecurityEventORM)
 
+    if start:
+        query = query.filter(SecurityEventORM.timestamp >= start)
+    if end:
+        query = query.filter(SecurityEventORM.timestamp < end)
+
     if severity:
         # Используем параметризованный запрос вместо f-string
         query = query.filter(SecurityEventORM.severity.ilike(severity))
     if category:
         query = query.filter(SecurityEventORM.category.ilike(category))
     if source:
-        # Безопасный способ - используем функцию concat вместо f-string
-        from sqlalchemy import func
-        query = query.filter(SecurityEventORM.source.ilike(func.concat('%', source, '%')))
+        # Параметризованный LIKE через оператор || (concat() нет в SQLite); % и _ во вводе экранируются
+        query = query.filter(SecurityEventORM.source.icontains(source, autoescape=True))
+    if hostname:
+        query = query.filter(SecurityEventORM.hostname == hostname.lower())
+
+    if src_ip or dst_ip:
+        postgres = db.get_bind().dialect.name == "postgresql"
+        if src_ip:
+            query = query.filter(
+                _ip_in_network(SecurityEventORM.src_ip, SecurityEventORM.src_ip_key, src_ip, postgres)
+            )
+        if dst_ip:
+            query = query.filter(
+                _ip_in_network(SecurityEventORM.dst_ip, SecurityEventORM.dst_ip_key, dst_ip, postgres)
+            )
 
     return query
 
 
+def _ip_in_network(column, key_column, value: str, postgres: bool):
+    """
+    Address or CIDR filter ("10.0.0.0/8"); raises ValueError on bad input.
+    Postgres: inet containment (GiST index); elsewhere: key range (B-tree index).
+    """
+    network = parse_network(value)
+    if postgres:
+        return column.op("<<=")(cast(str(network), INET))
+    low, high = network_key_range(network)
+    return key_column.between(low, high)
+
+
 def get_events(
     db: Session,
     severity: Optional[str] = None,
@@ -35,34 +77,275 @@ def get_events(
     source: Optional[str] = None,
     offset: int = 0,
     limit: int = 50,
+    src_ip: Optional[str] = None,
+    dst_ip: Optional[str] = None,
+    hostname: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
 ) -> Tuple[List[SecurityEvent], int]:
     """
     Return a page of security events and total count after filters.
-    Sorted by timestamp descending.
+    Sorted by timestamp descending. ``src_ip``/``dst_ip`` take an address or
+    CIDR block and raise ValueError if it is malformed. When ``start`` reaches
+    into the cold tier, matching cold events are merged in (see cold_storage).
     """
-    query = _filter_events_query(db, severity=severity, category=category, source=source)
+    rows, total = get_event_rows(
+        db,
+        severity=severity,
+        category=category,
+        source=source,
+        offset=offset,
+        limit=limit,
+        src_ip=src_ip,
+        dst_ip=dst_ip,
+        hostname=hostname,
+        start=start,
+        end=end,
+    )
+    return [SecurityEvent(**dict(zip(EVENT_COLUMNS, row))) for row in rows], total
 
-    total = query.count()
-    rows: List[SecurityEventORM] = (
-        query.order_by(SecurityEventORM.timestamp.desc())
-        .offset(max(offset, 0))
-        .limit(max(limit, 1))
-        .all()
+
+# Порядок колонок в "сырых" строках; совпадает с полями SecurityEvent
+EVENT_COLUMNS = (
+    "id",
+    "timestamp",
+    "source",
+    "category",
+    "severity",
+    "description",
+    "src_ip",
+    "dst_ip",
+    "hostname",
+    "duplicate_count",
+)
+
+
+def _event_columns():
+    return (
+        SecurityEventORM.id,
+        SecurityEventORM.timestamp,
+        SecurityEventORM.source,
+        SecurityEventORM.category,
+        SecurityEventORM.severity,
+        SecurityEventORM.description,
+        SecurityEventORM.src_ip,
+        SecurityEventORM.dst_ip,
+        SecurityEventORM.hostname,
+        SecurityEventORM.duplicate_count,
     )
 
-    items = [
-        SecurityEvent(
-            id=row.id,
-            timestamp=row.timestamp,
-            source=row.source,
-            category=row.category,
-            severity=row.severity,
-            description=row.description,
+
+_EVENTS = SecurityEventORM.__table__
+_EVENT_SELECT = tuple(_EVENTS.c[name] for name in EVENT_COLUMNS)
+
+
+def _like_pattern(value: str) -> str:
+    """'%value%' with LIKE wildcards escaped by '/' (as autoescape=True, which lambdas cannot take)."""
+    return "%" + value.replace("/", "//").replace("%", "/%").replace("_", "/_") + "%"
+
+
+def _events_where(
+    stmt: StatementLambdaElement,
+    postgres: bool,
+    severity: Optional[str] = None,
+    category: Optional[str] = None,
+    source: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    src_ip: Optional[str] = None,
+    dst_ip: Optional[str] = None,
+    hostname: Optional[str] = None,
+) -> StatementLambdaElement:
+    """
+    _filter_events_query on a Core lambda statement. Each lambda is analyzed
+    once; its closure values become bound parameters, so building the
+    statement and its cache key costs no SQL construction on repeat calls.
+    """
+    if start:
+        stmt += lambda s: s.where(_EVENTS.c.timestamp >= start)
+    if end:
+        stmt += lambda s: s.where(_EVENTS.c.timestamp < end)
+    if severity:
+        stmt += lambda s: s.where(_EVENTS.c.severity.ilike(severity))
+    if category:
+        stmt += lambda s: s.where(_EVENTS.c.category.ilike(category))
+    if source:
+        pattern = _like_pattern(source)
+        stmt += lambda s: s.where(_EVENTS.c.source.ilike(pattern, escape="/"))
+    if hostname:
+        host = hostname.lower()
+        stmt += lambda s: s.where(_EVENTS.c.hostname == host)
+    if src_ip:
+        src_condition = _ip_in_network(_EVENTS.c.src_ip, _EVENTS.c.src_ip_key, src_ip, postgres)
+        stmt += lambda s: s.where(src_condition)
+    if dst_ip:
+        dst_condition = _ip_in_network(_EVENTS.c.dst_ip, _EVENTS.c.dst_ip_key, dst_ip, postgres)
+        stmt += lambda s: s.where(dst_condition)
+    return stmt
+
+
+def get_event_rows(
+    db: Session,
+    severity: Optional[str] = None,
+    category: Optional[str] = None,
+    source: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 50,
+    src_ip: Optional[str] = None,
+    dst_ip: Optional[str] = None,
+    hostname: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    count: bool = True,
+) -> Tuple[List[Tuple], Optional[int]]:
+    """
+    Same as get_events, but returns plain row tuples (EVENT_COLUMNS order)
+    for direct serialization, without ORM objects or pydantic models: the
+    statements are cached Core lambda statements executed outside the ORM.
+    With ``count=False`` the total is not computed (None). Pages the event
+    buffer can answer are served without touching the database.
+    """
+    cold = cold_storage.covers(start)
+    if event_buffer.buffer is not None and not (src_ip or dst_ip or cold):
+        served = event_buffer.buffer.page(
+            severity=severity,
+            category=category,
+            source=source,
+            hostname=hostname,
+            start=start,
+            end=end,
+            offset=offset,
+            limit=limit,
+            count=count,
+        )
+        if served is not None:
+            return served
+
+    filters = dict(severity=severity, category=category, source=source, src_ip=src_ip, dst_ip=dst_ip, hostname=hostname)
+    postgres = db.get_bind().dialect.name == "postgresql"
+    # Core, без ORM: строки идут в сериализатор как есть, без объектов в identity map
+    rows_stmt = _events_where(lambda_stmt(lambda: select(*_EVENT_SELECT)), postgres, start=start, end=end, **filters)
+    offset, limit = max(offset, 0), max(limit, 1)
+
+    total = None
+    if count or cold:
+        count_stmt = lambda_stmt(lambda: select(func.count()).select_from(_EVENTS))
+        total = db.execute(_events_where(count_stmt, postgres, start=start, end=end, **filters)).scalar_one()
+    if cold:
+        # Обе части отсортированы по убыванию времени: берём по offset+limit из каждой и сливаем
+        wanted = offset + limit
+        rows_stmt += lambda s: s.order_by(_EVENTS.c.timestamp.desc(), _EVENTS.c.id.desc()).limit(wanted)
+        hot_rows = db.execute(rows_stmt)
+        cold_rows, cold_total = cold_storage.query_rows(start, end, wanted, **filters)
+        merged = heapq.merge(
+            (tuple(row) for row in hot_rows), cold_rows, key=lambda row: row[1], reverse=True
         )
-        for row in rows
-    ]
+        return list(islice(merged, offset, wanted)), total + cold_total
+
+    rows_stmt += lambda s: s.order_by(_EVENTS.c.timestamp.desc(), _EVENTS.c.id.desc()).offset(offset).limit(limit)
+    return [tuple(row) for row in db.execute(rows_stmt)], total
+
+
+def rule_events_query(
+    db: Session,
+    rule,
+    start: datetime,
+    end: datetime,
+    entity=SecurityEventORM,
+    max_cidrs: int = 32,
+):
+    """
+    Events in [start, end) matching ``rule`` (AlertRuleORM, may be unsaved) on
+    the conditions SQL serves from indexes: time range, severity, category,
+    suppression window and CIDR lists of up to ``max_cidrs`` blocks.
+    ``entity`` may be an alias of the events table (e.g. TABLESAMPLE).
+    Returns (query over EVENT_COLUMNS, complete); complete=False means the
+    source substring or a longer CIDR list still has to be checked per row
+    (RuleMatcher).
+    """
+    query = db.query(*(getattr(entity, name) for name in EVENT_COLUMNS)).filter(
+        entity.timestamp >= start, entity.timestamp < end
+    )
+    if rule.severity_filter:
+        query = query.filter(entity.severity.ilike(rule.severity_filter))
+    if rule.category_filter:
+        query = query.filter(entity.category.ilike(rule.category_filter))
+
+    suppressed = []
+    if rule.suppress_from is not None:
+        suppressed.append(entity.timestamp >= rule.suppress_from)
+    if rule.suppress_until is not None:
+        suppressed.append(entity.timestamp <= rule.suppress_until)
+    if suppressed:
+        query = query.filter(not_(and_(*suppressed)))
+
+    complete = not rule.source_filter
+    postgres = db.get_bind().dialect.name == "postgresql"
+    for column, key_column, cidrs in (
+        (entity.src_ip, entity.src_ip_key, split_cidrs(rule.src_cidrs)),
+        (entity.dst_ip, entity.dst_ip_key, split_cidrs(rule.dst_cidrs)),
+    ):
+        if not cidrs:
+            continue
+        if len(cidrs) > max_cidrs:
+            complete = False
+            continue
+        query = query.filter(or_(*(_ip_in_network(column, key_column, cidr, postgres) for cidr in cidrs)))
 
-    return items, total
+    return query, complete
+
+
+def iter_event_rows(
+    db: Session,
+    severity: Optional[str] = None,
+    category: Optional[str] = None,
+    source: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_size: int = 1000,
+    src_ip: Optional[str] = None,
+    dst_ip: Optional[str] = None,
+    hostname: Optional[str] = None,
+) -> Iterator[Tuple]:
+    """
+    Stream all matching events as row tuples, newest first.
+    Uses keyset pagination on (timestamp, id) so every chunk is a cheap
+    index range scan and no cursor stays open between chunks.
+    """
+    base = _filter_events_query(
+        db,
+        severity=severity,
+        category=category,
+        source=source,
+        start=start,
+        end=end,
+        src_ip=src_ip,
+        dst_ip=dst_ip,
+        hostname=hostname,
+    ).with_entities(*_event_columns())
+    last = None
+    while True:
+        query = base
+        if last is not None:
+            last_id, last_ts = last
+            query = query.filter(
+                or_(
+                    SecurityEventORM.timestamp < last_ts,
+                    and_(SecurityEventORM.timestamp == last_ts, SecurityEventORM.id < last_id),
+                )
+            )
+        rows = (
+            query.order_by(SecurityEventORM.timestamp.desc(), SecurityEventORM.id.desc())
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            return
+        for row in rows:
+            yield tuple(row)
+        if len(rows) < chunk_size:
+            return
+        last = (rows[-1][0], rows[-1][1])
 
 
 def get_events_summary(
@@ -70,13 +353,24 @@ def get_events_summary(
     severity: Optional[str] = None,
     category: Optional[str] = None,
     source: Optional[str] = None,
+    src_ip: Optional[str] = None,
+    dst_ip: Optional[str] = None,
+    hostname: Optional[str] = None,
 ) -> EventsSummary:
     """
     Build aggregated summary for dashboard widgets.
     ВАЖНО: Загружает все события для агрегации - может быть медленным на больших объемах.
     Для production рекомендуется использовать SQL агрегацию.
     """
-    query = _filter_events_query(db, severity=severity, category=category, source=source)
+    query = _filter_events_query(
+        db,
+        severity=severity,
+        category=category,
+        source=source,
+        src_ip=src_ip,
+        dst_ip=dst_ip,
+        hostname=hostname,
+    )
 
     # Ограничиваем количество событий для предотвращения OOM
     MAX_EVENTS_FOR_SUMMARY = 100000
@@ -0,0 +1,476 @@
+"""
+Threat-intel IOC matching.
+
+Indicators (IPs, domains, file hashes, free-text patterns) are loaded from
+local feed files in IOC_FEEDS_DIR:
+
+    *.csv          columns indicator|value|ioc and optionally type, feed
+    *.json         STIX 2.x bundle (indicator patterns and ipv4/ipv6/domain/url SCOs)
+    *.txt, *.list  one indicator per line, '#' comments; type is inferred
+
+Index layout, built once per load and never mutated afterwards:
+
+    exact indicators  64-bit blake2b fingerprints of "type:value" in a sorted
+                      array('Q') (8 bytes per indicator), fronted by a bloom
+                      filter so that the common "not an IOC" case costs a few
+                      bit tests and no binary search
+    patterns          multi-pattern Aho-Corasick automaton over the lowercased
+                      description (pyahocorasick when installed, otherwise a
+                      pure-Python automaton)
+
+An event is checked by extracting IP/domain/hash tokens from description plus
+src_ip/dst_ip/hostname and looking them up, and by running the automaton over
+the description. Matches produce alerts through create_alerts_for_event using
+one system rule per indicator type (rule_type="ioc"); disabling that rule
+disables alerts for the type, aggregation/suppression settings apply as usual.
+
+Reload builds a new index next to the current one and swaps the reference,
+so ingestion keeps matching against the old index until the new one is ready.
+"""
+import bisect
+import csv
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.bloom import BloomFilter
+from app.models.db_models import AlertRuleORM
+
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - pure-Python automaton is used instead
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+IOC_ENABLED = os.getenv("IOC_ENABLED", "false").lower() == "true"
+IOC_FEEDS_DIR = Path(os.getenv("IOC_FEEDS_DIR", "data/ioc"))
+IOC_RELOAD_INTERVAL_SECONDS = int(os.getenv("IOC_RELOAD_INTERVAL_SECONDS", "60"))
+IOC_BLOOM_FALSE_POSITIVE_RATE = float(os.getenv("IOC_BLOOM_FALSE_POSITIVE_RATE", "0.001"))
+
+IOC_TYPES = ("ip", "domain", "hash", "pattern")
+# Короткие подстроки дают слишком много ложных срабатываний
+MIN_PATTERN_LENGTH = 4
+
+_TOKEN_RE = re.compile(
+    r"(?P<ip>\b(?:\d{1,3}\.){3}\d{1,3}\b)"
+    r"|(?P<hash>\b(?:[a-fA-F0-9]{64}|[a-fA-F0-9]{40}|[a-fA-F0-9]{32})\b)"
+    r"|(?P<domain>\b(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z][a-zA-Z0-9-]{1,62}\b)"
+)
+_DOMAIN_RE = re.compile(r"^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z][a-z0-9-]{1,62}$")
+# ip_address() на каждой строке фида дорог из-за исключений - сначала дешёвая проверка
+_IP_CANDIDATE_RE = re.compile(r"^[\d.]+$|:")
+_HASH_RE = re.compile(r"^(?:[a-f0-9]{32}|[a-f0-9]{40}|[a-f0-9]{64})$")
+_STIX_PATTERN_RE = re.compile(
+    r"\[\s*(ipv4-addr|ipv6-addr|domain-name|url|file):(value|hashes\.[\w'\"-]+)\s*=\s*'((?:\\'|[^'])+)'\s*\]"
+)
+_STIX_TYPES = {"ipv4-addr": "ip", "ipv6-addr": "ip", "domain-name": "domain", "url": "url", "file": "hash"}
+
+
+# --- Normalization -------------------------------------------------------------
+
+
+def normalize_indicator(value: str, ioc_type: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """(type, canonical value) or None if the value is not a usable indicator."""
+    value = value.strip()
+    if not value:
+        return None
+    ioc_type = (ioc_type or "").strip().lower() or None
+    if ioc_type in ("ipv4", "ipv6", "ip-addr", "ipv4-addr", "ipv6-addr"):
+        ioc_type = "ip"
+    elif ioc_type in ("domain-name", "hostname", "fqdn"):
+        ioc_type = "domain"
+    elif ioc_type in ("md5", "sha1", "sha256", "file", "filehash"):
+        ioc_type = "hash"
+    elif ioc_type in ("string", "substring", "keyword"):
+        ioc_type = "pattern"
+
+    if ioc_type == "ip" or (ioc_type is None and _IP_CANDIDATE_RE.search(value)):
+        try:
+            return "ip", str(ipaddress.ip_address(value))
+        except ValueError:
+            if ioc_type == "ip":
+                return None
+    lowered = value.lower()
+    if ioc_type in (None, "url") and "://" in lowered:
+        host = lowered.split("://", 1)[1].split("/", 1)[0].split(":", 1)[0]
+        return normalize_indicator(host)
+    if ioc_type in (None, "hash") and _HASH_RE.match(lowered):
+        return "hash", lowered
+    if ioc_type in (None, "domain"):
+        domain = lowered.rstrip(".")
+        if domain.startswith("*."):
+            domain = domain[2:]
+        if _DOMAIN_RE.match(domain):
+            return "domain", domain
+        if ioc_type == "domain":
+            return None
+    if ioc_type in (None, "pattern") and len(lowered) >= MIN_PATTERN_LENGTH:
+        return "pattern", lowered
+    return None
+
+
+def fingerprint(ioc_type: str, value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{ioc_type}:{value}".encode(), digest_size=8).digest(), "big")
+
+
+# --- Feed readers ----------------------------------------------------------------
+
+
+def _read_csv(path: Path) -> Iterator[Tuple[str, Optional[str]]]:
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        reader = csv.DictReader(line for line in f if not line.startswith("#"))
+        fields = {name.lower(): name for name in reader.fieldnames or []}
+        value_field = next((fields[name] for name in ("indicator", "value", "ioc") if name in fields), None)
+        if value_field is None:
+            logger.warning("IOC feed %s has no indicator/value/ioc column, skipped", path)
+            return
+        type_field = fields.get("type")
+        for row in reader:
+            yield row.get(value_field) or "", row.get(type_field) if type_field else None
+
+
+def _read_stix(path: Path) -> Iterator[Tuple[str, Optional[str]]]:
+    with open(path, encoding="utf-8") as f:
+        bundle = json.load(f)
+    objects = bundle.get("objects", []) if isinstance(bundle, dict) else bundle
+    for obj in objects:
+        if not isinstance(obj, dict):
+            continue
+        obj_type = obj.get("type")
+        if obj_type == "indicator" and obj.get("pattern_type", "stix") == "stix":
+            for object_type, _prop, value in _STIX_PATTERN_RE.findall(obj.get("pattern", "")):
+                yield value.replace("\\'", "'"), _STIX_TYPES[object_type]
+        elif obj_type in _STIX_TYPES and obj_type != "file" and "value" in obj:
+            yield obj["value"], _STIX_TYPES[obj_type]
+
+
+def _read_list(path: Path) -> Iterator[Tuple[str, Optional[str]]]:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                yield line, None
+
+
+FEED_READERS = {".csv": _read_csv, ".json": _read_stix, ".txt": _read_list, ".list": _read_list}
+
+
+def feed_files(directory: Path) -> List[Path]:
+    if not directory.is_dir():
+        return []
+    return sorted(p for p in directory.iterdir() if p.is_file() and p.suffix.lower() in FEED_READERS)
+
+
+# --- Index structures -------------------------------------------------------------
+
+
+class _PyAutomaton:
+    """Aho-Corasick automaton; iter(text) yields (end_index, pattern) for every occurrence."""
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[str, ...]] = [()]
+        for pattern in patterns:
+            node = 0
+            for ch in pattern:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                node = nxt
+            out[node] = out[node] + (pattern,)
+
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fail[nxt] = goto[state].get(ch, 0) if goto[state].get(ch, 0) != nxt else 0
+                out[nxt] = out[nxt] + out[fail[nxt]]
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def iter(self, text: str) -> Iterator[Tuple[int, str]]:
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pattern in out[node]:
+                yield i, pattern
+
+    def size_bytes(self) -> int:
+        return sum(sys.getsizeof(d) for d in self._goto) + sys.getsizeof(self._goto) + 16 * len(self._fail)
+
+
+def _build_automaton(patterns: List[str]):
+    if not patterns:
+        return None
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for pattern in patterns:
+            automaton.add_word(pattern, pattern)
+        automaton.make_automaton()
+        return automaton
+    return _PyAutomaton(patterns)
+
+
+class IOCIndex:
+    """Immutable snapshot of all loaded indicators."""
+
+    def __init__(self, indicators: Dict[str, Set[str]], sources: Dict[Tuple[str, str], str], feeds: List[str]):
+        started = time.perf_counter()
+        exact = [(ioc_type, value) for ioc_type in ("ip", "domain", "hash") for value in indicators.get(ioc_type, ())]
+        fingerprints = sorted({fingerprint(ioc_type, value) for ioc_type, value in exact})
+        self._fingerprints = array("Q", fingerprints)
+        self._bloom = BloomFilter(len(fingerprints), IOC_BLOOM_FALSE_POSITIVE_RATE)
+        for fp in fingerprints:
+            self._bloom.add(fp)
+        patterns = sorted(indicators.get("pattern", ()))
+        self._automaton = _build_automaton(patterns)
+        # Для заметки в алерте: из какого фида индикатор (только для небольших наборов - экономия памяти)
+        self._sources = sources
+        self.feeds = feeds
+        self.counts = {ioc_type: len(indicators.get(ioc_type, ())) for ioc_type in IOC_TYPES}
+        self.loaded_at = time.time()
+        self.build_seconds = time.perf_counter() - started
+
+    def __len__(self) -> int:
+        return sum(self.counts.values())
+
+    def memory_bytes(self) -> Dict[str, int]:
+        automaton = 0
+        if isinstance(self._automaton, _PyAutomaton):
+            automaton = self._automaton.size_bytes()
+        elif self._automaton is not None:
+            automaton = self._automaton.get_stats().get("total_size", 0)
+        return {
+            "bloom": len(self._bloom.bits),
+            "fingerprints": self._fingerprints.itemsize * len(self._fingerprints),
+            "automaton": automaton,
+        }
+
+    def contains(self, ioc_type: str, value: str) -> bool:
+        fp = fingerprint(ioc_type, value)
+        if fp not in self._bloom:
+            return False
+        fps = self._fingerprints
+        i = bisect.bisect_left(fps, fp)
+        return i < len(fps) and fps[i] == fp
+
+    def source(self, ioc_type: str, value: str) -> Optional[str]:
+        return self._sources.get((ioc_type, value))
+
+    def match_text(self, text: str) -> Set[Tuple[str, str]]:
+        """All (type, indicator) pairs found in free text."""
+        found: Set[Tuple[str, str]] = set()
+        if len(self._fingerprints):
+            for match in _TOKEN_RE.finditer(text):
+                kind = match.lastgroup
+                value = match.group(kind).lower()
+                if kind == "domain":
+                    self._match_domain(value, found)
+                elif kind == "ip":
+                    try:
+                        value = str(ipaddress.ip_address(value))
+                    except ValueError:
+                        continue
+                    if self.contains("ip", value):
+                        found.add(("ip", value))
+                elif self.contains(kind, value):
+                    found.add((kind, value))
+        if self._automaton is not None:
+            for _end, pattern in self._automaton.iter(text.lower()):
+                found.add(("pattern", pattern))
+        return found
+
+    def match_values(self, ips: Iterable[Optional[str]], hostname: Optional[str]) -> Set[Tuple[str, str]]:
+        found: Set[Tuple[str, str]] = set()
+        if not len(self._fingerprints):
+            return found
+        for ip in ips:
+            if ip and self.contains("ip", ip):
+                found.add(("ip", ip))
+        if hostname:
+            self._match_domain(hostname.lower(), found)
+        return found
+
+    def _match_domain(self, domain: str, found: Set[Tuple[str, str]]) -> None:
+        # Индикатор evil.com срабатывает и на поддомены (a.b.evil.com)
+        labels = domain.split(".")
+        for i in range(len(labels) - 1):
+            candidate = ".".join(labels[i:])
+            if self.contains("domain", candidate):
+                found.add(("domain", candidate))
+                return
+
+
+# Источники индикаторов храним только до этого размера набора
+_MAX_SOURCES = 100_000
+
+
+def load_index(directory: Path) -> IOCIndex:
+    indicators: Dict[str, Set[str]] = {ioc_type: set() for ioc_type in IOC_TYPES}
+    sources: Dict[Tuple[str, str], str] = {}
+    feeds: List[str] = []
+    skipped = 0
+    for path in feed_files(directory):
+        reader = FEED_READERS[path.suffix.lower()]
+        try:
+            for value, ioc_type in reader(path):
+                normalized = normalize_indicator(value, ioc_type)
+                if normalized is None:
+                    skipped += 1
+                    continue
+                indicators[normalized[0]].add(normalized[1])
+                if len(sources) < _MAX_SOURCES:
+                    sources.setdefault(normalized, path.name)
+        except (OSError, ValueError) as exc:
+            logger.error("Failed to read IOC feed %s: %s", path, exc)
+            continue
+        feeds.append(path.name)
+    index = IOCIndex(indicators, sources, feeds)
+    logger.info(
+        "Loaded IOC index from %d feeds: %s (skipped %d invalid entries)", len(feeds), index.counts, skipped
+    )
+    return index
+
+
+# --- Engine ------------------------------------------------------------------------
+
+
+class IOCEngine:
+    def __init__(self, directory: Path = IOC_FEEDS_DIR) -> None:
+        self.directory = directory
+        self._index: Optional[IOCIndex] = None
+        self._feed_state: Dict[str, float] = {}
+        self._reload_lock = threading.Lock()
+        self.events_checked = 0
+        self.matches = 0
+        self.match_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def index(self) -> Optional[IOCIndex]:
+        return self._index
+
+    def _current_feed_state(self) -> Dict[str, float]:
+        return {str(path): path.stat().st_mtime for path in feed_files(self.directory)}
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuild the index if feed files changed (or always with force). Returns True if swapped."""
+        with self._reload_lock:
+            state = self._current_feed_state()
+            if not force and self._index is not None and state == self._feed_state:
+                return False
+            try:
+                index = load_index(self.directory)
+            except Exception as exc:
+                self.last_error = str(exc)
+                logger.exception("IOC reload failed, keeping the previous index")
+                return False
+            # Атомарная замена ссылки: матчинг продолжает работать на старом индексе до этой строки
+            self._index = index
+            self._feed_state = state
+            self.last_error = None
+            return True
+
+    def ensure_rules(self, db: Session) -> Dict[str, int]:
+        """Active system alert rules (one per indicator type) that IOC alerts are attached to."""
+        existing = {
+            rule.name: rule for rule in db.query(AlertRuleORM).filter(AlertRuleORM.rule_type == "ioc").all()
+        }
+        rule_ids: Dict[str, int] = {}
+        for ioc_type in IOC_TYPES:
+            name = f"Threat intel: {ioc_type}"
+            rule = existing.get(name)
+            if rule is None:
+                rule = AlertRuleORM(
+                    name=name,
+                    description=f"Event mentions a known-bad {ioc_type} from the IOC feeds",
+                    rule_type="ioc",
+                    is_active=True,
+                    created_by="system",
+                )
+                db.add(rule)
+                db.flush()
+            if rule.is_active:
+                rule_ids[ioc_type] = rule.id
+        return rule_ids
+
+    def match_event(self, event) -> Set[Tuple[str, str]]:
+        index = self._index
+        if index is None or not len(index):
+            return set()
+        started = time.perf_counter()
+        found = index.match_text(event.description or "")
+        found |= index.match_values(
+            (getattr(event, "src_ip", None), getattr(event, "dst_ip", None)), getattr(event, "hostname", None)
+        )
+        self.match_seconds += time.perf_counter() - started
+        self.events_checked += 1
+        self.matches += bool(found)
+        return found
+
+    def alert_on_event(self, db: Session, event, commit: bool = True) -> int:
+        """Match the event and create alerts for every indicator type that hit. Returns alerts created."""
+        found = self.match_event(event)
+        if not found:
+            return 0
+        from app.services.alert_service import create_alerts_for_event
+
+        rule_ids = self.ensure_rules(db)
+        index = self._index
+        created = 0
+        for ioc_type in sorted({ioc_type for ioc_type, _value in found} & rule_ids.keys()):
+            values = sorted(value for kind, value in found if kind == ioc_type)
+            notes = "IOC match: " + ", ".join(
+                f"{value} ({index.source(ioc_type, value) or 'feed'})" for value in values[:10]
+            )
+            created += create_alerts_for_event(db, event, [rule_ids[ioc_type]], commit=commit, notes=notes)
+        return created
+
+    def status(self) -> dict:
+        index = self._index
+        memory = index.memory_bytes() if index else {}
+        return {
+            "enabled": IOC_ENABLED,
+            "feeds_dir": str(self.directory),
+            "feeds": index.feeds if index else [],
+            "indicators": index.counts if index else {},
+            "loaded_at": index.loaded_at if index else None,
+            "build_seconds": round(index.build_seconds, 3) if index else None,
+            "memory_bytes": {**memory, "total": sum(memory.values())},
+            "automaton": "pyahocorasick" if ahocorasick is not None else "python",
+            "events_checked": self.events_checked,
+            "events_matched": self.matches,
+            "events_per_sec": round(self.events_checked / self.match_seconds, 1) if self.match_seconds else None,
+            "last_error": self.last_error,
+        }
+
+
+engine = IOCEngine()
+
+
+def is_enabled() -> bool:
+    return IOC_ENABLED and engine.index is not None
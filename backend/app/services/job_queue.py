@@ -0,0 +1,508 @@
+"""
+Database-backed queue for long-running maintenance jobs.
+
+Jobs are rows of the ``jobs`` table: submitted by POST /api/jobs (or by the
+API itself, e.g. evaluate-all, ATT&CK re-tagging and the startup seed
+import), claimed by workers, polled for progress, cancelled cooperatively.
+Job types are registered with @job_type(name, concurrency, max_attempts); a
+handler gets its own session and a JobContext and returns a JSON-serializable
+result.
+
+Claiming: on Postgres, candidates are selected ``FOR UPDATE SKIP LOCKED`` so
+workers never wait on each other, and claims of one type are serialized by
+an advisory transaction lock. The lock is taken with try-lock and held for
+one candidate at a time, so two workers cannot deadlock on locks of different
+types; a type locked by another worker is skipped until the next poll.
+Everywhere the claim itself is a conditional UPDATE (still queued, fewer than
+``concurrency`` running jobs of the type), which is atomic on SQLite as is -
+the mode used by tests and single-node setups.
+
+Workers are JOB_WORKERS threads of the API process (0 - none) and/or
+separate processes:
+
+    python -m app.services.job_queue [--processes 4]
+
+A running job refreshes heartbeat_at every JOB_HEARTBEAT_SECONDS; jobs whose
+worker died (no heartbeat for JOB_STALE_SECONDS) go back to the queue. A
+failed attempt is retried after JOB_RETRY_BACKOFF_SECONDS * 2**(attempt - 1)
+until max_attempts. Cancelling a queued job drops it; a running job stops
+at its next ctx.progress() call.
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased
+
+from app.models.db_models import JobORM
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "30"))
+
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    """Raised by JobContext.progress() when cancellation was requested."""
+
+
+@dataclass(frozen=True)
+class JobType:
+    name: str
+    handler: Callable[[Session, "JobContext"], Any]
+    concurrency: int
+    max_attempts: int
+
+
+JOB_TYPES: Dict[str, JobType] = {}
+
+
+def job_type(name: str, concurrency: int = 1, max_attempts: int = 1):
+    """Register a handler(db, ctx) -> result. ``concurrency`` - running jobs of the type across all workers."""
+
+    def register(handler):
+        JOB_TYPES[name] = JobType(name, handler, concurrency, max_attempts)
+        return handler
+
+    return register
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# --- Submission and control -----------------------------------------------------
+
+
+def submit(
+    db: Session,
+    type: str,
+    params: Optional[Dict[str, Any]] = None,
+    created_by: Optional[str] = None,
+    dedupe: bool = False,
+) -> JobORM:
+    """
+    Queue a job; raises ValueError for an unknown type. With ``dedupe`` an
+    active job of the same type and params is returned instead of a new one.
+    """
+    spec = JOB_TYPES.get(type)
+    if spec is None:
+        raise ValueError(f"unknown job type {type!r}")
+    encoded = json.dumps(params or {}, sort_keys=True, default=str)
+    if dedupe:
+        existing = (
+            db.query(JobORM)
+            .filter(JobORM.type == type, JobORM.params == encoded, JobORM.status.in_(ACTIVE_JOB_STATUSES))
+            .order_by(JobORM.id)
+            .first()
+        )
+        if existing is not None:
+            return existing
+    job = JobORM(
+        type=type,
+        params=encoded,
+        max_attempts=spec.max_attempts,
+        run_after=_now(),
+        created_by=created_by,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    logger.info("Queued job %d (%s)", job.id, type)
+    return job
+
+
+def get_job(db: Session, job_id: int) -> Optional[JobORM]:
+    return db.query(JobORM).filter(JobORM.id == job_id).first()
+
+
+def list_jobs(
+    db: Session,
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    limit: int = 50,
+) -> List[JobORM]:
+    query = db.query(JobORM)
+    if status:
+        query = query.filter(JobORM.status == status)
+    if type:
+        query = query.filter(JobORM.type == type)
+    return query.order_by(JobORM.id.desc()).limit(limit).all()
+
+
+def cancel(db: Session, job_id: int) -> Optional[JobORM]:
+    """Cancel a queued job at once, ask a running one to stop. Finished jobs are left as they are."""
+    job = get_job(db, job_id)
+    if job is None:
+        return None
+    if job.status == "queued":
+        job.status = "cancelled"
+        job.finished_at = _now()
+    elif job.status == "running":
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+# --- Claiming ---------------------------------------------------------------------
+
+
+def claim(db: Session, worker_id: str, types: Optional[Sequence[str]] = None) -> Optional[JobORM]:
+    """Take the oldest due job whose type has a free slot; None if there is nothing to run."""
+    types = [name for name in (types or JOB_TYPES) if name in JOB_TYPES]
+    if not types:
+        return None
+    postgres = db.get_bind().dialect.name == "postgresql"
+    now = _now()
+    candidates = (
+        db.query(JobORM.id, JobORM.type)
+        .filter(JobORM.status == "queued", JobORM.run_after <= now, JobORM.type.in_(types))
+        .order_by(JobORM.id)
+        .limit(20)
+    )
+    if postgres:
+        candidates = candidates.with_for_update(skip_locked=True)
+
+    for job_id, name in candidates.all():
+        if postgres:
+            # Подсчёт занятых слотов и захват атомарны только под блокировкой типа.
+            # Блокировка берётся без ожидания и одна на транзакцию: воркеры не могут
+            # взять блокировки разных типов в разном порядке и зависнуть друг на друге
+            if not db.execute(select(func.pg_try_advisory_xact_lock(zlib.crc32(name.encode())))).scalar():
+                continue
+        running = aliased(JobORM)
+        slots_used = (
+            select(func.count())
+            .select_from(running)
+            .where(running.type == name, running.status == "running")
+            .scalar_subquery()
+        )
+        claimed = (
+            db.query(JobORM)
+            .filter(JobORM.id == job_id, JobORM.status == "queued", slots_used < JOB_TYPES[name].concurrency)
+            .update(
+                {
+                    JobORM.status: "running",
+                    JobORM.attempts: JobORM.attempts + 1,
+                    JobORM.locked_by: worker_id,
+                    JobORM.started_at: now,
+                    JobORM.heartbeat_at: now,
+                    JobORM.cancel_requested: False,
+                },
+                synchronize_session=False,
+            )
+        )
+        if claimed:
+            db.commit()
+            return get_job(db, job_id)
+        if postgres:
+            db.rollback()  # снимает блокировку типа перед следующим кандидатом
+    db.rollback()
+    return None
+
+
+def requeue_stale(db: Session, stale_seconds: float = JOB_STALE_SECONDS) -> int:
+    """Return running jobs whose worker stopped sending heartbeats to the queue (or fail them)."""
+    cutoff = _now() - timedelta(seconds=stale_seconds)
+    stale = db.query(JobORM).filter(JobORM.status == "running", JobORM.heartbeat_at < cutoff).all()
+    for job in stale:
+        logger.warning("Job %d (%s) lost its worker %s", job.id, job.type, job.locked_by)
+        _finish_attempt(job, error=f"worker {job.locked_by} stopped responding")
+    db.commit()
+    return len(stale)
+
+
+def _finish_attempt(job: JobORM, error: str) -> None:
+    """Failed attempt: queue a retry with backoff while attempts remain."""
+    job.error = error[:4000]
+    job.locked_by = None
+    if job.attempts < job.max_attempts:
+        job.status = "queued"
+        job.run_after = _now() + timedelta(seconds=JOB_RETRY_BACKOFF_SECONDS * 2 ** max(job.attempts - 1, 0))
+    else:
+        job.status = "failed"
+        job.finished_at = _now()
+
+
+# --- Running ----------------------------------------------------------------------
+
+
+class JobContext:
+    """Handle passed to a job handler: params, progress reporting, cancellation check."""
+
+    def __init__(self, session_factory: Callable[[], Session], job_id: int, params: Dict[str, Any]) -> None:
+        self.session_factory = session_factory
+        self.job_id = job_id
+        self.params = params
+
+    def progress(self, fraction: float, message: Optional[str] = None) -> None:
+        """Store progress (0..1) and raise JobCancelled if cancellation was requested."""
+        values = {JobORM.progress: min(max(fraction, 0.0), 1.0), JobORM.heartbeat_at: _now()}
+        if message is not None:
+            values[JobORM.progress_message] = message
+        if self._update(values):
+            raise JobCancelled()
+
+    def update_params(self, **values: Any) -> None:
+        """Persist values into params, e.g. state a retry should resume from."""
+        self.params = {**self.params, **values}
+        self._update({JobORM.params: json.dumps(self.params, sort_keys=True, default=str)})
+
+    def _update(self, values: dict) -> bool:
+        # Отдельная сессия: не коммитит незавершённую работу обработчика
+        db = self.session_factory()
+        try:
+            db.query(JobORM).filter(JobORM.id == self.job_id).update(values, synchronize_session=False)
+            db.commit()
+            return bool(db.query(JobORM.cancel_requested).filter(JobORM.id == self.job_id).scalar())
+        finally:
+            db.close()
+
+
+def run_job(session_factory: Callable[[], Session], job: JobORM, worker_id: str) -> str:
+    """Run a claimed job to its next state; returns that status."""
+    spec = JOB_TYPES.get(job.type)
+    ctx = JobContext(session_factory, job.id, json.loads(job.params or "{}"))
+    heartbeat = _Heartbeat(session_factory, job.id)
+    heartbeat.start()
+    db = session_factory()
+    outcome: Dict[str, Any] = {}
+    try:
+        if spec is None:
+            raise ValueError(f"unknown job type {job.type!r}")
+        outcome["result"] = spec.handler(db, ctx)
+        outcome["status"] = "succeeded"
+    except JobCancelled:
+        db.rollback()
+        outcome["status"] = "cancelled"
+    except Exception as exc:
+        db.rollback()
+        logger.exception("Job %d (%s) failed", job.id, job.type)
+        outcome["status"] = "failed"
+        outcome["error"] = f"{type(exc).__name__}: {exc}"
+    finally:
+        heartbeat.stop()
+        db.close()
+
+    db = session_factory()
+    try:
+        current = db.query(JobORM).filter(JobORM.id == job.id, JobORM.locked_by == worker_id).first()
+        if current is None or current.status != "running":
+            return current.status if current is not None else "lost"  # снята как зависшая
+        if outcome["status"] == "failed":
+            _finish_attempt(current, outcome["error"])
+        else:
+            current.status = outcome["status"]
+            current.finished_at = _now()
+            current.locked_by = None
+            if outcome["status"] == "succeeded":
+                current.progress = 1.0
+                current.result = json.dumps(outcome["result"], default=str)
+                current.error = None
+        db.commit()
+        logger.info("Job %d (%s): %s", job.id, job.type, current.status)
+        return current.status
+    finally:
+        db.close()
+
+
+class _Heartbeat:
+    """Refreshes heartbeat_at of a running job from a side thread."""
+
+    def __init__(self, session_factory: Callable[[], Session], job_id: int) -> None:
+        self.session_factory = session_factory
+        self.job_id = job_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-{job_id}-heartbeat", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(JOB_HEARTBEAT_SECONDS):
+            db = self.session_factory()
+            try:
+                db.query(JobORM).filter(JobORM.id == self.job_id).update(
+                    {JobORM.heartbeat_at: _now()}, synchronize_session=False
+                )
+                db.commit()
+            except Exception:
+                logger.exception("Heartbeat of job %d failed", self.job_id)
+            finally:
+                db.close()
+
+
+class JobWorker:
+    """Claims and runs jobs one at a time in a background thread."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        types: Optional[Sequence[str]] = None,
+        poll_interval: float = JOB_POLL_INTERVAL_SECONDS,
+    ) -> None:
+        self.session_factory = session_factory
+        self.types = types
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Optional[str]:
+        """Claim and run one job; returns its status, None if the queue had nothing due."""
+        db = self.session_factory()
+        try:
+            requeue_stale(db)
+            job = claim(db, self.worker_id, self.types)
+        finally:
+            db.close()
+        if job is None:
+            return None
+        return run_job(self.session_factory, job, self.worker_id)
+
+    def run_forever(self) -> None:
+        logger.info("Job worker %s started", self.worker_id)
+        while not self._stop.is_set():
+            try:
+                if self.run_once() is not None:
+                    continue
+            except Exception:
+                logger.exception("Job worker %s iteration failed", self.worker_id)
+            self._stop.wait(self.poll_interval)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.run_forever, name=f"job-worker-{self.worker_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop after the current job (a running handler is not interrupted)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+# Потоки-воркеры процесса API (JOB_WORKERS), создаются при старте
+workers: List[JobWorker] = []
+
+
+# --- Job types --------------------------------------------------------------------
+
+
+@job_type("backfill", concurrency=1, max_attempts=3)
+def _backfill_job(db: Session, ctx: JobContext) -> Dict[str, Any]:
+    """
+    Rule backfill (app.services.backfill). Params: rule_ids, start, end (ISO),
+    resume_run_id. The run id is saved into params, so a retry resumes the
+    run from its checkpoints instead of starting over.
+    """
+    from app.services.backfill import create_run, run_backfill
+
+    params = ctx.params
+    run_id = params.get("resume_run_id")
+    if run_id is None:
+        run_id = create_run(
+            db,
+            rule_ids=params.get("rule_ids"),
+            start=datetime.fromisoformat(params["start"]) if params.get("start") else None,
+            end=datetime.fromisoformat(params["end"]) if params.get("end") else None,
+        ).id
+        ctx.update_params(resume_run_id=run_id)
+
+    summary = run_backfill(
+        db, run_id, progress=lambda done, total: ctx.progress(done / total, f"run {run_id}: {done}/{total} ranges")
+    )
+    if summary["status"] == "failed":
+        raise RuntimeError(f"backfill run {run_id}: {summary['ranges'].get('failed', 0)} ranges failed")
+    return summary
+
+
+@job_type("seed_events", concurrency=1, max_attempts=1)
+def _seed_events_job(db: Session, ctx: JobContext) -> Dict[str, Any]:
+    """Initial import of EVENTS_FILE into an empty events table."""
+    from app.repositories.event_repo import seed_events_from_file
+
+    return {"inserted": seed_events_from_file(db)}
+
+
+@job_type("retag_techniques", concurrency=1, max_attempts=1)
+def _retag_techniques_job(db: Session, ctx: JobContext) -> Dict[str, Any]:
+    """Re-tag stored events with the current ATT&CK mapping (mitre_mapping.retag_events). Params: start, end (ISO)."""
+    from app.models.db_models import SecurityEventORM
+    from app.services.mitre_mapping import retag_events
+
+    start = datetime.fromisoformat(ctx.params["start"]) if ctx.params.get("start") else None
+    end = datetime.fromisoformat(ctx.params["end"]) if ctx.params.get("end") else None
+    query = db.query(func.count(SecurityEventORM.id))
+    if start:
+        query = query.filter(SecurityEventORM.timestamp >= start)
+    if end:
+        query = query.filter(SecurityEventORM.timestamp < end)
+    total = query.scalar() or 0
+    tags = retag_events(
+        db, start=start, end=end, progress=lambda done: ctx.progress(done / max(total, 1), f"{done}/{total} events")
+    )
+    return {"tags": tags}
+
+
+def main() -> None:
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--types", help="comma-separated job types to run (default: all)")
+    args = parser.parse_args()
+
+    from app.db import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()  # соединения не должны наследоваться дочерними процессами
+    types = args.types.split(",") if args.types else None
+    if args.processes <= 1:
+        _run_process(types)
+        return
+
+    processes = [
+        multiprocessing.Process(target=_run_process, args=(types,), daemon=True) for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+def _run_process(types: Optional[List[str]]) -> None:
+    from app.db import SessionLocal
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    try:
+        JobWorker(SessionLocal, types=types).run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+ATT&CK technique tagging of events at ingest and the technique heatmap.
+
+Mapping rules live in MITRE_MAPPING_FILE (JSON list), e.g.
+
+    {"technique": "T1110", "category": "auth", "source": ["sshd"],
+     "description": ["failed password", "invalid user"], "pattern": "..."}
+
+Every given condition must hold: category is one of the listed values,
+source contains one of the substrings, description contains one of the
+keywords (case-insensitive, matched from a word start), description matches
+``pattern`` (regex). The rules are compiled into a MappingIndex: rules by
+category, and all keywords in one alternation regex, so an event costs one
+dict lookup and at most one regex pass regardless of the number of rules.
+The file is re-read when its mtime changes.
+
+Tags go to event_techniques (event_id, technique, event timestamp); the
+heatmap aggregates that table by an index on (timestamp, technique).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.models.db_models import AlertORM, EventTechniqueORM
+
+logger = logging.getLogger(__name__)
+
+MITRE_TAGGING_ENABLED = os.getenv("MITRE_TAGGING_ENABLED", "true").lower() == "true"
+MITRE_MAPPING_FILE = Path(os.getenv("MITRE_MAPPING_FILE", "data/mitre_mapping.json"))
+
+_TECHNIQUE_RE = re.compile(r"^T\d{4}(?:\.\d{3})?$")
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(item) for item in value]
+
+
+@dataclass(frozen=True)
+class MappingRule:
+    technique: str
+    categories: FrozenSet[str]
+    sources: Tuple[str, ...]
+    keywords: FrozenSet[str]
+    pattern: Optional[re.Pattern]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MappingRule":
+        technique = str(data.get("technique", "")).strip().upper()
+        if not _TECHNIQUE_RE.match(technique):
+            raise ValueError(f"invalid technique id {technique!r}")
+        pattern = data.get("pattern")
+        return cls(
+            technique=technique,
+            categories=frozenset(item.lower() for item in _as_list(data.get("category"))),
+            sources=tuple(item.lower() for item in _as_list(data.get("source"))),
+            keywords=frozenset(item.lower() for item in _as_list(data.get("description")) if item),
+            pattern=re.compile(pattern, re.IGNORECASE) if pattern else None,
+        )
+
+
+class MappingIndex:
+    """Compiled mapping rules; immutable, swapped as a whole on reload."""
+
+    def __init__(self, rules: Sequence[MappingRule]) -> None:
+        self.rules = list(rules)
+        self._by_category: Dict[Optional[str], List[MappingRule]] = {}
+        for rule in self.rules:
+            for category in rule.categories or (None,):
+                self._by_category.setdefault(category, []).append(rule)
+        self._any_category = self._by_category.get(None, [])
+
+        keywords = sorted({kw for rule in self.rules for kw in rule.keywords}, key=len, reverse=True)
+        # Ключевое слово совпадает с начала слова; окончание не проверяется (основы вроде "неудачн")
+        self._keyword_re = (
+            re.compile("|".join(_keyword_pattern(kw) for kw in keywords), re.IGNORECASE) if keywords else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def techniques(self, category: str, source: str, description: str) -> Set[str]:
+        candidates = self._by_category.get((category or "").lower(), [])
+        if self._any_category:
+            candidates = candidates + self._any_category
+        if not candidates:
+            return set()
+
+        found: Optional[Set[str]] = None
+        source = (source or "").lower()
+        tags: Set[str] = set()
+        for rule in candidates:
+            if rule.technique in tags:
+                continue
+            if rule.sources and not any(item in source for item in rule.sources):
+                continue
+            if rule.keywords:
+                if found is None:
+                    found = self._keywords_in(description)
+                if rule.keywords.isdisjoint(found):
+                    continue
+            if rule.pattern is not None and not rule.pattern.search(description or ""):
+                continue
+            tags.add(rule.technique)
+        return tags
+
+    def _keywords_in(self, text: Optional[str]) -> Set[str]:
+        if not text or self._keyword_re is None:
+            return set()
+        return {match.group(0).lower() for match in self._keyword_re.finditer(text)}
+
+
+def _keyword_pattern(keyword: str) -> str:
+    escaped = re.escape(keyword)
+    return rf"(?<!\w){escaped}" if re.match(r"\w", keyword) else escaped
+
+
+def load_rules(path: Path) -> List[MappingRule]:
+    """Parse the mapping file; invalid entries are logged and skipped."""
+    with open(path, encoding="utf-8") as handle:
+        raw = json.load(handle)
+    if not isinstance(raw, list):
+        raise ValueError(f"{path} must contain a JSON array of rules")
+    rules = []
+    for index, item in enumerate(raw):
+        try:
+            rules.append(MappingRule.from_dict(item))
+        except (ValueError, TypeError, re.error) as exc:
+            logger.warning("Skipping ATT&CK mapping rule #%d in %s: %s", index, path, exc)
+    return rules
+
+
+class MappingEngine:
+    """Current MappingIndex, rebuilt when the mapping file changes."""
+
+    def __init__(self, path: Path = MITRE_MAPPING_FILE) -> None:
+        self.path = path
+        self._index = MappingIndex([])
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def index(self) -> MappingIndex:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._reload(mtime)
+        return self._index
+
+    def _reload(self, mtime: Optional[float]) -> None:
+        if mtime is None:
+            if self._mtime is not None:
+                logger.warning("ATT&CK mapping file %s disappeared; tagging disabled", self.path)
+            self._index, self._mtime = MappingIndex([]), None
+            return
+        try:
+            rules = load_rules(self.path)
+        except (OSError, ValueError) as exc:
+            # Оставляем предыдущие правила, пока файл не исправят
+            logger.error("Failed to load ATT&CK mapping from %s: %s", self.path, exc)
+            self._mtime = mtime
+            return
+        self._index, self._mtime = MappingIndex(rules), mtime
+        logger.info("Loaded %d ATT&CK mapping rules from %s", len(rules), self.path)
+
+
+engine = MappingEngine()
+
+
+def tag_rows(rows: Iterable[Dict[str, Any]], index: Optional[MappingIndex] = None) -> List[Dict[str, Any]]:
+    """event_techniques rows for ingest row dicts (id, timestamp, category, source, description)."""
+    if index is None:
+        index = engine.index()
+    if not len(index):
+        return []
+    tags = []
+    for row in rows:
+        for technique in index.techniques(row["category"], row["source"], row["description"]):
+            tags.append({"event_id": row["id"], "technique": technique, "timestamp": row["timestamp"]})
+    return tags
+
+
+def tag_events(db: Session, rows: Sequence[Dict[str, Any]]) -> int:
+    """Store technique tags for freshly inserted events (caller commits)."""
+    if not MITRE_TAGGING_ENABLED:
+        return 0
+    tags = tag_rows(rows)
+    if tags:
+        db.execute(insert(EventTechniqueORM), tags)
+    return len(tags)
+
+
+def retag_events(
+    db: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_size: int = 5000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Recompute tags of stored events in [start, end) with the current mapping,
+    e.g. after the mapping file changed. Each chunk of events has its old tags
+    replaced by the new ones in one transaction, so an interrupted run leaves
+    every event tagged by either the old or the new mapping. ``progress`` is
+    called with the number of events done after each chunk. Returns tags written.
+    Runs as the ``retag_techniques`` job (POST /api/mitre/retag).
+    """
+    from app.services.event_service import iter_event_rows
+
+    index = engine.index()
+    written = 0
+    done = 0
+    chunk: List[Dict[str, Any]] = []
+    # iter_event_rows не держит курсор между порциями, коммиты по ходу чтения безопасны
+    for row in iter_event_rows(db, start=start, end=end, chunk_size=chunk_size):
+        chunk.append({"id": row[0], "timestamp": row[1], "source": row[2], "category": row[3], "description": row[5]})
+        if len(chunk) >= chunk_size:
+            written += _replace_tags(db, chunk, index)
+            done += len(chunk)
+            chunk = []
+            if progress is not None:
+                progress(done)
+    if chunk:
+        written += _replace_tags(db, chunk, index)
+        done += len(chunk)
+        if progress is not None:
+            progress(done)
+    logger.info("Re-tagged %d events %s .. %s: %d technique tags", done, start, end, written)
+    return written
+
+
+def _replace_tags(db: Session, rows: List[Dict[str, Any]], index: MappingIndex) -> int:
+    tags = tag_rows(rows, index)
+    db.query(EventTechniqueORM).filter(EventTechniqueORM.event_id.in_([row["id"] for row in rows])).delete(
+        synchronize_session=False
+    )
+    if tags:
+        db.execute(insert(EventTechniqueORM), tags)
+    db.commit()
+    return len(tags)
+
+
+def technique_heatmap(db: Session, start: datetime, end: datetime) -> Dict[str, Dict[str, int]]:
+    """
+    {technique: {"events": n, "alerts": m}} for events in [start, end).
+    Alerts are those raised on the tagged events (by event time).
+    """
+    in_window = (EventTechniqueORM.timestamp >= start, EventTechniqueORM.timestamp < end)
+    heatmap: Dict[str, Dict[str, int]] = {}
+    for technique, count in (
+        db.query(EventTechniqueORM.technique, func.count())
+        .filter(*in_window)
+        .group_by(EventTechniqueORM.technique)
+    ):
+        heatmap[technique] = {"events": count, "alerts": 0}
+
+    for technique, count in (
+        db.query(EventTechniqueORM.technique, func.count(AlertORM.id))
+        .join(AlertORM, AlertORM.event_id == EventTechniqueORM.event_id)
+        .filter(*in_window)
+        .group_by(EventTechniqueORM.technique)
+    ):
+        heatmap.setdefault(technique, {"events": 0, "alerts": 0})["alerts"] = count
+    return heatmap
@@ -0,0 +1,291 @@
+"""
+Syslog (RFC 5424) and CEF network listener.
+
+Sensors send one event per UDP datagram, or over TCP either newline-delimited
+or with RFC 6587 octet counting. Messages are parsed into row dicts by the
+parser registry (event_parsers: syslog, CEF, LEEF, JSON, key=value) on the
+event loop, queued in a bounded buffer, validated in bulk and written in
+batches (by size or by latency deadline) through event_repo.ingest_events in
+a worker thread. When
+the buffer is full new messages are dropped and counted, so a burst never
+grows memory or blocks the sockets.
+
+Parsing is CPU-bound and runs on one core per process (tens of thousands of
+messages per second). For higher rates run the standalone listener with
+SYSLOG_PROCESSES=N: N processes share the ports via SO_REUSEPORT.
+
+Runs inside the API process (SYSLOG_ENABLED=true) or standalone:
+    python -m app.services.syslog_listener
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.repositories.event_repo import ingest_events
+from app.services.event_parsers import ParseError, parse_message, validate_rows
+
+logger = logging.getLogger(__name__)
+
+SYSLOG_ENABLED = os.getenv("SYSLOG_ENABLED", "false").lower() == "true"
+SYSLOG_HOST = os.getenv("SYSLOG_HOST", "0.0.0.0")
+# Пустое значение отключает соответствующий транспорт
+SYSLOG_UDP_PORT = int(os.getenv("SYSLOG_UDP_PORT", "5514") or -1)
+SYSLOG_TCP_PORT = int(os.getenv("SYSLOG_TCP_PORT", "5514") or -1)
+SYSLOG_BATCH_SIZE = int(os.getenv("SYSLOG_BATCH_SIZE", "2000"))
+SYSLOG_BATCH_LATENCY_MS = int(os.getenv("SYSLOG_BATCH_LATENCY_MS", "500"))
+SYSLOG_QUEUE_SIZE = int(os.getenv("SYSLOG_QUEUE_SIZE", "200000"))
+SYSLOG_WRITERS = int(os.getenv("SYSLOG_WRITERS", "2"))
+# Standalone: число процессов-слушателей на одном порту (SO_REUSEPORT, ядро раздаёт сокеты)
+SYSLOG_PROCESSES = int(os.getenv("SYSLOG_PROCESSES", "1"))
+
+MAX_MESSAGE_BYTES = 64 * 1024
+
+
+class ListenerStats:
+    def __init__(self) -> None:
+        self.received = 0
+        self.parsed = 0
+        self.dropped = 0
+        self.written = 0
+        self.invalid = 0
+        self.write_errors = 0
+        self.batches = 0
+        self.parse_errors: Counter = Counter()  # peer host -> count
+        self.started_at = time.time()
+
+    def as_dict(self, queue_size: int) -> dict:
+        return {
+            "received": self.received,
+            "parsed": self.parsed,
+            "dropped": self.dropped,
+            "written": self.written,
+            "invalid": self.invalid,
+            "write_errors": self.write_errors,
+            "batches": self.batches,
+            "queue_size": queue_size,
+            "parse_errors": dict(self.parse_errors.most_common(100)),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+        }
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, listener: "SyslogListener") -> None:
+        self.listener = listener
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.listener.submit(data, addr[0])
+
+
+class SyslogListener:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        host: str = SYSLOG_HOST,
+        udp_port: int = SYSLOG_UDP_PORT,  # -1 отключает, 0 - любой свободный порт
+        tcp_port: int = SYSLOG_TCP_PORT,
+        batch_size: int = SYSLOG_BATCH_SIZE,
+        batch_latency: float = SYSLOG_BATCH_LATENCY_MS / 1000,
+        queue_size: int = SYSLOG_QUEUE_SIZE,
+        writers: int = SYSLOG_WRITERS,
+        reuse_port: bool = False,
+    ) -> None:
+        self.session_factory = session_factory
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.writers = max(writers, 1)
+        self.reuse_port = reuse_port
+        self.stats = ListenerStats()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    @property
+    def udp_address(self) -> Optional[Tuple[str, int]]:
+        return self._transport.get_extra_info("sockname")[:2] if self._transport else None
+
+    @property
+    def tcp_address(self) -> Optional[Tuple[str, int]]:
+        return self._server.sockets[0].getsockname()[:2] if self._server else None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.udp_port >= 0:
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _UDPProtocol(self), local_addr=(self.host, self.udp_port), reuse_port=self.reuse_port
+            )
+        if self.tcp_port >= 0:
+            self._server = await asyncio.start_server(
+                self._handle_tcp, self.host, self.tcp_port, reuse_port=self.reuse_port
+            )
+        self._tasks = [asyncio.create_task(self._writer_loop()) for _ in range(self.writers)]
+        logger.info("Syslog listener started: udp=%s tcp=%s", self.udp_address, self.tcp_address)
+
+    async def stop(self) -> None:
+        """Close sockets, write what is already buffered and stop the writers."""
+        if self._transport is not None:
+            self._transport.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._stopping = True
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.info("Syslog listener stopped: %s", self.stats.as_dict(self._queue.qsize()))
+
+    def snapshot(self) -> dict:
+        return self.stats.as_dict(self._queue.qsize())
+
+    def submit(self, data: bytes, peer: str) -> None:
+        """Parse one raw message and enqueue it; never blocks."""
+        stats = self.stats
+        stats.received += 1
+        try:
+            event = parse_message(data)
+        except ParseError:
+            stats.parse_errors[peer] += 1
+            return
+        stats.parsed += 1
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            stats.dropped += 1
+
+    async def _handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = (writer.get_extra_info("peername") or ("unknown",))[0]
+        try:
+            while True:
+                first = await reader.read(1)
+                if not first:
+                    break
+                if first in b"\r\n":
+                    continue
+                if first.isdigit():
+                    # RFC 6587 octet counting: "<len> <message>"
+                    size = int(first + (await reader.readuntil(b" "))[:-1])
+                    if size > MAX_MESSAGE_BYTES:
+                        self.stats.parse_errors[peer] += 1
+                        break
+                    message = await reader.readexactly(size)
+                else:
+                    try:
+                        message = first + await reader.readuntil(b"\n")
+                    except asyncio.IncompleteReadError as exc:
+                        message = first + exc.partial  # последняя строка без перевода строки
+                self.submit(message, peer)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            self.stats.parse_errors[peer] += 1
+        finally:
+            writer.close()
+
+    async def _writer_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._collect_batch(loop)
+            if batch:
+                await loop.run_in_executor(None, self._write_batch, batch)
+
+    async def _collect_batch(self, loop: asyncio.AbstractEventLoop) -> List[Dict[str, Any]]:
+        """Up to batch_size events, waiting at most batch_latency after the first one."""
+        queue = self._queue
+        batch: List[Dict[str, Any]] = []
+        deadline: Optional[float] = None
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(queue.get_nowait())
+                if deadline is None:
+                    deadline = loop.time() + self.batch_latency
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            if self._stopping:
+                break
+            timeout = self.batch_latency if deadline is None else deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                if batch:
+                    break
+                continue
+            if deadline is None:
+                deadline = loop.time() + self.batch_latency
+        return batch
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        rows, errors = validate_rows(batch)
+        if errors:
+            self.stats.invalid += len(errors)
+            logger.warning("Dropped %d invalid events, first: %s", len(errors), errors[0])
+        db = self.session_factory()
+        try:
+            self.stats.written += ingest_events(db, rows)
+            self.stats.batches += 1
+        except Exception:
+            db.rollback()
+            self.stats.write_errors += len(batch)
+            logger.exception("Failed to write batch of %d syslog events", len(batch))
+        finally:
+            db.close()
+
+
+# Запущенный в процессе API слушатель (для /api/ingest/stats)
+listener: Optional[SyslogListener] = None
+
+
+async def serve(reuse_port: bool = False) -> None:
+    from app.db import SessionLocal
+
+    instance = SyslogListener(SessionLocal, reuse_port=reuse_port)
+    await instance.start()
+    try:
+        while True:
+            await asyncio.sleep(60)
+            logger.info("Syslog listener stats (pid %d): %s", os.getpid(), instance.snapshot())
+    finally:
+        await instance.stop()
+
+
+def _run_process(reuse_port: bool) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    try:
+        asyncio.run(serve(reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> None:
+    import multiprocessing
+
+    from app.db import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()  # соединения не должны наследоваться дочерними процессами
+    if SYSLOG_PROCESSES <= 1:
+        _run_process(reuse_port=False)
+        return
+
+    processes = [
+        multiprocessing.Process(target=_run_process, args=(True,), daemon=True) for _ in range(SYSLOG_PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""
+Datetime helpers.
+
+DateTime columns hold naive UTC (SQLite has no time zones; the models never
+set timezone=True), while API parameters and rule fields may carry an
+offset. Values are brought to naive UTC before they are compared with or
+bound against the columns.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+
+def as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Aware datetimes converted to UTC without tzinfo; naive values and None unchanged."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
@@ -0,0 +1,164 @@
+"""
+CPU per 500-row page of the hot list endpoints: ORM path vs Core path.
+
+    events  - db.query(SecurityEventORM) + a SecurityEvent model per row (old get_events)
+              vs get_event_rows (cached Core lambda statement, row tuples) + rows_to_dicts
+    alerts  - get_alerts + _enrich_alert_with_event_data per alert (old /api/alerts/)
+              vs get_alert_rows (one joined statement) + rows_to_dicts
+    rules   - get_alert_rules + AlertRuleOut per rule (old /api/alerts/rules/)
+              vs get_alert_rule_rows + rows_to_dicts
+
+CPU is process time (time.process_time), so it counts the Python work of
+building, compiling and materializing, and SQLite's work in this process.
+The dataset is datagen.populate on a temporary SQLite file; the event buffer
+is off so every page reaches the database.
+
+Run from backend/:
+    python -m benchmarks.bench_core_reads [--events 100000] [--repeat 50] [--output result.json]
+"""
+import os
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-key-not-for-production")
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import statistics  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+from typing import Callable, Dict  # noqa: E402
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.db import Base  # noqa: E402
+from app.models.alert import AlertRuleOut  # noqa: E402
+from app.models.db_models import AlertRuleORM, SecurityEventORM  # noqa: E402
+from app.models.security_event import SecurityEvent  # noqa: E402
+from app.serialization import rows_to_dicts  # noqa: E402
+from app.services import event_buffer  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+
+PAGE = 500
+
+
+def cpu_ms(fn: Callable[[], object], repeat: int, warmup: int = 2) -> Dict[str, float]:
+    """Process-time stats in milliseconds over ``repeat`` calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        samples.append((time.process_time() - started) * 1000)
+    samples.sort()
+    return {
+        "iterations": repeat,
+        "cpu_mean_ms": round(statistics.fmean(samples), 3),
+        "cpu_p50_ms": round(samples[len(samples) // 2], 3),
+    }
+
+
+def run(events: int, repeat: int) -> Dict[str, dict]:
+    from app.api.alerts import _enrich_alert_with_event_data
+    from app.services.alert_service import (
+        ALERT_COLUMNS,
+        RULE_COLUMNS,
+        get_alert_rows,
+        get_alert_rule_rows,
+        get_alert_rules,
+        get_alerts,
+    )
+    from app.services.event_service import EVENT_COLUMNS, get_event_rows
+
+    event_buffer.buffer = None
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'reads.sqlite')}")
+        Base.metadata.create_all(bind=engine)
+        # alert_every=10: страница алертов из 500 строк при любом масштабе
+        datagen.populate(engine, events, alert_every=10)
+        with engine.begin() as conn:
+            conn.execute(
+                insert(AlertRuleORM.__table__),
+                [{**rule, "id": rule["id"] + 1000, "name": f"Extra {rule['id']}"} for rule in datagen.make_rules(80)],
+            )
+        Session = sessionmaker(bind=engine, autoflush=False)
+        db = Session()
+
+        def events_orm():
+            query = db.query(SecurityEventORM).filter(SecurityEventORM.severity.ilike("low"))
+            query.count()
+            rows = query.order_by(SecurityEventORM.timestamp.desc()).offset(0).limit(PAGE).all()
+            items = [
+                SecurityEvent(
+                    id=row.id,
+                    timestamp=row.timestamp,
+                    source=row.source,
+                    category=row.category,
+                    severity=row.severity,
+                    description=row.description,
+                    src_ip=row.src_ip,
+                    dst_ip=row.dst_ip,
+                    hostname=row.hostname,
+                    duplicate_count=row.duplicate_count,
+                )
+                for row in rows
+            ]
+            db.expunge_all()
+            return [item.model_dump() for item in items]
+
+        def events_core():
+            rows, _total = get_event_rows(db, severity="low", offset=0, limit=PAGE)
+            return rows_to_dicts(EVENT_COLUMNS, rows)
+
+        def alerts_orm():
+            alerts, _total = get_alerts(db, offset=0, limit=PAGE)
+            items = [_enrich_alert_with_event_data(db, alert) for alert in alerts]
+            db.expunge_all()
+            return items
+
+        def alerts_core():
+            rows, _total = get_alert_rows(db, offset=0, limit=PAGE)
+            return rows_to_dicts(ALERT_COLUMNS, rows)
+
+        def rules_orm():
+            items = [AlertRuleOut.model_validate(rule).model_dump() for rule in get_alert_rules(db)]
+            db.expunge_all()
+            return items
+
+        def rules_core():
+            return rows_to_dicts(RULE_COLUMNS, get_alert_rule_rows(db))
+
+        results = {}
+        try:
+            for name, before, after in (
+                ("events_page", events_orm, events_core),
+                ("alerts_page", alerts_orm, alerts_core),
+                ("rules_list", rules_orm, rules_core),
+            ):
+                assert len(before()) == len(after())
+                stats = {"orm": cpu_ms(before, repeat), "core": cpu_ms(after, repeat)}
+                stats["speedup"] = round(stats["orm"]["cpu_mean_ms"] / max(stats["core"]["cpu_mean_ms"], 1e-6), 2)
+                results[name] = stats
+        finally:
+            db.close()
+            engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    result = {"page_rows": PAGE, "results": run(args.events, args.repeat)}
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Threat-intel IOC engine: index build time, memory footprint and match rate.
+
+Writes synthetic feeds (IPs, domains, sha256 hashes, substring patterns) to a
+temporary directory, loads them with IOCEngine and matches synthetic event
+descriptions, a fraction of which mention a known indicator. Memory is the
+tracemalloc peak while building the index plus the index's own accounting.
+
+Run from backend/:
+    python -m benchmarks.bench_ioc [--indicators 100000] [--events 20000] [--output result.json]
+"""
+import argparse
+import hashlib
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+from app.services.ioc_service import IOCEngine
+from benchmarks.bench_serialization import DESCRIPTIONS
+
+PATTERNS = ["mimikatz", "cobaltstrike", "invoke-expression", "certutil -urlcache", "psexesvc", "rundll32 javascript"]
+
+
+def _write_feeds(directory: Path, indicators: int, rnd: random.Random) -> dict:
+    per_type = indicators // 3
+    ips = [f"{rnd.randint(1, 223)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}" for _ in range(per_type)]
+    domains = [f"h{i}-{rnd.getrandbits(24):06x}.example" for i in range(per_type)]
+    hashes = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(per_type)]
+    with open(directory / "ips.csv", "w") as f:
+        f.write("indicator,type\n")
+        f.writelines(f"{ip},ip\n" for ip in ips)
+    (directory / "domains.txt").write_text("\n".join(domains))
+    (directory / "hashes.txt").write_text("\n".join(hashes))
+    (directory / "patterns.csv").write_text("indicator,type\n" + "".join(f"{p},pattern\n" for p in PATTERNS))
+    return {"ip": ips, "domain": domains, "hash": hashes}
+
+
+def _events(known: dict, count: int, hit_ratio: float, rnd: random.Random) -> list:
+    events = []
+    for i in range(count):
+        text = rnd.choice(DESCRIPTIONS).format(a=rnd.randint(0, 255), b=rnd.randint(0, 255))
+        text += f" from 10.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)} host ws{i}.corp.local"
+        if rnd.random() < hit_ratio:
+            kind = rnd.choice(list(known))
+            text += f" ioc {rnd.choice(known[kind])}"
+        events.append(SimpleNamespace(description=text, src_ip=None, dst_ip=None, hostname=f"ws{i % 500}.corp.local"))
+    return events
+
+
+def run(indicators: int, events: int, hit_ratio: float = 0.01, seed: int = 42) -> dict:
+    rnd = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        known = _write_feeds(Path(tmp), indicators, rnd)
+        engine = IOCEngine(Path(tmp))
+        tracemalloc.start()
+        started = time.perf_counter()
+        engine.reload(force=True)
+        load_seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    batch = _events(known, events, hit_ratio, rnd)
+    started = time.process_time()
+    matched = sum(1 for event in batch if engine.match_event(event))
+    elapsed = time.process_time() - started
+    status = engine.status()
+    return {
+        "benchmark": "ioc",
+        "indicators": status["indicators"],
+        "automaton": status["automaton"],
+        "load_seconds": round(load_seconds, 3),
+        "load_peak_bytes": peak,
+        "index_memory_bytes": status["memory_bytes"],
+        "events": events,
+        "events_matched": matched,
+        "events_per_sec": round(events / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--indicators", type=int, default=100000)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--hit-ratio", type=float, default=0.01)
+    parser.add_argument("--output", help="write JSON result to this file")
+    args = parser.parse_args()
+
+    result = run(args.indicators, args.events, args.hit_ratio)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Serialization benchmark for one 500-row events page.
+
+Compares the old path (SecurityEvent models -> jsonable_encoder -> JSONResponse)
+with the row-tuple path (rows_to_dicts -> FastJSONResponse), and reports bytes
+on the wire for each supported content encoding.
+
+Run from backend/:
+    python -m benchmarks.bench_serialization [--rows 500] [--repeat 200] [--output result.json]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models.security_event import SecurityEvent
+from app.serialization import SUPPORTED_ENCODINGS, FastJSONResponse, _compressor, rows_to_dicts
+from app.services.event_service import EVENT_COLUMNS
+
+DESCRIPTIONS = [
+    "Подозрительная активность от IP 10.0.{a}.{b}: множественные попытки подключения",
+    "Неудачная попытка входа пользователя admin с узла 192.168.{a}.{b}",
+    "Обнаружен исполняемый файл с подозрительной подписью на рабочей станции WS-{a}",
+    "Аномальный объём исходящего трафика на внешний адрес 203.0.113.{b}",
+]
+
+
+def make_rows(count: int, seed: int = 42):
+    """Row tuples in EVENT_COLUMNS order, as event_service returns them."""
+    rnd = random.Random(seed)
+    start = datetime(2025, 11, 26, 14, 0, 0)
+    rows = []
+    for i in range(count):
+        event = {
+            "id": f"e{i}",
+            "timestamp": start - timedelta(seconds=i * 7),
+            "source": rnd.choice(["Firewall", "IDS", "EDR", "Proxy"]),
+            "category": rnd.choice(["network", "endpoint", "auth"]),
+            "severity": rnd.choice(["low", "medium", "high", "critical"]),
+            "description": rnd.choice(DESCRIPTIONS).format(a=rnd.randint(0, 255), b=rnd.randint(0, 255)),
+            "src_ip": f"10.0.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}",
+            "dst_ip": rnd.choice([None, f"203.0.113.{rnd.randint(1, 254)}"]),
+            "hostname": rnd.choice([None, f"ws-{rnd.randint(1, 500)}"]),
+            "duplicate_count": rnd.choice([0, 0, 0, rnd.randint(1, 20)]),
+        }
+        rows.append(tuple(event[column] for column in EVENT_COLUMNS))
+    return rows
+
+
+def render_with_models(rows) -> bytes:
+    items = [SecurityEvent(**dict(zip(EVENT_COLUMNS, row))) for row in rows]
+    return JSONResponse(jsonable_encoder(items)).body
+
+
+def render_fast(rows) -> bytes:
+    return FastJSONResponse(rows_to_dicts(EVENT_COLUMNS, rows)).body
+
+
+def cpu_per_call(fn, rows, repeat: int) -> float:
+    fn(rows)  # warm-up
+    started = time.process_time()
+    for _ in range(repeat):
+        fn(rows)
+    return (time.process_time() - started) / repeat
+
+
+def compressed_size(body: bytes, encoding: str) -> int:
+    compressor = _compressor(encoding)
+    return len(compressor.compress(body) + compressor.flush())
+
+
+def run(rows_count: int, repeat: int) -> dict:
+    rows = make_rows(rows_count)
+    before = render_with_models(rows)
+    after = render_fast(rows)
+    assert json.loads(before) == json.loads(after), "fast path must produce identical JSON"
+
+    return {
+        "benchmark": "serialization",
+        "rows": rows_count,
+        "cpu_ms_per_page": {
+            "models_jsonable_encoder": round(cpu_per_call(render_with_models, rows, repeat) * 1000, 3),
+            "row_tuples_fast_json": round(cpu_per_call(render_fast, rows, repeat) * 1000, 3),
+        },
+        "bytes_on_wire": {
+            "identity": len(after),
+            **{encoding: compressed_size(after, encoding) for encoding in SUPPORTED_ENCODINGS},
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="write JSON result to this file")
+    args = parser.parse_args()
+
+    result = run(args.rows, args.repeat)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare two benchmark result files produced by benchmarks.run.
+
+    python -m benchmarks.compare old.json new.json [--fail-above 1.25]
+
+Prints p50 (or total) per benchmark and the new/old ratio. With --fail-above
+the exit code is 1 if any ratio exceeds the threshold, for use in CI.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Optional
+
+
+def _metric(entry: Dict) -> Optional[float]:
+    for key in ("p50_ms", "total_ms"):
+        if key in entry:
+            return entry[key]
+    cpu = entry.get("cpu_ms_per_page")
+    if isinstance(cpu, dict) and cpu:
+        return min(cpu.values())
+    return None
+
+
+def compare(old: Dict, new: Dict) -> Dict[str, Dict[str, Optional[float]]]:
+    rows = {}
+    for name, new_entry in new["results"].items():
+        old_entry = old["results"].get(name)
+        new_value = _metric(new_entry)
+        old_value = _metric(old_entry) if old_entry else None
+        ratio = round(new_value / old_value, 3) if new_value and old_value else None
+        rows[name] = {"old": old_value, "new": new_value, "ratio": ratio}
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--fail-above", type=float, default=None)
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"{old.get('commit')} -> {new.get('commit')} ({new.get('backend')}, scale {new.get('scale')})")
+    rows = compare(old, new)
+    regressions = []
+    for name, row in rows.items():
+        print(f"{name:32} {str(row['old']):>12} {str(row['new']):>12} {str(row['ratio']):>8}")
+        if args.fail_above and row["ratio"] and row["ratio"] > args.fail_above:
+            regressions.append(name)
+
+    if regressions:
+        print(f"Regressions above {args.fail_above}x: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Deterministic synthetic data for benchmarks.
+
+The same (scale, seed) always produces the same events, rules and alerts,
+so results from different commits are comparable.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+
+from app.models.db_models import AlertORM, AlertRuleORM, SecurityEventORM
+
+SCALES: Dict[str, int] = {
+    "10k": 10_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+SOURCES = ["Firewall", "IDS", "EDR", "Proxy", "VPN", "Mail Gateway", "DNS", "WAF"]
+CATEGORIES = ["network", "endpoint", "auth", "web", "email"]
+SEVERITIES = ["low", "medium", "high", "critical"]
+SEVERITY_WEIGHTS = [50, 30, 15, 5]
+DESCRIPTIONS = [
+    "Подозрительная активность от IP 10.{a}.{b}.{c}",
+    "Неудачная попытка входа пользователя user{a} с узла 192.168.{b}.{c}",
+    "Обнаружен подозрительный процесс на рабочей станции WS-{a}",
+    "Аномальный объём исходящего трафика на 203.0.{b}.{c}",
+    "Блокировка соединения на порт {a}{b} от 172.16.{b}.{c}",
+]
+
+BASE_TIME = datetime(2025, 11, 26, 0, 0, 0)
+INSERT_CHUNK = 10_000
+
+
+def iter_events(count: int, seed: int = 42, span_days: int = 90) -> Iterator[dict]:
+    """Events spread evenly over span_days back from BASE_TIME, newest first."""
+    rnd = random.Random(seed)
+    step = timedelta(days=span_days) / max(count, 1)
+    for i in range(count):
+        yield {
+            "id": f"ev-{i:09d}",
+            "timestamp": BASE_TIME - step * i,
+            "source": rnd.choice(SOURCES),
+            "category": rnd.choice(CATEGORIES),
+            "severity": rnd.choices(SEVERITIES, SEVERITY_WEIGHTS)[0],
+            "description": rnd.choice(DESCRIPTIONS).format(
+                a=rnd.randint(0, 255), b=rnd.randint(0, 255), c=rnd.randint(0, 255)
+            ),
+            "created_at": BASE_TIME,
+        }
+
+
+def make_rules(count: int = 20, seed: int = 42) -> List[dict]:
+    rnd = random.Random(seed + 1)
+    rules = []
+    for i in range(count):
+        rules.append(
+            {
+                "id": i + 1,
+                "name": f"Rule {i + 1}",
+                "description": None,
+                "severity_filter": rnd.choice(SEVERITIES[1:] + [None]),
+                "category_filter": rnd.choice(CATEGORIES + [None, None]),
+                "source_filter": rnd.choice(["fire", "ids", "edr", "proxy", None, None]),
+                "is_active": i % 10 != 9,
+                "created_by": "benchmark",
+                "created_at": BASE_TIME,
+            }
+        )
+    return rules
+
+
+def populate(engine: Engine, events: int, seed: int = 42, alert_every: int = 50) -> Dict[str, int]:
+    """
+    Bulk-load events, rules and alerts (one alert per ``alert_every`` events)
+    with Core executemany. Returns row counts.
+    """
+    rules = make_rules(seed=seed)
+    rnd = random.Random(seed + 2)
+    alerts = 0
+    with engine.begin() as conn:
+        conn.execute(insert(AlertRuleORM.__table__), rules)
+
+        chunk: List[dict] = []
+        alert_chunk: List[dict] = []
+        for i, event in enumerate(iter_events(events, seed=seed)):
+            chunk.append(event)
+            if i % alert_every == 0:
+                alert_chunk.append(
+                    {
+                        "rule_id": rnd.randint(1, len(rules)),
+                        "event_id": event["id"],
+                        "status": rnd.choice(["open", "open", "investigating", "resolved", "false_positive"]),
+                        "created_at": event["timestamp"],
+                        "count": 1,
+                        "first_seen": event["timestamp"],
+                        "last_seen": event["timestamp"],
+                    }
+                )
+            if len(chunk) >= INSERT_CHUNK:
+                conn.execute(insert(SecurityEventORM.__table__), chunk)
+                chunk = []
+            if len(alert_chunk) >= INSERT_CHUNK:
+                conn.execute(insert(AlertORM.__table__), alert_chunk)
+                alerts += len(alert_chunk)
+                alert_chunk = []
+        if chunk:
+            conn.execute(insert(SecurityEventORM.__table__), chunk)
+        if alert_chunk:
+            conn.execute(insert(AlertORM.__table__), alert_chunk)
+            alerts += len(alert_chunk)
+
+    return {"events": events, "rules": len(rules), "alerts": alerts}
+
+
+def make_mitre_bundle(tactics: int = 14, techniques_per_tactic: int = 40) -> dict:
+    """Synthetic STIX bundle shaped like enterprise-attack.json (no network access needed)."""
+    shortnames = [
+        "reconnaissance", "resource-development", "initial-access", "execution",
+        "persistence", "privilege-escalation", "defense-evasion", "credential-access",
+        "discovery", "lateral-movement", "collection", "command-and-control",
+        "exfiltration", "impact",
+    ][:tactics]
+    objects = []
+    for t, shortname in enumerate(shortnames):
+        objects.append(
+            {
+                "type": "x-mitre-tactic",
+                "id": f"x-mitre-tactic--{t}",
+                "name": shortname.replace("-", " ").title(),
+                "description": "Tactic description " * 10,
+                "x_mitre_shortname": shortname,
+            }
+        )
+        for n in range(techniques_per_tactic):
+            objects.append(
+                {
+                    "type": "attack-pattern",
+                    "id": f"attack-pattern--{t}-{n}",
+                    "name": f"Technique {t}.{n}",
+                    "description": "Technique description " * 30,
+                    "external_references": [{"source_name": "mitre-attack", "external_id": f"T{1000 + t * 100 + n}"}],
+                    "x_mitre_platforms": ["Windows", "Linux"],
+                    "kill_chain_phases": [{"kill_chain_name": "mitre-attack", "phase_name": shortname}],
+                }
+            )
+            objects.append({"type": "relationship", "id": f"relationship--{t}-{n}"})
+    return {"type": "bundle", "objects": objects}
@@ -0,0 +1,341 @@
+"""
+End-to-end HTTP load test with latency SLO checks.
+
+Runs concurrent async httpx clients against the API with scripted scenarios:
+
+    dashboard  - analysts polling /api/events/summary, /api/alerts/, /api/mitre/tactics
+    triage     - bulk triage via PATCH /api/alerts/bulk
+    login      - login bursts against /api/auth/token (429 from the limiter is expected)
+    evaluate   - POST /api/events/evaluate-all (202, queues a job), polling GET /api/jobs/
+
+Reports throughput, p50/p95/p99 latency and error rate per endpoint and exits
+with code 1 when an SLO threshold is breached.
+
+With --start-server a local uvicorn is started on a temporary SQLite database
+preloaded with the synthetic dataset from datagen.py; otherwise --base-url is
+used as is.
+
+Run from backend/:
+    python -m benchmarks.loadtest --start-server --duration 30
+    python -m benchmarks.loadtest --base-url http://localhost:8000 --slo-file slo.json
+
+SLO file format (``*`` applies to endpoints without their own entry):
+    {"GET /api/events/summary": {"p95_ms": 250, "max_error_rate": 0.01},
+     "*": {"p99_ms": 2000, "max_error_rate": 0.05}}
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+DEFAULT_SLO: Dict[str, Dict[str, float]] = {
+    "GET /api/events/summary": {"p95_ms": 300, "max_error_rate": 0.01},
+    "GET /api/alerts/": {"p95_ms": 300, "max_error_rate": 0.01},
+    "GET /api/mitre/tactics": {"p95_ms": 300, "max_error_rate": 0.01},
+    "*": {"p99_ms": 5000, "max_error_rate": 0.05},
+}
+
+
+class Step(NamedTuple):
+    method: str
+    path: str
+    weight: int = 1
+    body: Optional[Callable[[random.Random], dict]] = None
+    form: Optional[Dict[str, str]] = None
+    auth: bool = True
+    ok_statuses: Tuple[int, ...] = (200,)
+
+
+class Scenario(NamedTuple):
+    name: str
+    steps: List[Step]
+    think_time: float  # seconds between requests of one virtual user
+
+
+def scenarios(username: str, password: str) -> Dict[str, Scenario]:
+    return {
+        "dashboard": Scenario(
+            name="dashboard",
+            steps=[
+                Step("GET", "/api/events/summary", weight=3),
+                Step("GET", "/api/alerts/?status=open&limit=50", weight=3),
+                Step("GET", "/api/events/paged?limit=50", weight=2),
+                Step("GET", "/api/mitre/tactics", weight=1),
+            ],
+            think_time=0.2,
+        ),
+        "triage": Scenario(
+            name="triage",
+            steps=[
+                Step(
+                    "PATCH",
+                    "/api/alerts/bulk",
+                    body=lambda rnd: {
+                        "filter": {"status": "open", "rule_id": rnd.randint(1, 20)},
+                        "status": "investigating",
+                        "assigned_to": username,
+                    },
+                ),
+            ],
+            think_time=1.0,
+        ),
+        "login": Scenario(
+            name="login",
+            steps=[
+                Step(
+                    "POST",
+                    "/api/auth/token",
+                    form={"username": username, "password": password},
+                    auth=False,
+                    ok_statuses=(200, 429),
+                ),
+            ],
+            think_time=0.05,
+        ),
+        "evaluate": Scenario(
+            name="evaluate",
+            steps=[
+                # Ставит задачу backfill и сразу отвечает 202; ход выполнения - опрос списка задач
+                Step("POST", "/api/events/evaluate-all", ok_statuses=(202,)),
+                Step("GET", "/api/jobs/?type=backfill&limit=5", weight=3),
+            ],
+            think_time=5.0,
+        ),
+    }
+
+
+class Sample(NamedTuple):
+    endpoint: str
+    latency_ms: float
+    ok: bool
+    status: int
+
+
+async def virtual_user(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    deadline: float,
+    headers: Dict[str, str],
+    seed: int,
+    samples: List[Sample],
+) -> None:
+    rnd = random.Random(seed)
+    weights = [step.weight for step in scenario.steps]
+    while time.monotonic() < deadline:
+        step = rnd.choices(scenario.steps, weights)[0]
+        endpoint = f"{step.method} {step.path.split('?')[0]}"
+        kwargs: dict = {"headers": headers if step.auth else {}}
+        if step.body is not None:
+            kwargs["json"] = step.body(rnd)
+        if step.form is not None:
+            kwargs["data"] = step.form
+        started = time.perf_counter()
+        try:
+            response = await client.request(step.method, step.path, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        latency = (time.perf_counter() - started) * 1000
+        samples.append(Sample(endpoint, latency, status in step.ok_statuses, status))
+        await asyncio.sleep(scenario.think_time * rnd.uniform(0.5, 1.5))
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 2)
+
+
+def summarize(samples: List[Sample], duration: float) -> Dict[str, dict]:
+    by_endpoint: Dict[str, List[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample.endpoint].append(sample)
+
+    report = {}
+    for endpoint, items in sorted(by_endpoint.items()):
+        latencies = sorted(s.latency_ms for s in items)
+        errors = sum(1 for s in items if not s.ok)
+        statuses: Dict[str, int] = defaultdict(int)
+        for s in items:
+            statuses[str(s.status)] += 1
+        report[endpoint] = {
+            "requests": len(items),
+            "rps": round(len(items) / duration, 2),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99),
+            "error_rate": round(errors / len(items), 4),
+            "statuses": dict(statuses),
+        }
+    return report
+
+
+def check_slo(report: Dict[str, dict], slo: Dict[str, Dict[str, float]]) -> List[str]:
+    """Return human-readable SLO violations."""
+    violations = []
+    for endpoint, stats in report.items():
+        limits = slo.get(endpoint, slo.get("*", {}))
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if metric in limits and stats[metric] > limits[metric]:
+                violations.append(f"{endpoint}: {metric}={stats[metric]} > {limits[metric]}")
+        if "max_error_rate" in limits and stats["error_rate"] > limits["max_error_rate"]:
+            violations.append(f"{endpoint}: error_rate={stats['error_rate']} > {limits['max_error_rate']}")
+    return violations
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> Dict[str, str]:
+    response = await client.post("/api/auth/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_load(
+    base_url: str,
+    selected: List[str],
+    users: Dict[str, int],
+    duration: float,
+    username: str,
+    password: str,
+) -> Dict[str, dict]:
+    limits = httpx.Limits(max_connections=sum(users.values()) + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0, limits=limits) as client:
+        headers = await login(client, username, password)
+        all_scenarios = scenarios(username, password)
+        samples: List[Sample] = []
+        deadline = time.monotonic() + duration
+        tasks = []
+        for name in selected:
+            for i in range(users[name]):
+                seed = selected.index(name) * 10_000 + i
+                tasks.append(virtual_user(client, all_scenarios[name], deadline, headers, seed, samples))
+        started = time.monotonic()
+        await asyncio.gather(*tasks)
+        return summarize(samples, time.monotonic() - started)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(events: int, workers: int) -> Tuple[subprocess.Popen, str, tempfile.TemporaryDirectory]:
+    """Preload a temporary SQLite DB and start uvicorn on it."""
+    tmp_dir = tempfile.TemporaryDirectory()
+    db_url = f"sqlite:///{os.path.join(tmp_dir.name, 'loadtest.sqlite')}"
+
+    from sqlalchemy import create_engine
+
+    from app.db import Base
+    from benchmarks import datagen
+
+    engine = create_engine(db_url)
+    Base.metadata.create_all(bind=engine)
+    datagen.populate(engine, events)
+    engine.dispose()
+
+    port = _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": db_url,
+        "JWT_SECRET": os.environ.get("JWT_SECRET", "loadtest-secret-key-not-for-production"),
+        "EVENTS_FILE": os.path.join(tmp_dir.name, "no-seed.json"),
+    }
+    command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1.0).status_code == 200:
+                return process, base_url, tmp_dir
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become healthy")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--start-server", action="store_true", help="start a local uvicorn on a temporary SQLite DB")
+    parser.add_argument("--events", type=int, default=10_000, help="dataset size for --start-server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --start-server")
+    parser.add_argument("--scenarios", default="dashboard,triage,login,evaluate")
+    parser.add_argument("--dashboard-users", type=int, default=20)
+    parser.add_argument("--triage-users", type=int, default=2)
+    parser.add_argument("--login-users", type=int, default=2)
+    parser.add_argument("--evaluate-users", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--username", default="analyst")
+    parser.add_argument("--password", default="Analyst123")
+    parser.add_argument("--slo-file", help="JSON with per-endpoint thresholds (default: built-in)")
+    parser.add_argument("--output", help="write JSON report to this file")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    users = {
+        "dashboard": args.dashboard_users,
+        "triage": args.triage_users,
+        "login": args.login_users,
+        "evaluate": args.evaluate_users,
+    }
+    unknown = set(selected) - set(users)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    slo = DEFAULT_SLO
+    if args.slo_file:
+        with open(args.slo_file) as f:
+            slo = json.load(f)
+
+    process = tmp_dir = None
+    base_url = args.base_url
+    if args.start_server:
+        process, base_url, tmp_dir = start_server(args.events, args.workers)
+    try:
+        report = asyncio.run(run_load(base_url, selected, users, args.duration, args.username, args.password))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+    violations = check_slo(report, slo)
+    result = {
+        "base_url": base_url,
+        "duration_s": args.duration,
+        "scenarios": selected,
+        "endpoints": report,
+        "slo_violations": violations,
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+    if violations:
+        print("SLO breached:\n  " + "\n  ".join(violations), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
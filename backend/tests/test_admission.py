@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import admission
+from app.admission import AdmissionController, AdmissionRule, CostClass, Rejected, classify
+
+CLASSES = {
+    "interactive": CostClass(0, 1.0, 200, 100),
+    "standard": CostClass(1, 1.0, 200, 1000),
+    "heavy": CostClass(2, 0.5, 200, 5000),
+}
+
+
+def test_classify_routes_and_costly_params():
+    assert classify("GET", "/api/alerts/42", {}) == ("interactive", None)
+    assert classify("PATCH", "/api/alerts/42", {})[0] == "standard"
+    assert classify("GET", "/api/events/summary", {})[0] == "standard"
+    # Подстрочный фильтр по source переводит сводку в тяжёлый класс
+    assert classify("GET", "/api/events/summary", {"source": "fire"})[0] == "heavy"
+    assert classify("GET", "/api/events/export", {"source": "fire"})[0] == "heavy"
+
+
+def test_queue_serves_interactive_before_heavy():
+    async def scenario():
+        controller = AdmissionController(initial=2, min_limit=1, max_limit=2, classes=CLASSES)
+        await controller.acquire("interactive", "a")
+        await controller.acquire("interactive", "b")
+        order = []
+
+        async def request(cost):
+            await controller.acquire(cost, cost)
+            order.append(cost)
+
+        heavy = asyncio.create_task(request("heavy"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(request("interactive"))
+        await asyncio.sleep(0)
+        assert controller.snapshot()["queued"] == 2
+
+        controller.release("interactive", "a", 10)
+        await asyncio.sleep(0.01)
+        assert order == ["interactive"]
+        controller.release("interactive", "b", 10)
+        await asyncio.gather(heavy, interactive)
+        assert order == ["interactive", "heavy"]
+
+    asyncio.run(scenario())
+
+
+def test_class_share_and_route_limit_cap_concurrency():
+    async def scenario():
+        controller = AdmissionController(initial=4, min_limit=1, max_limit=4, classes=CLASSES)
+        rule = AdmissionRule("standard", limit=1)
+        await controller.acquire("heavy", "h1")
+        await controller.acquire("heavy", "h2")
+        await controller.acquire("standard", "/api/x", rule)
+        # heavy занимает не больше половины лимита, маршрут - не больше одного запроса
+        with pytest.raises(Rejected):
+            await controller.acquire("heavy", "h3")
+        with pytest.raises(Rejected):
+            await controller.acquire("standard", "/api/x", rule)
+        assert await controller.acquire("interactive", "i") == 0.0
+        stats = controller.snapshot()["classes"]
+        assert stats["heavy"]["timed_out"] == 1 and stats["standard"]["timed_out"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_rejects_fast_when_estimated_wait_exceeds_budget():
+    async def scenario():
+        controller = AdmissionController(initial=1, min_limit=1, max_limit=1, classes=CLASSES)
+        await controller.acquire("standard", "a")
+        controller._service_ms = 3000.0
+        with pytest.raises(Rejected) as exc:
+            await controller.acquire("standard", "b")
+        assert exc.value.retry_after == 3
+        assert controller.snapshot()["classes"]["standard"]["rejected"] == 1
+        assert controller.snapshot()["queued"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_aimd_limit_follows_latency(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_DECREASE_INTERVAL_MS", 0)
+
+    async def scenario():
+        controller = AdmissionController(initial=4, min_limit=2, max_limit=8, classes=CLASSES)
+        for _ in range(4):
+            await controller.acquire("interactive", "a")
+        controller.release("interactive", "a", 10)  # в пределах цели при полном лимите
+        assert controller.limit == pytest.approx(4.25)
+        controller.release("interactive", "a", 500)  # медленнее цели
+        assert controller.limit == pytest.approx(4.25 * admission.ADMISSION_BACKOFF_FACTOR)
+        for _ in range(2):
+            controller.release("interactive", "a", 500)
+        await controller.acquire("heavy", "h")
+        controller.release("heavy", "h", 500)  # heavy: цель 5 секунд, лимит не трогает
+        assert controller.limit >= 2
+        assert controller.in_flight == 0
+        assert controller.snapshot()["limit_changes"] == {"increase": 1, "decrease": 3}
+
+    asyncio.run(scenario())
+
+
+def test_middleware_sheds_with_retry_after(monkeypatch):
+    from app.main import app
+
+    controller = AdmissionController(initial=1, min_limit=1, max_limit=1, classes=CLASSES)
+    controller._take("interactive", "busy")
+    controller._service_ms = 5000.0
+    monkeypatch.setattr(admission, "controller", controller)
+    client = TestClient(app)
+
+    response = client.get("/api/events/")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert response.headers["X-Admission-Class"] == "interactive"
+    assert client.get("/api/health").status_code == 200
+
+    controller._free("interactive", "busy")
+    response = client.get("/api/auth/me")  # допущен: дальше 401 без токена
+    assert response.status_code == 401
+    assert controller.in_flight == 0
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.alerts import _enrich_alert_with_event_data
+from app.db import Base
+from app.models.db_models import AlertArchiveORM, AlertCounterORM, AlertORM, AlertRuleORM, SecurityEventORM
+from app.serialization import rows_to_dicts
+from app.services.alert_archive import archive_resolved_alerts
+from app.services.alert_service import ALERT_COLUMNS, get_alert_by_id, get_alert_rows, get_alerts
+from app.services.alert_stats import get_alert_stats, reconcile_alert_counters
+from app.services.backfill import create_run, run_backfill
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+NOW = datetime(2025, 11, 26, 14, 0, 0)
+CUTOFF = NOW - timedelta(days=90)
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    session.add(AlertRuleORM(id=1, name="high", severity_filter="high"))
+    # (статус, создан дней назад, закрыт дней назад)
+    history = [
+        ("open", 200, None),
+        ("investigating", 150, None),
+        ("resolved", 200, 120),  # в архив
+        ("false_positive", 120, None),  # закрыт без resolved_at: считается от created_at
+        ("resolved", 100, 10),  # закрыт недавно - остаётся
+        ("resolved", 95, 91),  # в архив; самый большой id
+    ]
+    for i, (status, created_days, resolved_days) in enumerate(history, start=1):
+        ts = NOW - timedelta(days=created_days)
+        session.add(
+            SecurityEventORM(
+                id=f"e{i}", timestamp=ts, source="IDS", category="network", severity="high", description="event"
+            )
+        )
+        session.add(
+            AlertORM(
+                id=i,
+                rule_id=1,
+                event_id=f"e{i}",
+                status=status,
+                created_at=ts,
+                resolved_at=NOW - timedelta(days=resolved_days) if resolved_days else None,
+            )
+        )
+    session.commit()
+    reconcile_alert_counters(session)
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_archive_moves_only_old_closed_alerts(db):
+    counters = sorted((row.status, row.count) for row in db.query(AlertCounterORM))
+    assert archive_resolved_alerts(db, CUTOFF, batch_size=2) == 3
+    assert archive_resolved_alerts(db, CUTOFF) == 0
+
+    assert sorted(alert.id for alert in db.query(AlertORM)) == [1, 2, 5]
+    archived = db.query(AlertArchiveORM).order_by(AlertArchiveORM.id).all()
+    assert [(alert.id, alert.status) for alert in archived] == [(3, "resolved"), (4, "false_positive"), (6, "resolved")]
+    assert all(alert.archived_at is not None for alert in archived)
+
+    # Счётчики учитывают архив: сверка ничего не меняет
+    assert reconcile_alert_counters(db) == 0
+    assert sorted((row.status, row.count) for row in db.query(AlertCounterORM)) == counters
+
+    # id архивированных строк не выдаются новым алертам (SQLite AUTOINCREMENT)
+    db.add(AlertORM(rule_id=1, event_id="e1"))
+    db.commit()
+    assert db.query(AlertORM.id).order_by(AlertORM.id.desc()).first().id == 7
+
+
+def test_listings_read_archive_only_for_closed_statuses(db):
+    archive_resolved_alerts(db, CUTOFF)
+
+    alerts, total = get_alerts(db)
+    assert total == 3 and [alert.id for alert in alerts] == [5, 2, 1]
+    assert [alert.id for alert in get_alerts(db, status="open")[0]] == [1]
+
+    alerts, total = get_alerts(db, status="resolved")
+    assert total == 3
+    assert [alert.id for alert in alerts] == [6, 5, 3]  # created_at desc через обе таблицы
+    assert [alert.id for alert in get_alerts(db, status="resolved", offset=1, limit=1)[0]] == [5]
+
+    for filters in ({}, {"status": "resolved"}, {"status": "false_positive"}, {"status": "resolved", "offset": 1}):
+        rows, total = get_alert_rows(db, **filters)
+        alerts, expected_total = get_alerts(db, **filters)
+        assert total == expected_total
+        assert rows_to_dicts(ALERT_COLUMNS, rows) == [_enrich_alert_with_event_data(db, alert) for alert in alerts]
+
+    assert get_alert_by_id(db, 3) is None
+    assert get_alert_by_id(db, 3, include_archived=True).status == "resolved"
+
+
+def test_stats_timings_include_archive_for_long_windows(db):
+    since = NOW - timedelta(days=365)
+    before = get_alert_stats(db, since=since)
+    archive_resolved_alerts(db, CUTOFF)
+
+    after = get_alert_stats(db, since=since)
+    assert after.by_rule == before.by_rule
+    assert after.by_rule[0].resolved == 3 and after.total == 6
+
+
+def test_backfill_does_not_recreate_archived_alerts(db):
+    archive_resolved_alerts(db, CUTOFF)
+    summary = run_backfill(db, create_run(db).id)
+    assert summary["alerts_created"] == 0
+    assert db.query(AlertORM).count() == 3
@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import AlertCounterORM, AlertORM, AlertRuleORM, SecurityEventORM
+from app.services.alert_service import (
+    bulk_update_alerts,
+    create_alerts_for_event,
+    delete_alert_rule,
+    update_alert,
+)
+from app.services.alert_stats import get_alert_stats, reconcile_alert_counters
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+BASE_TS = datetime(2025, 11, 26, 14, 0, 0)
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _setup(db, events: int = 4):
+    rules = [AlertRuleORM(name="Firewall high"), AlertRuleORM(name="IDS")]
+    db.add_all(rules)
+    db.commit()
+    for i in range(events):
+        event = SecurityEventORM(
+            id=f"e{i}",
+            timestamp=BASE_TS + timedelta(seconds=i),
+            source="Firewall",
+            category="network",
+            severity="high",
+            description="Подозрительная активность от IP",
+        )
+        db.add(event)
+        db.flush()
+        create_alerts_for_event(db, event, [rules[0].id] if i % 2 == 0 else [rules[0].id, rules[1].id])
+    return rules
+
+
+def _counters(db):
+    return {
+        (row.rule_id, row.status, row.assigned_to): row.count
+        for row in db.query(AlertCounterORM).filter(AlertCounterORM.count != 0)
+    }
+
+
+def _actual(db):
+    counts = {}
+    for alert in db.query(AlertORM):
+        key = (alert.rule_id, alert.status, alert.assigned_to or "")
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def test_counters_follow_create_update_and_bulk(db):
+    """Counters match a full recount after every kind of alert change"""
+    rules = _setup(db)
+    assert _counters(db) == {(rules[0].id, "open", ""): 4, (rules[1].id, "open", ""): 2}
+
+    first = db.query(AlertORM).order_by(AlertORM.id).first()
+    update_alert(db, first.id, status="investigating", assigned_to="analyst")
+    update_alert(db, first.id, notes="только заметка")
+    assert _counters(db) == _actual(db)
+
+    bulk_update_alerts(db, filter_rule_id=rules[0].id, status="resolved")
+    bulk_update_alerts(db, filter_status="open", assigned_to="admin")
+    assert _counters(db) == _actual(db)
+    assert _counters(db)[(rules[0].id, "resolved", "analyst")] == 1
+
+    assert reconcile_alert_counters(db) == 0
+
+
+def test_reconcile_fixes_drift_and_initializes(db):
+    """Reconciler recounts from alerts: fills missing counters and removes stale ones"""
+    rules = _setup(db)
+    db.query(AlertCounterORM).delete()
+    db.add(AlertCounterORM(rule_id=rules[1].id, status="resolved", assigned_to="ghost", count=7))
+    db.commit()
+
+    assert reconcile_alert_counters(db) == 3
+    assert _counters(db) == _actual(db)
+
+
+def test_stats_counts_and_timings(db):
+    """Stats come from counters; MTTR/MTTA are averaged per rule in SQL"""
+    rules = _setup(db)
+    alerts = db.query(AlertORM).filter(AlertORM.rule_id == rules[0].id).order_by(AlertORM.id).all()
+    for alert, minutes in zip(alerts[:2], (10, 30)):
+        alert.created_at = BASE_TS
+        alert.acknowledged_at = BASE_TS + timedelta(minutes=minutes / 2)
+        alert.resolved_at = BASE_TS + timedelta(minutes=minutes)
+        alert.status = "resolved"
+    db.commit()
+    reconcile_alert_counters(db)
+
+    stats = get_alert_stats(db, since=BASE_TS - timedelta(days=1))
+    assert stats.total == 6
+    assert stats.by_status == {"open": 4, "resolved": 2}
+    assert stats.unassigned == 6
+
+    by_rule = {item.rule_id: item for item in stats.by_rule}
+    assert by_rule[rules[0].id].rule_name == "Firewall high"
+    assert by_rule[rules[0].id].resolved == 2
+    assert by_rule[rules[0].id].mttr_seconds == pytest.approx(1200, abs=1)
+    assert by_rule[rules[0].id].mtta_seconds == pytest.approx(600, abs=1)
+    assert by_rule[rules[1].id].mttr_seconds is None
+
+
+def test_update_sets_acknowledged_at_once(db):
+    """acknowledged_at is set on the first triage step and kept afterwards"""
+    _setup(db, events=1)
+    alert = db.query(AlertORM).first()
+    update_alert(db, alert.id, notes="заметка")
+    assert alert.acknowledged_at is None
+
+    update_alert(db, alert.id, assigned_to="analyst")
+    acknowledged = alert.acknowledged_at
+    assert acknowledged is not None
+    update_alert(db, alert.id, status="resolved")
+    assert alert.acknowledged_at == acknowledged
+
+
+def test_delete_rule_drops_its_counters(db):
+    rules = _setup(db)
+    db.query(AlertORM).filter(AlertORM.rule_id == rules[1].id).delete()
+    db.commit()
+    delete_alert_rule(db, rules[1].id)
+
+    assert all(key[0] == rules[0].id for key in _counters(db))
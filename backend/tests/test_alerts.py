@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import AlertORM, AlertRuleORM, SecurityEventORM
+from app.api.alerts import _enrich_alert_with_event_data
+from app.serialization import rows_to_dicts
+from app.services import alert_service
+from app.services.alert_service import (
+    ALERT_COLUMNS,
+    bulk_update_alerts,
+    create_alerts_for_event,
+    evaluate_event_against_rules,
+    get_alert_rows,
+    get_alerts,
+)
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+BASE_TS = datetime(2025, 11, 26, 14, 0, 0)
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _add_rule(db, **kwargs) -> AlertRuleORM:
+    rule = AlertRuleORM(name="Firewall high", severity_filter="high", **kwargs)
+    db.add(rule)
+    db.commit()
+    return rule
+
+
+def _ingest(db, event_id: str, ts: datetime, source: str = "Firewall") -> None:
+    event = SecurityEventORM(
+        id=event_id,
+        timestamp=ts,
+        source=source,
+        category="network",
+        severity="high",
+        description="Подозрительная активность от IP",
+    )
+    db.add(event)
+    db.flush()
+    create_alerts_for_event(db, event, evaluate_event_against_rules(db, event))
+
+
+def test_alert_per_event_without_aggregation(db):
+    """Without an aggregation window every matching event gets its own alert"""
+    _add_rule(db)
+    for i in range(3):
+        _ingest(db, f"e{i}", BASE_TS + timedelta(seconds=i))
+
+    assert db.query(AlertORM).count() == 3
+
+
+def test_aggregation_groups_by_rule_and_source(db):
+    """Events of one rule and source within the window fold into one alert"""
+    _add_rule(db, aggregation_window_seconds=300)
+    _ingest(db, "e1", BASE_TS + timedelta(seconds=60))
+    _ingest(db, "e2", BASE_TS)  # out of order
+    _ingest(db, "e3", BASE_TS + timedelta(seconds=120))
+    _ingest(db, "e4", BASE_TS + timedelta(seconds=30), source="IDS")
+
+    alerts = db.query(AlertORM).order_by(AlertORM.id).all()
+    assert len(alerts) == 2
+    grouped = alerts[0]
+    assert grouped.event_id == "e1"
+    assert grouped.group_key == "Firewall"
+    assert grouped.count == 3
+    assert grouped.first_seen == BASE_TS
+    assert grouped.last_seen == BASE_TS + timedelta(seconds=120)
+    assert alerts[1].count == 1
+
+
+def test_aggregation_starts_new_alert_outside_window_or_after_triage(db):
+    """A gap longer than the window, or a resolved group, opens a new alert"""
+    _add_rule(db, aggregation_window_seconds=60)
+    _ingest(db, "e1", BASE_TS)
+    _ingest(db, "e2", BASE_TS + timedelta(minutes=10))
+    assert db.query(AlertORM).count() == 2
+
+    db.query(AlertORM).update({AlertORM.status: "resolved"})
+    db.commit()
+    _ingest(db, "e3", BASE_TS + timedelta(minutes=10, seconds=5))
+    assert db.query(AlertORM).count() == 3
+
+
+def test_aggregation_group_span_never_exceeds_window(db):
+    """Events 50 s apart do not chain into one group longer than a 60 s window"""
+    _add_rule(db, aggregation_window_seconds=60)
+    for i in range(4):
+        _ingest(db, f"e{i}", BASE_TS + timedelta(seconds=50 * i))
+
+    alerts = db.query(AlertORM).order_by(AlertORM.id).all()
+    assert [alert.count for alert in alerts] == [2, 2]
+    assert all(alert.last_seen - alert.first_seen <= timedelta(seconds=60) for alert in alerts)
+
+
+def test_aggregation_looks_up_group_after_taking_lock(db, monkeypatch):
+    """A group committed by another writer while we wait for the lock is reused"""
+    rule = _add_rule(db, aggregation_window_seconds=300)
+    _ingest(db, "e0", BASE_TS - timedelta(hours=1))
+    db.commit()
+
+    def lock_while_other_writer_commits(session):
+        other = TestingSessionLocal()
+        other.add(AlertORM(
+            rule_id=rule.id, event_id="e0", status="open", group_key="Firewall",
+            count=1, first_seen=BASE_TS, last_seen=BASE_TS,
+        ))
+        other.commit()
+        other.close()
+
+    monkeypatch.setattr(alert_service, "_lock_alert_groups", lock_while_other_writer_commits)
+    _ingest(db, "e1", BASE_TS + timedelta(seconds=10))
+
+    groups = db.query(AlertORM).filter(AlertORM.first_seen >= BASE_TS).all()
+    assert [(group.event_id, group.count) for group in groups] == [("e0", 2)]
+
+
+def test_suppression_window(db):
+    """Events inside the suppression window do not create alerts"""
+    _add_rule(
+        db,
+        suppress_from=BASE_TS,
+        suppress_until=BASE_TS + timedelta(hours=1),
+    )
+    _ingest(db, "e1", BASE_TS + timedelta(minutes=30))
+    _ingest(db, "e2", BASE_TS + timedelta(hours=2))
+
+    alerts = db.query(AlertORM).all()
+    assert [a.event_id for a in alerts] == ["e2"]
+
+
+def test_patch_rule_clears_suppression_only_on_explicit_null(db):
+    """PATCH with suppress_*: null removes the window; omitting the fields keeps it"""
+    from app.api.alerts import update_alert_rule_endpoint
+    from app.models.alert import AlertRuleCreate
+
+    rule = _add_rule(db, suppress_from=BASE_TS, suppress_until=BASE_TS + timedelta(hours=1))
+
+    update_alert_rule_endpoint(rule.id, AlertRuleCreate(name="renamed"), db=db, current_user=None)
+    assert rule.suppress_from == BASE_TS and rule.suppress_until is not None
+
+    patch = AlertRuleCreate.model_validate({"name": "renamed", "suppress_until": None})
+    update_alert_rule_endpoint(rule.id, patch, db=db, current_user=None)
+    assert rule.suppress_from == BASE_TS and rule.suppress_until is None
+
+    patch = AlertRuleCreate.model_validate({"name": "renamed", "suppress_from": None})
+    update_alert_rule_endpoint(rule.id, patch, db=db, current_user=None)
+    assert rule.suppress_from is None
+    _ingest(db, "e1", BASE_TS + timedelta(minutes=30))
+    assert db.query(AlertORM).count() == 1
+
+
+def test_bulk_update_by_ids_and_by_rule(db):
+    """Bulk triage updates selected alerts in one statement and sets resolved_at"""
+    rule = _add_rule(db)
+    other = _add_rule(db, source_filter="ids")
+    for i in range(4):
+        _ingest(db, f"e{i}", BASE_TS + timedelta(seconds=i))
+    _ingest(db, "ids1", BASE_TS, source="IDS")  # matches both rules
+
+    first_two = [
+        a.id for a in db.query(AlertORM).filter(AlertORM.rule_id == rule.id).order_by(AlertORM.id).limit(2)
+    ]
+    before = datetime.utcnow()
+    assert bulk_update_alerts(db, ids=first_two, status="false_positive", notes="scanner") == 2
+    assert bulk_update_alerts(db, filter_rule_id=rule.id, filter_status="open", assigned_to="analyst") == 3
+
+    db.expire_all()
+    resolved = db.query(AlertORM).filter(AlertORM.status == "false_positive").all()
+    assert len(resolved) == 2
+    assert all(a.notes == "scanner" for a in resolved)
+    # Время ставится как в update_alert: naive UTC из приложения, а не часы БД
+    assert all(before <= a.resolved_at <= datetime.utcnow() and a.acknowledged_at == a.resolved_at for a in resolved)
+    other_alert = db.query(AlertORM).filter(AlertORM.rule_id == other.id).one()
+    assert other_alert.assigned_to is None
+
+
+def test_alert_rows_match_enriched_alerts(db):
+    """The joined Core listing returns what per-alert enrichment did, for each filter combination"""
+    rule = _add_rule(db)
+    _add_rule(db, source_filter="ids")
+    for i in range(4):
+        _ingest(db, f"e{i}", BASE_TS + timedelta(seconds=i))
+    _ingest(db, "ids1", BASE_TS, source="IDS")
+    bulk_update_alerts(db, filter_rule_id=rule.id, filter_status="open", assigned_to="analyst", status="investigating")
+
+    for filters in ({}, {"rule_id": rule.id}, {"status": "open"}, {"assigned_to": "analyst", "offset": 1, "limit": 2}):
+        rows, total = get_alert_rows(db, **filters)
+        alerts, expected_total = get_alerts(db, **filters)
+        assert total == expected_total
+        assert rows_to_dicts(ALERT_COLUMNS, rows) == [_enrich_alert_with_event_data(db, alert) for alert in alerts]
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import SecurityEventORM
+from app.services import analytics_service
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+NOW = datetime(2025, 11, 26, 14, 0, 0)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_service, "ANALYTICS_ENABLED", True)
+    monkeypatch.setattr(analytics_service, "ANALYTICS_DIR", tmp_path)
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    sources = ["Firewall", "IDS", "EDR"]
+    for i in range(300):
+        session.add(
+            SecurityEventORM(
+                id=f"e{i}",
+                timestamp=NOW - timedelta(hours=i),
+                source=sources[i % 3] if i % 5 else "Firewall",
+                category="network",
+                severity="high" if i % 2 else "low",
+                description="Подозрительная активность",
+            )
+        )
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_export_writes_only_closed_partitions(db, tmp_path):
+    written = analytics_service.export_closed_partitions(db, now=NOW)
+    assert written
+    # Today and yesterday (ANALYTICS_CLOSE_AFTER_DAYS=1) stay in the OLTP table
+    assert analytics_service.columnar_boundary() == datetime(2025, 11, 25)
+    assert analytics_service.export_closed_partitions(db, now=NOW) == []
+
+
+def test_split_query_matches_oltp(db, monkeypatch):
+    start, end = NOW - timedelta(days=30), NOW + timedelta(hours=1)
+    monkeypatch.setattr(analytics_service, "ANALYTICS_ENABLED", False)
+    expected, plan = analytics_service.aggregate_events(db, "source", start, end, severity="HIGH")
+    assert plan["columnar"] is None
+
+    monkeypatch.setattr(analytics_service, "ANALYTICS_ENABLED", True)
+    analytics_service.export_closed_partitions(db, now=NOW)
+    items, plan = analytics_service.aggregate_events(db, "source", start, end, severity="HIGH")
+    assert plan["columnar"] is not None
+    assert plan["oltp"][-1] == ["2025-11-25T00:00:00", (NOW + timedelta(hours=1)).isoformat()]
+    assert items == expected
+
+    by_day, _ = analytics_service.aggregate_events(db, "day", start, end, limit=100)
+    assert sum(item["count"] for item in by_day) == 300
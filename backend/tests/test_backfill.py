@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import AlertCounterORM, AlertORM, AlertRuleORM, BackfillRangeORM, SecurityEventORM
+from app.services import backfill
+from app.services.backfill import create_run, run_backfill
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+BASE_TS = datetime(2025, 11, 26, 0, 0, 0)
+
+
+def _events(count: int):
+    return [
+        SecurityEventORM(
+            id=f"e{i:03d}",
+            timestamp=BASE_TS + timedelta(minutes=30 * i),
+            source="Firewall" if i % 2 else "IDS",
+            category="network",
+            severity="high" if i % 3 == 0 else "low",
+            description="Подозрительная активность от IP",
+        )
+        for i in range(count)
+    ]
+
+
+def _populate(db, count: int = 60):
+    db.add_all(_events(count))
+    db.add_all(
+        [
+            AlertRuleORM(id=1, name="high", severity_filter="high"),
+            AlertRuleORM(id=2, name="firewall", source_filter="fire", aggregation_window_seconds=3 * 3600),
+            AlertRuleORM(id=3, name="inactive", is_active=False),
+        ]
+    )
+    db.add(AlertORM(rule_id=1, event_id="e000", status="resolved"))  # уже есть: не задваивается
+    db.commit()
+
+
+def _alert_pairs(db):
+    return sorted((alert.rule_id, alert.event_id, alert.count) for alert in db.query(AlertORM))
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_backfill_creates_missing_alerts_once(db):
+    _populate(db)
+    run = create_run(db, range_hours=6)
+    assert len(run.ranges) == 5  # 60 событий по 30 минут
+
+    summary = run_backfill(db, run.id, chunk_size=4)
+    assert summary["status"] == "done"
+    assert summary["events_scanned"] == 60
+    high = {alert.event_id for alert in db.query(AlertORM).filter(AlertORM.rule_id == 1)}
+    assert high == {f"e{i:03d}" for i in range(0, 60, 3)}
+    # 30 событий Firewall раз в час, окно 3 часа: группы внутри каждого 6-часового диапазона
+    groups = db.query(AlertORM).filter(AlertORM.rule_id == 2).all()
+    assert sum(alert.count for alert in groups) == 30
+    assert summary["alerts_created"] == 19 + len(groups)
+    counter = db.get(AlertCounterORM, (1, "open", ""))
+    assert counter.count == 19
+
+    # Повторный прогон ничего не добавляет
+    before = _alert_pairs(db)
+    assert run_backfill(db, create_run(db).id)["alerts_created"] == 0
+    assert _alert_pairs(db) == before
+
+
+def test_interrupted_run_resumes_from_checkpoint(db, monkeypatch):
+    _populate(db)
+    run = create_run(db, rule_ids=[1], range_hours=12)
+    merge = backfill._merge_alerts
+    calls = {"n": 0}
+
+    def flaky(*args):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise RuntimeError("worker killed")
+        return merge(*args)
+
+    monkeypatch.setattr(backfill, "_merge_alerts", flaky)
+    summary = run_backfill(db, run.id, chunk_size=5)
+    assert summary["status"] == "failed"
+    assert summary["ranges"] == {"failed": 1, "done": 2}
+    failed = db.query(BackfillRangeORM).filter(BackfillRangeORM.status == "failed").one()
+    assert failed.last_id == "e004" and failed.events_scanned == 5  # первая порция закоммичена
+
+    monkeypatch.setattr(backfill, "_merge_alerts", merge)
+    summary = run_backfill(db, run.id, chunk_size=5)
+    assert summary["status"] == "done"
+    assert summary["events_scanned"] == 60
+    assert summary["alerts_created"] == 19
+    assert db.query(AlertORM).filter(AlertORM.rule_id == 1).count() == 20
+
+
+def test_process_pool_matches_inline_run(tmp_path):
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'backfill.sqlite'}")
+    Base.metadata.create_all(bind=file_engine)
+    session = sessionmaker(autoflush=False, bind=file_engine)()
+    try:
+        _populate(session)
+        summary = run_backfill(session, create_run(session, range_hours=6).id, processes=2, chunk_size=4)
+        assert summary["status"] == "done"
+        assert summary["events_scanned"] == 60
+        assert session.query(AlertORM).filter(AlertORM.rule_id == 1).count() == 20
+        assert sum(alert.count for alert in session.query(AlertORM).filter(AlertORM.rule_id == 2)) == 30
+    finally:
+        session.close()
+        file_engine.dispose()
@@ -0,0 +1,125 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import AlertORM, AlertRuleORM, EventTechniqueORM, SecurityEventORM
+from app.services import cold_storage, mitre_mapping
+from app.services.event_service import get_event_rows, get_events
+from app.services.mitre_mapping import technique_heatmap
+
+pytest.importorskip("zstandard")
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+NOW = datetime(2025, 11, 26, 14, 0, 0)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(cold_storage, "COLD_STORAGE_ENABLED", True)
+    monkeypatch.setattr(cold_storage, "COLD_BLOCK_ROWS", 10)
+    monkeypatch.setattr(cold_storage, "catalog", cold_storage.SegmentCatalog(tmp_path))
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    for i in range(200):
+        session.add(
+            SecurityEventORM(
+                id=f"e{i:03d}",
+                timestamp=NOW - timedelta(days=i),
+                source="Firewall" if i % 2 else "EDR",
+                category="network" if i % 2 else "endpoint",
+                severity="high" if i % 3 else "low",
+                description=f"Event {i}",
+                src_ip=f"10.0.{i % 4}.1",
+            )
+        )
+    rule = AlertRuleORM(name="r")
+    session.add(rule)
+    session.flush()
+    session.add(AlertORM(rule_id=rule.id, event_id="e150"))
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _ids(rows):
+    return [row[0] for row in rows]
+
+
+def test_tier_moves_old_events_except_alerted(db, tmp_path):
+    assert cold_storage.tier_events(db, NOW - timedelta(days=99, hours=12), segment_rows=40) == 99
+    assert db.query(SecurityEventORM).count() == 101
+    assert db.get(SecurityEventORM, "e150") is not None  # на событие ссылается алерт
+
+    segments = cold_storage.catalog.segments()
+    assert len(segments) == 3
+    assert sum(segment.rows for segment in segments) == 99
+    assert segments[0].stats["severity"]["values"] == ["high", "low"]
+    assert len(list(tmp_path.glob("*.seg"))) == 3
+
+
+def test_get_events_merges_cold_range(db):
+    cold_storage.tier_events(db, NOW - timedelta(days=99, hours=12))
+    hot_only, hot_total = get_event_rows(db, limit=500)
+    assert hot_total == 101
+
+    start = NOW - timedelta(days=105)
+    rows, total = get_event_rows(db, start=start, end=NOW - timedelta(days=95), limit=5)
+    assert total == 10
+    assert _ids(rows) == ["e096", "e097", "e098", "e099", "e100"]
+    rows, _ = get_event_rows(db, start=start, end=NOW - timedelta(days=95), offset=5, limit=5)
+    assert _ids(rows) == ["e101", "e102", "e103", "e104", "e105"]
+
+    items, total = get_events(db, start=NOW - timedelta(days=200), severity="LOW", src_ip="10.0.0.0/24", limit=100)
+    assert [item.id for item in items] == [f"e{i:03d}" for i in range(0, 200, 12)]
+    assert total == len(items)
+
+
+def test_segment_pruning(db):
+    cold_storage.tier_events(db, NOW - timedelta(days=99, hours=12), segment_rows=40)
+    segment = cold_storage.catalog.segments()[0]
+    assert not segment.may_contain("severity", "critical")
+    assert segment.may_contain("category", "Network")
+    # Читаются только блоки, пересекающие диапазон
+    rows = list(segment.iter_rows(segment.max_ts, None))
+    assert len(rows) == segment.blocks[-1][4] < segment.rows
+
+
+def test_restore_to_hot(db):
+    cold_storage.tier_events(db, NOW - timedelta(days=99, hours=12), segment_rows=40)
+    restored = cold_storage.restore_events(db, NOW - timedelta(days=120), NOW - timedelta(days=110))
+    assert restored == 10
+    assert db.get(SecurityEventORM, "e115").src_ip_key is not None
+    assert sum(segment.rows for segment in cold_storage.catalog.segments()) == 89
+    rows, total = get_event_rows(db, start=NOW - timedelta(days=200), limit=500)
+    assert total == 200
+    assert len(set(_ids(rows))) == 200
+
+
+def test_restore_retags_techniques(db, tmp_path, monkeypatch):
+    mapping = tmp_path / "mapping.json"
+    mapping.write_text(json.dumps([{"technique": "T1046", "category": "network"}]))
+    monkeypatch.setattr(mitre_mapping, "engine", mitre_mapping.MappingEngine(mapping))
+    mitre_mapping.retag_events(db)
+    window = (NOW - timedelta(days=120), NOW - timedelta(days=110))
+    assert technique_heatmap(db, *window) == {"T1046": {"events": 5, "alerts": 0}}
+
+    cold_storage.tier_events(db, NOW - timedelta(days=99, hours=12), segment_rows=40)
+    assert technique_heatmap(db, *window) == {}
+
+    assert cold_storage.restore_events(db, *window) == 10
+    assert technique_heatmap(db, *window) == {"T1046": {"events": 5, "alerts": 0}}
+    # Повторное восстановление того же окна не дублирует теги
+    assert cold_storage.restore_events(db, *window) == 0
+    assert db.query(EventTechniqueORM).count() == 50 + 5  # горячие сетевые события + восстановленные
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import AlertORM, SecurityEventORM
+from app.repositories.event_repo import ingest_events
+from app.services import dedup_service
+from app.services.alert_service import create_alert_rule
+from app.services.dedup_service import Deduplicator, content_hash
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+BASE_TS = datetime(2025, 11, 26, 14, 0, 0)
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def dedup(monkeypatch):
+    deduplicator = Deduplicator(bloom_capacity=1000)
+    monkeypatch.setattr(dedup_service, "DEDUP_ENABLED", True)
+    monkeypatch.setattr(dedup_service, "deduplicator", deduplicator)
+    return deduplicator
+
+
+def _row(event_id: str, description: str = "Blocked connection", seconds: int = 0) -> dict:
+    return {
+        "id": event_id,
+        "timestamp": BASE_TS + timedelta(seconds=seconds),
+        "source": "Firewall",
+        "category": "network",
+        "severity": "high",
+        "description": description,
+        "src_ip": "10.0.0.5",
+    }
+
+
+def _duplicate_counts(db):
+    return dict(db.query(SecurityEventORM.id, SecurityEventORM.duplicate_count).order_by(SecurityEventORM.id))
+
+
+def test_content_hash_uses_time_bucket():
+    assert content_hash(_row("a")) == content_hash(_row("b", seconds=59))
+    assert content_hash(_row("a")) != content_hash(_row("a", seconds=60))
+    assert content_hash(_row("a")) != content_hash({**_row("a"), "src_ip": "10.0.0.6"})
+
+
+def test_duplicates_increment_original(db, dedup):
+    create_alert_rule(db, "High", None, "high", None, None, True, None)
+
+    assert ingest_events(db, [_row("e1"), _row("e2", seconds=10), _row("e3", "Port scan")]) == 2
+    assert ingest_events(db, [_row("e4", seconds=30), _row("e5", seconds=120)]) == 1
+
+    assert _duplicate_counts(db) == {"e1": 2, "e3": 0, "e5": 0}
+    # Дубликаты не проходят через правила
+    assert db.query(AlertORM).count() == 3
+    stats = dedup.stats()
+    assert stats["received"] == 5 and stats["duplicates"] == 2 and stats["dedup_ratio"] == 0.4
+    assert stats["memory_bytes"]["bloom"] > 0
+
+
+def test_bloom_confirms_against_db_after_window(db, dedup):
+    ingest_events(db, [_row("e1")])
+    dedup._window.clear()
+
+    assert ingest_events(db, [_row("e2")]) == 0
+    assert _duplicate_counts(db) == {"e1": 1}
+    assert dedup.db_hits == 1
+
+
+def test_unique_hash_guards_concurrent_writers(db, dedup):
+    # Фильтр заполнен до того, как другой процесс со своим окном записал то же событие
+    dedup.split(db, [])
+    other = Deduplicator(bloom_capacity=1000)
+    dedup_service.deduplicator = other
+    ingest_events(db, [_row("e1")])
+    dedup_service.deduplicator = dedup
+
+    assert ingest_events(db, [_row("e2"), _row("e3", "Port scan")]) == 1
+    assert _duplicate_counts(db) == {"e1": 1, "e3": 0}
+    assert dedup.insert_conflicts == 1
+
+
+def test_disabled_stores_everything(db):
+    assert ingest_events(db, [_row("e1"), _row("e2")]) == 2
+    assert db.query(SecurityEventORM.content_hash).filter(SecurityEventORM.content_hash.isnot(None)).count() == 0
+
+
+@pytest.mark.parametrize("dedup_enabled", [False, True])
+def test_resent_event_id_does_not_drop_batch(db, monkeypatch, dedup_enabled):
+    monkeypatch.setattr(dedup_service, "DEDUP_ENABLED", dedup_enabled)
+    monkeypatch.setattr(dedup_service, "deduplicator", Deduplicator(bloom_capacity=1000))
+    ingest_events(db, [_row("abc")])
+
+    # Повтор того же externalId в другой минуте и новое событие в одном пакете
+    assert ingest_events(db, [_row("abc", seconds=90), _row("new", "Port scan"), _row("new", "Port scan")]) == 1
+    # С дедупликацией второй "new" - дубликат по содержимому
+    assert _duplicate_counts(db) == {"abc": 0, "new": int(dedup_enabled)}
@@ -0,0 +1,133 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import SecurityEventORM
+from app.repositories.event_repo import ingest_events
+from app.services import event_buffer
+from app.services.event_service import get_event_rows
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+BASE_TS = datetime(2025, 11, 26, 14, 0, 0)
+
+
+def _event(i: int) -> dict:
+    return {
+        "id": f"e{i:03d}",
+        "timestamp": BASE_TS + timedelta(seconds=i),
+        "source": "Firewall" if i % 3 == 0 else "IDS",
+        "category": "network",
+        "severity": "high" if i % 2 == 0 else "low",
+        "description": "Подозрительная активность от IP",
+        "src_ip": "10.0.0.1",
+        "dst_ip": None,
+        "hostname": f"host{i % 5}",
+    }
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(event_buffer, "EVENT_BUFFER_MIN_RELOAD_SECONDS", 0)
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    ingest_events(session, [_event(i) for i in range(100)])
+    buffer = event_buffer.EventBuffer(TestingSessionLocal, size=40)
+    buffer.reload()
+    monkeypatch.setattr(event_buffer, "buffer", buffer)
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _sql(db, monkeypatch, **kwargs):
+    with monkeypatch.context() as patched:
+        patched.setattr(event_buffer, "buffer", None)
+        return get_event_rows(db, **kwargs)
+
+
+class _CountQueries:
+    def __enter__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [{}, {"severity": "HIGH"}, {"severity": "low", "category": "network"}],
+)
+def test_first_pages_served_from_memory(db, monkeypatch, filters):
+    """First pages and totals match SQL and need no queries"""
+    with _CountQueries() as queries:
+        served = get_event_rows(db, offset=10, limit=10, **filters)
+    assert queries.count == 0
+    assert served == _sql(db, monkeypatch, offset=10, limit=10, **filters)
+
+
+def test_substring_filter_and_start_within_buffer(db, monkeypatch):
+    """Without a known total, /paged-style requests are served only when the range is fully buffered"""
+    start = BASE_TS + timedelta(seconds=80)
+    with _CountQueries() as queries:
+        served = get_event_rows(db, source="fire", hostname="HOST1", start=start, limit=5)
+    assert queries.count == 0
+    assert served == _sql(db, monkeypatch, source="fire", hostname="HOST1", start=start, limit=5)
+
+    assert event_buffer.buffer.page(source="fire", limit=5) is None  # total unknown
+    assert event_buffer.buffer.page(source="fire", limit=5, count=False) is not None
+
+
+def test_deep_pages_and_ip_filters_fall_back_to_sql(db, monkeypatch):
+    misses = event_buffer.buffer.misses
+    assert event_buffer.buffer.page(offset=35, limit=10) is None
+    assert event_buffer.buffer.misses == misses + 1
+
+    with _CountQueries() as queries:
+        rows, total = get_event_rows(db, src_ip="10.0.0.0/8", limit=5)
+    assert queries.count > 0
+    assert total == 100
+
+
+def test_ingest_updates_buffer_in_place(db):
+    """Batches ingested by this process are added without a reload"""
+    reloads = event_buffer.buffer.reloads
+    ingest_events(db, [_event(500), {**_event(50), "id": "late"}])  # newest and one older than the buffer
+
+    rows, total = get_event_rows(db, limit=3)
+    assert [row[0] for row in rows] == ["e500", "e099", "e098"]
+    assert total == 102
+    assert event_buffer.buffer.reloads == reloads
+    assert len(event_buffer.buffer._rows) == 40
+
+    event_buffer.buffer.add([], Counter({"e099": 2}), before=event_buffer.buffer.generation())
+    assert get_event_rows(db, limit=2)[0][1][9] == 2
+
+
+def test_foreign_write_triggers_reload(db):
+    """A commit outside ingest (e.g. another worker) bumps the generation and the buffer reloads"""
+    reloads = event_buffer.buffer.reloads
+    other = TestingSessionLocal()
+    other.add(SecurityEventORM(**{**_event(900), "id": "foreign"}))
+    other.commit()
+    other.close()
+
+    rows, total = get_event_rows(db, limit=1)
+    assert rows[0][0] == "foreign"
+    assert total == 101
+    assert event_buffer.buffer.reloads == reloads + 1
@@ -0,0 +1,134 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services.event_parsers import (
+    ParseError,
+    compile_parser,
+    get_parser,
+    normalize_category,
+    normalize_severity,
+    parse_message,
+    validate_rows,
+)
+
+RFC5424 = (
+    b'<34>1 2025-11-26T14:00:00.000Z fw01 Firewall 1234 ID47 [exampleSDID@32473 iut="3" '
+    b'eventSource="App\\]lication"] Blocked connection from 10.0.0.5'
+)
+CEF = (
+    b"<13>1 2025-11-26T14:00:01Z ids01 - - - - CEF:0|Acme|IDS|1.0|100|Port scan|7|"
+    b"src=10.0.0.5 cat=network msg=Port scan detected on 22\\=ssh"
+)
+
+
+def test_parse_rfc5424():
+    row = parse_message(RFC5424)
+    assert row["source"] == "Firewall"
+    assert row["category"] == "auth"  # facility 4
+    assert row["severity"] == "critical"  # PRI severity 2
+    assert row["description"] == "Blocked connection from 10.0.0.5"
+    assert row["timestamp"] == datetime(2025, 11, 26, 14, 0, 0, tzinfo=timezone.utc)
+    assert row["id"]
+
+
+def test_parse_cef_with_syslog_header():
+    row = parse_message(CEF)
+    assert row["source"] == "Acme IDS"
+    assert row["category"] == "network"
+    assert row["severity"] == "high"
+    assert row["description"] == "Port scan detected on 22=ssh"
+    assert row["timestamp"] == datetime(2025, 11, 26, 14, 0, 1, tzinfo=timezone.utc)
+
+
+def test_parse_leef_2_custom_delimiter():
+    row = parse_message(
+        b"LEEF:2.0|Lancope|StealthWatch|1.0|41|^|cat=Firewall/Deny^sev=9^devTime=1764165600000^msg=Denied"
+    )
+    assert row["source"] == "Lancope StealthWatch"
+    assert row["category"] == "network"
+    assert row["severity"] == "critical"
+    assert row["description"] == "Denied"
+    assert row["timestamp"] == datetime(2025, 11, 26, 14, 0, 0, tzinfo=timezone.utc)
+
+
+def test_parse_kv_firewall():
+    row = parse_message(b'date=2025-11-26 time=14:00:00 devname=FGT60 level=warning type=traffic msg="Deny tcp/22"')
+    assert row["source"] == "FGT60"
+    assert row["category"] == "network"
+    assert row["severity"] == "medium"
+    assert row["description"] == "Deny tcp/22"
+    assert row["timestamp"] == datetime(2025, 11, 26, 14, 0, 0)
+
+
+def test_parse_edr_json_nested_paths():
+    row = get_parser("edr_json").parse(
+        '{"event_id": "edr-1", "@timestamp": "2025-11-26T14:00:00Z", "sensor": {"name": "EDR-01"},'
+        ' "event": {"category": "malware", "severity": "Severe"}, "threat": {"name": "Trojan.Gen"}}'
+    )
+    assert row == {
+        "id": "edr-1",
+        "timestamp": datetime(2025, 11, 26, 14, 0, 0, tzinfo=timezone.utc),
+        "source": "EDR-01",
+        "category": "endpoint",
+        "severity": "critical",
+        "description": "Trojan.Gen",
+        "src_ip": None,
+        "dst_ip": None,
+        "hostname": None,
+    }
+
+
+@pytest.mark.parametrize("raw", [b"", b"hello world", b"<999>1 - - - - - -", b"CEF:0|Acme|IDS|1.0|100"])
+def test_parse_rejects_malformed(raw):
+    with pytest.raises(ParseError):
+        parse_message(raw)
+
+
+def test_lookup_tables():
+    assert normalize_severity("3") == "low"
+    assert normalize_severity("Very-High") == "critical"
+    assert normalize_category("/Authentication/Failure") == "auth"
+    # Неизвестные категории сохраняются как есть
+    assert normalize_category("Compliance") == "compliance"
+    with pytest.raises(ParseError):
+        normalize_severity("purple")
+
+
+def test_compile_rejects_unknown_type():
+    with pytest.raises(ValueError):
+        compile_parser("bad", {"format": "kv", "fields": {"severity": {"from": ["x"], "type": "nope"}}})
+
+
+def test_custom_parser_batch():
+    parser = compile_parser(
+        "vpn",
+        {
+            "format": "kv",
+            "fields": {
+                "source": {"template": "vpn-{gw}"},
+                "category": {"from": ["kind"], "type": "category"},
+                "severity": {"from": ["sev"], "type": "severity"},
+                "description": {"from": ["text"], "default": ""},
+            },
+        },
+    )
+    rows, errors = parser.parse_batch(["gw=a kind=login sev=4", "gw=b kind=login sev=purple", "gw=c"])
+    assert [row["source"] for row in rows] == ["vpn-a"]
+    assert rows[0]["category"] == "auth" and rows[0]["severity"] == "medium"
+    assert [index for index, _ in errors] == [1, 2]
+
+
+def test_validate_rows_in_bulk():
+    good = {
+        "id": "e1",
+        "timestamp": "2025-11-26T14:00:00Z",
+        "source": "Firewall",
+        "category": "network",
+        "severity": "high",
+        "description": "x",
+    }
+    rows, errors = validate_rows([good, {**good, "id": 5}, {**good, "timestamp": "yesterday"}, good])
+    assert len(rows) == 2
+    assert rows[0]["timestamp"] == datetime(2025, 11, 26, 14, 0, tzinfo=timezone.utc)
+    assert [index for index, _ in errors] == [1, 2]
@@ -0,0 +1,139 @@
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import AlertORM, AlertRuleORM
+from app.repositories.event_repo import ingest_events
+from app.services import ioc_service
+from app.services.alert_service import get_active_rules
+from app.services.ioc_service import IOCEngine, _PyAutomaton, normalize_indicator
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+SHA256 = "a" * 63 + "f"
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def feeds(tmp_path):
+    (tmp_path / "abuse.csv").write_text(
+        "# comment\nindicator,type\n203.0.113.7,ipv4\nevil.example,domain\nnot a domain,domain\n"
+    )
+    (tmp_path / "hashes.txt").write_text(f"# sha256\n{SHA256}\nhttp://phish.example/login\nmimikatz\n")
+    (tmp_path / "bundle.json").write_text(
+        json.dumps(
+            {
+                "type": "bundle",
+                "objects": [
+                    {"type": "indicator", "pattern": "[ipv4-addr:value = '198.51.100.1']", "pattern_type": "stix"},
+                    {"type": "indicator", "pattern": "[file:hashes.'SHA-256' = '" + "b" * 64 + "']"},
+                    {"type": "domain-name", "value": "c2.test"},
+                ],
+            }
+        )
+    )
+    return tmp_path
+
+
+def _event(description, **fields):
+    return SimpleNamespace(
+        description=description,
+        src_ip=fields.get("src_ip"),
+        dst_ip=fields.get("dst_ip"),
+        hostname=fields.get("hostname"),
+    )
+
+
+def test_normalize_indicator():
+    assert normalize_indicator("10.0.0.1") == ("ip", "10.0.0.1")
+    assert normalize_indicator("HTTPS://Bad.Example:8443/x") == ("domain", "bad.example")
+    assert normalize_indicator("*.Evil.Example.") == ("domain", "evil.example")
+    assert normalize_indicator("D41D8CD98F00B204E9800998ECF8427E") == ("hash", "d41d8cd98f00b204e9800998ecf8427e")
+    assert normalize_indicator("Invoke-Mimikatz") == ("pattern", "invoke-mimikatz")
+    assert normalize_indicator("abc") is None
+    assert normalize_indicator("x.y", "ip") is None
+
+
+def test_automaton_finds_overlapping_patterns():
+    automaton = _PyAutomaton(["he", "she", "his", "hers"])
+    assert sorted(pattern for _, pattern in automaton.iter("ushers")) == ["he", "hers", "she"]
+
+
+def test_engine_matches_all_indicator_types(feeds):
+    ioc = IOCEngine(feeds)
+    assert ioc.reload()
+    assert ioc.index.counts == {"ip": 2, "domain": 3, "hash": 2, "pattern": 1}
+
+    found = ioc.match_event(
+        _event(f"Outbound to 203.0.113.7 resolving cdn.evil.example, dropped {SHA256.upper()} via Mimikatz")
+    )
+    assert found == {
+        ("ip", "203.0.113.7"),
+        ("domain", "evil.example"),
+        ("hash", SHA256),
+        ("pattern", "mimikatz"),
+    }
+    assert ioc.match_event(_event("", src_ip="198.51.100.1", hostname="beacon.c2.test")) == {
+        ("ip", "198.51.100.1"),
+        ("domain", "c2.test"),
+    }
+    assert ioc.match_event(_event("Connection from 10.0.0.1 to example.org")) == set()
+    assert ioc.status()["memory_bytes"]["total"] > 0
+
+
+def test_reload_swaps_index_only_when_feeds_change(feeds):
+    ioc = IOCEngine(feeds)
+    ioc.reload()
+    old_index = ioc.index
+    assert not ioc.reload()
+    assert ioc.index is old_index
+
+    (feeds / "new.txt").write_text("192.0.2.55\n")
+    assert ioc.reload()
+    assert ioc.index is not old_index
+    assert ioc.match_event(_event("ping 192.0.2.55")) == {("ip", "192.0.2.55")}
+
+
+def test_ingest_creates_ioc_alerts(db, feeds, monkeypatch):
+    ioc = IOCEngine(feeds)
+    ioc.reload()
+    monkeypatch.setattr(ioc_service, "engine", ioc)
+    monkeypatch.setattr(ioc_service, "IOC_ENABLED", True)
+
+    row = {
+        "timestamp": datetime(2025, 11, 26, 14, 0, 0),
+        "source": "Proxy",
+        "category": "network",
+        "severity": "low",
+        "description": "GET http://phish.example/login",
+        "dst_ip": "203.0.113.7",
+    }
+    ingest_events(db, [{**row, "id": "e1"}, {**row, "id": "e2", "description": "ok", "dst_ip": "10.0.0.1"}])
+
+    alerts = db.query(AlertORM).all()
+    assert len(alerts) == 2
+    assert {a.event_id for a in alerts} == {"e1"}
+    notes = sorted(a.notes for a in alerts)
+    assert notes == ["IOC match: 203.0.113.7 (abuse.csv)", "IOC match: phish.example (hashes.txt)"]
+    # Системные правила не участвуют в обычном сопоставлении
+    assert db.query(AlertRuleORM).filter(AlertRuleORM.rule_type == "ioc").count() == 4
+    assert get_active_rules(db) == []
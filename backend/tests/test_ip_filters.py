@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.ip_utils import IPRadixTrie, ip_key, network_key_range, parse_network
+from app.models.db_models import AlertORM
+from app.repositories.event_repo import ingest_events
+from app.services.alert_service import create_alert_rule
+from app.services.event_service import get_event_rows
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+BASE_TS = datetime(2025, 11, 26, 14, 0, 0)
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _row(i: int, src_ip, dst_ip=None, hostname=None) -> dict:
+    return {
+        "id": f"e{i}",
+        "timestamp": BASE_TS - timedelta(minutes=i),
+        "source": "Firewall",
+        "category": "network",
+        "severity": "high",
+        "description": "Blocked connection",
+        "src_ip": src_ip,
+        "dst_ip": dst_ip,
+        "hostname": hostname,
+    }
+
+
+def test_trie_returns_all_containing_prefixes():
+    trie = IPRadixTrie()
+    trie.insert("10.0.0.0/8", "a")
+    trie.insert("10.1.0.0/16", "b")
+    trie.insert("10.1.2.3/32", "c")
+    trie.insert("2001:db8::/32", "v6")
+    trie.insert("0.0.0.0/0", "any")
+
+    assert trie.lookup("10.1.2.3") == {"a", "b", "c", "any"}
+    assert trie.lookup("10.2.0.1") == {"a", "any"}
+    assert trie.lookup("::ffff:10.1.9.9") == {"a", "b", "any"}
+    assert trie.lookup("2001:db8::1") == {"v6"}
+    assert trie.lookup("not-an-ip") == set()
+    assert trie.lookup(None) == set()
+
+
+def test_key_range_orders_like_addresses():
+    low, high = network_key_range(parse_network("10.0.0.0/8"))
+    assert low <= ip_key("10.0.0.0") <= ip_key("10.255.255.255") <= high
+    assert not low <= ip_key("11.0.0.0") <= high
+    assert not low <= ip_key("::a00:1") <= high  # IPv6 с теми же младшими битами
+
+
+def test_cidr_filter(db):
+    ingest_events(
+        db,
+        [
+            _row(0, "10.1.2.3", "192.168.0.10", hostname="WS-01"),
+            _row(1, "10.200.0.1"),
+            _row(2, "172.16.0.5", "192.168.1.20"),
+            _row(3, "not-an-ip"),
+            _row(4, "2001:db8::5"),
+        ],
+    )
+
+    def ids(**filters):
+        rows, total = get_event_rows(db, limit=100, **filters)
+        assert total == len(rows)
+        return sorted(row[0] for row in rows)
+
+    assert ids(src_ip="10.0.0.0/8") == ["e0", "e1"]
+    assert ids(src_ip="10.1.2.3") == ["e0"]
+    assert ids(dst_ip="192.168.0.0/16") == ["e0", "e2"]
+    assert ids(src_ip="10.0.0.0/8", dst_ip="192.168.0.0/24") == ["e0"]
+    assert ids(src_ip="2001:db8::/32") == ["e4"]
+    assert ids(hostname="ws-01") == ["e0"]
+    with pytest.raises(ValueError):
+        get_event_rows(db, src_ip="10.0.0.0/33")
+
+
+def test_source_filter_escapes_wildcards(db):
+    ingest_events(db, [{**_row(0, None), "source": "fw_1"}, {**_row(1, None), "source": "fwx1"}])
+
+    for source, expected in (("W_1", ["e0"]), ("w%", []), ("fw", ["e0", "e1"])):
+        rows, total = get_event_rows(db, source=source, limit=100)
+        assert sorted(row[0] for row in rows) == expected
+        assert total == len(expected)
+
+
+def test_rule_matches_ip_ranges(db):
+    internal = create_alert_rule(
+        db,
+        name="From lab",
+        description=None,
+        severity_filter=None,
+        category_filter=None,
+        source_filter=None,
+        is_active=True,
+        created_by=None,
+        src_cidrs=["10.1.0.0/16", "172.16.0.0/12"],
+    )
+    to_dmz = create_alert_rule(
+        db,
+        name="Lab to DMZ",
+        description=None,
+        severity_filter="high",
+        category_filter=None,
+        source_filter=None,
+        is_active=True,
+        created_by=None,
+        src_cidrs=["10.1.0.0/16"],
+        dst_cidrs=["192.168.0.0/24"],
+    )
+    ingest_events(
+        db,
+        [
+            _row(0, "10.1.2.3", "192.168.0.10"),
+            _row(1, "10.1.2.4", "8.8.8.8"),
+            _row(2, "172.20.0.1"),
+            _row(3, "10.2.0.1", "192.168.0.10"),
+            _row(4, None),
+        ],
+    )
+
+    def alerted(rule):
+        return sorted(a.event_id for a in db.query(AlertORM).filter(AlertORM.rule_id == rule.id))
+
+    assert alerted(internal) == ["e0", "e1", "e2"]
+    assert alerted(to_dmz) == ["e0"]
+    with pytest.raises(ValueError):
+        create_alert_rule(
+            db, "bad", None, None, None, None, True, None, src_cidrs=["10.0.0.0/99"]
+        )
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base, get_db
+from app.models.db_models import AlertORM, AlertRuleORM, JobORM, SecurityEventORM
+from app.services import job_queue
+from app.services.job_queue import JobType, JobWorker, claim, requeue_stale, submit
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+BASE_TS = datetime(2025, 11, 26, 14, 0, 0)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    calls = []
+
+    def echo(db, ctx):
+        calls.append(ctx.params)
+        ctx.progress(0.5, "half way")
+        if ctx.params.get("fail_times", 0) >= len(calls):
+            raise RuntimeError("boom")
+        return {"echo": ctx.params.get("value")}
+
+    monkeypatch.setitem(job_queue.JOB_TYPES, "echo", JobType("echo", echo, concurrency=1, max_attempts=2))
+    monkeypatch.setitem(job_queue.JOB_TYPES, "other", JobType("other", echo, concurrency=2, max_attempts=1))
+    monkeypatch.setattr(job_queue, "JOB_RETRY_BACKOFF_SECONDS", 0)
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _worker():
+    return JobWorker(TestingSessionLocal)
+
+
+def test_job_runs_to_success_with_progress_and_result(db):
+    job = submit(db, "echo", {"value": 7})
+    assert job.status == "queued"
+    with pytest.raises(ValueError):
+        submit(db, "no-such-type")
+
+    assert _worker().run_once() == "succeeded"
+    db.refresh(job)
+    assert (job.status, job.progress, job.progress_message, job.attempts) == ("succeeded", 1.0, "half way", 1)
+    assert job.result == '{"echo": 7}'
+    assert _worker().run_once() is None  # очередь пуста
+
+
+def test_concurrency_limit_per_type(db):
+    first, second = submit(db, "echo"), submit(db, "echo")
+    other = submit(db, "other")
+
+    assert claim(db, "w1").id == first.id
+    # Слот echo занят: следующей берётся задача другого типа, вторая echo ждёт
+    assert claim(db, "w2").id == other.id
+    assert claim(db, "w3") is None
+
+    db.query(JobORM).filter(JobORM.id == first.id).update({JobORM.status: "succeeded"})
+    db.commit()
+    assert claim(db, "w3").id == second.id
+
+
+def test_failed_attempt_is_retried_then_fails(db):
+    job = submit(db, "echo", {"fail_times": 1})
+    assert _worker().run_once() == "queued"
+    db.refresh(job)
+    assert job.attempts == 1 and job.error == "RuntimeError: boom"
+    assert _worker().run_once() == "succeeded"
+
+    job = submit(db, "echo", {"fail_times": 5})
+    assert _worker().run_once() == "queued"
+    assert _worker().run_once() == "failed"  # max_attempts=2
+
+
+def test_cancel_queued_and_running_jobs(db, monkeypatch):
+    queued = submit(db, "echo")
+    assert job_queue.cancel(db, queued.id).status == "cancelled"
+    assert _worker().run_once() is None
+
+    def cancel_self(session, ctx):
+        job_queue.cancel(session, ctx.job_id)  # как POST /api/jobs/{id}/cancel во время работы
+        ctx.progress(0.1)
+        return {"finished": True}
+
+    monkeypatch.setitem(job_queue.JOB_TYPES, "slow", JobType("slow", cancel_self, concurrency=1, max_attempts=3))
+    running = submit(db, "slow")
+    assert _worker().run_once() == "cancelled"
+    db.refresh(running)
+    assert running.result is None and running.attempts == 1
+
+
+def test_stale_running_job_is_requeued(db):
+    job = submit(db, "echo")
+    claim(db, "dead-worker")
+    db.query(JobORM).filter(JobORM.id == job.id).update({JobORM.heartbeat_at: datetime(2000, 1, 1)})
+    db.commit()
+
+    assert requeue_stale(db, stale_seconds=60) == 1
+    db.refresh(job)
+    assert (job.status, job.locked_by) == ("queued", None)
+    assert "dead-worker" in job.error
+
+
+def test_evaluate_all_queues_backfill_job(db, monkeypatch):
+    from app.main import app
+
+    db.add(AlertRuleORM(id=1, name="high", severity_filter="high"))
+    db.add_all(
+        SecurityEventORM(
+            id=f"e{i}",
+            timestamp=BASE_TS + timedelta(minutes=i),
+            source="IDS",
+            category="network",
+            severity="high" if i % 2 else "low",
+            description="Подозрительная активность",
+        )
+        for i in range(10)
+    )
+    db.commit()
+
+    def override_get_db():
+        session = TestingSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    client = TestClient(app)
+    response = client.post("/api/events/evaluate-all")
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert client.post("/api/events/evaluate-all").json()["job_id"] == job_id  # та же активная задача
+    assert db.query(AlertORM).count() == 0  # запрос не ждёт выполнения
+
+    assert _worker().run_once() == "succeeded"
+    job = db.get(JobORM, job_id)
+    db.refresh(job)
+    assert '"resume_run_id"' in job.params
+    assert db.query(AlertORM).count() == 5
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import migrations
+from app.db import Base
+from app.migrations import upgrade_schema
+from app.models.db_models import AlertORM
+from app.services.alert_stats import get_alert_stats, reconcile_alert_counters
+
+# Схема первой выпущенной версии (до ADDED_COLUMNS)
+BASELINE_DDL = [
+    """CREATE TABLE security_events (
+        id VARCHAR NOT NULL PRIMARY KEY, timestamp DATETIME NOT NULL, source VARCHAR NOT NULL,
+        category VARCHAR NOT NULL, severity VARCHAR NOT NULL, description TEXT NOT NULL, created_at DATETIME NOT NULL
+    )""",
+    """CREATE TABLE users (
+        id INTEGER NOT NULL PRIMARY KEY, username VARCHAR NOT NULL UNIQUE, hashed_password VARCHAR NOT NULL,
+        role VARCHAR NOT NULL, is_active BOOLEAN NOT NULL, created_at DATETIME NOT NULL
+    )""",
+    """CREATE TABLE alert_rules (
+        id INTEGER NOT NULL PRIMARY KEY, name VARCHAR NOT NULL, description TEXT, severity_filter VARCHAR,
+        category_filter VARCHAR, source_filter VARCHAR, is_active BOOLEAN NOT NULL, created_by VARCHAR,
+        created_at DATETIME NOT NULL
+    )""",
+    """CREATE TABLE alerts (
+        id INTEGER NOT NULL PRIMARY KEY, rule_id INTEGER NOT NULL REFERENCES alert_rules (id) ON DELETE CASCADE,
+        event_id VARCHAR NOT NULL REFERENCES security_events (id) ON DELETE CASCADE, status VARCHAR NOT NULL,
+        assigned_to VARCHAR, notes TEXT, created_at DATETIME NOT NULL, resolved_at DATETIME
+    )""",
+    "CREATE INDEX ix_alerts_status_created ON alerts (status, created_at)",
+    "INSERT INTO security_events VALUES ('e1', '2025-11-26 14:00:00', 'IDS', 'network', 'high', 'old event', '2025-11-26 14:00:00')",
+    "INSERT INTO alert_rules (id, name, is_active, created_at) VALUES (1, 'old rule', 1, '2025-11-26 14:00:00')",
+    "INSERT INTO alerts (id, rule_id, event_id, status, created_at) VALUES (1, 1, 'e1', 'open', '2025-11-26 14:00:00')",
+]
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as conn:
+        for statement in BASELINE_DDL:
+            conn.execute(text(statement))
+    yield engine
+    engine.dispose()
+
+
+def _columns(engine, table):
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+def test_upgrade_adds_missing_columns_and_keeps_rows(engine):
+    Base.metadata.create_all(bind=engine)
+    applied = upgrade_schema(engine)
+    assert applied
+
+    for table, names in migrations.ADDED_COLUMNS.items():
+        assert set(names) <= _columns(engine, table), table
+
+    with engine.connect() as conn:
+        # server_default заполнил старые строки
+        assert conn.execute(text("SELECT count, group_key FROM alerts WHERE id = 1")).one() == (1, None)
+        assert conn.execute(text("SELECT suppress_from, rule_type FROM alert_rules WHERE id = 1")).one() == (None, "filter")
+        assert conn.execute(text("SELECT src_ip, hostname, duplicate_count FROM security_events")).one() == (None, None, 0)
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes("security_events")}
+    assert {"ix_security_events_hostname", "ix_events_src_ip_key", "ix_events_dst_ip_key"} <= set(indexes)
+    # Уникальность content_hash - последний рубеж дедупликации (ON CONFLICT DO NOTHING)
+    assert indexes["uq_security_events_content_hash"]["unique"]
+
+    db = sessionmaker(bind=engine)()
+    assert db.get(AlertORM, 1).acknowledged_at is None
+    assert reconcile_alert_counters(db) == 1
+    assert get_alert_stats(db, since=datetime(2025, 1, 1)).by_status == {"open": 1}
+    db.close()
+
+    # Повторный запуск ничего не меняет
+    assert upgrade_schema(engine) == []
+
+
+def test_upgrade_replaces_alert_indexes_and_keeps_ids_increasing(engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX ix_alerts_rule_group_status ON alerts (rule_id, status)"))
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # Последние алерты ушли в архив до обновления
+        conn.execute(text(
+            "INSERT INTO alerts_archive (id, rule_id, event_id, status, created_at, count, archived_at) "
+            "VALUES (7, 1, 'e1', 'resolved', '2025-11-26 14:00:00', 1, '2025-11-27 00:00:00')"
+        ))
+    upgrade_schema(engine)
+
+    for table in Base.metadata.sorted_tables:
+        assert {column.name for column in table.columns} <= _columns(engine, table.name), table.name
+    indexes = {index["name"] for index in inspect(engine).get_indexes("alerts")}
+    assert "ix_alerts_status_created" not in indexes
+    assert "ix_alerts_rule_group_status" not in indexes
+    assert {
+        "ix_alerts_active_status_created", "ix_alerts_active_assignee_created",
+        "ix_alerts_active_rule_group", "ix_alerts_rule_event",
+    } <= indexes
+    with engine.connect() as conn:
+        assert "AUTOINCREMENT" in conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'alerts'")).scalar()
+
+    db = sessionmaker(bind=engine)()
+    assert db.get(AlertORM, 1).status == "open"
+    alert = AlertORM(rule_id=1, event_id="e1", status="open")
+    db.add(alert)
+    db.commit()
+    assert alert.id == 8
+    db.close()
+
+    assert upgrade_schema(engine) == []
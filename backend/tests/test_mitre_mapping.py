@@ -0,0 +1,157 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import AlertRuleORM, EventTechniqueORM
+from app.repositories.event_repo import ingest_events
+from app.services import mitre_mapping
+from app.services.mitre_mapping import MappingEngine, MappingIndex, MappingRule, retag_events, technique_heatmap
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+BASE_TS = datetime(2025, 11, 26, 14, 0, 0)
+
+RULES = [
+    {"technique": "T1110", "category": "auth", "description": ["failed password", "неудачн"]},
+    {"technique": "T1021.004", "category": ["auth", "network"], "source": ["sshd"], "description": ["accepted"]},
+    {"technique": "T1046", "category": "network", "pattern": r"scan(ned)? \d+ ports"},
+    {"technique": "T1566", "description": ["phishing"]},
+]
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def mapping(tmp_path, monkeypatch):
+    path = tmp_path / "mapping.json"
+    path.write_text(json.dumps(RULES))
+    monkeypatch.setattr(mitre_mapping, "engine", MappingEngine(path))
+    return path
+
+
+def _event(i: int, category: str, source: str, description: str) -> dict:
+    return {
+        "id": f"e{i}",
+        "timestamp": BASE_TS + timedelta(minutes=i),
+        "source": source,
+        "category": category,
+        "severity": "high",
+        "description": description,
+        "src_ip": None,
+        "dst_ip": None,
+        "hostname": None,
+    }
+
+
+def test_index_matches_all_conditions():
+    index = MappingIndex([MappingRule.from_dict(rule) for rule in RULES])
+
+    assert index.techniques("AUTH", "sshd", "Failed password for root") == {"T1110"}
+    assert index.techniques("auth", "sshd", "Accepted publickey for bob") == {"T1021.004"}
+    assert index.techniques("network", "nginx", "accepted connection") == set()  # source condition
+    assert index.techniques("auth", "pam", "Вход неудачный") == {"T1110"}  # keyword as word stem
+    assert index.techniques("auth", "pam", "unfailed password") == set()  # keyword from word start only
+    assert index.techniques("network", "ids", "host scanned 1000 ports") == {"T1046"}
+    assert index.techniques("endpoint", "mail", "Phishing link clicked") == {"T1566"}  # any category
+
+
+def test_engine_reloads_changed_file_and_skips_bad_rules(mapping):
+    assert len(mitre_mapping.engine.index()) == 4
+
+    mapping.write_text(json.dumps([{"technique": "bogus"}, {"technique": "t1059", "description": ["powershell"]}]))
+    os.utime(mapping, (1, 1))  # гарантированно другое mtime
+    index = mitre_mapping.engine.index()
+    assert [rule.technique for rule in index.rules] == ["T1059"]
+
+    mapping.write_text("{not json")
+    os.utime(mapping, (2, 2))
+    assert mitre_mapping.engine.index() is index  # ошибка чтения: остаются прежние правила
+
+
+def test_ingest_tags_events_and_heatmap_counts(db, mapping):
+    db.add(AlertRuleORM(name="sshd", source_filter="sshd"))
+    db.commit()
+    ingest_events(
+        db,
+        [
+            _event(0, "auth", "sshd", "Failed password for root"),
+            _event(1, "auth", "sshd", "Failed password for admin"),
+            _event(2, "auth", "pam", "Failed password for bob"),
+            _event(3, "network", "ids", "host scanned 80 ports"),
+            _event(90, "network", "ids", "host scanned 22 ports"),
+        ],
+    )
+    assert db.query(EventTechniqueORM).count() == 5
+
+    heatmap = technique_heatmap(db, BASE_TS, BASE_TS + timedelta(hours=1))
+    assert heatmap == {
+        "T1110": {"events": 3, "alerts": 2},
+        "T1046": {"events": 1, "alerts": 0},
+    }
+
+
+def test_retag_applies_new_mapping(db, mapping):
+    ingest_events(db, [_event(0, "endpoint", "edr", "powershell -enc ..."), _event(1, "auth", "sshd", "Failed password")])
+    assert {tag.technique for tag in db.query(EventTechniqueORM)} == {"T1110"}
+
+    mapping.write_text(json.dumps(RULES + [{"technique": "T1059.001", "category": "endpoint", "description": ["powershell"]}]))
+    os.utime(mapping, (1, 1))
+    assert retag_events(db, start=BASE_TS, end=BASE_TS + timedelta(hours=1), chunk_size=1) == 2
+    assert {tag.technique for tag in db.query(EventTechniqueORM)} == {"T1110", "T1059.001"}
+
+
+def test_interrupted_retag_keeps_untouched_chunks_tagged(db, mapping):
+    ingest_events(db, [_event(i, "auth", "sshd", "Failed password") for i in range(3)])
+    mapping.write_text(json.dumps([{"technique": "T1110.001", "category": "auth", "description": ["failed password"]}]))
+    os.utime(mapping, (1, 1))
+
+    def stop_after_first_chunk(done):
+        raise RuntimeError("worker stopped")
+
+    with pytest.raises(RuntimeError):
+        retag_events(db, chunk_size=1, progress=stop_after_first_chunk)
+    db.rollback()
+    # Первая порция перетегирована, остальные сохранили старые теги
+    tags = sorted((tag.event_id, tag.technique) for tag in db.query(EventTechniqueORM))
+    assert tags == [("e0", "T1110"), ("e1", "T1110"), ("e2", "T1110.001")]
+
+
+def test_heatmap_accepts_aware_window(db, mapping):
+    from app.api.mitre import get_heatmap
+
+    ingest_events(db, [_event(0, "auth", "sshd", "Failed password")])
+    start = datetime(2025, 11, 26, 17, 0, tzinfo=timezone(timedelta(hours=3)))
+    heatmap = get_heatmap(start=start, end=None, db=db, current_user=None)
+    assert heatmap.start == BASE_TS
+    assert heatmap.techniques["T1110"].events == 1
+
+
+def test_retag_runs_as_job(db, mapping):
+    from app.services.job_queue import JobWorker, submit
+
+    ingest_events(db, [_event(0, "endpoint", "edr", "powershell -enc ..."), _event(1, "auth", "sshd", "Failed password")])
+    mapping.write_text(json.dumps(RULES + [{"technique": "T1059.001", "category": "endpoint", "description": ["powershell"]}]))
+    os.utime(mapping, (1, 1))
+
+    job = submit(db, "retag_techniques", {"start": BASE_TS.isoformat()})
+    assert JobWorker(TestingSessionLocal).run_once() == "succeeded"
+    db.refresh(job)
+    assert json.loads(job.result) == {"tags": 2} and job.progress_message == "2/2 events"
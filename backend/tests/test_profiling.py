@@ -0,0 +1,94 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from app import profiling
+from app.auth import create_access_token
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+
+app = FastAPI()
+app.add_middleware(profiling.ProfilingMiddleware)
+
+
+def _busy_work() -> int:
+    deadline = time.perf_counter() + 0.05
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+@app.get("/work")
+def work_route():
+    with engine.connect() as conn:
+        value = conn.execute(text("SELECT 1")).scalar()
+    return {"value": value, "work": _busy_work() > 0}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(profiling, "profiles", profiling.OrderedDict())
+    monkeypatch.setattr(profiling, "slow_queries", profiling.deque(maxlen=10))
+    profiling.install_query_logging(engine)
+    return TestClient(app)
+
+
+def _auth(role: str) -> dict:
+    return {"Authorization": "Bearer " + create_access_token({"sub": "u", "role": role})}
+
+
+def test_admin_request_gets_profile(client):
+    response = client.get("/work", headers={**_auth("admin"), "X-Profile": "1"})
+    assert response.json() == {"value": 1, "work": True}
+    report = profiling.profiles[response.headers["X-Profile-Id"]]
+    assert "db;dur=" in response.headers["Server-Timing"]
+    assert report["samples"] > 0
+    assert any(item["function"].endswith(":_busy_work") for item in report["functions"])
+    assert report["sql"]["queries"] == 1
+
+
+@pytest.mark.parametrize("headers", [{"X-Profile": "1"}, {**_auth("analyst"), "X-Profile": "1"}, _auth("admin")])
+def test_profile_requires_admin_and_flag(client, headers):
+    response = client.get("/work", headers=headers)
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert not profiling.profiles
+
+
+def test_query_flag(client):
+    response = client.get("/work?profile=1", headers=_auth("admin"))
+    assert response.headers["X-Profile-Id"] in profiling.profiles
+
+
+def test_slow_query_log(client, monkeypatch):
+    monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 0)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT :x"), {"x": 42})
+    entry = profiling.slow_queries[-1]
+    assert entry["statement"] == "SELECT ?"
+    assert "42" in entry["parameters"]
+    assert entry["explain"] is None  # EXPLAIN ANALYZE только для Postgres
+
+
+def test_memory_report_includes_caches(monkeypatch):
+    cache = {"enterprise_data": {"objects": [{"id": str(i)} for i in range(100)]}}
+    monkeypatch.setitem(profiling.memory_probes, "mitre._cache", lambda: cache)
+    profiling.start_tracing()
+    try:
+        profiling.memory_report()
+        blob = [bytearray(1000) for _ in range(100)]
+        report = profiling.memory_report(limit=5)
+    finally:
+        profiling.stop_tracing()
+    assert report["caches"]["mitre._cache"] > 100 * 50
+    assert report["top"] and report["growth"]
+    assert blob
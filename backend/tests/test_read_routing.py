@@ -0,0 +1,78 @@
+import time
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import db as db_module
+from app.db import READ_PRIMARY_COOKIE, get_read_db
+
+
+@pytest.fixture
+def two_databases(tmp_path, monkeypatch):
+    """Two SQLite files standing in for the primary and the replica."""
+    engines = {}
+    for name in ("primary", "replica"):
+        engine = create_engine(f"sqlite:///{tmp_path / name}.sqlite")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE whoami (name TEXT)"))
+            conn.execute(text("INSERT INTO whoami VALUES (:name)"), {"name": name})
+        engines[name] = engine
+
+    monkeypatch.setattr(db_module, "engine", engines["primary"])
+    monkeypatch.setattr(db_module, "read_engine", engines["replica"])
+    monkeypatch.setattr(db_module, "SessionLocal", sessionmaker(bind=engines["primary"]))
+    monkeypatch.setattr(db_module, "ReadSessionLocal", sessionmaker(bind=engines["replica"]))
+    monkeypatch.setattr(db_module, "replica_lag_seconds", lambda: 0.0)
+    yield engines
+    for engine in engines.values():
+        engine.dispose()
+
+
+def _read_from(cookies=None) -> str:
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+    if cookies:
+        cookie = "; ".join(f"{k}={v}" for k, v in cookies.items())
+        scope["headers"] = [(b"cookie", cookie.encode())]
+    dependency = get_read_db(Request(scope))
+    session = next(dependency)
+    try:
+        return session.execute(text("SELECT name FROM whoami")).scalar()
+    finally:
+        dependency.close()
+
+
+def test_reads_go_to_replica(two_databases):
+    assert _read_from() == "replica"
+
+
+def test_lagging_replica_falls_back_to_primary(two_databases, monkeypatch):
+    monkeypatch.setattr(db_module, "replica_lag_seconds", lambda: db_module.REPLICA_MAX_LAG_SECONDS + 1)
+    assert _read_from() == "primary"
+
+
+def test_read_your_writes_cookie(two_databases):
+    assert _read_from({READ_PRIMARY_COOKIE: str(time.time() + 10)}) == "primary"
+    assert _read_from({READ_PRIMARY_COOKIE: str(time.time() - 1)}) == "replica"
+
+
+def test_successful_write_sets_sticky_cookie():
+    from app.main import read_your_writes
+
+    app = FastAPI()
+    app.middleware("http")(read_your_writes)
+
+    @app.patch("/thing")
+    def patch_thing():
+        return {}
+
+    @app.get("/thing")
+    def get_thing():
+        return {}
+
+    client = TestClient(app)
+    assert READ_PRIMARY_COOKIE not in client.get("/thing").cookies
+    response = client.patch("/thing")
+    assert float(response.cookies[READ_PRIMARY_COOKIE]) > time.time()
@@ -0,0 +1,102 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import response_cache
+from app.db import Base
+from app.auth import create_access_token
+from app.models.db_models import AlertRuleORM, UserORM
+from app.response_cache import ActiveUsers, CacheRule, InMemoryLRUCache, ResponseCacheMiddleware
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+calls = {"count": 0}
+app = FastAPI()
+app.add_middleware(ResponseCacheMiddleware)
+
+
+@app.get("/cached")
+def cached_route():
+    calls["count"] += 1
+    db = TestingSessionLocal()
+    try:
+        return {"rules": db.query(AlertRuleORM).count()}
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(response_cache, "backend", InMemoryLRUCache(max_entries=8))
+    monkeypatch.setattr(response_cache, "active_users", ActiveUsers(ttl=60, session_factory=TestingSessionLocal))
+    monkeypatch.setitem(response_cache.CACHE_RULES, "/cached", CacheRule(ttl=60, tables=("alert_rules",)))
+    calls["count"] = 0
+    yield TestClient(app)
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_repeated_get_is_served_from_cache(client):
+    first = client.get("/cached?b=2&a=1")
+    second = client.get("/cached?a=1&b=2")  # same query, different order
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+    assert calls["count"] == 1
+
+
+def test_if_none_match_returns_304(client):
+    etag = client.get("/cached").headers["ETag"]
+    response = client.get("/cached", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_commit_to_table_invalidates_route(client):
+    assert client.get("/cached").json() == {"rules": 0}
+
+    db = TestingSessionLocal()
+    db.add(AlertRuleORM(name="new rule"))
+    db.commit()
+    db.close()
+
+    response = client.get("/cached")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json() == {"rules": 1}
+
+
+def test_inactive_user_is_not_served_from_cache(client):
+    db = TestingSessionLocal()
+    user = UserORM(username="alice", hashed_password="x", role="analyst")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": "alice", "role": "admin"})}
+    client.get("/cached", headers=headers)
+    assert client.get("/cached", headers=headers).headers["X-Cache"] == "HIT"
+
+    # Раздел кэша выбирает роль из БД, а не заявленная в токене
+    assert response_cache.active_users.role("alice") == "analyst"
+
+    user.is_active = False
+    db.commit()  # запись в users сбрасывает снимок активных пользователей
+    db.close()
+    assert "X-Cache" not in client.get("/cached", headers=headers).headers
+    unknown = {"Authorization": "Bearer " + create_access_token({"sub": "mallory", "role": "admin"})}
+    assert "X-Cache" not in client.get("/cached", headers=unknown).headers
+
+
+def test_lru_is_bounded():
+    cache = InMemoryLRUCache(max_entries=2)
+    entry = response_cache.CachedResponse(200, "application/json", b"{}", '"x"')
+    for key in ("a", "b", "c"):
+        cache.set(key, entry, ttl=60)
+    assert cache.get("a") is None
+    assert cache.get("c") == entry
@@ -0,0 +1,110 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base, StatementTimeout, statement_deadline
+from app.models.alert import AlertRulePreviewRequest
+from app.models.db_models import SecurityEventORM
+from app.services import rule_preview
+from app.services.rule_preview import draft_rule, preview_rule
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+BASE_TS = datetime(2025, 11, 26, 14, 0, 0)
+WINDOW = (BASE_TS - timedelta(hours=1), BASE_TS + timedelta(hours=1))
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    for i in range(200):
+        session.add(
+            SecurityEventORM(
+                id=f"e{i}",
+                timestamp=BASE_TS + timedelta(seconds=i),
+                source="Firewall-edge" if i % 4 == 0 else "IDS",
+                category="network",
+                severity="high" if i % 2 == 0 else "low",
+                description="Подозрительная активность от IP",
+                src_ip=f"10.0.{i % 2}.{i % 250}",
+            )
+        )
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _preview(db, sample_size=5, **draft):
+    return preview_rule(db, draft_rule(AlertRulePreviewRequest(**draft)), *WINDOW, sample_size=sample_size)
+
+
+def test_indexed_conditions_give_exact_count(db):
+    """Severity/category/CIDR/time conditions are counted exactly in SQL"""
+    result = _preview(db, severity_filter="HIGH", src_cidrs=["10.0.0.0/24"])
+
+    assert result.method == "index" and result.exact
+    assert result.matches == 100
+    assert len(result.samples) == 5
+    assert result.samples[0].id == "e198"  # newest first
+
+
+def test_substring_filter_checks_candidates(db):
+    """A source substring is checked per candidate; few candidates -> exact"""
+    result = _preview(db, severity_filter="high", source_filter="firewall")
+
+    assert result.method == "scan" and result.exact
+    assert result.upper_bound == 100
+    assert result.matches == 50
+    assert all(sample.source == "Firewall-edge" for sample in result.samples)
+
+
+def test_many_candidates_are_sampled(db, monkeypatch):
+    """Above RULE_PREVIEW_SAMPLE_ROWS candidates the match rate of a sample is scaled"""
+    monkeypatch.setattr(rule_preview, "RULE_PREVIEW_SAMPLE_ROWS", 40)
+    result = _preview(db, source_filter="firewall")
+
+    assert result.method == "sample" and not result.exact
+    assert result.sampled == 40
+    assert result.upper_bound == 200
+    assert result.matches == 50
+
+
+def test_suppression_window_excluded(db):
+    result = _preview(db, suppress_from=BASE_TS, suppress_until=BASE_TS + timedelta(seconds=99))
+    assert result.matches == 100
+
+
+def test_statement_deadline_interrupts_sqlite(db):
+    """A statement running past the deadline is interrupted and the session stays usable"""
+    slow = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT count(*) FROM n"
+    started = time.monotonic()
+    with pytest.raises(StatementTimeout):
+        with statement_deadline(db, 0.05):
+            db.execute(text(slow))
+    assert time.monotonic() - started < 2
+    assert db.query(SecurityEventORM).count() == 200
+
+
+def test_preview_reports_timeout(db, monkeypatch):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _stall(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(0.05)
+
+    try:
+        result = preview_rule(db, draft_rule(AlertRulePreviewRequest()), *WINDOW, timeout_ms=10)
+    finally:
+        event.remove(engine, "before_cursor_execute", _stall)
+
+    assert result.timed_out
+    assert result.matches is None
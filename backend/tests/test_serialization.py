@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.serialization import CompressionMiddleware, FastJSONResponse, dumps, negotiate_encoding, rows_to_dicts
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+ROWS = [("e1", datetime(2025, 11, 26, 14, 0), "Firewall", "Подозрительная активность от IP")] * 20
+
+
+@app.get("/rows")
+def rows():
+    return FastJSONResponse(rows_to_dicts(("id", "timestamp", "source", "description"), ROWS))
+
+
+@app.get("/small")
+def small():
+    return FastJSONResponse({"status": "ok"})
+
+
+@app.get("/tagged")
+def tagged():
+    return FastJSONResponse(rows_to_dicts(("id", "timestamp", "source", "description"), ROWS), headers={"ETag": '"abc"'})
+
+
+def test_dumps_matches_default_json_format():
+    """Fast encoder keeps non-ASCII text and ISO timestamps like JSONResponse"""
+    body = dumps({"d": "Подозрительная", "t": datetime(2025, 11, 26, 14, 0)})
+    assert body == '{"d":"Подозрительная","t":"2025-11-26T14:00:00"}'.encode()
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("deflate, gzip;q=0.5") == "gzip"
+
+
+def test_gzip_response_roundtrip():
+    client = TestClient(app)
+    response = client.get("/rows", headers={"Accept-Encoding": "gzip;q=1.0, zstd;q=0, br;q=0"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json()[0]["description"] == "Подозрительная активность от IP"
+
+
+def test_encoded_response_has_weak_etag():
+    """The tag of the identity body does not describe the encoded bytes"""
+    client = TestClient(app)
+    response = client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    response = client.get("/tagged", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"abc"'
+
+
+def test_small_body_is_not_compressed():
+    client = TestClient(app)
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"status": "ok"}
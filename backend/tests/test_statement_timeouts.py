@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import db as app_db
+from app.db import Base, QueryCancelled, QueryGuard, StatementTimeout, get_read_db, install_query_guards
+from app.models.db_models import SecurityEventORM
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+install_query_guards(engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+SLOW = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT count(*) FROM n"
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _guarded(guard):
+    session = TestingSessionLocal()
+    session.info["query_guard"] = guard
+    return session
+
+
+def test_statement_timeout_interrupts_and_is_translated(db):
+    session = _guarded(QueryGuard(timeout_ms=50))
+    started = time.monotonic()
+    with pytest.raises(StatementTimeout):
+        session.execute(text(SLOW))
+    assert time.monotonic() - started < 2
+    session.rollback()
+    assert session.execute(text("SELECT 1")).scalar() == 1  # быстрые запросы проходят
+    session.close()
+
+    # После возврата соединения в пул ни guard, ни обработчик на нём не остаются
+    with engine.connect() as conn:
+        assert "query_guard" not in conn.info
+    assert db.query(SecurityEventORM).count() == 0
+
+
+def test_cancel_aborts_running_statement_and_later_ones(db):
+    guard = QueryGuard(timeout_ms=0)
+    session = _guarded(guard)
+    timer = threading.Timer(0.05, guard.cancel)
+    timer.start()
+    try:
+        with pytest.raises(QueryCancelled):
+            session.execute(text(SLOW))
+        session.rollback()
+        with pytest.raises(QueryCancelled):
+            session.execute(text("SELECT 1"))
+    finally:
+        timer.cancel()
+        session.close()
+
+    finished = QueryGuard(timeout_ms=0)
+    finished.finished = True
+    finished.cancel()  # ответ уже отправлен: отменять нечего
+    assert not finished.cancelled
+
+
+def test_endpoint_timeout_maps_to_504(db, monkeypatch):
+    from app.api import events
+    from app.main import app
+
+    def override_get_read_db(request: Request):
+        session = _guarded(request.state.query_guard)
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def slow_summary(db, **filters):
+        return db.execute(text(SLOW)).scalar()
+
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, override_get_read_db)
+    monkeypatch.setitem(app_db.STATEMENT_TIMEOUTS_MS, "/api/events/summary", 50)
+    monkeypatch.setattr(events, "get_events_summary", slow_summary)
+
+    response = TestClient(app).get("/api/events/summary")
+    assert response.status_code == 504
+    assert "timed out" in response.json()["detail"]
+
+
+def test_middleware_cancels_on_client_disconnect():
+    from app.db import QueryCancellationMiddleware
+
+    seen = {}
+
+    async def endpoint(scope, receive, send):
+        guard = scope["state"]["query_guard"]
+        seen["timeout"] = guard.timeout_ms
+        assert (await receive())["type"] == "http.request"
+        for _ in range(100):  # запрос «в базе», пока клиент не ушёл
+            if guard.cancelled:
+                break
+            await asyncio.sleep(0.01)
+        seen["cancelled"] = guard.cancelled
+
+    async def scenario():
+        messages = [{"type": "http.request", "body": b"", "more_body": False}, {"type": "http.disconnect"}]
+
+        async def receive():
+            await asyncio.sleep(0.02)
+            return messages.pop(0)
+
+        async def send(message):
+            pass
+
+        scope = {"type": "http", "path": "/api/events/summary"}
+        await QueryCancellationMiddleware(endpoint)(scope, receive, send)
+
+    asyncio.run(scenario())
+    assert seen == {"timeout": app_db.STATEMENT_TIMEOUTS_MS["/api/events/summary"], "cancelled": True}
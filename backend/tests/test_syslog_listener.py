@@ -0,0 +1,87 @@
+import asyncio
+import socket
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models.db_models import AlertORM, AlertRuleORM, SecurityEventORM
+from app.services.syslog_listener import SyslogListener
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+RFC5424 = (
+    b'<34>1 2025-11-26T14:00:00.000Z fw01 Firewall 1234 ID47 [exampleSDID@32473 iut="3" '
+    b'eventSource="App\\]lication"] Blocked connection from 10.0.0.5'
+)
+CEF = (
+    b"<13>1 2025-11-26T14:00:01Z ids01 - - - - CEF:0|Acme|IDS|1.0|100|Port scan|7|"
+    b"src=10.0.0.5 cat=network msg=Port scan detected on 22\\=ssh"
+)
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    session.add(AlertRuleORM(name="High severity", severity_filter="high"))
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+async def _run_listener(messages_udp, tcp_payload):
+    listener = SyslogListener(
+        TestingSessionLocal, host="127.0.0.1", udp_port=0, tcp_port=0, batch_size=100, batch_latency=0.05, writers=1
+    )
+    await listener.start()
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for message in messages_udp:
+                sock.sendto(message, listener.udp_address)
+        _reader, writer = await asyncio.open_connection(*listener.tcp_address)
+        writer.write(tcp_payload)
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+        expected = len(messages_udp) + 2
+        for _ in range(100):
+            if listener.stats.received >= expected and listener.stats.written >= listener.stats.parsed:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await listener.stop()
+    return listener.stats
+
+
+def test_listener_ingests_udp_and_tcp(db):
+    tcp_payload = RFC5424 + b"\n" + str(len(CEF)).encode() + b" " + CEF
+    stats = asyncio.run(_run_listener([RFC5424, CEF, b"garbage"], tcp_payload))
+
+    assert stats.received == 5
+    assert stats.parsed == 4
+    assert stats.written == 4
+    assert stats.dropped == 0
+    assert stats.parse_errors == {"127.0.0.1": 1}
+
+    assert db.query(SecurityEventORM).count() == 4
+    assert db.query(SecurityEventORM).filter(SecurityEventORM.source == "Acme IDS").count() == 2
+    # Правило severity=high срабатывает на CEF-события
+    assert db.query(AlertORM).count() == 2
+
+
+def test_full_buffer_drops_and_counts():
+    listener = SyslogListener(TestingSessionLocal, queue_size=2)
+    for _ in range(5):
+        listener.submit(RFC5424, "10.1.1.1")
+    assert listener.stats.parsed == 5
+    assert listener.stats.dropped == 3
@@ -1,3 +1,5 @@
+import type { SecurityEvent } from './events';
+
 export type Alert = {
   id: number;
   rule_id: number;
@@ -13,6 +15,9 @@ export type Alert = {
   notes: string | null;
   created_at: string;
   resolved_at: string | null;
+  count: number;
+  first_seen: string | null;
+  last_seen: string | null;
 };
 
 export type AlertRule = {
@@ -25,6 +30,12 @@ export type AlertRule = {
   is_active: boolean;
   created_by: string | null;
   created_at: string;
+  aggregation_window_seconds: number | null;
+  suppress_from: string | null;
+  suppress_until: string | null;
+  src_cidrs: string[];
+  dst_cidrs: string[];
+  rule_type: string;
 };
 
 export type AlertRuleCreate = {
@@ -34,6 +45,29 @@ export type AlertRuleCreate = {
   category_filter?: string | null;
   source_filter?: string | null;
   is_active?: boolean;
+  aggregation_window_seconds?: number | null;
+  suppress_from?: string | null;
+  suppress_until?: string | null;
+  src_cidrs?: string[] | null;
+  dst_cidrs?: string[] | null;
+};
+
+export type AlertRulePreviewRequest = Partial<AlertRuleCreate> & {
+  window_hours?: number;
+  sample_size?: number;
+};
+
+export type AlertRulePreview = {
+  start: string;
+  end: string;
+  method: 'index' | 'scan' | 'sample';
+  matches: number | null;
+  exact: boolean;
+  upper_bound: number | null;
+  sampled: number;
+  samples: SecurityEvent[];
+  timed_out: boolean;
+  elapsed_ms: number;
 };
 
 export type AlertUpdate = {
@@ -42,6 +76,16 @@ export type AlertUpdate = {
   notes?: string | null;
 };
 
+export type AlertBulkUpdate = AlertUpdate & {
+  ids?: number[];
+  filter?: {
+    status?: string;
+    rule_id?: number;
+    created_from?: string;
+    created_to?: string;
+  };
+};
+
 export type PagedAlerts = {
   items: Alert[];
   total: number;
@@ -49,6 +93,26 @@ export type PagedAlerts = {
   limit: number;
 };
 
+export type AlertRuleStats = {
+  rule_id: number;
+  rule_name: string | null;
+  total: number;
+  by_status: Record<string, number>;
+  resolved: number;
+  mttr_seconds: number | null;
+  acknowledged: number;
+  mtta_seconds: number | null;
+};
+
+export type AlertStats = {
+  total: number;
+  by_status: Record<string, number>;
+  by_assignee: Record<string, number>;
+  unassigned: number;
+  by_rule: AlertRuleStats[];
+  since: string;
+};
+
 export type AlertFilters = {
   status?: string;
   rule_id?: number;
@@ -166,3 +230,42 @@ export async function updateAlert(alertId: number, update: AlertUpdate): Promise
   return res.json();
 }
 
+export async function bulkUpdateAlerts(update: AlertBulkUpdate): Promise<{ updated: number }> {
+  const res = await fetch('/api/alerts/bulk', {
+    method: 'PATCH',
+    headers: await getAuthHeaders(),
+    body: JSON.stringify(update),
+  });
+
+  if (!res.ok) {
+    throw new Error(`Failed to bulk update alerts: ${res.status} ${res.statusText}`);
+  }
+
+  return res.json();
+}
+
+export async function fetchAlertStats(sinceDays = 30): Promise<AlertStats> {
+  const res = await fetch(`/api/alerts/stats?since_days=${sinceDays}`, {
+    headers: await getAuthHeaders(),
+  });
+
+  if (!res.ok) {
+    throw new Error(`Failed to load alert stats: ${res.status} ${res.statusText}`);
+  }
+
+  return res.json();
+}
+
+export async function previewAlertRule(draft: AlertRulePreviewRequest): Promise<AlertRulePreview> {
+  const res = await fetch('/api/alerts/rules/preview', {
+    method: 'POST',
+    headers: await getAuthHeaders(),
+    body: JSON.stringify(draft),
+  });
+
+  if (!res.ok) {
+    throw new Error(`Failed to preview alert rule: ${res.status} ${res.statusText}`);
+  }
+
+  return res.json();
+}
@@ -5,12 +5,21 @@ export type SecurityEvent = {
   category: string;
   severity: string;
   description: string;
+  src_ip: string | null;
+  dst_ip: string | null;
+  hostname: string | null;
+  duplicate_count: number;
 };
 
 export type EventFilters = {
   severity?: string;
   category?: string;
   source?: string;
+  src_ip?: string; // address or CIDR, e.g. 10.0.0.0/8
+  dst_ip?: string;
+  hostname?: string;
+  start?: string; // ISO datetime; ranges older than the hot window are read from cold storage
+  end?: string;
 };
 
 export type PagedEvents = {
@@ -35,6 +44,11 @@ function buildQuery(filters: EventFilters, offset?: number, limit?: number): str
   if (filters.severity) params.set("severity", filters.severity);
   if (filters.category) params.set("category", filters.category);
   if (filters.source) params.set("source", filters.source);
+  if (filters.src_ip) params.set("src_ip", filters.src_ip);
+  if (filters.dst_ip) params.set("dst_ip", filters.dst_ip);
+  if (filters.hostname) params.set("hostname", filters.hostname);
+  if (filters.start) params.set("start", filters.start);
+  if (filters.end) params.set("end", filters.end);
 
   if (typeof offset === "number") params.set("offset", String(offset));
   if (typeof limit === "number") params.set("limit", String(limit));
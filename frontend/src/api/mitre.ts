@@ -35,6 +35,39 @@ export async function getMitreTactics(): Promise<MitreTacticsResponse> {
   return response.json();
 }
 
+export interface TechniqueCounts {
+  events: number;
+  alerts: number;
+}
+
+export interface MitreHeatmapResponse {
+  start: string;
+  end: string;
+  techniques: Record<string, TechniqueCounts>; // external_id -> counts
+}
+
+/**
+ * Количество событий и алертов по техникам за окно (по умолчанию последние 24 часа)
+ */
+export async function getMitreHeatmap(start?: string, end?: string): Promise<MitreHeatmapResponse> {
+  const params = new URLSearchParams();
+  if (start) params.set('start', start);
+  if (end) params.set('end', end);
+  const query = params.toString();
+
+  const headers: HeadersInit = {};
+  const token = localStorage.getItem('auth_token');
+  if (token) {
+    headers['Authorization'] = `Bearer ${token}`;
+  }
+
+  const response = await fetch(API_BASE + '/heatmap' + (query ? `?${query}` : ''), { headers });
+  if (!response.ok) {
+    throw new Error(`Failed to fetch MITRE heatmap: ${response.statusText}`);
+  }
+  return response.json();
+}
+
 /**
  * Очищает кэш MITRE данных
  */
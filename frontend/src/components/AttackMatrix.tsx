@@ -1,10 +1,11 @@
 import React, { useEffect, useState } from 'react';
-import { getMitreTactics, type MitreTactic } from '../api/mitre';
+import { getMitreHeatmap, getMitreTactics, type MitreTactic, type TechniqueCounts } from '../api/mitre';
 
 export const AttackMatrix: React.FC = () => {
   const [tactics, setTactics] = useState<MitreTactic[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const [heatmap, setHeatmap] = useState<Record<string, TechniqueCounts>>({});
 
   useEffect(() => {
     loadMitreData();
@@ -16,6 +17,10 @@ export const AttackMatrix: React.FC = () => {
       setError(null);
       const data = await getMitreTactics();
       setTactics(data.tactics);
+      // Без теплокарты (нет входа, ошибка) матрица показывается без раскраски
+      getMitreHeatmap()
+        .then((result) => setHeatmap(result.techniques))
+        .catch((err) => console.warn('Failed to load MITRE heatmap:', err));
     } catch (err) {
       console.error('Failed to load MITRE data:', err);
       setError('Не удалось загрузить данные MITRE ATT&CK. Проверьте подключение к интернету.');
@@ -24,6 +29,8 @@ export const AttackMatrix: React.FC = () => {
     }
   };
 
+  const maxEvents = Math.max(1, ...Object.values(heatmap).map((counts) => counts.events));
+
   if (loading) {
     return (
       <div
@@ -187,21 +194,34 @@ export const AttackMatrix: React.FC = () => {
                 }}
               >
                 <ul style={{ margin: 0, paddingLeft: '18px', color: '#9ca3af', fontSize: 12 }}>
-                  {tactic.techniques.slice(0, 10).map((tech) => (
-                    <li
-                      key={tech.id}
-                      style={{
-                        marginBottom: 6,
-                        lineHeight: 1.4
-                      }}
-                      title={tech.description}
-                    >
-                      <span style={{ color: '#6b7280', fontSize: 11 }}>
-                        {tech.external_id}
-                      </span>{' '}
-                      <span style={{ color: '#e5e7eb' }}>{tech.name}</span>
-                    </li>
-                  ))}
+                  {tactic.techniques.slice(0, 10).map((tech) => {
+                    const counts = heatmap[tech.external_id];
+                    const intensity = counts ? 0.15 + 0.6 * (counts.events / maxEvents) : 0;
+                    return (
+                      <li
+                        key={tech.id}
+                        style={{
+                          marginBottom: 6,
+                          lineHeight: 1.4,
+                          background: counts ? `rgba(220, 38, 38, ${intensity})` : undefined,
+                          borderRadius: 4
+                        }}
+                        title={
+                          counts
+                            ? `${tech.description}\n${counts.events} событий, ${counts.alerts} алертов за 24 ч`
+                            : tech.description
+                        }
+                      >
+                        <span style={{ color: '#6b7280', fontSize: 11 }}>
+                          {tech.external_id}
+                        </span>{' '}
+                        <span style={{ color: '#e5e7eb' }}>{tech.name}</span>
+                        {counts && (
+                          <span style={{ color: '#fca5a5', fontSize: 11 }}> ({counts.events})</span>
+                        )}
+                      </li>
+                    );
+                  })}
                   {tactic.techniques.length > 10 && (
                     <li style={{ color: '#6b7280', fontStyle: 'italic' }}>
                       +{tactic.techniques.length - 10} больше техник...